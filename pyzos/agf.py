@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        agf.py
+# Purpose:     Glass catalog (.agf) loader with vectorized index evaluation
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Offline glass catalog (.agf) loader with vectorized evaluation of refractive
+index, dn/dT and Abbe numbers.
+
+Parsed catalogs are cached in a compact binary (.npz) file next to the catalog
+(or in a given cache directory), which is used as long as the catalog file is
+not modified. All evaluations are done with NumPy over arrays of glasses and
+wavelengths, so no OpticStudio call is required.
+
+Example
+-------
+>>> import pyzos.agf as agf
+>>> cat = agf.load_catalogs([r'C:\\...\\glasscat\\SCHOTT.AGF', r'C:\\...\\OHARA.AGF'])
+>>> n = cat.index(['N-BK7', 'F2'], [0.4861327, 0.5875618, 0.6562725])  # 2 x 3 array
+>>> cat.abbe(['N-BK7', 'F2'])
+"""
+from __future__ import division, print_function
+import os as _os
+import numpy as _np
+from pyzos.zmxfile import open_text as _open_text
+
+#%% Module constants
+NUM_COEFFS = 10  # number of dispersion coefficients retained per glass
+
+# Dispersion formula numbers (as in the NM record of the catalog)
+SCHOTT = 1
+SELLMEIER1 = 2
+HERZBERGER = 3
+SELLMEIER2 = 4
+CONRADY = 5
+SELLMEIER3 = 6
+HANDBOOK1 = 7
+HANDBOOK2 = 8
+SELLMEIER4 = 9
+EXTENDED1 = 10
+SELLMEIER5 = 11
+EXTENDED2 = 12
+EXTENDED3 = 13
+
+# Fraunhofer lines (micrometers)
+WAVE_d, WAVE_F, WAVE_C = 0.5875618, 0.4861327, 0.6562725
+WAVE_e, WAVE_Fp, WAVE_Cp = 0.546074, 0.4799914, 0.6438469
+
+_CACHE_VERSION = 1
+
+#%% Custom Exceptions
+class AGFError(Exception): pass
+
+#%% Parser
+def _parse_agf(filename):
+    """Parse an .agf file into a dictionary of arrays"""
+    names, formula, nd, vd, status = [], [], [], [], []
+    coeffs, thermal, wave_range = [], [], []
+    with _open_text(filename) as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+            rec, args = tokens[0], tokens[1:]
+            if rec == 'NM':
+                names.append(args[0])
+                formula.append(int(float(args[1])))
+                nd.append(float(args[3]) if len(args) > 3 else _np.nan)
+                vd.append(float(args[4]) if len(args) > 4 else _np.nan)
+                status.append(int(float(args[6])) if len(args) > 6 else 0)
+                coeffs.append(_np.zeros(NUM_COEFFS))
+                thermal.append(_np.zeros(7))
+                wave_range.append(_np.array([0.0, _np.inf]))
+            elif not names:
+                continue
+            elif rec == 'CD':
+                vals = [float(a) for a in args[:NUM_COEFFS]]
+                coeffs[-1][:len(vals)] = vals
+            elif rec == 'TD':
+                vals = [float(a) for a in args[:7]]
+                thermal[-1][:len(vals)] = vals
+            elif rec == 'LD' and len(args) > 1:
+                wave_range[-1][:] = float(args[0]), float(args[1])
+    if not names:
+        raise AGFError('No glass found in {}'.format(filename))
+    return dict(names=_np.array(names), formula=_np.array(formula, dtype=_np.int8),
+                nd=_np.array(nd), vd=_np.array(vd), status=_np.array(status, dtype=_np.int8),
+                coeffs=_np.array(coeffs), thermal=_np.array(thermal),
+                wave_range=_np.array(wave_range))
+
+def _cache_filename(filename, cache_dir):
+    if cache_dir is None:
+        return filename + '.npz'
+    return _os.path.join(cache_dir, _os.path.basename(filename) + '.npz')
+
+def load_agf(filename, cache=True, cache_dir=None):
+    """Load a glass catalog file
+
+    @param filename: name of the .agf file
+    @param cache: if `True` (default) the catalog is loaded from (and if
+                  required stored into) the binary cache file
+    @param cache_dir: directory of the binary cache files. The default is
+                      the directory of the catalog file.
+    @return: instance of `GlassCatalog`
+    """
+    stat = _os.stat(filename)
+    stamp = _np.array([_CACHE_VERSION, stat.st_mtime, stat.st_size])
+    cache_file = _cache_filename(filename, cache_dir)
+    if cache and _os.path.exists(cache_file):
+        try:
+            with _np.load(cache_file) as npz:
+                if _np.array_equal(npz['stamp'], stamp):
+                    return GlassCatalog(**dict((k, npz[k]) for k in npz.files if k != 'stamp'))
+        except (IOError, OSError, KeyError, ValueError):
+            pass
+    data = _parse_agf(filename)
+    if cache:
+        try:
+            with open(cache_file, 'wb') as f:
+                _np.savez(f, stamp=stamp, **data)
+        except (IOError, OSError):
+            pass  # read-only location; the catalog is usable without cache
+    return GlassCatalog(**data)
+
+def load_catalogs(filenames, cache=True, cache_dir=None):
+    """Load and merge several glass catalog files. If a glass is listed in
+    more than one catalog, the first occurrence takes precedence.
+
+    @param filenames: sequence of .agf file names
+    @return: instance of `GlassCatalog`
+    """
+    cats = [load_agf(f, cache, cache_dir) for f in filenames]
+    keys = ('names', 'formula', 'nd', 'vd', 'status', 'coeffs', 'thermal', 'wave_range')
+    data = dict((k, _np.concatenate([getattr(c, k) for c in cats])) for k in keys)
+    return GlassCatalog(**data)
+
+#%% Dispersion formulas
+def _n2_sellmeier(c, w2, numTerms):
+    n2 = 1.0
+    for k in range(numTerms):
+        n2 = n2 + c[:, 2*k, None]*w2/(w2 - c[:, 2*k + 1, None])
+    return n2
+
+def _n2_power_series(c, w2, powers):
+    n2 = 0.0
+    for k, p in enumerate(powers):
+        n2 = n2 + c[:, k, None]*w2**p
+    return n2
+
+def _dispersion(formula, c, w):
+    """Refractive index for the glasses (rows of `c`) with the dispersion
+    formula `formula`, at the wavelengths `w` (2-D array, micrometers)"""
+    w2 = w*w
+    if formula == SCHOTT:
+        return _np.sqrt(_n2_power_series(c, w2, (0, 1, -1, -2, -3, -4)))
+    elif formula == SELLMEIER1:
+        return _np.sqrt(_n2_sellmeier(c, w2, 3))
+    elif formula == SELLMEIER2:
+        return _np.sqrt(1.0 + c[:, 0, None] + c[:, 1, None]*w2/(w2 - c[:, 2, None]**2)
+                        + c[:, 3, None]/(w2 - c[:, 4, None]**2))
+    elif formula == CONRADY:
+        return c[:, 0, None] + c[:, 1, None]/w + c[:, 2, None]/w**3.5
+    elif formula == SELLMEIER3:
+        return _np.sqrt(_n2_sellmeier(c, w2, 4))
+    elif formula == HANDBOOK1:
+        return _np.sqrt(c[:, 0, None] + c[:, 1, None]/(w2 - c[:, 2, None]) - c[:, 3, None]*w2)
+    elif formula == HANDBOOK2:
+        return _np.sqrt(c[:, 0, None] + c[:, 1, None]*w2/(w2 - c[:, 2, None])
+                        - c[:, 3, None]*w2)
+    elif formula == SELLMEIER4:
+        return _np.sqrt(c[:, 0, None] + c[:, 1, None]*w2/(w2 - c[:, 2, None])
+                        + c[:, 3, None]*w2/(w2 - c[:, 4, None]))
+    elif formula == EXTENDED1:
+        return _np.sqrt(_n2_power_series(c, w2, (0, 1, -1, -2, -3, -4, -5, -6)))
+    elif formula == SELLMEIER5:
+        return _np.sqrt(_n2_sellmeier(c, w2, 5))
+    elif formula == EXTENDED2:
+        return _np.sqrt(_n2_power_series(c, w2, (0, 1, -1, -2, -3, -4, 2, 3)))
+    elif formula == EXTENDED3:
+        return _np.sqrt(_n2_power_series(c, w2, (0, 1, 2, -1, -2, -3, -4, -5, -6)))
+    else:
+        raise NotImplementedError('Dispersion formula {} is not supported'.format(formula))
+
+def model_index(nd, vd, wavelengths):
+    """Refractive index of model glasses defined only by `nd` and `vd`,
+    using a Cauchy-type dispersion that reproduces nd at the d-line and
+    nF - nC = (nd - 1)/vd.
+
+    @param nd, vd: arrays of shape (numGlass,)
+    @param wavelengths: wavelength(s) in micrometers
+    @return: array of shape (numGlass, numWave)
+    """
+    nd = _np.asarray(nd, dtype=_np.float64)[:, None]
+    vd = _np.asarray(vd, dtype=_np.float64)[:, None]
+    w = _np.atleast_1d(_np.asarray(wavelengths, dtype=_np.float64))[None, :]
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        dispersion = _np.where(vd > 0, (nd - 1.0)/vd, 0.0)
+    return nd + dispersion*(w**-2 - WAVE_d**-2)/(WAVE_F**-2 - WAVE_C**-2)
+
+#%% Glass catalog
+class GlassCatalog(object):
+    """Array-backed glass catalog
+
+    The refractive index related methods accept a glass name or a sequence of
+    glass names (or glass indices into the catalog), and a scalar or sequence
+    of wavelengths in micrometers. They return arrays of shape
+    (numGlass, numWave).
+    """
+    def __init__(self, names, formula, nd, vd, status, coeffs, thermal, wave_range):
+        self.names = _np.asarray(names)
+        self.formula = _np.asarray(formula)
+        self.nd = _np.asarray(nd)
+        self.vd = _np.asarray(vd)
+        self.status = _np.asarray(status)
+        self.coeffs = _np.asarray(coeffs)
+        self.thermal = _np.asarray(thermal)   # D0, D1, D2, E0, E1, Ltk, Tref
+        self.wave_range = _np.asarray(wave_range)
+        self._lookup = {}
+        for i, name in enumerate(self.names):
+            self._lookup.setdefault(name.upper(), i)
+
+    def __repr__(self):
+        return "{.__name__}(numGlass={})".format(type(self), len(self))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name.upper() in self._lookup
+
+    def find(self, glasses):
+        """Return array of catalog indices of `glasses`
+
+        @raise: KeyError if a glass isn't in the catalog
+        """
+        if isinstance(glasses, str):
+            glasses = [glasses]
+        elif isinstance(glasses, _np.ndarray) and glasses.dtype.kind in 'iu':
+            return glasses.astype(_np.intp, copy=False)
+        try:
+            return _np.array([g if isinstance(g, (int, _np.integer)) else self._lookup[g.upper()]
+                              for g in glasses], dtype=_np.intp)
+        except KeyError as err:
+            raise KeyError('Glass {} not found in catalog'.format(err))
+
+    def index(self, glasses, wavelengths, temperature=None):
+        """Refractive index (relative to air) of the glasses
+
+        @param glasses: glass name, or sequence of glass names or catalog indices
+        @param wavelengths: wavelength(s) in micrometers
+        @param temperature: glass temperature in degree Celsius. If `None`, the
+                            index at the catalog reference temperature is returned.
+        @return: array of shape (numGlass, numWave)
+        """
+        idx = self.find(glasses)
+        w = _np.broadcast_to(_np.atleast_1d(_np.asarray(wavelengths, dtype=_np.float64)),
+                             (len(idx), _np.size(wavelengths)))
+        n = _np.empty(w.shape)
+        formulas = self.formula[idx]
+        for formula in _np.unique(formulas):
+            sel = formulas == formula
+            n[sel] = _dispersion(int(formula), self.coeffs[idx[sel]], w[sel])
+        if temperature is not None:
+            n = n + self._delta_n(idx, n, w, temperature)
+        return n
+
+    def _delta_n(self, idx, n, w, temperature):
+        D0, D1, D2, E0, E1, Ltk, Tref = (self.thermal[idx, k, None] for k in range(7))
+        dT = temperature - Tref
+        return ((n*n - 1.0)/(2.0*n)*(D0*dT + D1*dT**2 + D2*dT**3
+                                     + (E0*dT + E1*dT**2)/(w*w - _np.sign(Ltk)*Ltk*Ltk)))
+
+    def dndt(self, glasses, wavelengths, temperature=None):
+        """Absolute temperature coefficient of refractive index, dn/dT (1/K),
+        following the Schott thermal model (TD record of the catalog)
+
+        @param temperature: temperature in degree Celsius (default: reference
+                            temperature of each glass)
+        @return: array of shape (numGlass, numWave)
+        """
+        idx = self.find(glasses)
+        n = self.index(idx, wavelengths)
+        w = _np.broadcast_to(_np.atleast_1d(_np.asarray(wavelengths, dtype=_np.float64)),
+                             n.shape)
+        D0, D1, D2, E0, E1, Ltk, Tref = (self.thermal[idx, k, None] for k in range(7))
+        dT = 0.0 if temperature is None else temperature - Tref
+        return ((n*n - 1.0)/(2.0*n)*(D0 + 2.0*D1*dT + 3.0*D2*dT**2
+                                     + (E0 + 2.0*E1*dT)/(w*w - _np.sign(Ltk)*Ltk*Ltk)))
+
+    def abbe(self, glasses, lines='d'):
+        """Abbe number computed from the dispersion formula
+
+        @param lines: 'd' for Vd = (nd - 1)/(nF - nC), or 'e' for
+                      Ve = (ne - 1)/(nF' - nC')
+        @return: array of shape (numGlass,)
+        """
+        waves = (WAVE_d, WAVE_F, WAVE_C) if lines == 'd' else (WAVE_e, WAVE_Fp, WAVE_Cp)
+        n = self.index(glasses, waves)
+        return (n[:, 0] - 1.0)/(n[:, 1] - n[:, 2])
+
+    def partial_dispersion(self, glasses, wave1=0.4358343, wave2=WAVE_F):
+        """Relative partial dispersion P = (n1 - n2)/(nF - nC), default is PgF"""
+        n = self.index(glasses, (wave1, wave2, WAVE_F, WAVE_C))
+        return (n[:, 0] - n[:, 1])/(n[:, 2] - n[:, 3])
+
+    def in_range(self, glasses, wavelengths):
+        """Boolean array (numGlass, numWave); True where the wavelength is within
+        the valid wavelength range (LD record) of the glass"""
+        idx = self.find(glasses)
+        w = _np.atleast_1d(_np.asarray(wavelengths, dtype=_np.float64))[None, :]
+        return (w >= self.wave_range[idx, 0, None]) & (w <= self.wave_range[idx, 1, None])
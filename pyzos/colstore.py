@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        colstore.py
+# Purpose:     Append-only, crash-safe columnar on-disk store
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Append-only columnar store for streaming results (such as Monte Carlo trials)
+to disk as they arrive.
+
+The store is a directory with one raw binary file per column, and a small
+JSON file with the schema, the user metadata and the number of committed rows.
+Rows are appended to the column files, and then committed by atomically
+replacing the JSON file; hence, after a crash the store is re-opened with
+all committed rows (partially written rows are discarded). The columns are
+read as memory-mapped NumPy arrays.
+
+Example
+-------
+>>> from pyzos.colstore import ColumnStore
+>>> store = ColumnStore('trials', columns=[('trial', 'i8'), ('merit', 'f8')])
+>>> store.append({'trial': 0, 'merit': 1.2e-3})
+>>> store['merit']
+"""
+from __future__ import division, print_function
+import os as _os
+import json as _json
+import numpy as _np
+
+_SCHEMA_FILE = 'store.json'
+
+def _replace(src, dst):
+    """Atomic rename (replacing `dst`) also in Python 2"""
+    if hasattr(_os, 'replace'):
+        _os.replace(src, dst)
+    else:
+        if _os.path.exists(dst):
+            _os.remove(dst)
+        _os.rename(src, dst)
+
+class ColumnStore(object):
+    """Append-only columnar on-disk store"""
+    def __init__(self, directory, columns=None, meta=None):
+        """
+        @param directory: store directory. An existing store is opened (and its
+                          uncommitted rows discarded); otherwise, a new store is
+                          created.
+        @param columns: list of (name, dtype) of the columns (dtype is a NumPy
+                        type code such as 'f8'). Required for a new store; for an
+                        existing store the columns must be the same.
+        @param meta: JSON serializable metadata stored with a new store
+        """
+        self.directory = _os.path.abspath(directory)
+        schema_file = _os.path.join(self.directory, _SCHEMA_FILE)
+        if _os.path.exists(schema_file):
+            with open(schema_file) as f:
+                schema = _json.load(f)
+            if (columns is not None and
+                [[name, _np.dtype(dtype).str] for name, dtype in columns] != schema['columns']):
+                raise ValueError('The columns of the store {} are {}'
+                                 .format(self.directory, schema['columns']))
+            self.columns = [(name, dtype) for name, dtype in schema['columns']]
+            self.meta = schema['meta']
+            self._rows = schema['rows']
+            self._truncate()
+        else:
+            if columns is None:
+                raise ValueError('The columns of a new store must be given')
+            if not _os.path.isdir(self.directory):
+                _os.makedirs(self.directory)
+            self.columns = [(name, _np.dtype(dtype).str) for name, dtype in columns]
+            self.meta = meta
+            self._rows = 0
+            for name, _ in self.columns:
+                open(self._column_file(name), 'wb').close()
+            self._commit()
+
+    def __repr__(self):
+        return "{.__name__}('{}', numRows={}, columns={})".format(
+            type(self), self.directory, len(self), [name for name, _ in self.columns])
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, name):
+        return self.read(name)
+
+    @property
+    def names(self):
+        """column names"""
+        return [name for name, _ in self.columns]
+
+    def _column_file(self, name):
+        return _os.path.join(self.directory, name + '.bin')
+
+    def _commit(self):
+        schema_file = _os.path.join(self.directory, _SCHEMA_FILE)
+        tmp_file = schema_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            _json.dump({'columns': [list(c) for c in self.columns], 'meta': self.meta,
+                        'rows': self._rows}, f)
+            f.flush()
+            _os.fsync(f.fileno())
+        _replace(tmp_file, schema_file)
+
+    def _truncate(self):
+        """Discard uncommitted rows of the column files"""
+        for name, dtype in self.columns:
+            size = self._rows*_np.dtype(dtype).itemsize
+            with open(self._column_file(name), 'r+b') as f:
+                f.truncate(size)
+
+    def append(self, rows):
+        """Append and commit rows
+
+        @param rows: a row (dictionary of column name : value) or a list of rows,
+                     or a dictionary of column name : array of values
+        """
+        if isinstance(rows, dict):
+            if any(_np.ndim(value) for value in rows.values()):
+                data = rows
+            else:
+                data = dict((name, [value]) for name, value in rows.items())
+        else:
+            data = dict((name, [row[name] for row in rows]) for name in self.names)
+        arrays = [_np.asarray(data[name], dtype=dtype) for name, dtype in self.columns]
+        numRows = len(arrays[0]) if arrays else 0
+        if any(len(a) != numRows for a in arrays):
+            raise ValueError('All columns must have the same number of rows')
+        for (name, _), array in zip(self.columns, arrays):
+            with open(self._column_file(name), 'ab') as f:
+                f.write(array.tobytes())
+                f.flush()
+                _os.fsync(f.fileno())
+        self._rows += numRows
+        self._commit()
+
+    def read(self, name):
+        """Return the committed values of the column `name` as a (read-only,
+        memory-mapped) array"""
+        dtype = dict(self.columns)[name]
+        if not self._rows:
+            return _np.zeros(0, dtype=dtype)
+        return _np.memmap(self._column_file(name), dtype=dtype, mode='r', shape=(self._rows,))
+
+    def read_all(self):
+        """Return dictionary of column name : array of all columns"""
+        return dict((name, self.read(name)) for name in self.names)
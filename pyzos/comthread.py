@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        comthread.py
+# Purpose:     Multi-threaded use of the ZOS-API objects via per-thread marshalling
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Thread pool executor whose worker threads can use the optical system.
+
+The ZOS-API COM objects belong to the apartment (thread) that created them.
+`COMThreadPoolExecutor` marshals the system (IOpticalSystem) and the
+application interfaces of an `OpticalSystem`, once per worker thread, in the
+creating thread (`CoMarshalInterThreadInterfaceInStream()`). Each worker thread
+initializes COM (`CoInitialize()`), unmarshals its interfaces
+(`CoGetInterfaceAndReleaseStream()`), and wraps the system in its own
+`OpticalSystem`. Tasks are functions `func(osys, *args)`, where `osys` is the
+system of the worker thread; so I/O-bound Python work of the tasks (result
+conversion, file writes, DDE) overlaps with the COM calls of other tasks.
+
+The COM layer is replaceable: `FakeCOM` emulates the apartment rules of COM
+objects without COM, for testing on any platform.
+
+Example
+-------
+>>> from pyzos.comthread import COMThreadPoolExecutor
+>>> def spot(osys, field, filename):
+...     data = osys.zApplyAnalysis(osys.pAnalyses.New_StandardSpot())
+...     np.save(filename, data.series[0].y)   # overlaps with the next analysis
+>>> with COMThreadPoolExecutor(osys, max_workers=4) as executor:
+...     futures = [executor.submit(spot, f, 'spot{}.npy'.format(f)) for f in (1, 2, 3)]
+"""
+from __future__ import division, print_function
+import sys as _sys
+import functools as _functools
+import threading as _threading
+try:
+    import queue as _queue
+except ImportError:
+    import Queue as _queue
+
+_local = _threading.local()   # system and application of the worker thread
+
+def current_system():
+    """Return the optical system of the current worker thread (or `None`)"""
+    return getattr(_local, 'osys', None)
+
+def current_application():
+    """Return the (unmarshalled) ZOS-API application of the current worker thread"""
+    return getattr(_local, 'app', None)
+
+#%% COM layers
+class PythonCOM(object):
+    """COM layer of pywin32"""
+    def __init__(self):
+        import pythoncom
+        self._pythoncom = pythoncom
+
+    def initialize(self):
+        self._pythoncom.CoInitialize()
+
+    def uninitialize(self):
+        self._pythoncom.CoUninitialize()
+
+    def marshal(self, obj):
+        """Returns stream with the marshalled IDispatch interface of `obj`; to be
+        called in the thread owning `obj`"""
+        pc = self._pythoncom
+        return pc.CoMarshalInterThreadInterfaceInStream(pc.IID_IDispatch, obj._oleobj_)
+
+    def unmarshal(self, stream, like):
+        """Returns the object unmarshalled from `stream` (once), wrapped in the
+        (win32com) class of `like`"""
+        pc = self._pythoncom
+        return type(like)(pc.CoGetInterfaceAndReleaseStream(stream, pc.IID_IDispatch))
+
+class FakeCOMError(Exception): pass
+
+class _FakeStream(object):
+    def __init__(self, target):
+        self.target = target
+        self.used = False
+
+class ApartmentObject(object):
+    """Object of `FakeCOM`, usable only from its apartment (thread)"""
+    def __init__(self, target, apartment):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_apartment', apartment)
+
+    def _check(self):
+        if _threading.current_thread().ident != self._apartment:
+            raise FakeCOMError('The application called an interface that was marshalled '
+                               'for a different thread')
+
+    def __getattr__(self, name):
+        self._check()
+        return getattr(self._target, name)
+
+    def __setattr__(self, name, value):
+        self._check()
+        setattr(self._target, name, value)
+
+class FakeCOM(object):
+    """COM layer stand-in (no COM) for testing: `bind()` makes objects bound to
+    the current thread, which are only usable in other threads after
+    marshalling; unmarshalling requires an initialized thread"""
+    def __init__(self):
+        self._lock = _threading.Lock()
+        self.initialized = set()    # thread idents
+        self.marshalled = 0
+        self.unmarshalled = 0
+
+    def bind(self, obj):
+        """Returns `obj` bound to the current thread"""
+        return ApartmentObject(obj, _threading.current_thread().ident)
+
+    def initialize(self):
+        with self._lock:
+            self.initialized.add(_threading.current_thread().ident)
+
+    def uninitialize(self):
+        with self._lock:
+            self.initialized.discard(_threading.current_thread().ident)
+
+    def marshal(self, obj):
+        obj._check()
+        with self._lock:
+            self.marshalled += 1
+        return _FakeStream(obj._target)
+
+    def unmarshal(self, stream, like):
+        ident = _threading.current_thread().ident
+        if ident not in self.initialized:
+            raise FakeCOMError('CoInitialize has not been called')
+        if stream.used:
+            raise FakeCOMError('The stream was already released')
+        stream.used = True
+        with self._lock:
+            self.unmarshalled += 1
+        return ApartmentObject(stream.target, ident)
+
+#%% Executor
+class Future(object):
+    """Result of a task of `COMThreadPoolExecutor`"""
+    def __init__(self):
+        self._done = _threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._cancelled = False
+        self._running = False
+
+    def __repr__(self):
+        state = ('cancelled' if self._cancelled else 'finished' if self._done.is_set() else
+                 'running' if self._running else 'pending')
+        return '<{.__name__} {}>'.format(type(self), state)
+
+    def cancel(self):
+        """Cancel the task if it hasn't started; returns whether it was cancelled"""
+        if self._running or self._done.is_set():
+            return self._cancelled
+        self._cancelled = True
+        self._done.set()
+        return True
+
+    def cancelled(self):
+        return self._cancelled
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Return the result of the task (waiting up to `timeout` seconds), or
+        raise its exception"""
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timeout waiting for the task')
+        if self._cancelled:
+            raise RuntimeError('The task was cancelled')
+        if self._exc_info is not None:
+            raise self._exc_info[1]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Return the exception of the task (or `None`)"""
+        self._done.wait(timeout)
+        return self._exc_info[1] if self._exc_info is not None else None
+
+def _wrap_system(iopticalsystem, peer=None):
+    from pyzos.zos import OpticalSystem
+    return OpticalSystem._from_zos_system(iopticalsystem, peer)
+
+class COMThreadPoolExecutor(object):
+    """Thread pool whose worker threads use (marshalled) interfaces of the
+    optical system"""
+    def __init__(self, osys, max_workers=4, com=None, wrap=_wrap_system):
+        """
+        @param osys: `pyzos.zos.OpticalSystem` (or a COM object); to be created in
+                     the current thread
+        @param max_workers: number of worker threads
+        @param com: COM layer (default `PythonCOM()`; `FakeCOM()` for testing)
+        @param wrap: function wrapping the unmarshalled system object of a worker
+                     (default makes an `OpticalSystem`); `None` for no wrapping
+        """
+        self.com = PythonCOM() if com is None else com
+        self.max_workers = max_workers
+        if wrap is _wrap_system and hasattr(osys, '_iopticalsystem'):
+            # the edits made in the workers are tracked by `osys` too
+            wrap = _functools.partial(_wrap_system, peer=osys)
+        self._wrap = wrap
+        system = getattr(osys, '_iopticalsystem', osys)
+        app = getattr(type(osys), '_pyzosapp', None)
+        # the streams are made in the owning thread, one per worker (a stream is
+        # unmarshalled once)
+        self._streams = [(self.com.marshal(system),
+                          self.com.marshal(app) if app is not None else None)
+                         for _ in range(max_workers)]
+        self._like = (system, app)
+        self._tasks = _queue.Queue()
+        self._shutdown = False
+        self._init_errors = []
+        self._ready = _threading.Semaphore(0)   # released by each worker once initialized
+        self._threads = []
+        for streams in self._streams:
+            thread = _threading.Thread(target=self._worker, args=(streams,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        self._streams = None
+        for _ in self._threads:
+            self._ready.acquire()
+        if self._init_errors:
+            self.shutdown()
+            raise self._init_errors[0]
+
+    def __repr__(self):
+        return '{.__name__}(max_workers={}, com={.__name__})'.format(
+            type(self), self.max_workers, type(self.com))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+    def _worker(self, streams):
+        self.com.initialize()
+        try:
+            try:
+                system = self.com.unmarshal(streams[0], self._like[0])
+                app = (self.com.unmarshal(streams[1], self._like[1])
+                       if streams[1] is not None else None)
+                _local.osys = self._wrap(system) if self._wrap is not None else system
+                _local.app = app
+            except Exception as e:
+                self._init_errors.append(e)
+                return
+            finally:
+                self._ready.release()
+            while True:
+                item = self._tasks.get()
+                if item is None:
+                    break
+                future, func, args, kwargs = item
+                if future._cancelled:
+                    continue
+                future._running = True
+                try:
+                    future._result = func(_local.osys, *args, **kwargs)
+                except BaseException:
+                    future._exc_info = _sys.exc_info()
+                future._done.set()
+        finally:
+            _local.osys = None
+            _local.app = None
+            self.com.uninitialize()
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule `func(osys, *args, **kwargs)`, where `osys` is the system of the
+        worker thread; returns `Future`"""
+        if self._shutdown:
+            raise RuntimeError('The executor is shut down')
+        future = Future()
+        self._tasks.put((future, func, args, kwargs))
+        return future
+
+    def map(self, func, *iterables):
+        """Return iterator of the results of `func(osys, *args)` for the arguments
+        from `iterables` (in order)"""
+        futures = [self.submit(func, *args) for args in zip(*iterables)]
+        return (future.result() for future in futures)
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads after the submitted tasks"""
+        if not self._shutdown:
+            self._shutdown = True
+            for _ in self._threads:
+                self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
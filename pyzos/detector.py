@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        detector.py
+# Purpose:     NumPy conversion and accumulation of NSC detector data
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Helpers for NSC detector data: conversion of the pixel data returned by the
+ZOS-API (nested sequences, or pixel by pixel values) into NumPy arrays, in row
+tiles and optionally into memory-mapped .npy files, and accumulation of
+detector data over repeated ray traces.
+
+The detector data is read from OpticStudio by `INonSeqEditor.zGetDetectorArray()`
+(see `read_detector()`).
+
+Example
+-------
+>>> from pyzos.detector import DetectorAccumulator
+>>> acc = DetectorAccumulator('irradiance_sum.npy')
+>>> for _ in range(10):
+...     # clear detectors and trace rays (INSCRayTrace)...
+...     osys.pNCE.zGetDetectorArray(5, accumulator=acc)
+>>> acc.mean
+"""
+from __future__ import division, print_function
+import numpy as _np
+
+def new_array(shape, filename=None):
+    """Return a new (uninitialized) float64 array of shape `shape`, which is a
+    memory-mapped .npy file if `filename` is given"""
+    if filename is None:
+        return _np.empty(shape)
+    return _np.lib.format.open_memmap(filename, mode='w+', dtype=_np.float64, shape=shape)
+
+def to_array(rows, filename=None, tile_rows=256, shape=None):
+    """Return the nested sequence (of rows) `rows` as a float64 array, converted
+    in tiles of `tile_rows` rows
+
+    @param rows: sequence of rows (sequences of numbers), such as the 2D data
+                 returned by the ZOS-API
+    @param filename: if given, the array is a memory-mapped .npy file
+    @param tile_rows: number of rows converted at a time (bounds the temporary
+                      memory used for the conversion)
+    @param shape: shape of the output (default (len(rows), len(rows[0])))
+    """
+    if shape is None:
+        shape = (len(rows), len(rows[0]) if len(rows) else 0)
+    out = new_array(shape, filename)
+    _copy_rows(rows, out, tile_rows)
+    return out
+
+def from_pixels(get_pixel, shape, filename=None, tile_rows=256, out=None):
+    """Return the detector data of shape `shape` (numRows, numCols) read pixel by
+    pixel, in tiles of `tile_rows` rows
+
+    @param get_pixel: function returning the value of a pixel given its number
+                      (1-based, row by row), such as a wrapper of
+                      `INonSeqEditor.GetDetectorData()`
+    @param filename: if given, the array is a memory-mapped .npy file
+    @param tile_rows: number of rows read (and written to the output) at a time
+    @param out: array of shape `shape` to write the data into, instead of a new array
+    """
+    numRows, numCols = shape
+    if out is None:
+        out = new_array(shape, filename)
+    tile = _np.empty((min(tile_rows, numRows), numCols))
+    for start in range(0, numRows, tile_rows):
+        stop = min(start + tile_rows, numRows)
+        block = tile[:stop - start].reshape(-1)
+        first = start*numCols + 1
+        for k in range(len(block)):
+            block[k] = get_pixel(first + k)
+        out[start:stop] = tile[:stop - start]
+    return out
+
+def read_detector(nce, objNum, data=0, filename=None, tile_rows=256, per_pixel=False):
+    """Return the data of all pixels of a detector object read from the (unwrapped)
+    Non-Sequential Component Editor `nce`
+
+    By default, the data of each code is read in one `GetAllDetectorDataSafe()`
+    call and converted to NumPy (and written to the output) in tiles of
+    `tile_rows` rows. With `per_pixel`, it is read with one `GetDetectorData()`
+    call per pixel instead; this is much slower (minutes for millions of pixels),
+    but never holds the full data in a ZOS-API array.
+
+    @param nce: INonSeqEditor (ZOS-API object)
+    @param objNum: object number of the detector
+    @param data: data type code (the `Data` argument of `GetDetectorData()`),
+                 or a sequence of codes
+    @param filename: if given, the data is written to (and returned as) a
+                     memory-mapped .npy file
+    @param tile_rows: number of rows converted and written at a time
+    @param per_pixel: read the data pixel by pixel
+    @return: array of shape (numRows, numCols), or (len(data), numRows, numCols)
+             if `data` is a sequence
+    """
+    isDetector, numCols, numRows = nce.GetDetectorDimensions(objNum)[:3]
+    if not isDetector:
+        raise ValueError('Object {} is not a detector'.format(objNum))
+    codes = _np.atleast_1d(data)
+    shape = (numRows, numCols)
+    out = new_array(shape if _np.ndim(data) == 0 else (len(codes),) + shape, filename)
+    for i, code in enumerate(codes):
+        code = int(code)
+        target = out if _np.ndim(data) == 0 else out[i]
+        if per_pixel:
+            def get_pixel(pix, code=code):
+                valid, value = nce.GetDetectorData(objNum, pix, code)
+                if not valid:
+                    raise ValueError('Object {} has no data {} (pixel {})'
+                                     .format(objNum, code, pix))
+                return value
+            from_pixels(get_pixel, shape, tile_rows=tile_rows, out=target)
+        else:
+            rows = nce.GetAllDetectorDataSafe(objNum, code)
+            if rows is None:
+                raise ValueError('Object {} has no data {}'.format(objNum, code))
+            _copy_rows(rows, target, tile_rows)
+    return out
+
+def _copy_rows(rows, out, tile_rows):
+    """Write the nested sequence `rows` into the array `out`, in tiles of rows"""
+    if len(rows) == 0:
+        return
+    flat = out.reshape(len(rows), -1)
+    for start in range(0, len(rows), tile_rows):
+        stop = min(start + tile_rows, len(rows))
+        flat[start:stop] = _np.array(rows[start:stop], dtype=_np.float64).reshape(stop - start, -1)
+
+class DetectorAccumulator(object):
+    """Running sum of detector data over repeated ray traces"""
+    def __init__(self, filename=None, tile_rows=1024):
+        """
+        @param filename: if given, the sum is kept in a memory-mapped .npy file
+        @param tile_rows: number of rows added at a time
+        """
+        self.filename = filename
+        self.tile_rows = tile_rows
+        self.sum = None
+        self.count = 0
+
+    def __repr__(self):
+        shape = None if self.sum is None else self.sum.shape
+        return '{.__name__}(shape={}, count={})'.format(type(self), shape, self.count)
+
+    def add(self, data):
+        """Add the detector data `data` (array-like) to the sum"""
+        data = _np.asarray(data, dtype=_np.float64)
+        if self.sum is None:
+            if self.filename is None:
+                self.sum = _np.zeros(data.shape)
+            else:
+                self.sum = _np.lib.format.open_memmap(self.filename, mode='w+',
+                                                      dtype=_np.float64, shape=data.shape)
+                self.sum[...] = 0.0
+        elif self.sum.shape != data.shape:
+            raise ValueError('Detector data of shape {} can not be added to the sum of shape {}'
+                             .format(data.shape, self.sum.shape))
+        if data.ndim:
+            for start in range(0, len(data), self.tile_rows):
+                self.sum[start:start + self.tile_rows] += data[start:start + self.tile_rows]
+        else:
+            self.sum += data
+        self.count += 1
+
+    @property
+    def mean(self):
+        """mean of the added detector data"""
+        if not self.count:
+            return None
+        return self.sum / self.count
+
+    def reset(self):
+        """Reset the sum to zero"""
+        if self.sum is not None:
+            self.sum[...] = 0.0
+        self.count = 0
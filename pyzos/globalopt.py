@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        globalopt.py
+# Purpose:     Time-budgeted Global and Hammer optimization with checkpoints
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Run the Global or Hammer optimization tool of OpticStudio for a wall-clock
+budget, in time slices, keeping the best designs on disk.
+
+After each slice (`RunAndWaitWithTimeout()`), the best designs found are
+saved to the checkpoint directory (the N best are kept), the progress is
+recorded, and the system is set to the best design, from which the next slice
+starts. The run stops when the budget is spent, or when the best merit
+function value stalls. A run that was interrupted is resumed from its last
+checkpoint by calling `run()` again with the same directory.
+
+The Hammer optimization modifies the system; the design is saved after each
+slice. The Global optimization saves its best designs as GLOPT_nnnn.ZMX files
+in the directory of the lens file (so the system must have been saved to a
+file); these are collected after each slice. The tool is reopened for each
+slice, so a Global search starts over (from the best design) every
+`interval`: use long slices with the Global optimization.
+
+Example
+-------
+>>> import pyzos.globalopt as gopt
+>>> result = gopt.run(osys, 'hammer_run', budget=8*3600, tool='hammer', interval=600)
+>>> result.merit, result.filename
+"""
+from __future__ import division, print_function
+import os as _os
+import re as _re
+import json as _json
+import time as _time
+import shutil as _shutil
+import collections as _co
+
+_CHECKPOINT_FILE = 'checkpoint.json'
+TOOLS = ('hammer', 'global')
+
+global_result = _co.namedtuple('global_result', ['merit', 'filename', 'elapsed', 'slices',
+                                                 'history', 'best', 'stopped'])
+
+def load_checkpoint(directory):
+    """Return the checkpoint (dictionary) of the run in `directory`, or `None`
+
+    The checkpoint has the keys 'tool', 'elapsed' (seconds spent), 'slices'
+    (number of slices run), 'history' (list of [elapsed, best merit]) and
+    'best' (list of [merit, design file name], best first).
+    """
+    filename = _os.path.join(directory, _CHECKPOINT_FILE)
+    if not _os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return _json.load(f)
+
+def _save_checkpoint(directory, checkpoint):
+    filename = _os.path.join(directory, _CHECKPOINT_FILE)
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w') as f:
+        _json.dump(checkpoint, f, indent=1)
+        f.flush()
+        _os.fsync(f.fileno())
+    if hasattr(_os, 'replace'):
+        _os.replace(tmp_file, filename)
+    else:
+        if _os.path.exists(filename):
+            _os.remove(filename)
+        _os.rename(tmp_file, filename)
+
+def _save_copy(osys, filename):
+    """Save a copy of the system (the file of `osys` is unchanged)"""
+    copy = osys.CopySystem()
+    copy.SaveAs(filename)
+    copy.Close(False)
+
+def _glopt_files(lens_dir, since):
+    """Return dictionary of number : path of the GLOPT_nnnn.ZMX files in
+    `lens_dir` modified after `since`"""
+    files = {}
+    for name in _os.listdir(lens_dir):
+        match = _re.match(r'GLOPT_(\d+)\.ZMX$', name, _re.IGNORECASE)
+        path = _os.path.join(lens_dir, name)
+        if match and _os.path.getmtime(path) >= since:
+            files[int(match.group(1))] = path
+    return files
+
+def _run_slice(osys, tool, seconds, cores, directory, slice_num):
+    """Run the tool for `seconds`, and return list of (merit, design file name)
+    of the designs found"""
+    tools = osys.pTools
+    if tool == 'hammer':
+        opt = tools.OpenHammerOptimization()
+    else:
+        opt = tools.OpenGlobalOptimization()
+    if opt is None:
+        raise RuntimeError('Another optimization tool is open')
+    start = _time.time()
+    try:
+        if cores:
+            opt.pNumberOfCores = cores
+        opt.RunAndWaitWithTimeout(seconds)
+        if opt.pIsRunning:
+            opt.Cancel()
+            opt.WaitForCompletion()
+        designs = []
+        if tool == 'hammer':
+            name = 'design_{:04d}.zmx'.format(slice_num)
+            _save_copy(osys, _os.path.join(directory, name))
+            designs.append((osys.pMFE.CalculateMeritFunction(), name))
+        else:
+            lens_dir = _os.path.dirname(osys.pSystemFile)
+            for num, path in sorted(_glopt_files(lens_dir, start).items()):
+                merit = opt.CurrentMeritFunction(num)
+                if merit <= 0:
+                    continue
+                name = 'design_{:04d}_{:02d}.zmx'.format(slice_num, num)
+                _shutil.copyfile(path, _os.path.join(directory, name))
+                designs.append((merit, name))
+    finally:
+        opt.Close()
+    return designs
+
+def run(osys, directory, budget, tool='hammer', interval=300, keep=5, stall_slices=3,
+        stall_tol=1e-4, cores=None):
+    """Run (or resume) a time-budgeted Global or Hammer optimization
+
+    Parameters
+    ----------
+    osys : `pyzos.zos.OpticalSystem`
+        system to optimize (with its variables and merit function). On return,
+        the system is loaded from the best design.
+    directory : string
+        checkpoint directory. If it has a checkpoint, the run is resumed from
+        the best design, with the remaining budget.
+    budget : float
+        wall-clock budget of the run (seconds), including the resumed parts
+    tool : string
+        'hammer' or 'global'
+    interval : float
+        duration of the slices (seconds), i.e. the checkpoint interval. The
+        tool is reopened for each slice: the Global search restarts every
+        `interval`, and the Hammer continues from the best design.
+    keep : integer
+        number of best designs kept in the checkpoint directory
+    stall_slices : integer
+        stop if the best merit function value decreased by less than
+        `stall_tol` (relative) over the last `stall_slices` slices
+    stall_tol : float
+        relative tolerance of the stall criterion
+    cores : integer, optional
+        number of cores used by the tool (default is the tool's setting)
+
+    Returns
+    -------
+    global_result : namedtuple
+        `merit` and `filename` -- best merit function value and its design
+        file; `elapsed` -- seconds spent; `slices` -- number of slices run;
+        `history` -- list of [elapsed, best merit]; `best` -- list of [merit,
+        file name] of the kept designs; `stopped` -- 'budget' or 'stalled'
+    """
+    if tool not in TOOLS:
+        raise ValueError('Unknown tool {}'.format(tool))
+    directory = _os.path.abspath(directory)
+    checkpoint = load_checkpoint(directory) if _os.path.isdir(directory) else None
+    if tool == 'global' and checkpoint is None and not osys.pSystemFile:
+        # the GLOPT files are saved in the directory of the lens file
+        raise ValueError('The system must be saved to a file for the Global optimization')
+    if not _os.path.isdir(directory):
+        _os.makedirs(directory)
+    if checkpoint is None:
+        merit = osys.pMFE.CalculateMeritFunction()
+        name = 'design_initial.zmx'
+        _save_copy(osys, _os.path.join(directory, name))
+        checkpoint = {'tool': tool, 'elapsed': 0.0, 'slices': 0,
+                      'history': [[0.0, merit]], 'best': [[merit, name]]}
+        _save_checkpoint(directory, checkpoint)
+    elif checkpoint['tool'] != tool:
+        raise ValueError('The run in {} uses the {} tool'.format(directory, checkpoint['tool']))
+    else:
+        osys.LoadFile(_os.path.join(directory, checkpoint['best'][0][1]), False)
+    stopped = 'budget'
+    while checkpoint['elapsed'] < budget:
+        history = checkpoint['history']
+        if (len(history) > stall_slices and
+            history[-stall_slices - 1][1] - history[-1][1] <= stall_tol*history[-stall_slices - 1][1]):
+            stopped = 'stalled'
+            break
+        seconds = max(1, int(round(min(interval, budget - checkpoint['elapsed']))))
+        start = _time.time()
+        slice_num = checkpoint['slices'] + 1
+        designs = _run_slice(osys, tool, seconds, cores, directory, slice_num)
+        best = sorted([tuple(b) for b in checkpoint['best']] + designs)
+        for _, name in best[keep:]:
+            path = _os.path.join(directory, name)
+            if _os.path.exists(path):
+                _os.remove(path)
+        best = best[:keep]
+        # the Hammer leaves its design in the system, the Global search doesn't
+        current = designs[0][1] if tool == 'hammer' else checkpoint['best'][0][1]
+        if best[0][1] != current:
+            osys.LoadFile(_os.path.join(directory, best[0][1]), False)
+        checkpoint['elapsed'] += _time.time() - start
+        checkpoint['slices'] = slice_num
+        checkpoint['best'] = [list(b) for b in best]
+        checkpoint['history'].append([checkpoint['elapsed'], best[0][0]])
+        _save_checkpoint(directory, checkpoint)
+    best_merit, best_name = checkpoint['best'][0]
+    return global_result(best_merit, _os.path.join(directory, best_name), checkpoint['elapsed'],
+                         checkpoint['slices'], checkpoint['history'], checkpoint['best'],
+                         stopped)
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        optimize.py
+# Purpose:     External optimizers with batched, parallel merit function evaluation
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Optimization of OpticStudio designs with algorithms running in Python.
+
+`MeritObjective` exposes the merit function of an optical system as a
+vectorized objective: it takes a batch of variable vectors (one per row)
+and evaluates them in parallel on a pool of worker processes, each with its
+own ZOS-API connection and copy of the system (`pyzos.workers.SystemPool`).
+The operand values of the evaluated points are cached, so revisited points
+are not evaluated again.
+
+The optimizers of this module consume such batched objectives (any function
+of a 2D array works, so they don't depend on OpticStudio):
+
+- `dls()`: damped least squares; the Jacobian and several damping factors
+  are evaluated as one batch per iteration.
+- `differential_evolution()` and `particle_swarm()`: population-based global
+  optimizers; a generation is evaluated as one batch.
+
+Example
+-------
+>>> from pyzos.optimize import MeritObjective, dls
+>>> with MeritObjective(osys, processes=8) as objective:
+...     result = dls(objective.residuals, objective.x0)
+...     objective.apply(result.x)
+"""
+from __future__ import division, print_function
+import os as _os
+import tempfile as _tempfile
+import collections as _co
+import numpy as _np
+from pyzos.workers import SystemPool as _SystemPool
+
+optimize_result = _co.namedtuple('optimize_result', ['x', 'fun', 'nit', 'nfev', 'history'])
+
+#%% Batched merit function of an optical system
+def _evaluate_task(osys, variables, points):
+    """Worker task of `MeritObjective`: returns the operand values for each
+    point (vector of variable values)"""
+    from pyzos.zos import _variable_cell, _operand_values
+    system = osys._iopticalsystem
+    cells = [_variable_cell(system, variable) for variable in variables]
+    values = []
+    for point in points:
+        for cell, value in zip(cells, point):
+            cell.DoubleValue = float(value)
+        values.append(_operand_values(system))
+    return values
+
+class MeritObjective(object):
+    """Merit function of an optical system as a batched objective, evaluated
+    in parallel"""
+    def __init__(self, osys, variables=None, processes=None, max_cache=100000):
+        """
+        @param osys: `pyzos.zos.OpticalSystem`; its variables, merit function
+                     and current state define the objective
+        @param variables: list of (editor, row, column) of the variable cells (see
+                          `OpticalSystem.zGetVariables()`); all variables if `None`
+        @param processes: number of worker processes (default is the number of CPUs)
+        @param max_cache: maximum number of cached points
+        """
+        self.osys = osys
+        self.variables = [tuple(v) for v in (osys.zGetVariables() if variables is None
+                                             else variables)]
+        self.max_cache = max_cache
+        self.nfev = 0     # number of points evaluated by the workers
+        self.hits = 0     # number of points served from the cache
+        self._cache = _co.OrderedDict()
+        from pyzos.zos import _variable_cell
+        system = osys._iopticalsystem
+        self.x0 = _np.array([_variable_cell(system, v).DoubleValue for v in self.variables],
+                            dtype=_np.float64)
+        mfe = system.MFE
+        operands = [mfe.GetOperandAt(i) for i in range(1, mfe.NumberOfOperands + 1)]
+        self.targets = _np.array([op.Target for op in operands], dtype=_np.float64)
+        weights = _np.array([op.Weight for op in operands], dtype=_np.float64)
+        weights[weights < 0] = 0.0      # Lagrangian constraints are not supported
+        total = weights.sum()
+        self.weights = weights/total if total else weights
+        self._filename = _os.path.join(_tempfile.gettempdir(), 'pyzos_optimize_{}_{}.zmx'
+                                       .format(_os.getpid(), id(self)))
+        copy = system.CopySystem()
+        copy.SaveAs(self._filename)
+        copy.Close(False)
+        self.pool = _SystemPool(self._filename, processes, osys.pMode)
+
+    def __repr__(self):
+        return ('{.__name__}(numVariables={}, numOperands={}, nfev={}, hits={})'
+                .format(type(self), len(self.variables), len(self.targets), self.nfev,
+                        self.hits))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __call__(self, X):
+        """Return the merit function values (array of shape (numPoints,)) of
+        the batch of points `X` (array of shape (numPoints, numVariables))"""
+        R = self.residuals(X)
+        return _np.sqrt(_np.sum(R**2, axis=1))
+
+    def operand_values(self, X):
+        """Return the operand values (array of shape (numPoints, numOperands))
+        of the batch of points `X`"""
+        X = _np.atleast_2d(_np.asarray(X, dtype=_np.float64))
+        values = _np.empty((len(X), len(self.targets)), dtype=_np.float64)
+        keys = [x.tobytes() for x in X]
+        todo = _co.OrderedDict()    # key : index of the first row with that point
+        for i, key in enumerate(keys):
+            if key in self._cache:
+                values[i] = self._cache[key]
+                self._cache[key] = self._cache.pop(key)   # most recently used
+                self.hits += 1
+            elif key in todo:
+                self.hits += 1
+            else:
+                todo[key] = i
+        if todo:
+            rows = list(todo.values())
+            chunks = _np.array_split(_np.array(rows), min(self.pool.processes, len(rows)))
+            results = self.pool.map(_evaluate_task, [(self.variables, X[chunk].tolist())
+                                                     for chunk in chunks])
+            for chunk, chunk_values in zip(chunks, results):
+                for i, v in zip(chunk, chunk_values):
+                    self._cache[keys[i]] = _np.array(v, dtype=_np.float64)
+            self.nfev += len(rows)
+            for i, key in enumerate(keys):
+                if key in todo:
+                    values[i] = self._cache[key]
+            while len(self._cache) > self.max_cache:
+                self._cache.popitem(last=False)
+        return values
+
+    def residuals(self, X):
+        """Return the weighted residuals (array of shape (numPoints, numOperands))
+        of the batch of points `X`. The merit function value is the norm of the
+        residuals of a point."""
+        return _np.sqrt(self.weights)*(self.operand_values(X) - self.targets)
+
+    def apply(self, x):
+        """Set the variables of the optical system to the values `x`"""
+        from pyzos.zos import _variable_cell
+        from pyzos.zosutils import wrapped_zos_object
+        system = self.osys._iopticalsystem
+        for variable, value in zip(self.variables, x):
+            # wrapped, so that the edits are tracked
+            wrapped_zos_object(_variable_cell(system, variable)).pDoubleValue = float(value)
+
+    def close(self):
+        """Stop the worker processes and remove the copy of the system"""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+            try:
+                _os.remove(self._filename)
+            except OSError:
+                pass
+
+#%% Optimizers
+def dls(residuals, x0, step=1e-6, damping=1e-3, max_iter=50, tol=1e-10, bounds=None,
+        factors=(0.1, 1.0, 10.0, 100.0)):
+    """Damped least squares (Levenberg-Marquardt) minimization of the norm of
+    the residuals
+
+    Each iteration evaluates one batch with the base point and the forward
+    difference points of the Jacobian, and one batch with the steps of the
+    damping factors `damping*factors`.
+
+    @param residuals: function returning the residuals (array of shape
+                      (numPoints, numResiduals)) of a batch of points
+    @param x0: initial point
+    @param step: finite-difference step
+    @param damping: initial damping factor (relative to the diagonal of J^T J)
+    @param max_iter: maximum number of iterations
+    @param tol: stop when the relative decrease of the merit function is below `tol`
+    @param bounds: optional (lower, upper) arrays of bounds of the variables
+    @param factors: multipliers of the damping factor tried in each iteration
+    @return: `optimize_result` namedtuple (x, fun, nit, nfev, history), where
+             `fun` is the norm of the residuals and `history` the list of `fun`
+             of each iteration
+    """
+    x = _np.asarray(x0, dtype=_np.float64).copy()
+    n = len(x)
+    factors = _np.asarray(factors, dtype=_np.float64)
+    lower, upper = (None, None) if bounds is None else map(_np.asarray, bounds)
+    nfev, history, nit = 0, [], 0
+    R = residuals(_np.vstack([x, x + step*_np.eye(n)]))
+    nfev += n + 1
+    fun = _np.linalg.norm(R[0])
+    history.append(fun)
+    for nit in range(1, max_iter + 1):
+        r = R[0]
+        J = (R[1:] - r).T/step
+        JtJ = J.T.dot(J)
+        g = J.T.dot(r)
+        diag = _np.diag(JtJ).copy()
+        diag[diag == 0] = 1.0
+        candidates = []
+        for mu in damping*factors:
+            try:
+                dx = _np.linalg.solve(JtJ + mu*_np.diag(diag), -g)
+            except _np.linalg.LinAlgError:
+                dx = _np.zeros(n)
+            xc = x + dx
+            if bounds is not None:
+                xc = _np.clip(xc, lower, upper)
+            candidates.append(xc)
+        candidates = _np.array(candidates)
+        funs = _np.linalg.norm(residuals(candidates), axis=1)
+        nfev += len(candidates)
+        best = int(_np.argmin(funs))
+        if funs[best] >= fun:
+            damping *= factors[-1]
+            if damping > 1e12:
+                break
+            continue
+        decrease = (fun - funs[best])/fun if fun else 0.0
+        x, fun = candidates[best], funs[best]
+        damping *= factors[best]
+        history.append(fun)
+        if decrease < tol:
+            break
+        R = residuals(_np.vstack([x, x + step*_np.eye(n)]))
+        nfev += n + 1
+    return optimize_result(x, fun, nit, nfev, history)
+
+def differential_evolution(func, bounds, popsize=15, max_iter=100, mutation=0.7,
+                           recombination=0.9, tol=1e-8, seed=None, x0=None):
+    """Differential evolution (DE/rand/1/bin) minimization; each generation is
+    evaluated as one batch
+
+    @param func: function returning the objective values (array of shape
+                 (numPoints,)) of a batch of points
+    @param bounds: (lower, upper) arrays of bounds of the variables
+    @param popsize: population size (multiplier of the number of variables)
+    @param max_iter: maximum number of generations
+    @param mutation: differential weight
+    @param recombination: crossover probability
+    @param tol: stop when the standard deviation of the objective values of
+                the population is below `tol` times their mean (absolute)
+    @param seed: seed of the random generator
+    @param x0: optional point included in the initial population
+    @return: `optimize_result` namedtuple (x, fun, nit, nfev, history), where
+             `history` is the list of best objective values of each generation
+    """
+    rs = _np.random.RandomState(seed)
+    lower, upper = [_np.asarray(b, dtype=_np.float64) for b in bounds]
+    n = len(lower)
+    size = max(popsize*n, 5)
+    pop = lower + rs.uniform(size=(size, n))*(upper - lower)
+    if x0 is not None:
+        pop[0] = _np.clip(x0, lower, upper)
+    fit = _np.asarray(func(pop), dtype=_np.float64)
+    nfev, history, nit = size, [fit.min()], 0
+    for nit in range(1, max_iter + 1):
+        idx = _np.array([rs.choice(_np.delete(_np.arange(size), i), 3, replace=False)
+                         for i in range(size)])
+        mutants = pop[idx[:, 0]] + mutation*(pop[idx[:, 1]] - pop[idx[:, 2]])
+        cross = rs.uniform(size=(size, n)) < recombination
+        cross[_np.arange(size), rs.randint(n, size=size)] = True
+        trials = _np.clip(_np.where(cross, mutants, pop), lower, upper)
+        trial_fit = _np.asarray(func(trials), dtype=_np.float64)
+        nfev += size
+        better = trial_fit <= fit
+        pop[better], fit[better] = trials[better], trial_fit[better]
+        history.append(fit.min())
+        if _np.std(fit) <= tol*abs(_np.mean(fit)):
+            break
+    best = int(_np.argmin(fit))
+    return optimize_result(pop[best], fit[best], nit, nfev, history)
+
+def particle_swarm(func, bounds, swarmsize=30, max_iter=100, inertia=0.72,
+                   cognitive=1.49, social=1.49, tol=1e-8, seed=None, x0=None):
+    """Particle swarm minimization (global best topology); each iteration is
+    evaluated as one batch
+
+    @param func: function returning the objective values (array of shape
+                 (numPoints,)) of a batch of points
+    @param bounds: (lower, upper) arrays of bounds of the variables
+    @param swarmsize: number of particles
+    @param max_iter: maximum number of iterations
+    @param inertia: inertia weight of the velocities
+    @param cognitive: acceleration towards the best point of each particle
+    @param social: acceleration towards the best point of the swarm
+    @param tol: stop when the best value improved by less than `tol` (relative)
+                over 20 iterations
+    @param seed: seed of the random generator
+    @param x0: optional point included in the initial swarm
+    @return: `optimize_result` namedtuple (x, fun, nit, nfev, history), where
+             `history` is the list of best objective values of each iteration
+    """
+    rs = _np.random.RandomState(seed)
+    lower, upper = [_np.asarray(b, dtype=_np.float64) for b in bounds]
+    n = len(lower)
+    span = upper - lower
+    pos = lower + rs.uniform(size=(swarmsize, n))*span
+    if x0 is not None:
+        pos[0] = _np.clip(x0, lower, upper)
+    vel = rs.uniform(-1.0, 1.0, size=(swarmsize, n))*span*0.1
+    fit = _np.asarray(func(pos), dtype=_np.float64)
+    best_pos, best_fit = pos.copy(), fit.copy()
+    g = int(_np.argmin(best_fit))
+    nfev, history, nit = swarmsize, [best_fit[g]], 0
+    for nit in range(1, max_iter + 1):
+        r1, r2 = rs.uniform(size=(2, swarmsize, n))
+        vel = (inertia*vel + cognitive*r1*(best_pos - pos) +
+               social*r2*(best_pos[g] - pos))
+        pos = _np.clip(pos + vel, lower, upper)
+        fit = _np.asarray(func(pos), dtype=_np.float64)
+        nfev += swarmsize
+        improved = fit < best_fit
+        best_pos[improved], best_fit[improved] = pos[improved], fit[improved]
+        g = int(_np.argmin(best_fit))
+        history.append(best_fit[g])
+        if nit >= 20 and history[-21] - history[-1] <= tol*abs(history[-21]):
+            break
+    return optimize_result(best_pos[g], best_fit[g], nit, nfev, history)
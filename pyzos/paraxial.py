@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        paraxial.py
+# Purpose:     Vectorized paraxial (y-nu) ray trace over LDE snapshots
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Local, vectorized paraxial (y-nu) ray trace engine.
+
+The engine computes first-order quantities (EFL, BFL, pupils, magnification,
+F/#, paraxial image height) and the marginal and chief ray data of a batch
+of lens variants at once. Each surface quantity is an array of shape
+(numVariant, numSurf) (a single lens of shape (numSurf,) is also accepted),
+so thousands of variants are traced with one pass over the surfaces.
+
+Conventions (same as OpticStudio)
+---------------------------------
+* surface 0 is the object surface and surface numSurf-1 is the image surface
+* `thickness[..., i]` is the distance from surface i to i+1 (inf for an
+  object at infinity)
+* `index[..., i]` is the refractive index of the medium following surface i;
+  index of the media following a mirror is negative (as are the thicknesses)
+* the entrance pupil position (`enpp`) is measured from surface 1 and the
+  exit pupil position (`expp`) from the image surface
+
+Example
+-------
+>>> import pyzos.zmxfile as zmx, pyzos.paraxial as par
+>>> lens = zmx.read_zmx('doublet.zmx')
+>>> fo = par.trace(**par.lens_model_inputs(lens))
+>>> fo.efl, fo.bfl, fo.enpp, fo.expd
+"""
+from __future__ import division, print_function
+import collections as _co
+import numpy as _np
+import pyzos.agf as _agf
+
+first_order = _co.namedtuple('first_order', ['efl', 'bfl', 'epd', 'enpp', 'expd', 'expp',
+                                             'mag', 'fno', 'wfno', 'image_height',
+                                             'lagrange', 'marginal', 'chief'])
+ray_data = _co.namedtuple('ray_data', ['y', 'nu', 'u'])
+
+#%% Input helpers
+def surface_indices(material, nd=None, catalog=None, wavelength=None, vd=None):
+    """Return the index of the medium following each surface
+
+    @param material: sequence of material names (blank for air, 'MIRROR' for mirrors)
+    @param nd: sequence of catalog (d-line) indices used if `catalog` is None
+    @param vd: sequence of catalog Abbe numbers; if given (and `catalog` is None),
+               the indices at `wavelength` are computed from nd and vd using the
+               model glass dispersion `pyzos.agf.model_index()`
+    @param catalog: `pyzos.agf.GlassCatalog` used to compute the indices at `wavelength`
+    @param wavelength: wavelength in micrometers (or sequence of wavelengths)
+    @return: array of shape (numSurf,) or (numWave, numSurf) if `wavelength` is a
+             sequence
+    """
+    waves = _np.atleast_1d(wavelength if wavelength is not None else 0.5875618)
+    n = _np.ones((len(waves), len(material)))
+    glass_surfs = [i for i, m in enumerate(material) if m and m != 'MIRROR']
+    if glass_surfs:
+        if catalog is not None:
+            n[:, glass_surfs] = catalog.index([material[i] for i in glass_surfs], waves).T
+        elif nd is not None and vd is not None:
+            n[:, glass_surfs] = _agf.model_index(_np.asarray(nd)[glass_surfs],
+                                                 _np.asarray(vd)[glass_surfs], waves).T
+        elif nd is not None:
+            n[:, glass_surfs] = _np.asarray(nd, dtype=_np.float64)[glass_surfs]
+    # reflection flips the sign of the index of all following media
+    sign = _np.cumprod([-1.0 if m == 'MIRROR' else 1.0 for m in material])
+    n = n*sign
+    return n[0] if _np.ndim(wavelength) == 0 else n
+
+def lens_model_inputs(lens, catalog=None, wavelength=None, field=None):
+    """Return the keyword arguments of `trace()` for a `pyzos.zmxfile.LensModel`
+
+    @param lens: `LensModel` instance
+    @param catalog: glass catalog for the indices; the catalog indices (nd) of
+                    the lens file are used if None
+    @param wavelength: wavelength in micrometers; primary wavelength if None
+    @param field: field value (in the units of the lens field type); the
+                  largest field of the lens if None
+    """
+    if wavelength is None:
+        wavelength = lens.wavelengths[lens.primary_wave - 1]
+    if field is None:
+        field = _np.hypot(lens.fields[:, 0], lens.fields[:, 1]).max() if len(lens.fields) else 0.0
+    if lens.aperture_type == 'ENPD':
+        aperture, aperture_type = lens.aperture_value, 'ENPD'
+    elif lens.aperture_type == 'FNUM':
+        aperture, aperture_type = lens.aperture_value, 'FNUM'
+    else:
+        raise NotImplementedError('Aperture type {} is not supported'.format(lens.aperture_type))
+    return dict(curvature=lens.curvature, thickness=lens.thickness,
+                index=surface_indices(lens.material, lens.nd, catalog, wavelength),
+                stop=lens.stop, aperture=aperture, aperture_type=aperture_type,
+                field=field, field_type=lens.field_type)
+
+def lde_array_inputs(lde_array, index, aperture, aperture_type='ENPD', field=0.0,
+                     field_type=0):
+    """Return the keyword arguments of `trace()` for a LDE snapshot returned by
+    `OpticalSystem.zGetLDEArray()`. The `index` array may be obtained using
+    `OpticalSystem.zGetIndexArray()`.
+    """
+    radius = _np.asarray(lde_array.radius, dtype=_np.float64)
+    with _np.errstate(divide='ignore'):
+        curvature = _np.where((radius == 0) | _np.isinf(radius), 0.0, 1.0/radius)
+    return dict(curvature=curvature, thickness=_np.asarray(lde_array.thick, dtype=_np.float64),
+                index=index, stop=lde_array.stop, aperture=aperture,
+                aperture_type=aperture_type, field=field, field_type=field_type)
+
+#%% Trace
+def _trace_basis(c, t, n, y1, nu1):
+    """Trace a ray starting at surface 1 with height `y1` and reduced angle
+    `nu1` (in object space). Returns arrays (y, nu) of shape (numVariant, numSurf),
+    where nu[:, i] is the reduced angle following surface i.
+    """
+    numVar, numSurf = c.shape
+    y = _np.zeros((numVar, numSurf))
+    nu = _np.zeros((numVar, numSurf))
+    y[:, 1], nu[:, 0] = y1, nu1
+    for i in range(1, numSurf - 1):
+        nu[:, i] = nu[:, i-1] - y[:, i]*c[:, i]*(n[:, i] - n[:, i-1])
+        y[:, i+1] = y[:, i] + nu[:, i]*t[:, i]/n[:, i]
+    nu[:, -1] = nu[:, -2]
+    return y, nu
+
+def trace(curvature, thickness, index, stop, aperture, aperture_type='ENPD', field=0.0,
+          field_type=0):
+    """Paraxial trace of a batch of lens variants
+
+    Parameters
+    ----------
+    curvature, thickness, index : array-like
+        surface data of shape (numSurf,) or (numVariant, numSurf). Arrays of
+        different shapes are broadcast against each other.
+    stop : integer
+        stop surface number
+    aperture : real or array-like of shape (numVariant,)
+        entrance pupil diameter (if `aperture_type` is 'ENPD') or image space
+        F/# (if `aperture_type` is 'FNUM')
+    field : real or array-like of shape (numVariant,)
+        field used for the chief ray; angle in degrees if `field_type` is 0, or
+        object height if `field_type` is 1.
+
+    Returns
+    -------
+    first_order : namedtuple
+        arrays of shape (numVariant,): `efl`, `bfl`, `epd`, `enpp`, `expd`, `expp`,
+        `mag` (lateral magnification, 0 for objects at infinity), `fno` (image
+        space F/#), `wfno` (paraxial working F/#), `image_height` (paraxial chief
+        ray height on the image surface), `lagrange` (Lagrange invariant); and
+        `ray_data` namedtuples `marginal` and `chief` with arrays `y`, `nu`
+        (reduced angle n*u) and `u` of shape (numVariant, numSurf).
+        All arrays are squeezed to scalars/1-D if the inputs were 1-D.
+    """
+    c, t, n = _np.broadcast_arrays(_np.atleast_2d(_np.asarray(curvature, dtype=_np.float64)),
+                                   _np.atleast_2d(_np.asarray(thickness, dtype=_np.float64)),
+                                   _np.atleast_2d(_np.asarray(index, dtype=_np.float64)))
+    single = (all(_np.ndim(a) <= 1 for a in (curvature, thickness, index)) and
+              _np.ndim(aperture) == 0 and _np.ndim(field) == 0)
+    numVar, numSurf = c.shape
+    if not 1 <= stop < numSurf - 1:
+        raise ValueError('Invalid stop surface {}'.format(stop))
+    n0 = n[:, 0]
+    t0 = t[:, 0]
+    infinite = _np.isinf(t0)
+
+    # Two independent basis rays; every paraxial ray is a linear combination
+    # (Y*a + U*b) where Y is the height on surface 1 and U the object space angle
+    ya, nua = _trace_basis(c, t, n, 1.0, 0.0)
+    yb, nub = _trace_basis(c, t, n, 0.0, n0)
+
+    # entrance pupil (image of the stop in object space), relative to surface 1
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        enpp = yb[:, stop]/ya[:, stop]
+    # effective and back focal lengths (from ray a)
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        efl = -1.0/nua[:, -1]
+        bfl = -ya[:, -2]*n[:, -2]/nua[:, -1]
+
+    aperture = _np.broadcast_to(_np.asarray(aperture, dtype=_np.float64), (numVar,))
+    field = _np.broadcast_to(_np.asarray(field, dtype=_np.float64), (numVar,))
+    if aperture_type == 'ENPD':
+        epd = aperture.copy()
+    elif aperture_type == 'FNUM':
+        epd = _np.abs(efl)/aperture
+    else:
+        raise NotImplementedError('Aperture type {} is not supported'.format(aperture_type))
+
+    # marginal ray (on-axis object point to the edge of the entrance pupil)
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        U_m = _np.where(infinite, 0.0, 0.5*epd/(t0 + enpp))
+        Y_m = _np.where(infinite, 0.5*epd, U_m*t0)
+    # chief ray (edge of field through the center of the entrance pupil)
+    if field_type == 0:
+        U_c = _np.tan(_np.radians(field))
+        Y_c = -U_c*enpp
+    elif field_type == 1:
+        with _np.errstate(divide='ignore', invalid='ignore'):
+            U_c = _np.where(infinite, 0.0, -field/(t0 + enpp))
+            Y_c = field + U_c*t0
+    else:
+        raise NotImplementedError('Field type {} is not supported'.format(field_type))
+
+    def combine(Y, U):
+        y = Y[:, None]*ya + U[:, None]*yb
+        nu = Y[:, None]*nua + U[:, None]*nub
+        return ray_data(y, nu, nu/n)
+    marginal, chief = combine(Y_m, U_m), combine(Y_c, U_c)
+
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        # exit pupil (relative to image surface)
+        z_xp = -chief.y[:, -2]/chief.u[:, -2]        # from last surface
+        expp = z_xp - t[:, -2]
+        expd = 2.0*_np.abs(marginal.y[:, -2] + marginal.u[:, -2]*z_xp)
+        mag = _np.where(infinite, 0.0, marginal.nu[:, 0]/marginal.nu[:, -1])
+        fno = _np.abs(efl/epd)
+        wfno = _np.abs(1.0/(2.0*marginal.nu[:, -1]))
+        lagrange = n0*(chief.u[:, 0]*marginal.y[:, 1] - marginal.u[:, 0]*chief.y[:, 1])
+    image_height = chief.y[:, -1]
+
+    result = first_order(efl, bfl, epd, enpp, expd, expp, mag, fno, wfno, image_height,
+                         lagrange, marginal, chief)
+    if single:
+        result = first_order(*([float(a[0]) for a in result[:11]] +
+                               [ray_data(*(a[0] for a in result.marginal)),
+                                ray_data(*(a[0] for a in result.chief))]))
+    return result
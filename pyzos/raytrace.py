@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        raytrace.py
+# Purpose:     Local batched real-ray tracer for sequential rotationally
+#              symmetric surfaces
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Local, vectorized real-ray tracer for sequential systems made of standard
+(spherical/conic) and even asphere surfaces.
+
+Ray bundles are NumPy arrays and every surface is processed for all rays at
+once. Large bundles may optionally be split across a process pool. The
+intended use is a cheap first-pass evaluation (for example spot size) of
+large populations of candidate designs before anything touches OpticStudio.
+
+Limitations
+-----------
+* only 'STANDARD' and 'EVENASPH' surfaces (no tilts/decenters, no coordinate
+  breaks)
+* rays are aimed paraxially at the entrance pupil (no real ray aiming)
+
+The tracer can be validated against OpticStudio's `IBatchRayTrace` output
+recorded with `OpticalSystem.zRecordRayTraceFixture()` using
+`compare_with_fixture()`.
+
+Example
+-------
+>>> import pyzos.zmxfile as zmx, pyzos.raytrace as rt
+>>> lens = rt.RealLens.from_lens_model(zmx.read_zmx('doublet.zmx'))
+>>> res = rt.trace_normalized(lens, hy=1.0, px=px, py=py, wave=0)
+>>> rt.spot_rms(res)
+"""
+from __future__ import division, print_function
+import collections as _co
+import multiprocessing as _mp
+import numpy as _np
+import pyzos.paraxial as _par
+
+#%% Module constants
+NUM_ASPHERE_TERMS = 8          # even asphere terms r^2 ... r^16 (PARM 1 ... PARM 8)
+MAX_NEWTON_ITERATIONS = 20
+NEWTON_TOLERANCE = 1e-12
+
+SURFACE_TYPES = {'STANDARD' : 'STANDARD', 'Standard' : 'STANDARD',
+                 'EVENASPH' : 'EVENASPH', 'Even Asphere' : 'EVENASPH',}
+
+ray_result = _co.namedtuple('ray_result', ['x', 'y', 'z', 'l', 'm', 'n', 'vignetted'])
+
+#%% Lens data
+class RealLens(object):
+    """Surface data for the real-ray tracer
+
+    All arrays have the length `numSurf` (object and image surfaces included);
+    `index` has shape (numWave, numSurf) and follows the sign convention of
+    `pyzos.paraxial` (negative index following a mirror).
+    """
+    def __init__(self, curvature, conic, asphere, thickness, index, semidia, stop,
+                 wavelengths, aperture, field_type=0, fields=None, surf_type=None):
+        self.curvature = _np.asarray(curvature, dtype=_np.float64)
+        self.conic = _np.asarray(conic, dtype=_np.float64)
+        self.asphere = _np.asarray(asphere, dtype=_np.float64)
+        self.thickness = _np.asarray(thickness, dtype=_np.float64)
+        self.index = _np.atleast_2d(_np.asarray(index, dtype=_np.float64))
+        self.semidia = _np.asarray(semidia, dtype=_np.float64)
+        self.stop = stop
+        self.wavelengths = _np.atleast_1d(_np.asarray(wavelengths, dtype=_np.float64))
+        self.aperture = aperture        # entrance pupil diameter
+        self.field_type = field_type
+        self.fields = _np.zeros((1, 2)) if fields is None else _np.asarray(fields)
+        surf_type = surf_type or ['STANDARD']*len(self.curvature)
+        unsupported = [t for t in surf_type if t not in SURFACE_TYPES]
+        if unsupported:
+            raise NotImplementedError('Surface type(s) {} not supported'.format(unsupported))
+        self.surf_type = [SURFACE_TYPES[t] for t in surf_type]
+
+    def __repr__(self):
+        return "{.__name__}(numSurf={}, numWave={})".format(type(self), self.numSurf,
+                                                            len(self.wavelengths))
+
+    @property
+    def numSurf(self):
+        return len(self.curvature)
+
+    @property
+    def max_field(self):
+        return float(_np.hypot(self.fields[:, 0], self.fields[:, 1]).max())
+
+    @classmethod
+    def from_lens_model(cls, lens, catalog=None):
+        """Create from a `pyzos.zmxfile.LensModel`. The indices at the lens
+        wavelengths are computed using the glass `catalog` if given, else with
+        a model dispersion derived from the catalog nd and vd of the lens file.
+        """
+        index = _par.surface_indices(lens.material, lens.nd, catalog, list(lens.wavelengths),
+                                     vd=lens.vd)
+        asphere = _np.where(_np.array([t == 'EVENASPH' for t in lens.surf_type])[:, None],
+                            lens.parm[:, :NUM_ASPHERE_TERMS], 0.0)
+        first = _par.lens_model_inputs(lens, catalog)
+        epd = (first['aperture'] if first['aperture_type'] == 'ENPD' else
+               _par.trace(**first).epd)
+        return cls(lens.curvature, lens.conic, asphere, lens.thickness, index, lens.semidia,
+                   lens.stop, lens.wavelengths, epd, lens.field_type, lens.fields,
+                   lens.surf_type)
+
+    @classmethod
+    def from_lde_array(cls, lde_array, index, wavelengths, aperture, field_type=0, fields=None):
+        """Create from a LDE snapshot returned by `OpticalSystem.zGetLDEArray()`
+
+        @param index: indices returned by `OpticalSystem.zGetIndexArray()` for each
+                      wavelength, shape (numWave, numSurf)
+        @param aperture: entrance pupil diameter
+        """
+        radius = _np.asarray(lde_array.radius, dtype=_np.float64)
+        with _np.errstate(divide='ignore'):
+            curvature = _np.where((radius == 0) | _np.isinf(radius), 0.0, 1.0/radius)
+        asphere = _np.where(_np.array([SURFACE_TYPES.get(t) == 'EVENASPH'
+                                       for t in lde_array.surftype])[:, None],
+                            lde_array.parm[:, :NUM_ASPHERE_TERMS], 0.0)
+        return cls(curvature, lde_array.conic, asphere, lde_array.thick, index,
+                   lde_array.semidia, lde_array.stop, wavelengths, aperture, field_type,
+                   fields, lde_array.surftype)
+
+    def paraxial(self, wave=0):
+        """Paraxial first-order data at wavelength number `wave` (0-based)"""
+        return _par.trace(self.curvature, self.thickness, self.index[wave], self.stop,
+                          self.aperture, 'ENPD', self.max_field, self.field_type)
+
+#%% Surface geometry
+def _sag_and_slope(c, k, a, rho):
+    """Sag z and g = (dz/dr)/r of the surface as functions of rho = r^2"""
+    root = _np.sqrt(_np.maximum(1.0 - (1.0 + k)*c*c*rho, 0.0))
+    z = c*rho/(1.0 + root)
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        g = _np.where(root > 0, c/root, _np.inf)
+    rho_i = _np.ones_like(rho)
+    for i in range(len(a)):
+        if a[i]:
+            g = g + 2.0*(i + 1)*a[i]*rho_i
+            z = z + a[i]*rho_i*rho
+        rho_i = rho_i*rho
+    return z, g
+
+def _intersect(P, D, c, k, a):
+    """Intersect rays (P, D) given in the vertex coordinates of the surface.
+    Returns the intersection points, unit normals and a mask of failed rays."""
+    Px, Py, Pz = P
+    Dx, Dy, Dz = D
+    kk = 1.0 + k
+    # conic intersection (closed form)
+    A = c*(Dx*Dx + Dy*Dy + kk*Dz*Dz)
+    B = c*(Px*Dx + Py*Dy + kk*Pz*Dz) - Dz
+    C = c*(Px*Px + Py*Py + kk*Pz*Pz) - 2.0*Pz
+    disc = B*B - A*C
+    failed = disc < 0
+    with _np.errstate(invalid='ignore', divide='ignore'):
+        s = C/(-B + _np.sign(Dz)*_np.sqrt(_np.maximum(disc, 0.0)))
+    if _np.any(a):
+        # refine with Newton's method on the full aspheric sag
+        for _ in range(MAX_NEWTON_ITERATIONS):
+            X, Y, Z = Px + s*Dx, Py + s*Dy, Pz + s*Dz
+            z, g = _sag_and_slope(c, k, a, X*X + Y*Y)
+            f = Z - z
+            df = Dz - g*(X*Dx + Y*Dy)
+            with _np.errstate(invalid='ignore', divide='ignore'):
+                ds = f/df
+            s = s - ds
+            if not _np.any(_np.abs(ds[~failed]) > NEWTON_TOLERANCE):
+                break
+    X, Y, Z = Px + s*Dx, Py + s*Dy, Pz + s*Dz
+    _, g = _sag_and_slope(c, k, a, X*X + Y*Y)
+    Nx, Ny, Nz = -X*g, -Y*g, _np.ones_like(X)
+    norm = _np.sqrt(Nx*Nx + Ny*Ny + Nz*Nz)
+    failed |= ~_np.isfinite(s) | ~_np.isfinite(norm)
+    return (X, Y, Z), (Nx/norm, Ny/norm, Nz/norm), failed
+
+def _refract(D, N, n1, n2):
+    """Refract (or reflect, if the signs of n1 and n2 differ) unit direction
+    vectors D at surfaces with unit normals N. Returns new directions and a
+    mask of rays with total internal reflection."""
+    Dx, Dy, Dz = D
+    Nx, Ny, Nz = N
+    cosI = Dx*Nx + Dy*Ny + Dz*Nz
+    if n1*n2 < 0:  # mirror
+        return (Dx - 2*cosI*Nx, Dy - 2*cosI*Ny, Dz - 2*cosI*Nz), _np.zeros(Dx.shape, bool)
+    sgn = _np.sign(cosI)
+    mu = abs(n1)/abs(n2)
+    cos2 = 1.0 - mu*mu*(1.0 - cosI*cosI)
+    tir = cos2 < 0
+    gamma = sgn*_np.sqrt(_np.maximum(cos2, 0.0)) - mu*cosI
+    return (mu*Dx + gamma*Nx, mu*Dy + gamma*Ny, mu*Dz + gamma*Nz), tir
+
+#%% Tracing
+def trace(lens, P, D, wave=0, to_surf=None, clip=False):
+    """Trace rays through the lens
+
+    Parameters
+    ----------
+    lens : RealLens
+    P : array of shape (3, numRay)
+        ray positions in the local coordinates of surface 1 (the ray must be
+        located in front of surface 1)
+    D : array of shape (3, numRay)
+        ray direction cosines in object space
+    wave : integer
+        wavelength number (0-based index into `lens.wavelengths`)
+    to_surf : integer, optional
+        last surface to trace to; default is the image surface
+    clip : boolean
+        if `True`, rays falling outside the semi-diameter of a surface are
+        marked as vignetted
+
+    Returns
+    -------
+    ray_result : namedtuple
+        arrays `x`, `y`, `z` (in the local coordinates of `to_surf`), `l`, `m`,
+        `n` and the boolean mask `vignetted`
+    """
+    to_surf = lens.numSurf - 1 if to_surf is None else to_surf % lens.numSurf
+    P = tuple(_np.array(p, dtype=_np.float64) for p in P)
+    D = tuple(_np.array(d, dtype=_np.float64) for d in D)
+    vignetted = _np.zeros(P[0].shape, bool)
+    n = lens.index[wave]
+    for i in range(1, to_surf + 1):
+        if i > 1:
+            P = (P[0], P[1], P[2] - lens.thickness[i-1])
+        P, N, failed = _intersect(P, D, lens.curvature[i], lens.conic[i], lens.asphere[i])
+        vignetted |= failed
+        if clip and lens.semidia[i] > 0:
+            vignetted |= P[0]**2 + P[1]**2 > lens.semidia[i]**2
+        D, tir = _refract(D, N, n[i-1], n[i])
+        vignetted |= tir
+    return ray_result(P[0], P[1], P[2], D[0], D[1], D[2], vignetted)
+
+def launch_rays(lens, hx, hy, px, py, wave=0):
+    """Generate rays for normalized field (`hx`, `hy`) and normalized pupil
+    (`px`, `py`) coordinates, as used by OpticStudio's `IBatchRayTrace`.
+
+    @return: tuple (P, D) of arrays of shape (3, numRay) as required by `trace()`
+    """
+    px, py = _np.broadcast_arrays(_np.asarray(px, dtype=_np.float64),
+                                  _np.asarray(py, dtype=_np.float64))
+    px, py = px.ravel(), py.ravel()
+    fo = lens.paraxial(wave)
+    field = lens.max_field
+    rp = 0.5*lens.aperture
+    ex, ey, ez = px*rp, py*rp, _np.full(px.shape, fo.enpp)  # entrance pupil points
+    t0 = lens.thickness[0]
+    if _np.isinf(t0):
+        if lens.field_type != 0:
+            raise NotImplementedError('Only angle fields are supported for objects at infinity')
+        tx, ty = _np.tan(_np.radians(hx*field)), _np.tan(_np.radians(hy*field))
+        norm = _np.sqrt(1.0 + tx*tx + ty*ty)
+        D = _np.vstack([_np.full(px.shape, tx/norm), _np.full(px.shape, ty/norm),
+                        _np.full(px.shape, 1.0/norm)])
+        # start rays in a plane in front of surface 1 (and its sag)
+        z0 = min(0.0, fo.enpp) - _np.abs(lens.semidia[1:]).max() - rp - 1.0
+        s = (z0 - ez)/D[2]
+        P = _np.vstack([ex + s*D[0], ey + s*D[1], ez + s*D[2]])
+    else:
+        if lens.field_type != 1:
+            raise NotImplementedError('Only object height fields are supported for finite objects')
+        P = _np.vstack([_np.full(px.shape, hx*field), _np.full(px.shape, hy*field),
+                        _np.full(px.shape, -t0)])
+        D = _np.vstack([ex - P[0], ey - P[1], ez - P[2]])
+        D = D/_np.sqrt((D*D).sum(axis=0))
+    return P, D
+
+def _trace_chunk(args):
+    lens, P, D, wave, to_surf, clip = args
+    return trace(lens, P, D, wave, to_surf, clip)
+
+def trace_normalized(lens, hx=0.0, hy=0.0, px=0.0, py=0.0, wave=0, to_surf=None,
+                     clip=False, processes=None, chunksize=100000):
+    """Launch and trace rays defined by normalized field and pupil coordinates
+
+    @param processes: if greater than 1, bundles larger than `chunksize` rays
+                      are split into chunks traced in a process pool
+    @return: `ray_result` namedtuple
+    """
+    P, D = launch_rays(lens, hx, hy, px, py, wave)
+    numRay = P.shape[1]
+    if not processes or processes < 2 or numRay <= chunksize:
+        return trace(lens, P, D, wave, to_surf, clip)
+    chunks = [(lens, P[:, j:j + chunksize], D[:, j:j + chunksize], wave, to_surf, clip)
+              for j in range(0, numRay, chunksize)]
+    pool = _mp.Pool(processes)
+    try:
+        results = pool.map(_trace_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    return ray_result(*[_np.concatenate(a) for a in zip(*results)])
+
+#%% Ray bundles and spot data
+def hexapolar_pupil(rings):
+    """Normalized pupil coordinates (px, py) of a hexapolar grid"""
+    px, py = [0.0], [0.0]
+    for r in range(1, rings + 1):
+        theta = _np.arange(6*r)*2*_np.pi/(6*r)
+        px.extend(r/rings*_np.sin(theta))
+        py.extend(r/rings*_np.cos(theta))
+    return _np.array(px), _np.array(py)
+
+def square_pupil(grid):
+    """Normalized pupil coordinates (px, py) of a square grid within the unit circle"""
+    u = _np.linspace(-1, 1, grid)
+    px, py = _np.meshgrid(u, u)
+    inside = px**2 + py**2 <= 1.0
+    return px[inside], py[inside]
+
+def spot_rms(result, reference='centroid'):
+    """RMS spot radius of the traced (non-vignetted) rays
+
+    @param reference: 'centroid' or 'chief' (the first ray is assumed to be the
+                      chief ray, as in `hexapolar_pupil()`)
+    """
+    ok = ~result.vignetted
+    x, y = result.x[ok], result.y[ok]
+    if reference == 'chief':
+        x0, y0 = result.x[0], result.y[0]
+    else:
+        x0, y0 = x.mean(), y.mean()
+    return float(_np.sqrt(((x - x0)**2 + (y - y0)**2).mean()))
+
+#%% Validation against IBatchRayTrace fixtures
+def load_fixture(filename):
+    """Load a ray trace fixture recorded by `OpticalSystem.zRecordRayTraceFixture()`
+
+    @return: tuple (lens, inputs, expected) where `lens` is a `RealLens`, inputs
+             is a dict with keys 'hx', 'hy', 'px', 'py', 'wave' and expected is a
+             `ray_result` (with the vignetted flag from the OpticStudio error
+             and vignette codes)
+    """
+    with _np.load(filename) as f:
+        d = dict((k, f[k]) for k in f.files)
+    lens = RealLens(d['curvature'], d['conic'], d['asphere'], d['thickness'], d['index'],
+                    d['semidia'], int(d['stop']), d['wavelengths'], float(d['aperture']),
+                    int(d['field_type']), d['fields'], list(d['surftype']))
+    inputs = dict((k, d[k]) for k in ('hx', 'hy', 'px', 'py', 'wave'))
+    expected = ray_result(d['x'], d['y'], d['z'], d['l'], d['m'], d['n'], d['vignetted'])
+    return lens, inputs, expected
+
+def compare_with_fixture(filename):
+    """Trace the rays of a recorded `IBatchRayTrace` fixture locally and return
+    the maximum absolute deviations of positions and direction cosines
+
+    @return: tuple (max_position_error, max_direction_error, num_compared)
+    """
+    lens, inputs, expected = load_fixture(filename)
+    dpos, ddir, count = 0.0, 0.0, 0
+    waves = inputs['wave']
+    for wave in _np.unique(waves):
+        for hx, hy in set(zip(inputs['hx'][waves == wave], inputs['hy'][waves == wave])):
+            sel = (waves == wave) & (inputs['hx'] == hx) & (inputs['hy'] == hy)
+            res = trace_normalized(lens, hx, hy, inputs['px'][sel], inputs['py'][sel],
+                                   int(wave), clip=True)
+            ok = ~(res.vignetted | expected.vignetted[sel])
+            if not ok.any():
+                continue
+            dpos = max(dpos, max(_np.abs(getattr(res, a)[ok] - getattr(expected, a)[sel][ok]).max()
+                                 for a in 'xyz'))
+            ddir = max(ddir, max(_np.abs(getattr(res, a)[ok] - getattr(expected, a)[sel][ok]).max()
+                                 for a in 'lmn'))
+            count += int(ok.sum())
+    return dpos, ddir, count
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        resultcache.py
+# Purpose:     On-disk, size-bounded LRU cache of analysis results
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""On-disk cache of analysis results (NumPy arrays) with a byte budget and
+least-recently-used (LRU) eviction.
+
+Each entry is a set of named arrays, stored as .npy files (so that cache hits
+are served as memory-mapped arrays), and JSON metadata. The entries are
+indexed in a SQLite database in the cache directory, so the cache can be
+shared across sessions and processes.
+
+The analysis results of OpticStudio are cached by `OpticalSystem.zApplyAnalysis()`,
+keyed on the content fingerprint of the system (`OpticalSystem.zFingerprint()`),
+the analysis type and the analysis settings.
+
+Example
+-------
+>>> from pyzos.resultcache import ResultCache
+>>> cache = ResultCache('analysis_cache', max_bytes=2*1024**3)
+>>> mtf = osys.pAnalyses.New_FftMtf()
+>>> data = osys.zApplyAnalysis(mtf, cache)   # runs the analysis
+>>> data = osys.zApplyAnalysis(mtf, cache)   # served from the cache
+>>> data.series[0].y
+"""
+from __future__ import division, print_function
+import os as _os
+import json as _json
+import time as _time
+import shutil as _shutil
+import sqlite3 as _sqlite3
+import hashlib as _hashlib
+import collections as _co
+import numpy as _np
+
+#%% Analysis data containers
+analysis_data = _co.namedtuple('analysis_data', ['grids', 'series', 'header'])
+data_grid = _co.namedtuple('data_grid', ['description', 'values', 'min_x', 'min_y',
+                                         'dx', 'dy', 'x_label', 'y_label', 'value_label'])
+data_series = _co.namedtuple('data_series', ['description', 'x', 'y', 'x_label',
+                                             'series_labels'])
+
+def pack_analysis_data(data):
+    """Return (arrays, meta) representation of `analysis_data` for `ResultCache.put()`"""
+    arrays, grids, series = {}, [], []
+    for i, grid in enumerate(data.grids):
+        arrays['grid{}'.format(i)] = grid.values
+        grids.append(dict((k, v) for k, v in grid._asdict().items() if k != 'values'))
+    for i, ser in enumerate(data.series):
+        arrays['series{}_x'.format(i)] = ser.x
+        arrays['series{}_y'.format(i)] = ser.y
+        series.append(dict((k, v) for k, v in ser._asdict().items() if k not in ('x', 'y')))
+    return arrays, {'grids': grids, 'series': series, 'header': data.header}
+
+def unpack_analysis_data(arrays, meta):
+    """Return `analysis_data` from the (arrays, meta) returned by `ResultCache.get()`"""
+    grids = [data_grid(values=arrays['grid{}'.format(i)], **g)
+             for i, g in enumerate(meta['grids'])]
+    series = [data_series(x=arrays['series{}_x'.format(i)], y=arrays['series{}_y'.format(i)], **s)
+              for i, s in enumerate(meta['series'])]
+    return analysis_data(grids, series, meta['header'])
+
+#%% Cache
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key     TEXT PRIMARY KEY,
+    nbytes  INTEGER,
+    atime   REAL,
+    ctime   REAL,
+    arrays  TEXT,
+    meta    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_atime ON entries (atime);
+"""
+
+def make_key(*parts):
+    """Return cache key (hex string) from the `repr()` of the given parts"""
+    return _hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+class ResultCache(object):
+    """On-disk LRU cache of named NumPy arrays with a byte budget"""
+    def __init__(self, directory, max_bytes=1024**3):
+        """
+        @param directory: cache directory (created if it doesn't exist)
+        @param max_bytes: byte budget; the least recently used entries are evicted
+                          when the total size of the entries exceeds it
+        """
+        self.directory = _os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        if not _os.path.isdir(self.directory):
+            _os.makedirs(self.directory)
+        self._db = _sqlite3.connect(_os.path.join(self.directory, 'index.db'))
+        self._db.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return ("{.__name__}('{}', max_bytes={}, numEntries={}, nbytes={})"
+                .format(type(self), self.directory, self.max_bytes, len(self), self.nbytes))
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def __contains__(self, key):
+        return self._db.execute('SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone() is not None
+
+    @property
+    def nbytes(self):
+        """total size (bytes) of the cached entries"""
+        return self._db.execute('SELECT COALESCE(SUM(nbytes), 0) FROM entries').fetchone()[0]
+
+    make_key = staticmethod(make_key)
+
+    def _entry_dir(self, key):
+        return _os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, mmap=True):
+        """Return the entry `key` as (arrays, meta), or `None` if it isn't cached
+
+        @param mmap: if `True`, the arrays are read-only memory-mapped arrays
+        """
+        row = self._db.execute('SELECT arrays, meta FROM entries WHERE key = ?',
+                               (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        entry_dir = self._entry_dir(key)
+        try:
+            arrays = dict((name, _np.load(_os.path.join(entry_dir, name + '.npy'),
+                                          mmap_mode='r' if mmap else None))
+                          for name in _json.loads(row[0]))
+        except (IOError, OSError, ValueError):   # entry removed or corrupted
+            self.remove(key)
+            self.misses += 1
+            return None
+        with self._db:
+            self._db.execute('UPDATE entries SET atime = ? WHERE key = ?', (_time.time(), key))
+        self.hits += 1
+        return arrays, _json.loads(row[1])
+
+    def put(self, key, arrays, meta=None):
+        """Store the dictionary of arrays `arrays` and the JSON serializable
+        metadata `meta` as entry `key`, and evict entries exceeding the budget
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = '{}.{}.tmp'.format(entry_dir, _os.getpid())
+        _shutil.rmtree(tmp_dir, ignore_errors=True)
+        _os.makedirs(tmp_dir)
+        nbytes = 0
+        for name, array in arrays.items():
+            filename = _os.path.join(tmp_dir, name + '.npy')
+            _np.save(filename, _np.ascontiguousarray(array))
+            nbytes += _os.path.getsize(filename)
+        _shutil.rmtree(entry_dir, ignore_errors=True)
+        _os.rename(tmp_dir, entry_dir)
+        now = _time.time()
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, nbytes, now, now, _json.dumps(sorted(arrays)),
+                              _json.dumps(meta)))
+        self.evict()
+
+    def remove(self, key):
+        """Remove the entry `key`"""
+        with self._db:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+        # files that are memory-mapped (on Windows) are removed on a later eviction
+        _shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def evict(self, max_bytes=None):
+        """Remove the least recently used entries until the total size is within
+        `max_bytes` (default is the byte budget of the cache)
+
+        @return: number of entries removed
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        total = self.nbytes
+        removed = 0
+        if total <= max_bytes:
+            return removed
+        for key, nbytes in self._db.execute('SELECT key, nbytes FROM entries '
+                                            'ORDER BY atime').fetchall():
+            if total <= max_bytes:
+                break
+            self.remove(key)
+            total -= nbytes
+            removed += 1
+        return removed
+
+    def clear(self):
+        """Remove all entries"""
+        return self.evict(0)
+
+    def close(self):
+        """Close the cache index"""
+        self._db.close()
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        scheduler.py
+# Purpose:     Priority job scheduler with request coalescing for analyses and tools
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Priority job scheduler for the analyses and tools of optical systems.
+
+Jobs are queued by priority (`INTERACTIVE` jobs run before `NORMAL` jobs,
+which run before `BULK` jobs); within a priority, the callers are served in
+turn, so that a caller submitting a large sweep doesn't starve the others.
+Jobs with the same key (for analyses and tools: the system fingerprint, the
+analysis or tool, and the settings) that are pending or running are
+coalesced: they are computed once, and all the submitters get the result.
+Pending jobs can be cancelled; running tool jobs are cancelled with the
+tool's `Cancel()`.
+
+The jobs are run by the worker thread(s) of the scheduler, one at a time per
+thread (one thread by default). The ZOS-API objects belong to the thread that
+created them, so the analysis and tool jobs of a system are run by a
+`pyzos.comthread.COMThreadPoolExecutor` of the system (with as many workers as
+the scheduler), on interfaces marshalled for its worker threads; the executor
+is created, the first time the system is submitted, in the submitting thread,
+which must be the thread owning the system.
+
+Example
+-------
+>>> from pyzos.scheduler import Scheduler, INTERACTIVE, BULK
+>>> scheduler = Scheduler()
+>>> sweep = [scheduler.submit_analysis(osys, 'FftMtf', {'MaximumFrequency': f},
+...                                    priority=BULK, caller='sweep')
+...          for f in range(50, 500, 10)]
+>>> spot = scheduler.submit_analysis(osys, 'StandardSpot', priority=INTERACTIVE)
+>>> spot.result().series       # runs before the pending sweep jobs
+>>> scheduler.metrics()
+"""
+from __future__ import division, print_function
+import time as _time
+import threading as _threading
+import collections as _co
+import numpy as _np
+import pyzos.comthread as _comthread
+
+INTERACTIVE, NORMAL, BULK = 0, 1, 2
+PRIORITIES = (INTERACTIVE, NORMAL, BULK)
+
+class CancelledError(Exception): pass
+
+scheduler_metrics = _co.namedtuple('scheduler_metrics', [
+    'queue_depth', 'running', 'submitted', 'coalesced', 'completed', 'failed', 'cancelled',
+    'wait_mean', 'wait_p95', 'run_mean', 'run_p95'])
+
+class _Task(object):
+    """Unit of work shared by the coalesced jobs"""
+    def __init__(self, func, args, kwargs, priority, caller, key, interrupt):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.caller = caller
+        self.key = key
+        self.interrupt = interrupt   # callable cancelling the task while it runs
+        self.jobs = []               # jobs (handles) waiting for the task
+        self.state = 'pending'       # 'pending', 'running', 'done', 'cancelled'
+        self.result = None
+        self.error = None
+        self.submitted = _time.time()
+        self.started = None
+        self.finished = None
+        self.done = _threading.Event()
+
+class Job(object):
+    """Handle of a submitted job"""
+    def __init__(self, scheduler, task):
+        self._scheduler = scheduler
+        self._task = task
+        self.cancelled = False
+
+    def __repr__(self):
+        return '<{.__name__} key={!r} priority={} state={}>'.format(
+            type(self), self._task.key, self._task.priority, self.state)
+
+    @property
+    def state(self):
+        """'pending', 'running', 'done' or 'cancelled'"""
+        return 'cancelled' if self.cancelled else self._task.state
+
+    def done(self):
+        """Whether the job finished (or was cancelled)"""
+        return self.cancelled or self._task.done.is_set()
+
+    def result(self, timeout=None):
+        """Return the result of the job (waiting up to `timeout` seconds); raises
+        the exception of the job, or `CancelledError` if it was cancelled"""
+        if not self.cancelled and not self._task.done.wait(timeout):
+            raise RuntimeError('Timeout waiting for {!r}'.format(self))
+        if self.cancelled or self._task.state == 'cancelled':
+            raise CancelledError('{!r} was cancelled'.format(self))
+        if self._task.error is not None:
+            raise self._task.error
+        return self._task.result
+
+    def cancel(self):
+        """Cancel the job. The shared task is cancelled when all its jobs are
+        cancelled; a running task is interrupted if it supports it.
+
+        @return: whether the job was cancelled (`False` if it had finished)
+        """
+        return self._scheduler._cancel(self)
+
+class Scheduler(object):
+    """Priority job scheduler with coalescing of identical jobs"""
+    def __init__(self, workers=1, history=1000, com=None):
+        """
+        @param workers: number of worker threads
+        @param history: number of finished jobs kept for the latency metrics
+        @param com: COM layer of the executors running the analysis and tool
+                    jobs (see `pyzos.comthread`; default `PythonCOM()`)
+        """
+        self._com = com
+        self._executors = {}       # id(osys) : (osys, COMThreadPoolExecutor)
+        self._cond = _threading.Condition()
+        self._queues = dict((p, _co.OrderedDict()) for p in PRIORITIES)  # caller : deque
+        self._by_key = {}          # key : pending or running task
+        self._running = set()
+        self._waits = _co.deque(maxlen=history)
+        self._runs = _co.deque(maxlen=history)
+        self._counts = _co.Counter()
+        self._stopped = False
+        self._threads = []
+        for _ in range(workers):
+            thread = _threading.Thread(target=self._work_loop)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __repr__(self):
+        return '{.__name__}(workers={}, queued={})'.format(type(self), len(self._threads),
+                                                           self.queue_depth())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+    def submit(self, func, args=(), kwargs=None, priority=NORMAL, caller=None, key=None,
+               interrupt=None):
+        """Submit the job `func(*args, **kwargs)`
+
+        @param priority: `INTERACTIVE`, `NORMAL` or `BULK`
+        @param caller: identifier of the submitter (for fairness)
+        @param key: hashable key; a job with the same key as a pending or running
+                    job shares its result. If the new job has a higher priority,
+                    the pending task is moved up.
+        @param interrupt: callable that cancels the job while it runs
+        @return: `Job`
+        """
+        if priority not in PRIORITIES:
+            raise ValueError('Unknown priority {}'.format(priority))
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError('The scheduler is shut down')
+            self._counts['submitted'] += 1
+            task = self._by_key.get(key) if key is not None else None
+            if task is not None:
+                self._counts['coalesced'] += 1
+                if task.state == 'pending' and priority < task.priority:
+                    self._dequeue(task)
+                    task.priority = priority
+                    self._enqueue(task)
+            else:
+                task = _Task(func, tuple(args), kwargs or {}, priority, caller, key, interrupt)
+                if key is not None:
+                    self._by_key[key] = task
+                self._enqueue(task)
+                self._cond.notify()
+            job = Job(self, task)
+            task.jobs.append(job)
+            return job
+
+    def _enqueue(self, task):
+        self._queues[task.priority].setdefault(task.caller, _co.deque()).append(task)
+
+    def _dequeue(self, task):
+        queue = self._queues[task.priority].get(task.caller)
+        if queue is not None and task in queue:
+            queue.remove(task)
+            if not queue:
+                del self._queues[task.priority][task.caller]
+
+    def _next_task(self):
+        """Returns the next pending task: highest priority, callers in turn"""
+        for priority in PRIORITIES:
+            callers = self._queues[priority]
+            while callers:
+                caller, queue = next(iter(callers.items()))
+                task = queue.popleft()
+                del callers[caller]
+                if queue:
+                    callers[caller] = queue   # caller goes to the back of the line
+                return task
+        return None
+
+    def _cancel(self, job):
+        with self._cond:
+            task = job._task
+            if job.cancelled or task.state in ('done', 'cancelled'):
+                return False
+            job.cancelled = True
+            task.jobs.remove(job)
+            self._counts['cancelled'] += 1
+            if task.jobs:
+                return True
+            if task.state == 'pending':
+                self._dequeue(task)
+                self._finish(task, 'cancelled')
+                return True
+            interrupt = task.interrupt
+        if interrupt is not None:
+            interrupt()
+        return True
+
+    def _finish(self, task, state):
+        task.state = state
+        task.finished = _time.time()
+        if self._by_key.get(task.key) is task:
+            del self._by_key[task.key]
+        task.done.set()
+
+    def _work_loop(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None and not self._stopped:
+                    self._cond.wait()
+                    task = self._next_task()
+                if task is None:
+                    return
+                task.state = 'running'
+                task.started = _time.time()
+                self._running.add(task)
+            try:
+                task.result = task.func(*task.args, **task.kwargs)
+            except Exception as e:
+                task.error = e
+            with self._cond:
+                self._running.discard(task)
+                if not task.jobs:
+                    state = 'cancelled'
+                else:
+                    state = 'done'
+                    self._counts['failed' if task.error is not None else 'completed'] += 1
+                self._waits.append(task.started - task.submitted)
+                self._runs.append(_time.time() - task.started)
+                self._finish(task, state)
+
+    def queue_depth(self, priority=None):
+        """Return the number of pending jobs (of the priority `priority`)"""
+        with self._cond:
+            priorities = PRIORITIES if priority is None else (priority,)
+            return sum(len(q) for p in priorities for q in self._queues[p].values())
+
+    def metrics(self):
+        """Return `scheduler_metrics` namedtuple: `queue_depth` -- dictionary of
+        priority : number of pending tasks; `running` -- number of running tasks;
+        counts of jobs `submitted`, `coalesced` (served by another job's task),
+        `completed`, `failed` and `cancelled`; and the mean and 95th percentile
+        of the waiting and running times (seconds) of the recent tasks"""
+        with self._cond:
+            depth = dict((p, sum(len(q) for q in self._queues[p].values())) for p in PRIORITIES)
+            waits, runs = _np.array(self._waits), _np.array(self._runs)
+            stats = []
+            for values in (waits, runs):
+                if len(values):
+                    stats.extend([float(values.mean()), float(_np.percentile(values, 95))])
+                else:
+                    stats.extend([0.0, 0.0])
+            c = self._counts
+            return scheduler_metrics(depth, len(self._running), c['submitted'], c['coalesced'],
+                                     c['completed'], c['failed'], c['cancelled'], *stats)
+
+    def shutdown(self, cancel_pending=True, wait=True):
+        """Stop the workers (after the running jobs)
+
+        @param cancel_pending: cancel the pending jobs; otherwise they are run first
+        @param wait: wait for the workers to stop
+        """
+        with self._cond:
+            if cancel_pending:
+                for priority in PRIORITIES:
+                    for queue in self._queues[priority].values():
+                        for task in queue:
+                            self._finish(task, 'cancelled')
+                    self._queues[priority].clear()
+            self._stopped = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            with self._cond:
+                executors, self._executors = list(self._executors.values()), {}
+            for _, executor in executors:
+                executor.shutdown()
+
+    #%% Analyses and tools
+    def _executor(self, osys):
+        """Returns the executor running the jobs of `osys` (created in the
+        current thread, which must own `osys`)"""
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError('The scheduler is shut down')
+            entry = self._executors.get(id(osys))
+            if entry is None:
+                # plain COM objects (and stand-ins) are used unwrapped
+                wrap = _comthread._wrap_system if hasattr(osys, '_iopticalsystem') else None
+                executor = _comthread.COMThreadPoolExecutor(osys, len(self._threads),
+                                                            com=self._com, wrap=wrap)
+                entry = self._executors[id(osys)] = (osys, executor)   # keeps id(osys) valid
+            return entry[1]
+
+    def submit_analysis(self, osys, analysis_type, settings=None, priority=NORMAL, caller=None,
+                        cache=None):
+        """Submit an analysis of `osys`; identical pending analyses (same system
+        fingerprint, analysis type and settings) are computed once
+
+        @param osys: `pyzos.zos.OpticalSystem`, owned by the current thread
+        @param analysis_type: AnalysisIDM constant or its name, such as 'FftMtf'
+        @param settings: dictionary of analysis settings (property name : value)
+        @param cache: optional `pyzos.resultcache.ResultCache`
+        @return: `Job`, whose result is the `analysis_data` (see
+                 `OpticalSystem.zApplyAnalysis()`)
+        """
+        key = ('analysis', id(osys), osys.zFingerprint(), analysis_type,
+               tuple(sorted((settings or {}).items())))
+        return self.submit(_run_on, (self._executor(osys), _run_analysis, analysis_type,
+                                     settings, cache),
+                           priority=priority, caller=caller, key=key)
+
+    def submit_tool(self, osys, tool, settings=None, extract=None, priority=NORMAL, caller=None):
+        """Submit a run of a tool of `osys`, such as 'LocalOptimization' (opened by
+        `osys.pTools.Open<tool>()`); identical pending runs are run once
+
+        @param osys: `pyzos.zos.OpticalSystem`, owned by the current thread
+        @param settings: dictionary of tool settings (property name : value)
+        @param extract: function `extract(osys, tool)` returning the result of the
+                        run (before the tool is closed); it is called in a worker
+                        thread, with the worker's system. Default returns `None`.
+        @return: `Job`; cancelling a running job cancels the tool
+        """
+        key = ('tool', id(osys), osys.zFingerprint(), tool,
+               tuple(sorted((settings or {}).items())), extract)
+        stop = _threading.Event()   # the tool is cancelled in the worker thread
+        return self.submit(_run_on, (self._executor(osys), _run_tool, tool, settings,
+                                     extract, stop),
+                           priority=priority, caller=caller, key=key, interrupt=stop.set)
+
+def _run_on(executor, func, *args):
+    """Runs `func(osys, *args)` in a worker thread of `executor` and returns its result"""
+    return executor.submit(func, *args).result()
+
+def _run_analysis(osys, analysis_type, settings, cache):
+    with osys.pAnalyses.zPooledAnalysis(analysis_type, settings) as analysis:
+        return osys.zApplyAnalysis(analysis, cache)
+
+def _run_tool(osys, tool, settings, extract, stop, poll=0.05):
+    opened_tool = getattr(osys.pTools, 'Open' + tool)()
+    if opened_tool is None:
+        raise RuntimeError('Another tool is open')
+    try:
+        if settings:
+            with opened_tool.zBatch() as batch:
+                for name, value in settings.items():
+                    setattr(opened_tool, 'p' + name, value)
+        opened_tool.Run()
+        while opened_tool.pIsRunning:
+            if stop.wait(poll):
+                opened_tool.Cancel()
+                break
+        opened_tool.WaitForCompletion()
+        return extract(osys, opened_tool) if extract is not None else None
+    finally:
+        opened_tool.Close()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        seidel.py
+# Purpose:     Vectorized Seidel (third-order) aberration and chromatic
+#              coefficient calculator
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Local, vectorized third-order (Seidel) aberration calculator.
+
+The per-surface Seidel sums SI (spherical), SII (coma), SIII (astigmatism),
+SIV (Petzval), SV (distortion), and the first-order chromatic sums CL (axial
+color) and CT (lateral color) are computed from the marginal and chief rays
+of the local paraxial trace `pyzos.paraxial.trace()`, for a batch of lens
+variants at once. The conventions (and names) of the coefficients are the
+same as those of the Seidel Coefficients analysis (`IAS_SeidelCoefficients`)
+of OpticStudio, with conic and 4th order even asphere contributions.
+
+Example
+-------
+>>> import pyzos.zmxfile as zmx, pyzos.seidel as sei
+>>> coeffs = sei.seidel(**sei.lens_model_inputs(zmx.read_zmx('doublet.zmx')))
+>>> coeffs.total.SI, coeffs.surface.CL
+"""
+from __future__ import division, print_function
+import collections as _co
+import numpy as _np
+import pyzos.paraxial as _par
+
+seidel_sums = _co.namedtuple('seidel_sums', ['SI', 'SII', 'SIII', 'SIV', 'SV', 'CL', 'CT'])
+seidel_coefficients = _co.namedtuple('seidel_coefficients', ['surface', 'total', 'first_order'])
+
+#%% Input helpers
+def lens_model_inputs(lens, catalog=None, wavelength=None, field=None, color_waves=None):
+    """Return the keyword arguments of `seidel()` for a `pyzos.zmxfile.LensModel`
+
+    @param color_waves: the two wavelengths (micrometers) defining the dispersion
+                        for the chromatic sums; default is the shortest and the
+                        longest wavelengths of the lens
+    Other parameters are as in `pyzos.paraxial.lens_model_inputs()`
+    """
+    inputs = _par.lens_model_inputs(lens, catalog, wavelength, field)
+    if color_waves is None:
+        color_waves = (lens.wavelengths.min(), lens.wavelengths.max())
+    n_short, n_long = _par.surface_indices(lens.material, lens.nd, catalog, list(color_waves),
+                                           vd=lens.vd)
+    asphere = [t == 'EVENASPH' for t in lens.surf_type]
+    inputs.update(conic=lens.conic, a4=_np.where(asphere, lens.parm[:, 1], 0.0),
+                  dispersion=n_short - n_long)
+    return inputs
+
+#%% Calculator
+def seidel(curvature, thickness, index, stop, aperture, aperture_type='ENPD', field=0.0,
+           field_type=0, conic=0.0, a4=0.0, dispersion=0.0):
+    """Seidel aberration and chromatic sums of a batch of lens variants
+
+    Parameters
+    ----------
+    curvature, thickness, index, stop, aperture, aperture_type, field, field_type :
+        as in `pyzos.paraxial.trace()`; the chief ray is traced for `field`.
+    conic : array-like, optional
+        conic constant of each surface
+    a4 : array-like, optional
+        4th order (r^4) aspheric coefficient of each surface
+    dispersion : array-like, optional
+        index difference (n_short - n_long) of the medium following each surface
+
+    Returns
+    -------
+    seidel_coefficients : namedtuple
+        `surface` -- `seidel_sums` of per-surface arrays of shape
+                     (numVariant, numSurf); the object and image columns are zero.
+        `total` -- `seidel_sums` of arrays of shape (numVariant,)
+        `first_order` -- output of `pyzos.paraxial.trace()`
+        The variant axis is removed if the inputs describe a single lens.
+    """
+    surface_data = (curvature, thickness, index, conic, a4, dispersion)
+    single = (all(_np.ndim(a) <= 1 for a in surface_data) and
+              _np.ndim(aperture) == 0 and _np.ndim(field) == 0)
+    # the variants may be given by any of the surface arrays
+    c, t, n, k, a4, dn = _np.broadcast_arrays(*(_np.atleast_2d(_np.asarray(a, dtype=_np.float64))
+                                                for a in surface_data))
+    fo = _par.trace(c[0] if single else c, t[0] if single else t, n[0] if single else n,
+                    stop, aperture, aperture_type, field, field_type)
+    m, ch = fo.marginal, fo.chief
+    y, nu, ybar, nubar = (_np.atleast_2d(a) for a in (m.y, m.nu, ch.y, ch.nu))
+    numVar, numSurf = y.shape
+    H = _np.atleast_1d(fo.lagrange)[:, None]
+
+    s = slice(1, numSurf - 1)    # refracting surfaces
+    prev = slice(0, numSurf - 2)
+    n1, n2 = n[:, prev], n[:, s]
+    cs, ys, ybs = c[:, s], y[:, s], ybar[:, s]
+    A = nu[:, prev] + n1*ys*cs                 # n*i (refraction invariant)
+    Abar = nubar[:, prev] + n1*ybs*cs
+    d_u_n = nu[:, s]/(n2*n2) - nu[:, prev]/(n1*n1)   # delta(u/n)
+    d_1_n = 1.0/n2 - 1.0/n1
+
+    SI = -A*A*ys*d_u_n
+    SII = -A*Abar*ys*d_u_n
+    SIII = -Abar*Abar*ys*d_u_n
+    SIV = -H*H*cs*d_1_n
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        SV = _np.where(A != 0, Abar/A*(SIII + SIV), 0.0)
+    # contributions of the conic and 4th order aspheric terms
+    dSI = (k[:, s]*cs**3 + 8.0*a4[:, s])*ys**4*(n2 - n1)
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        ratio = _np.where(ys != 0, ybs/ys, 0.0)
+    SI = SI + dSI
+    SII = SII + dSI*ratio
+    SIII = SIII + dSI*ratio**2
+    SV = SV + dSI*ratio**3
+    # chromatic sums
+    d_dn_n = dn[:, s]/n2 - dn[:, prev]/n1
+    CL = A*ys*d_dn_n
+    CT = Abar*ys*d_dn_n
+
+    def full(a):
+        out = _np.zeros((numVar, numSurf))
+        out[:, s] = a
+        return out[0] if single else out
+    surface = seidel_sums(*(full(a) for a in (SI, SII, SIII, SIV, SV, CL, CT)))
+    total = seidel_sums(*(a.sum(axis=-1) for a in surface))
+    return seidel_coefficients(surface, total, fo)
@@ -0,0 +1,702 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        server.py
+# Purpose:     Local RPC server sharing one OpticStudio instance among clients
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Local RPC server exposing `OpticalSystem` objects to several client processes
+(notebooks, dashboards, CI jobs), so that they share one licensed OpticStudio
+instance.
+
+Protocol
+--------
+A message is a fixed prefix (magic, header length, number of blobs), a JSON
+header, and the binary blobs (NumPy arrays and bytes, each preceded by its
+length). Arrays are sent and received as raw buffers, without conversion,
+and read directly into the result arrays.
+
+Objects that can't be encoded (the ZOS-API objects) stay in the server and
+are sent as references; the client wraps them in `RemoteObject` proxies that
+mirror the wrapper API: attribute gets and sets, and method calls, are
+forwarded to the server. Methods are recognized after their first use, so
+calling a method is one round trip. `RemoteBatch` sends several operations
+in one message. Private attributes (names starting with '_') are not served.
+
+An object has one reference per system, counted per connection: each
+reference sent to a client is released when its proxy is garbage collected
+(the releases are sent with the next request of the client), or by
+`Client.release()`, and all the references of a connection are released
+when it is closed. The objects of a system are released when the system is
+closed.
+
+The requests are queued per system, and the queues are served in turn
+(up to `batch_size` requests of a system at a time) by the dispatcher
+thread, which is the only thread using the backend (the ZOS-API objects).
+
+Example
+-------
+Server (in the process owning the OpticStudio connection)
+
+>>> from pyzos.server import Server
+>>> Server(('127.0.0.1', 8765)).serve_forever()
+
+or ``python -m pyzos.server --address 127.0.0.1:8765``. Client
+
+>>> from pyzos.server import Client
+>>> client = Client(('127.0.0.1', 8765))
+>>> osys = client.new_system()
+>>> osys.LoadFile(r'C:\\lenses\\doublet.zmx', False)
+>>> lde = osys.zGetLDEArray()      # arrays streamed as binary blobs
+>>> osys.pLDE.GetSurfaceAt(2).pThickness = 5.0
+
+The `StubBackend` serves simple pure Python systems, for testing clients
+without OpticStudio.
+"""
+from __future__ import division, print_function
+import json as _json
+import socket as _socket
+import struct as _struct
+import threading as _threading
+import itertools as _itertools
+import collections as _co
+import numpy as _np
+
+try:
+    _string_types = (basestring,)
+except NameError:
+    _string_types = (str,)
+
+MAGIC = b'PZS1'
+_PREFIX = _struct.Struct('!4sII')   # magic, header length, number of blobs
+_BLOB_SIZE = _struct.Struct('!Q')
+_CHUNK = 1 << 20                    # receive buffer size for the blobs
+
+class ProtocolError(Exception): pass
+
+class RemoteError(Exception):
+    """Exception raised in the server by a request"""
+    def __init__(self, type_name, message):
+        Exception.__init__(self, '{}: {}'.format(type_name, message))
+        self.type_name = type_name
+
+#%% Message encoding
+def _encode_value(value, blobs, register=None):
+    """Returns JSON serializable representation of `value`; arrays and bytes
+    are appended to `blobs`, and other objects are registered with `register`
+    (which returns their reference)"""
+    if isinstance(value, _np.ndarray):
+        blobs.append(_np.ascontiguousarray(value))
+        return {'__array__': len(blobs) - 1, 'dtype': value.dtype.str, 'shape': value.shape}
+    elif isinstance(value, _np.generic):
+        return value.item()
+    elif value is None or isinstance(value, (bool, int, float) + _string_types):
+        return value
+    elif isinstance(value, bytes):
+        blobs.append(_np.frombuffer(value, dtype=_np.uint8))
+        return {'__bytes__': len(blobs) - 1}
+    elif isinstance(value, tuple) and hasattr(value, '_fields'):
+        return {'__namedtuple__': type(value).__name__, 'fields': list(value._fields),
+                'values': [_encode_value(v, blobs, register) for v in value]}
+    elif isinstance(value, tuple):
+        return {'__tuple__': [_encode_value(v, blobs, register) for v in value]}
+    elif isinstance(value, list):
+        return [_encode_value(v, blobs, register) for v in value]
+    elif isinstance(value, dict):
+        return {'__dict__': [[_encode_value(k, blobs, register), _encode_value(v, blobs, register)]
+                             for k, v in value.items()]}
+    elif isinstance(value, RemoteObject):
+        return {'__ref__': value._ref}
+    elif register is not None:
+        return register(value)
+    else:
+        raise TypeError("Can't encode {!r}".format(value))
+
+_namedtuple_classes = {}
+
+def _decode_value(value, blobs, resolve):
+    """Inverse of `_encode_value()`; references are resolved with `resolve`"""
+    if isinstance(value, list):
+        return [_decode_value(v, blobs, resolve) for v in value]
+    elif not isinstance(value, dict):
+        return value
+    elif '__array__' in value:
+        array = blobs[value['__array__']]
+        return array.view(_np.dtype(str(value['dtype']))).reshape(value['shape'])
+    elif '__bytes__' in value:
+        return blobs[value['__bytes__']].tobytes()
+    elif '__namedtuple__' in value:
+        key = (value['__namedtuple__'], tuple(value['fields']))
+        if key not in _namedtuple_classes:
+            _namedtuple_classes[key] = _co.namedtuple(str(key[0]), [str(f) for f in key[1]])
+        return _namedtuple_classes[key](*[_decode_value(v, blobs, resolve)
+                                          for v in value['values']])
+    elif '__tuple__' in value:
+        return tuple(_decode_value(v, blobs, resolve) for v in value['__tuple__'])
+    elif '__dict__' in value:
+        return dict((_decode_value(k, blobs, resolve), _decode_value(v, blobs, resolve))
+                    for k, v in value['__dict__'])
+    else:
+        return resolve(value)
+
+def send_message(sock, message, register=None):
+    """Encode and send `message` (see `_encode_value()`)"""
+    blobs = []
+    header = _json.dumps(_encode_value(message, blobs, register)).encode('utf-8')
+    sock.sendall(_PREFIX.pack(MAGIC, len(header), len(blobs)) + header)
+    for blob in blobs:
+        sock.sendall(_BLOB_SIZE.pack(blob.nbytes))
+        if blob.nbytes:
+            sock.sendall(memoryview(blob.reshape(-1).view(_np.uint8)))
+
+def _recv_into(sock, buf):
+    view = memoryview(buf)
+    pos = 0
+    while pos < len(buf):
+        n = sock.recv_into(view[pos:], min(len(buf) - pos, _CHUNK))
+        if not n:
+            raise EOFError('Connection closed')
+        pos += n
+    return buf
+
+def recv_message(sock, resolve):
+    """Receive and decode a message; raises `EOFError` if the connection is closed"""
+    magic, header_len, num_blobs = _PREFIX.unpack(bytes(_recv_into(sock, bytearray(_PREFIX.size))))
+    if magic != MAGIC:
+        raise ProtocolError('Bad message prefix {!r}'.format(magic))
+    header = _json.loads(bytes(_recv_into(sock, bytearray(header_len))).decode('utf-8'))
+    blobs = []
+    for _ in range(num_blobs):
+        size, = _BLOB_SIZE.unpack(bytes(_recv_into(sock, bytearray(_BLOB_SIZE.size))))
+        blobs.append(_np.frombuffer(_recv_into(sock, bytearray(size)), dtype=_np.uint8))
+    return _decode_value(header, blobs, resolve)
+
+def _make_socket(address):
+    """TCP socket for (host, port) addresses, Unix socket for path addresses"""
+    if isinstance(address, _string_types):
+        return _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    return _socket.socket(_socket.AF_INET, _socket.SOCK_STREAM)
+
+#%% Backends
+class ZOSBackend(object):
+    """Backend serving `pyzos.zos.OpticalSystem` objects"""
+    def init_thread(self):
+        """Initialize COM in the dispatcher thread (the thread using the ZOS-API)"""
+        import pythoncom
+        pythoncom.CoInitialize()
+
+    def exit_thread(self):
+        import pythoncom
+        pythoncom.CoUninitialize()
+
+    def new_system(self, mode=0):
+        from pyzos.zos import OpticalSystem
+        return OpticalSystem(mode=mode)
+
+    def close_system(self, osys):
+        try:
+            osys.Close(False)
+        except Exception:
+            pass  # the primary system can't be closed
+
+class StubSurface(object):
+    """Surface of `StubSystem`"""
+    def __init__(self):
+        self.pRadius = _np.inf
+        self.pThickness = 0.0
+        self.pMaterial = ''
+        self.pSemiDiameter = 0.0
+        self.pConic = 0.0
+        self.pComment = ''
+
+class StubLDE(object):
+    """Lens data editor of `StubSystem`"""
+    def __init__(self):
+        self._surfaces = [StubSurface() for _ in range(3)]
+
+    @property
+    def pNumberOfSurfaces(self):
+        return len(self._surfaces)
+
+    def GetSurfaceAt(self, surfNum):
+        return self._surfaces[surfNum]
+
+    def InsertNewSurfaceAt(self, surfNum):
+        self._surfaces.insert(surfNum, StubSurface())
+        return self._surfaces[surfNum]
+
+class StubMFE(object):
+    """Merit function editor of `StubSystem`; the merit function is the sum of
+    the squared thicknesses"""
+    def __init__(self, lde):
+        self._lde = lde
+
+    def CalculateMeritFunction(self):
+        return float(sum(s.pThickness**2 for s in self._lde._surfaces))
+
+class StubSystem(object):
+    """Pure Python stand-in of `OpticalSystem` for testing the server and clients"""
+    def __init__(self, mode=0):
+        self.pMode = mode
+        self.pSystemName = ''
+        self.pLDE = StubLDE()
+        self.pMFE = StubMFE(self.pLDE)
+
+    def zGetLDEArray(self):
+        lde_array = _co.namedtuple('lde_array', ['radius', 'thick', 'material', 'semidia',
+                                                 'conic', 'comment'])
+        surfs = self.pLDE._surfaces
+        return lde_array(_np.array([s.pRadius for s in surfs]),
+                         _np.array([s.pThickness for s in surfs]),
+                         [s.pMaterial for s in surfs], _np.array([s.pSemiDiameter for s in surfs]),
+                         _np.array([s.pConic for s in surfs]), [s.pComment for s in surfs])
+
+    def zSetLDEArray(self, radius=None, thick=None):
+        for i, surf in enumerate(self.pLDE._surfaces):
+            if radius is not None:
+                surf.pRadius = float(radius[i])
+            if thick is not None:
+                surf.pThickness = float(thick[i])
+
+class StubBackend(object):
+    """Backend serving `StubSystem` objects (no OpticStudio required)"""
+    def init_thread(self):
+        pass
+
+    def exit_thread(self):
+        pass
+
+    def new_system(self, mode=0):
+        return StubSystem(mode)
+
+    def close_system(self, osys):
+        pass
+
+#%% Server
+class _Method(object):
+    """Result of an attribute get that returned a method"""
+    def __init__(self, name):
+        self.name = name
+
+class _Connection(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = _threading.Lock()   # one response at a time
+
+class Server(object):
+    """Local RPC server of optical systems"""
+    def __init__(self, address=('127.0.0.1', 0), backend=None, batch_size=16):
+        """
+        @param address: (host, port) for a TCP socket (port 0 picks a free port),
+                        or path of a Unix socket
+        @param backend: `ZOSBackend` (default) or `StubBackend`
+        @param batch_size: maximum number of requests of a system served in a
+                           turn of the dispatcher
+        """
+        self.backend = ZOSBackend() if backend is None else backend
+        self.batch_size = batch_size
+        self._objects = {}                  # reference : [system id, object, 
+                                            #              {connection : count}]
+        self._identities = {}               # (system id, id(object)) : reference
+        self._refs = _itertools.count(1)
+        self._queues = _co.OrderedDict()    # system id : deque of (connection, request)
+        self._cond = _threading.Condition()
+        self._running = False
+        self._sock = _make_socket(address)
+        if not isinstance(address, _string_types):
+            self._sock.setsockopt(_socket.SOL_SOCKET, _socket.SO_REUSEADDR, 1)
+        self._sock.bind(address)
+        self._sock.listen(16)
+        self.address = self._sock.getsockname()
+        self._threads = []
+
+    def __repr__(self):
+        return '{.__name__}({!r}, backend={.__name__})'.format(type(self), self.address,
+                                                             type(self.backend))
+
+    def start(self):
+        """Start serving in background threads"""
+        self._running = True
+        for target in (self._accept_loop, self._dispatch_loop):
+            thread = _threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def serve_forever(self):
+        """Serve until `stop()` is called (or KeyboardInterrupt)"""
+        self.start()
+        try:
+            while self._running:
+                self._threads[0].join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        """Stop serving"""
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        try:
+            self._sock.close()
+        except _socket.error:
+            pass
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, _ = self._sock.accept()
+            except (_socket.error, OSError):
+                break
+            thread = _threading.Thread(target=self._read_loop, args=(_Connection(sock),))
+            thread.daemon = True
+            thread.start()
+
+    def _read_loop(self, conn):
+        try:
+            while self._running:
+                request = recv_message(conn.sock, lambda marker: marker)
+                with self._cond:
+                    queue = self._queues.setdefault(request.get('system'), _co.deque())
+                    queue.append((conn, request))
+                    self._cond.notify()
+        except (EOFError, ProtocolError, _socket.error, OSError, ValueError):
+            conn.sock.close()
+        # release the references of the connection (in the dispatcher thread)
+        with self._cond:
+            self._queues.setdefault(None, _co.deque()).append((conn, None))
+            self._cond.notify()
+
+    def _dispatch_loop(self):
+        self.backend.init_thread()
+        try:
+            while self._running:
+                with self._cond:
+                    while self._running and not any(self._queues.values()):
+                        self._cond.wait(0.5)
+                    work = []
+                    for system, queue in self._queues.items():
+                        for _ in range(min(self.batch_size, len(queue))):
+                            work.append(queue.popleft())
+                for conn, request in work:
+                    if request is None:
+                        self._release_connection(conn)
+                        continue
+                    self._respond(conn, request, self._handle(request, conn))
+        finally:
+            self.backend.exit_thread()
+
+    def _respond(self, conn, request, response):
+        # the released proxies may be arguments of the request
+        self._release(conn, request.get('release', ()))
+        try:
+            with conn.lock:
+                send_message(conn.sock, response, lambda obj:
+                             self._register(request.get('system'), obj, conn))
+        except (_socket.error, OSError):
+            pass   # client gone
+
+    def _register(self, system, obj, conn):
+        if isinstance(obj, _Method):
+            return {'__method__': obj.name}
+        ref = None if system is None else self._identities.get((system, id(obj)))
+        if ref is None:
+            ref = next(self._refs)
+            if system is None:   # new system: its reference is the system id
+                system = ref
+            self._objects[ref] = [system, obj, {}]
+            self._identities[(system, id(obj))] = ref
+        system, _, counts = self._objects[ref]
+        counts[conn] = counts.get(conn, 0) + 1
+        marker = {'__ref__': ref, 'type': type(obj).__name__}
+        if system == ref:
+            marker['system'] = ref
+        return marker
+
+    def _remove(self, ref):
+        system, obj, _ = self._objects.pop(ref)
+        self._identities.pop((system, id(obj)), None)
+
+    def _release(self, conn, refs):
+        """Release one count of the connection `conn` of each reference; the 
+        objects without counts are removed (except the systems)"""
+        for ref in refs:
+            entry = self._objects.get(ref)
+            if entry is None or conn not in entry[2]:
+                continue
+            system, _, counts = entry
+            counts[conn] -= 1
+            if counts[conn] <= 0:
+                del counts[conn]
+                if not counts and ref != system:
+                    self._remove(ref)
+
+    def _release_connection(self, conn):
+        for ref, (system, _, counts) in list(self._objects.items()):
+            if counts.pop(conn, None) and not counts and ref != system:
+                self._remove(ref)
+
+    def _resolve(self, marker):
+        try:
+            return self._objects[marker['__ref__']][1]
+        except KeyError:
+            raise LookupError('Unknown object reference {}'.format(marker.get('__ref__')))
+
+    def _decode_refs(self, value):
+        if isinstance(value, dict) and '__ref__' in value:
+            return self._resolve(value)
+        elif isinstance(value, list):
+            return [self._decode_refs(v) for v in value]
+        elif isinstance(value, tuple):
+            return tuple(self._decode_refs(v) for v in value)
+        elif isinstance(value, dict):
+            return dict((k, self._decode_refs(v)) for k, v in value.items())
+        return value
+
+    def _handle(self, request, conn=None):
+        try:
+            if request['op'] == 'batch':
+                result = [self._execute(r, conn) for r in request['requests']]
+            else:
+                result = self._execute(request, conn)
+            return {'id': request.get('id'), 'result': result}
+        except Exception as e:
+            return {'id': request.get('id'), 'error': [type(e).__name__, str(e)]}
+
+    def _execute(self, request, conn=None):
+        op = request['op']
+        name = request.get('name')
+        if name is not None and (not isinstance(name, _string_types) or name.startswith('_')):
+            raise AttributeError('Attribute {!r} is not served'.format(name))
+        if op == 'new_system':
+            return self.backend.new_system(*request.get('args', ()))
+        elif op == 'close_system':
+            system = request['system']
+            self.backend.close_system(self._objects[system][1])
+            for ref in [r for r, (s, _, _) in self._objects.items() if s == system]:
+                self._remove(ref)
+            with self._cond:
+                pending = self._queues.pop(system, ())
+            # the requests queued (by other connections) for the system fail
+            for other, queued in pending:
+                error = LookupError('System {} is closed'.format(system))
+                self._respond(other, queued, {'id': queued.get('id'),
+                                              'error': [type(error).__name__, str(error)]})
+            return None
+        elif op == 'release':
+            self._release(conn, request['refs'])
+            return None
+        obj = self._resolve({'__ref__': request['ref']})
+        if op == 'getattr':
+            value = getattr(obj, name)
+            if callable(value) and not isinstance(value, type):
+                return _Method(name)
+            return value
+        elif op == 'setattr':
+            setattr(obj, name, self._decode_refs(request['value']))
+            return None
+        elif op == 'call':
+            func = getattr(obj, name) if name else obj
+            return func(*self._decode_refs(request.get('args', [])),
+                        **self._decode_refs(request.get('kwargs', {})))
+        else:
+            raise ValueError('Unknown operation {}'.format(op))
+
+#%% Client
+class RemoteObject(object):
+    """Proxy of an object in the server; mirrors its attributes and methods"""
+    __slots__ = ('_client', '_system', '_ref', '_type', '_released')
+
+    def __init__(self, client, system, ref, type_name):
+        object.__setattr__(self, '_client', client)
+        object.__setattr__(self, '_system', system)
+        object.__setattr__(self, '_ref', ref)
+        object.__setattr__(self, '_type', type_name)
+        object.__setattr__(self, '_released', False)
+
+    def __repr__(self):
+        return '<RemoteObject {} #{}>'.format(self._type, self._ref)
+
+    def __del__(self):
+        try:
+            if not self._released:
+                self._client._release_later(self._ref)
+        except AttributeError:
+            pass   # not initialized
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if (self._type, name) in self._client._methods:
+            return RemoteMethod(self, name)
+        value = self._client._request({'op': 'getattr', 'system': self._system,
+                                       'ref': self._ref, 'name': name})
+        if isinstance(value, RemoteMethod):
+            self._client._methods.add((self._type, name))
+            return RemoteMethod(self, name)
+        return value
+
+    def __setattr__(self, name, value):
+        self._client._request({'op': 'setattr', 'system': self._system, 'ref': self._ref,
+                               'name': name, 'value': value})
+
+    def __call__(self, *args, **kwargs):
+        return self._client._request({'op': 'call', 'system': self._system, 'ref': self._ref,
+                                      'name': None, 'args': list(args), 'kwargs': kwargs})
+
+class RemoteMethod(object):
+    """Method of a `RemoteObject`"""
+    def __init__(self, obj, name):
+        self.obj = obj
+        self.name = name
+
+    def __repr__(self):
+        return '<RemoteMethod {}.{}>'.format(self.obj._type, self.name)
+
+    def __call__(self, *args, **kwargs):
+        obj = self.obj
+        return obj._client._request({'op': 'call', 'system': obj._system, 'ref': obj._ref,
+                                     'name': self.name, 'args': list(args), 'kwargs': kwargs})
+
+class RemoteBatch(object):
+    """Operations on the objects of a system, sent in one message
+
+    >>> with client.batch(osys) as batch:
+    ...     for k in range(1, 5):
+    ...         batch.set(lde.GetSurfaceAt(k), 'pThickness', 2.0*k)
+    ...     batch.call(osys.pMFE, 'CalculateMeritFunction')
+    >>> batch.results[-1]
+    """
+    def __init__(self, client, system):
+        self.client = client
+        self.system = system._system
+        self.requests = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+        return False
+
+    def get(self, obj, name):
+        """Add attribute get; returns the index of its result"""
+        self.requests.append({'op': 'getattr', 'ref': obj._ref, 'name': name})
+        return len(self.requests) - 1
+
+    def set(self, obj, name, value):
+        """Add attribute set; returns the index of its result"""
+        self.requests.append({'op': 'setattr', 'ref': obj._ref, 'name': name, 'value': value})
+        return len(self.requests) - 1
+
+    def call(self, obj, name, *args, **kwargs):
+        """Add method call; returns the index of its result"""
+        self.requests.append({'op': 'call', 'ref': obj._ref, 'name': name, 'args': list(args),
+                              'kwargs': kwargs})
+        return len(self.requests) - 1
+
+    def run(self):
+        """Send the operations, and return (and store) the list of results"""
+        requests, self.requests = self.requests, []
+        self.results = self.client._request({'op': 'batch', 'system': self.system,
+                                             'requests': requests})
+        return self.results
+
+class Client(object):
+    """Client of a pyzos `Server`"""
+    def __init__(self, address, timeout=None):
+        """
+        @param address: address of the server, (host, port) or Unix socket path
+        @param timeout: socket timeout (seconds)
+        """
+        self.address = address
+        self._sock = _make_socket(address)
+        self._sock.settimeout(timeout)
+        self._sock.connect(address)
+        self._lock = _threading.Lock()
+        self._ids = _itertools.count(1)
+        self._methods = set()   # (type name, attribute name) of known methods
+        self._releases = _co.deque()   # references of the collected proxies
+
+    def __repr__(self):
+        return '{.__name__}({!r})'.format(type(self), self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _resolve(self, marker):
+        if '__method__' in marker:
+            return RemoteMethod(None, marker['__method__'])
+        system = marker.get('system', self._current_system)
+        return RemoteObject(self, system, marker['__ref__'], marker.get('type'))
+
+    def _release_later(self, ref):
+        self._releases.append(ref)
+
+    def _request(self, request):
+        with self._lock:
+            request['id'] = next(self._ids)
+            release = []
+            while self._releases:
+                release.append(self._releases.popleft())
+            if release:
+                request['release'] = release
+            self._current_system = request.get('system')
+            send_message(self._sock, request)
+            response = recv_message(self._sock, self._resolve)
+        if 'error' in response:
+            raise RemoteError(*response['error'])
+        return response['result']
+
+    def new_system(self, mode=0):
+        """Return (a proxy of) a new optical system of the server"""
+        return self._request({'op': 'new_system', 'args': [mode]})
+
+    def close_system(self, system):
+        """Close the optical system and release its objects"""
+        self._request({'op': 'close_system', 'system': system._system})
+
+    def release(self, *objects):
+        """Release the server references of the (proxy) objects now, instead of
+        when the proxies are garbage collected; the proxies can't be used after"""
+        objects = [obj for obj in objects if not obj._released]
+        for obj in objects:
+            object.__setattr__(obj, '_released', True)
+        if objects:
+            self._request({'op': 'release', 'system': objects[0]._system,
+                           'refs': [obj._ref for obj in objects]})
+
+    def batch(self, system):
+        """Return a `RemoteBatch` of operations on the objects of `system`"""
+        return RemoteBatch(self, system)
+
+    def close(self):
+        """Close the connection"""
+        self._sock.close()
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='pyzos RPC server')
+    parser.add_argument('--address', default='127.0.0.1:8765',
+                        help='host:port, or path of a Unix socket')
+    parser.add_argument('--stub', action='store_true', help='serve stub systems (testing)')
+    args = parser.parse_args(argv)
+    if ':' in args.address and not args.address.startswith('/'):
+        host, port = args.address.rsplit(':', 1)
+        address = (host, int(port))
+    else:
+        address = args.address
+    server = Server(address, StubBackend() if args.stub else None)
+    print('Serving on {}'.format(server.address))
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
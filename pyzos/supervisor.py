@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        supervisor.py
+# Purpose:     Connection supervisor with health checks, reconnects and standby
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Supervisor of the ZOS-API connection of an optical system.
+
+The supervisor checks the health of the connection (at most once per
+`interval`, when `check()` or `call()` is called, and optionally in a monitor
+thread), and if the connection is lost, it reconnects with exponential
+backoff (`OpticalSystem.zReconnect()`) and reloads the most recent state:
+the last checkpoint (a copy of the system saved by `checkpoint()`, also
+periodically) or the lens file of the system, whichever is newer.
+Optionally, a standby connection is created in advance, so that a failover
+doesn't wait for OpticStudio to start.
+
+`call()` runs a function on the system, and if it fails because the
+connection was lost, reconnects and runs it again.
+
+The monitor thread (`start()`) uses its own interfaces of the system,
+marshalled by `pyzos.comthread.COMThreadPoolExecutor`; it probes the
+connection and makes the automatic checkpoints. A lost connection is
+reconnected by the next `check()` or `call()`, in the thread owning the
+system.
+
+Example
+-------
+>>> from pyzos.supervisor import Supervisor
+>>> sup = Supervisor(osys, 'state', interval=10, checkpoint_interval=300, standby=True)
+>>> for thick in thicknesses:
+...     merit = sup.call(evaluate, thick)   # evaluate(osys, thick)
+>>> sup.reconnects, sup.downtime
+"""
+from __future__ import division, print_function
+import os as _os
+import time as _time
+import random as _random
+import warnings as _warnings
+import threading as _threading
+import pyzos.comthread as _comthread
+
+class ConnectionLostError(Exception): pass
+
+def _new_connection():
+    """Returns a new ZOS-API connection (see `pyzos.zos.new_connection()`)"""
+    import pyzos.zos as _zos
+    return _zos.new_connection()
+
+def _probe(osys):
+    """Whether a round trip to OpticStudio through the system `osys` succeeds"""
+    try:
+        return osys.pMode in (0, 1)
+    except Exception:
+        return False
+
+class Supervisor(object):
+    """Health checks, reconnection and state restore of the ZOS-API connection
+    of an optical system"""
+    def __init__(self, osys, state_dir, interval=10.0, checkpoint_interval=None, standby=False,
+                 max_attempts=8, backoff=1.0, max_backoff=60.0, retries=1, on_reconnect=None):
+        """
+        @param osys: `pyzos.zos.OpticalSystem` to supervise
+        @param state_dir: directory of the checkpoint file
+        @param interval: minimum time (seconds) between health checks
+        @param checkpoint_interval: time (seconds) between automatic checkpoints
+                                    (by `check()`); no automatic checkpoints if `None`
+        @param standby: keep a standby connection for failover
+        @param max_attempts: maximum number of connection attempts of a reconnect
+        @param backoff: delay (seconds) before the second attempt; the delay doubles
+                        with each attempt (with jitter), up to `max_backoff`
+        @param retries: number of times `call()` reruns a function that failed
+                        because the connection was lost
+        @param on_reconnect: function `on_reconnect(osys)` called after a reconnect
+                             and state restore
+        """
+        self.osys = osys
+        self.state_dir = _os.path.abspath(state_dir)
+        if not _os.path.isdir(self.state_dir):
+            _os.makedirs(self.state_dir)
+        self.state_file = _os.path.join(self.state_dir, 'state.zmx')
+        self.interval = interval
+        self.checkpoint_interval = checkpoint_interval
+        self.standby = standby
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = retries
+        self.on_reconnect = on_reconnect
+        self.mode = osys.pMode
+        self.system_file = osys.pSystemFile or None   # lens file of the system
+        self.reconnects = 0        # number of successful reconnects
+        self.downtime = 0.0        # total time (seconds) spent reconnecting
+        self.last_error = None
+        self._last_check = _time.time()
+        self._last_checkpoint = None
+        self._standby = None
+        self._lock = _threading.RLock()
+        self._monitor = None       # monitor executor (see start())
+        self._monitor_com = None
+        self._stop = None          # stop event of the monitor
+        self._lost = _threading.Event()   # set by the monitor
+        if standby:
+            self._create_standby()
+
+    def __repr__(self):
+        return ('{.__name__}(interval={}, standby={}, reconnects={}, downtime={:.1f})'
+                .format(type(self), self.interval, self._standby is not None, self.reconnects,
+                        self.downtime))
+
+    def is_healthy(self):
+        """Probe the connection (a round trip to OpticStudio)"""
+        try:
+            return bool(self.osys.pConnectIsAlive) and _probe(self.osys)
+        except Exception:
+            return False
+
+    def check(self, force=False):
+        """Check the connection if `interval` elapsed since the last check (or
+        if `force`), and reconnect if it is lost. Also makes the automatic
+        checkpoints.
+
+        @return: whether the connection was healthy
+        """
+        with self._lock:
+            now = _time.time()
+            lost = self._lost.is_set()
+            if not force and not lost and now - self._last_check < self.interval:
+                return True
+            self._last_check = now
+            if lost or not self.is_healthy():
+                self.reconnect()
+                return False
+            self.system_file = self.osys.pSystemFile or self.system_file
+            if self._checkpoint_due(now):
+                self.checkpoint()
+            return True
+
+    def _checkpoint_due(self, now):
+        return (self.checkpoint_interval is not None and
+                (self._last_checkpoint is None or
+                 now - self._last_checkpoint >= self.checkpoint_interval))
+
+    def checkpoint(self, osys=None):
+        """Save a copy of the current state of the system to the checkpoint file
+
+        @param osys: system used to make the copy (default is the supervised 
+                     system); the monitor thread passes its own system
+        """
+        osys = self.osys if osys is None else osys
+        with self._lock:
+            tmp_file = _os.path.join(self.state_dir, 'state_tmp.zmx')
+            copy = osys.CopySystem()
+            copy.SaveAs(tmp_file)
+            copy.Close(False)
+            if _os.path.exists(self.state_file):
+                _os.remove(self.state_file)
+            _os.rename(tmp_file, self.state_file)
+            self._last_checkpoint = _time.time()
+
+    def _create_standby(self):
+        try:
+            self._standby = _new_connection()
+        except Exception as e:
+            self._standby = None
+            self.standby = False
+            _warnings.warn('Standby connection disabled: {}'.format(e), stacklevel=3)
+
+    def _restore_file(self):
+        """Returns the newest of the checkpoint file and the lens file"""
+        files = [f for f in (self.state_file, self.system_file) if f and _os.path.exists(f)]
+        return max(files, key=_os.path.getmtime) if files else None
+
+    def reconnect(self):
+        """Reconnect (with backoff) and restore the state of the system
+
+        @return: the file the state was restored from (or `None`)
+        """
+        with self._lock:
+            start = _time.time()
+            delay = self.backoff
+            for attempt in range(self.max_attempts):
+                connection, self._standby = self._standby, None
+                try:
+                    self.osys.zReconnect(self.mode, connection)
+                    filename = self._restore_file()
+                    if filename:
+                        self.osys.LoadFile(filename, False)
+                    if not self.is_healthy():
+                        raise ConnectionLostError('The new connection is not alive')
+                except Exception as e:
+                    self.last_error = e
+                    if attempt + 1 < self.max_attempts:
+                        _time.sleep(delay*_random.uniform(0.5, 1.0))
+                        delay = min(2.0*delay, self.max_backoff)
+                    continue
+                self.reconnects += 1
+                self.downtime += _time.time() - start
+                self._last_check = _time.time()
+                self._lost.clear()
+                if self._monitor is not None:   # the monitor's interfaces are dead
+                    self.stop()
+                    self.start(self._monitor_com)
+                if self.standby:
+                    self._create_standby()
+                if self.on_reconnect is not None:
+                    self.on_reconnect(self.osys)
+                return filename
+            self.downtime += _time.time() - start
+            raise ConnectionLostError("Couldn't reconnect in {} attempts: {}"
+                                      .format(self.max_attempts, self.last_error))
+
+    def call(self, func, *args, **kwargs):
+        """Return `func(osys, *args, **kwargs)`; if it fails and the connection
+        is lost, reconnect and call it again (up to `retries` times)"""
+        self.check()
+        for attempt in range(self.retries + 1):
+            try:
+                return func(self.osys, *args, **kwargs)
+            except Exception:
+                with self._lock:
+                    if attempt == self.retries or self.is_healthy():
+                        raise
+                    self.reconnect()
+
+    def start(self, com=None):
+        """Start a monitor thread that probes the connection every `interval`,
+        and makes the automatic checkpoints. Call it from the thread owning 
+        the system.
+
+        @param com: COM layer of the monitor thread (see 
+                    `pyzos.comthread.COMThreadPoolExecutor`)
+        """
+        if self._monitor is None:
+            self._monitor_com = com
+            self._stop = _threading.Event()
+            # plain COM objects (and stand-ins) are used unwrapped
+            wrap = _comthread._wrap_system if hasattr(self.osys, '_iopticalsystem') else None
+            self._monitor = _comthread.COMThreadPoolExecutor(self.osys, max_workers=1, com=com,
+                                                             wrap=wrap)
+            self._monitor.submit(self._monitor_loop, self._stop)
+        return self
+
+    def stop(self):
+        """Stop the monitor thread"""
+        if self._monitor is not None:
+            self._stop.set()
+            self._monitor.shutdown()
+            self._monitor = None
+
+    def _monitor_loop(self, osys, stop):
+        """Task of the monitor thread; `osys` is the system of the thread"""
+        while not stop.wait(self.interval):
+            if not _probe(osys):
+                self._lost.set()   # reconnected by the next check() or call()
+                return
+            if self._checkpoint_due(_time.time()) and self._lock.acquire(False):
+                try:
+                    self.checkpoint(osys)
+                except Exception as e:
+                    self.last_error = e
+                finally:
+                    self._lock.release()
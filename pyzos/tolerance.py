@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        tolerance.py
+# Purpose:     Parallel Monte Carlo tolerancing with streamed, resumable results
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Parallel Monte Carlo tolerancing.
+
+The tolerance operands are read from the Tolerance Data Editor (TDE) of the
+lens file. For each trial, the perturbation values are drawn from a random
+generator seeded with (seed, trial number), so the trials are reproducible
+regardless of which worker runs them. The trials are evaluated in a pool of
+worker processes with independent ZOS-API connections (`pyzos.workers`); the
+compensators (TDE 'COMP' operands) are optimized with the local optimizer,
+and the criterion is the merit function value (or a user function).
+
+The results (criterion, perturbation values and compensator values of each
+trial) are appended to a columnar on-disk store (`pyzos.colstore`) as they
+arrive. An interrupted run is resumed by running it again with the same
+store directory; only the missing trials are evaluated.
+
+Supported perturbation operands: TRAD, TCUR, TTHI, TCON, TSDX, TSDY, TSTX and
+TSTY. Trial 0 is the nominal system.
+
+Example
+-------
+>>> import pyzos.tolerance as tol
+>>> store = tol.monte_carlo(r'C:\\lenses\\doublet.zmx', 'mc_doublet', num_trials=10000,
+...                         seed=1, processes=8)
+>>> store['criterion']
+"""
+from __future__ import division, print_function
+import os as _os
+import time as _time
+import warnings as _warnings
+import collections as _co
+import numpy as _np
+from pyzos.colstore import ColumnStore as _ColumnStore
+from pyzos.workers import SystemPool as _SystemPool
+
+#%% Module constants
+PERTURBATION_OPERANDS = ('TRAD', 'TCUR', 'TTHI', 'TCON', 'TSDX', 'TSDY', 'TSTX', 'TSTY')
+COMPENSATOR_OPERANDS = ('COMP',)
+# operands that don't define perturbations (ignored without warning)
+_CONTROL_OPERANDS = ('TWAV', 'SAVE', 'STAT', 'SEED', 'CPAR', 'CEDV', 'TMCO', 'TCMU', 'UNDF')
+DISTRIBUTIONS = ('uniform', 'normal', 'parabolic')
+
+tolerance = _co.namedtuple('tolerance', ['type', 'param1', 'param2', 'param3', 'min', 'max'])
+
+#%% Perturbation sampling
+def sample(tolerances, trial, seed=0, distribution='uniform'):
+    """Return the perturbation values of the trial number `trial`
+
+    @param tolerances: list of `tolerance` namedtuples
+    @param trial: trial number (trial 0 is the nominal system)
+    @param seed: seed of the run; the values only depend on (seed, trial)
+    @param distribution: 'uniform' over [min, max]; 'normal' with the mean at
+                         the center and (min, max) at +/-2 standard deviations
+                         (truncated); or 'parabolic' (density increasing towards
+                         the limits)
+    @return: array of perturbation values
+    """
+    if trial == 0:
+        return _np.zeros(len(tolerances))
+    rs = _np.random.RandomState([seed, trial])
+    num = len(tolerances)
+    if distribution == 'uniform':
+        u = rs.uniform(-1.0, 1.0, num)
+    elif distribution == 'normal':
+        u = rs.standard_normal(num)
+        out = _np.abs(u) > 2.0
+        while out.any():
+            u[out] = rs.standard_normal(out.sum())
+            out = _np.abs(u) > 2.0
+        u = u/2.0
+    elif distribution == 'parabolic':
+        v = rs.uniform(-1.0, 1.0, num)
+        u = _np.sign(v)*_np.abs(v)**(1.0/3.0)
+    else:
+        raise ValueError('Unknown distribution {}'.format(distribution))
+    lo = _np.array([t.min for t in tolerances], dtype=_np.float64)
+    hi = _np.array([t.max for t in tolerances], dtype=_np.float64)
+    return 0.5*(hi + lo) + 0.5*(hi - lo)*u
+
+#%% Worker functions (run in the worker processes)
+def read_tolerances(osys):
+    """Return list of `tolerance` namedtuples of the operands of the TDE"""
+    from pyzos.zos import _constant_names
+    type_names = _constant_names('TolerancingOperand_')
+    tde = osys.pTDE
+    tols = []
+    for i in range(1, tde.pNumberOfOperands + 1):
+        row = tde.GetOperandAt(i)
+        tols.append(tolerance(type_names.get(row.Type, str(row.Type)), row.Param1,
+                              row.Param2, row.Param3, row.Min, row.Max))
+    return tols
+
+def _apply_perturbation(osys, tol, value):
+    surf = osys.pLDE.GetSurfaceAt(tol.param1)
+    if tol.type == 'TRAD':
+        surf.pRadius = surf.pRadius + value
+    elif tol.type == 'TCUR':
+        radius = surf.pRadius
+        curvature = (1.0/radius if radius and _np.isfinite(radius) else 0.0) + value
+        surf.pRadius = 1.0/curvature if curvature else _np.inf
+    elif tol.type == 'TTHI':
+        surf.pThickness = surf.pThickness + value
+        if tol.param2 > tol.param1:  # adjust surface keeps the following surfaces in place
+            adjust = osys.pLDE.GetSurfaceAt(tol.param2)
+            adjust.pThickness = adjust.pThickness - value
+    elif tol.type == 'TCON':
+        surf.pConic = surf.pConic + value
+    else:
+        tilt_decenter = surf.pTiltDecenterData
+        prop = {'TSDX': 'pBeforeSurfaceDecenterX', 'TSDY': 'pBeforeSurfaceDecenterY',
+                'TSTX': 'pBeforeSurfaceTiltX', 'TSTY': 'pBeforeSurfaceTiltY'}[tol.type]
+        setattr(tilt_decenter, prop, getattr(tilt_decenter, prop) + value)
+
+def _compensator_cell(osys, comp):
+    surf = osys.pLDE.GetSurfaceAt(comp.param1)
+    return surf.pRadiusCell if comp.param2 == 1 else surf.pThicknessCell
+
+def _optimize_compensators(osys):
+    """Optimize the variables (the compensators) with the local optimizer"""
+    from pyzos.zos import Const
+    opt = osys.pTools.OpenLocalOptimization()
+    opt.pAlgorithm = Const.OptimizationAlgorithm_DampedLeastSquares
+    opt.pCycles = Const.OptimizationCycles_Automatic
+    opt.RunAndWaitForCompletion()
+    opt.Close()
+
+def run_trial(osys, filename, trial, tolerances, values, compensators, criterion=None):
+    """Evaluate a trial: reload the nominal system, apply the perturbations,
+    optimize the compensators, and evaluate the criterion
+
+    @return: (trial, criterion value, compensator values, elapsed time)
+    """
+    start = _time.time()
+    osys.LoadFile(filename, False)
+    for tol, value in zip(tolerances, values):
+        _apply_perturbation(osys, tol, value)
+    comp_values = []
+    if compensators:
+        tools = osys.pTools
+        tools.RemoveAllVariables()
+        for comp in compensators:
+            _compensator_cell(osys, comp).MakeSolveVariable()
+        if trial:
+            _optimize_compensators(osys)
+        for comp in compensators:
+            surf = osys.pLDE.GetSurfaceAt(comp.param1)
+            comp_values.append(surf.pRadius if comp.param2 == 1 else surf.pThickness)
+    if criterion is None:
+        value = osys.pMFE.CalculateMeritFunction()
+    else:
+        value = criterion(osys)
+    return trial, value, comp_values, _time.time() - start
+
+#%% Orchestrator
+def monte_carlo(filename, directory, num_trials, seed=0, distribution='uniform',
+                processes=None, criterion=None, compensate=True):
+    """Run (or resume) a parallel Monte Carlo tolerance analysis
+
+    Parameters
+    ----------
+    filename : string
+        lens file with the tolerance operands in the TDE, and the merit function
+        used as criterion
+    directory : string
+        directory of the results store (`pyzos.colstore.ColumnStore`). If the
+        store exists, the run is resumed: only the trials missing in the store
+        are evaluated.
+    num_trials : integer
+        number of trials, including the nominal trial 0
+    seed : integer
+        seed of the run
+    distribution : string
+        'uniform', 'normal' or 'parabolic' (see `sample()`)
+    processes : integer, optional
+        number of worker processes (default is the number of CPUs)
+    criterion : callable, optional
+        module level function `criterion(osys)` returning the criterion value;
+        the merit function value is used if `None`
+    compensate : boolean
+        whether to optimize the compensators (COMP operands)
+
+    Returns
+    -------
+    store : ColumnStore
+        columns 'trial', 'criterion', 'elapsed', the perturbation values 'p0',
+        'p1', ... (in the order of `store.meta['tolerances']`) and the
+        compensator values 'c0', 'c1', ... The rows are in completion order.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError('Unknown distribution {}'.format(distribution))
+    filename = _os.path.abspath(filename)
+    pool = _SystemPool(filename, processes)
+    try:
+        tols = pool.apply(read_tolerances)
+        perturbations = [t for t in tols if t.type in PERTURBATION_OPERANDS]
+        compensators = [t for t in tols if t.type in COMPENSATOR_OPERANDS] if compensate else []
+        unsupported = sorted(set(t.type for t in tols) - set(PERTURBATION_OPERANDS) -
+                             set(COMPENSATOR_OPERANDS) - set(_CONTROL_OPERANDS))
+        if unsupported:
+            _warnings.warn('Tolerance operands {} are not supported and are ignored'
+                           .format(', '.join(unsupported)), stacklevel=2)
+        columns = ([('trial', 'i8'), ('criterion', 'f8'), ('elapsed', 'f8')] +
+                   [('p{}'.format(i), 'f8') for i in range(len(perturbations))] +
+                   [('c{}'.format(i), 'f8') for i in range(len(compensators))])
+        meta = {'filename': filename, 'seed': seed, 'distribution': distribution,
+                'tolerances': [list(t) for t in perturbations],
+                'compensators': [list(t) for t in compensators]}
+        store = _ColumnStore(directory, columns, meta)
+        for key in ('seed', 'distribution', 'tolerances', 'compensators'):
+            if store.meta[key] != meta[key]:
+                raise ValueError("Can't resume the run in {}; its {} is different"
+                                 .format(directory, key))
+        done = set(store['trial'].tolist())
+        tasks = ((filename, trial, perturbations,
+                  sample(perturbations, trial, seed, distribution), compensators, criterion)
+                 for trial in range(num_trials) if trial not in done)
+        for trial, value, comp_values, elapsed in pool.imap_unordered(run_trial, tasks):
+            row = {'trial': trial, 'criterion': value, 'elapsed': elapsed}
+            row.update(('p{}'.format(i), v) for i, v in
+                       enumerate(sample(perturbations, trial, seed, distribution)))
+            row.update(('c{}'.format(i), v) for i, v in enumerate(comp_values))
+            store.append(row)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    return store
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        workers.py
+# Purpose:     Pool of worker processes with independent ZOS-API connections
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Pool of worker processes, each with its own (standalone) ZOS-API connection
+and optical system, for distributing independent evaluations of a design,
+such as Monte Carlo trials or finite-difference perturbations.
+
+Tasks are module level (picklable) functions `func(osys, *args)`, where `osys`
+is the `OpticalSystem` of the worker process. Each worker loads the lens
+file once when it starts.
+
+Example
+-------
+>>> from pyzos.workers import SystemPool
+>>> def merit(osys, thick):
+...     osys.pLDE.GetSurfaceAt(2).pThickness = thick
+...     return osys.pMFE.CalculateMeritFunction()
+>>> with SystemPool('lens.zmx', processes=4) as pool:
+...     values = pool.map(merit, [(t,) for t in (4.0, 4.5, 5.0)])
+"""
+from __future__ import division, print_function
+import multiprocessing as _mp
+
+_worker_osys = None     # optical system of the worker process
+
+def _init_worker(filename, mode):
+    global _worker_osys
+    from pyzos.zos import OpticalSystem
+    _worker_osys = OpticalSystem(mode=mode)
+    if filename:
+        _worker_osys.LoadFile(filename, False)
+
+def _run_task(task):
+    func, args = task
+    return func(_worker_osys, *args)
+
+def worker_system():
+    """Return the optical system of the current worker process"""
+    return _worker_osys
+
+class SystemPool(object):
+    """Pool of worker processes with independent ZOS-API connections"""
+    def __init__(self, filename=None, processes=None, mode=0):
+        """
+        @param filename: lens file loaded by each worker (absolute path)
+        @param processes: number of worker processes (default is the number of CPUs)
+        @param mode: sequential (0) or non-sequential (1) mode of the systems
+        """
+        self.filename = filename
+        self.processes = processes or _mp.cpu_count()
+        self._pool = _mp.Pool(self.processes, _init_worker, (filename, mode))
+
+    def __repr__(self):
+        return "{.__name__}('{}', processes={})".format(type(self), self.filename,
+                                                       self.processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+        return False
+
+    def apply(self, func, *args):
+        """Run `func(osys, *args)` in a worker and return the result"""
+        return self._pool.apply(_run_task, ((func, args),))
+
+    def map(self, func, args_list, chunksize=1):
+        """Return list of `func(osys, *args)` for each `args` of `args_list`"""
+        return self._pool.map(_run_task, [(func, tuple(args)) for args in args_list], chunksize)
+
+    def imap_unordered(self, func, args_list, chunksize=1):
+        """Iterator of the results of `func(osys, *args)` for each `args` of
+        `args_list`, in the order they are completed"""
+        return self._pool.imap_unordered(_run_task, ((func, tuple(args)) for args in args_list),
+                                         chunksize)
+
+    def close(self):
+        """Wait for the pending tasks and stop the workers"""
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """Stop the workers immediately"""
+        self._pool.terminate()
+        self._pool.join()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        zmxcatalog.py
+# Purpose:     Indexed catalog of lens files with fast metadata search
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Indexed catalog of lens files (.zmx) with fast metadata search.
+
+The catalog scans a directory tree (in parallel), extracts key metadata of
+every lens file using the offline reader `pyzos.zmxfile`, and stores them in
+an on-disk SQLite index. Subsequent scans only re-parse new or modified files.
+No OpticStudio call is made.
+
+Example
+-------
+>>> from pyzos.zmxcatalog import LensCatalog
+>>> cat = LensCatalog('lenses.idx')
+>>> cat.update(r'C:\\Users\\me\\Documents\\Zemax\\Samples')
+>>> cat.query(elements=2, efl=(90, 110), glass='N-BK7')
+"""
+from __future__ import division, print_function
+import os as _os
+import sqlite3 as _sqlite3
+import collections as _co
+import multiprocessing as _mp
+import numpy as _np
+import pyzos.zmxfile as _zmx
+import pyzos.paraxial as _par
+
+#%% Module constants
+LENS_FILE_EXTENSIONS = ('.zmx',)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lenses (
+    path         TEXT PRIMARY KEY,
+    mtime        REAL,
+    size         INTEGER,
+    name         TEXT,
+    units        TEXT,
+    efl          REAL,
+    fno          REAL,
+    epd          REAL,
+    field_type   INTEGER,
+    max_field    REAL,
+    num_surf     INTEGER,
+    num_elements INTEGER,
+    num_configs  INTEGER,
+    error        TEXT
+);
+CREATE TABLE IF NOT EXISTS glasses (
+    path  TEXT,
+    glass TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_lenses_efl ON lenses (efl);
+CREATE INDEX IF NOT EXISTS idx_lenses_elements ON lenses (num_elements);
+CREATE INDEX IF NOT EXISTS idx_glasses_glass ON glasses (glass);
+CREATE INDEX IF NOT EXISTS idx_glasses_path ON glasses (path);
+"""
+
+_COLUMNS = ['path', 'mtime', 'size', 'name', 'units', 'efl', 'fno', 'epd', 'field_type',
+            'max_field', 'num_surf', 'num_elements', 'num_configs', 'error']
+
+lens_record = _co.namedtuple('lens_record', _COLUMNS + ['glasses'])
+
+#%% Metadata extraction
+def lens_metadata(path):
+    """Return the catalog metadata (`lens_record`) of the lens file `path`.
+
+    Files that can't be read are returned with the `error` field set.
+    """
+    stat = _os.stat(path)
+    try:
+        lens = _zmx.read_zmx(path)
+        index = _par.surface_indices(lens.material, lens.nd)
+        efl = _par.trace(lens.curvature, lens.thickness, index, lens.stop, 0.0).efl
+    except Exception as err:
+        return lens_record(path, stat.st_mtime, stat.st_size, '', '', None, None, None,
+                           None, None, None, None, None, str(err) or type(err).__name__, [])
+    efl = float(efl) if _np.isfinite(efl) else None
+    epd = lens.aperture_value if lens.aperture_type == 'ENPD' else None
+    if lens.aperture_type in ('FNUM', 'PFNO'):
+        fno = lens.aperture_value
+    elif epd and efl is not None:
+        fno = abs(efl) / epd
+    else:
+        fno = None
+    max_field = (float(_np.hypot(lens.fields[:, 0], lens.fields[:, 1]).max()) 
+                 if len(lens.fields) else 0.0)
+    return lens_record(path, stat.st_mtime, stat.st_size, lens.name, lens.units,
+                       efl, fno, epd, lens.field_type,
+                       max_field, lens.numSurf, lens.num_elements, lens.num_configs, None,
+                       lens.glasses)
+
+def iter_lens_files(directory):
+    """Generator of lens file names in the directory tree `directory`"""
+    for root, _, files in _os.walk(directory):
+        for f in files:
+            if f.lower().endswith(LENS_FILE_EXTENSIONS):
+                yield _os.path.join(root, f)
+
+#%% Catalog class
+class LensCatalog(object):
+    """Incremental on-disk index of lens file metadata"""
+    def __init__(self, index_file):
+        """
+        @param index_file: name of the index file (created if it doesn't exist).
+                           Use ':memory:' for a non-persistent index.
+        """
+        self.index_file = index_file
+        self._db = _sqlite3.connect(index_file)
+        self._db.executescript(_SCHEMA)
+
+    def __repr__(self):
+        return "{.__name__}('{}', numLens={})".format(type(self), self.index_file, len(self))
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM lenses').fetchone()[0]
+
+    def close(self):
+        """Close the index"""
+        self._db.close()
+
+    def update(self, directory, processes=None, chunksize=16):
+        """Scan the directory tree `directory` and update the index. Only new
+        and modified files are parsed; entries of files that no longer exist
+        in the tree are removed.
+
+        @param directory: root of the directory tree to scan
+        @param processes: number of worker processes used for parsing (default is
+                          the number of CPUs). Use 1 to parse in this process.
+        @param chunksize: number of files sent to a worker process at a time
+        @return: tuple (num_parsed, num_removed)
+        """
+        directory = _os.path.abspath(directory)
+        prefix = _os.path.join(directory, '')
+        known = dict(((p, (m, s)) for p, m, s in
+                      self._db.execute('SELECT path, mtime, size FROM lenses')
+                      if p.startswith(prefix)))
+        to_parse = []
+        for path in iter_lens_files(directory):
+            stat = _os.stat(path)
+            if known.pop(path, None) != (stat.st_mtime, stat.st_size):
+                to_parse.append(path)
+        removed = list(known)
+        if processes == 1 or len(to_parse) < 2*chunksize:
+            records = map(lens_metadata, to_parse)
+            self._store(records, removed)
+        else:
+            pool = _mp.Pool(processes)
+            try:
+                records = pool.imap_unordered(lens_metadata, to_parse, chunksize)
+                self._store(records, removed)
+            finally:
+                pool.close()
+                pool.join()
+        return len(to_parse), len(removed)
+
+    def _store(self, records, removed):
+        with self._db:
+            for path in removed:
+                self._db.execute('DELETE FROM lenses WHERE path = ?', (path,))
+                self._db.execute('DELETE FROM glasses WHERE path = ?', (path,))
+            for rec in records:
+                self._db.execute('DELETE FROM glasses WHERE path = ?', (rec.path,))
+                self._db.execute('INSERT OR REPLACE INTO lenses VALUES ({})'
+                                 .format(','.join('?'*len(_COLUMNS))), rec[:len(_COLUMNS)])
+                self._db.executemany('INSERT INTO glasses VALUES (?, ?)',
+                                     [(rec.path, g.upper()) for g in rec.glasses])
+
+    def query(self, elements=None, efl=None, fno=None, max_field=None, glass=None,
+              name=None, num_configs=None, modified_after=None):
+        """Search the index
+
+        Parameters
+        ----------
+        elements : integer or 2-tuple, optional
+            number of elements (a doublet has 2 elements), or (min, max) range
+        efl : 2-tuple of real, optional
+            (min, max) effective focal length in lens units; use `None` for an
+            open end
+        fno : 2-tuple of real, optional
+            (min, max) F/#
+        max_field : 2-tuple of real, optional
+            (min, max) of the maximum field value (in the field units of the lens)
+        glass : string or sequence of strings, optional
+            glass name(s); all of them must be used in the lens
+        name : string, optional
+            sub-string (case insensitive) of the lens title or file path
+        num_configs : integer or 2-tuple, optional
+            number of configurations, or (min, max) range
+        modified_after : real, optional
+            modification time (seconds since the epoch)
+
+        Returns
+        -------
+        records : list of `lens_record` namedtuples
+        """
+        where, params = ['error IS NULL'], []
+        def add_range(column, rng):
+            if rng is None:
+                return
+            lo, hi = (rng, rng) if not isinstance(rng, (tuple, list)) else rng
+            if lo is not None:
+                where.append('{} >= ?'.format(column))
+                params.append(lo)
+            if hi is not None:
+                where.append('{} <= ?'.format(column))
+                params.append(hi)
+        add_range('num_elements', elements)
+        add_range('efl', efl)
+        add_range('fno', fno)
+        add_range('max_field', max_field)
+        add_range('num_configs', num_configs)
+        add_range('mtime', (modified_after, None) if modified_after is not None else None)
+        if name:
+            where.append('(name LIKE ? OR path LIKE ?)')
+            params.extend(['%{}%'.format(name)]*2)
+        if glass:
+            glasses = [glass] if isinstance(glass, str) else list(glass)
+            for g in glasses:
+                where.append('path IN (SELECT path FROM glasses WHERE glass = ?)')
+                params.append(g.upper())
+        sql = 'SELECT * FROM lenses WHERE {} ORDER BY path'.format(' AND '.join(where))
+        rows = self._db.execute(sql, params).fetchall()
+        return [lens_record(*(row + (self._glasses(row[0]),))) for row in rows]
+
+    def _glasses(self, path):
+        return [g for (g,) in self._db.execute('SELECT glass FROM glasses WHERE path = ? '
+                                               'ORDER BY glass', (path,))]
+
+    def errors(self):
+        """Return list of (path, error) of lens files that couldn't be parsed"""
+        return self._db.execute('SELECT path, error FROM lenses WHERE error IS NOT NULL '
+                                'ORDER BY path').fetchall()
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        zmxfile.py
+# Purpose:     Offline reader for OpticStudio sequential lens files (.zmx)
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Pure-Python reader for Zemax/OpticStudio lens files (.zmx).
+
+The reader doesn't require OpticStudio (or PyWin32) and can therefore be used
+on any platform to inspect, index and pre-screen lens designs. The file is
+streamed line-by-line, and the lens data is collected into a compact, array
+backed `LensModel` object.
+
+Example
+-------
+>>> import pyzos.zmxfile as zmx
+>>> lens = zmx.read_zmx('Cooke 40 degree field.zmx')
+>>> lens.curvature, lens.thickness, lens.material
+>>> osys.zSetLDEArray(**lens.lde_arrays())    # bulk write into a live system
+"""
+from __future__ import division, print_function
+import io as _io
+import codecs as _codecs
+import collections as _co
+import numpy as _np
+
+#%% Module constants
+NUM_PARAMS = 12   # number of surface parameter columns (PARM 1 ... PARM 12) retained
+
+# Aperture type keywords used in the lens file and their ZOS-API ZemaxApertureType value
+APERTURE_TYPES = {'ENPD' : 0,   # entrance pupil diameter
+                  'FNUM' : 1,   # image space F/#
+                  'OBNA' : 2,   # object space NA
+                  'FLOA' : 3,   # float by stop size
+                  'PFNO' : 4,   # paraxial working F/#
+                  'OBSC' : 5,}  # object cone angle
+
+# Surface type keywords used in the lens file and their ZOS-API SurfaceType name
+SURFACE_TYPES = {'STANDARD' : 'Standard',
+                 'EVENASPH' : 'EvenAspheric',
+                 'ODDASPHE' : 'OddAsphere',
+                 'TOROIDAL' : 'Toroidal',
+                 'BICONICX' : 'Biconic',
+                 'PARAXIAL' : 'Paraxial',
+                 'COORDBRK' : 'CoordinateBreak',
+                 'TILTSURF' : 'Tilted',
+                 'IRREGULA' : 'Irregular',
+                 'BINARY_1' : 'BinaryOptic1',
+                 'BINARY_2' : 'BinaryOptic2',}
+
+# Multi-configuration cell records have the layout
+#   TYPE int1 config value solve pickup_config pickup_operand scale ... offset "comment" [int2]
+# for example 'THIC 5 2 12.5 0 0 0 1 1 0 0.0 ""'. The second integer of the
+# operand (the parameter number of 'PRAM') follows the comment.
+_MCE_INT2_INDEX = 11
+
+# keywords following 'MNUM' that are not multi-configuration operand cells
+_NON_MCE_KEYWORDS = set(['MNUM', 'MODE', 'MAZH', 'NSCD', 'NSCS', 'COFN', 'BLNK'])
+
+#%% Custom Exceptions
+class ZMXFileError(Exception): pass
+
+#%% Helper functions
+def _detect_encoding(filename):
+    """Returns the text encoding of the lens file `filename`.
+
+    OpticStudio (since Zemax 13) writes lens files as UTF-16 (with BOM); older
+    versions of Zemax used plain 8-bit ANSI text.
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(4)
+    if head.startswith(_codecs.BOM_UTF16_LE) or head.startswith(_codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    elif head.startswith(_codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    elif len(head) >= 2 and head[1:2] == b'\x00':
+        return 'utf-16-le'
+    else:
+        return 'latin-1'
+
+def open_text(filename):
+    """Open a Zemax text file (.zmx, .agf, etc.) for streaming, irrespective of
+    the encoding used for writing the file.
+
+    @param filename: name of the file
+    @return: file object opened in text mode
+    """
+    return _io.open(filename, 'r', encoding=_detect_encoding(filename), errors='replace')
+
+def _split(line):
+    """Split a record line into tokens, keeping quoted strings together"""
+    tokens = []
+    rest = line.strip()
+    while rest:
+        if rest[0] == '"':
+            end = rest.find('"', 1)
+            end = len(rest) if end == -1 else end
+            tokens.append(rest[1:end])
+            rest = rest[end+1:].lstrip()
+        else:
+            parts = rest.split(None, 1)
+            tokens.append(parts[0])
+            rest = parts[1] if len(parts) > 1 else ''
+    return tokens
+
+def _float(token, default=0.0):
+    """Convert lens-file number token to float"""
+    try:
+        return float(token)
+    except (ValueError, TypeError):
+        if isinstance(token, str) and token.upper().startswith('INF'):
+            return _np.inf
+        return default
+
+def iter_records(filename):
+    """Stream the records of a lens file
+
+    @param filename: name of the lens file (.zmx)
+    @return: generator yielding tuples `(surf, keyword, args)` where `surf`
+             is the surface number the record belongs to (None for system
+             records), `keyword` is the 4 letter record keyword (for example
+             'CURV') and `args` is a list of string tokens.
+
+    Notes: the file is read one line at a time, therefore arbitrarily large
+    lens files can be streamed without loading them in memory.
+    """
+    surf = None
+    with open_text(filename) as f:
+        for line in f:
+            indented = line[:1] in (' ', '\t')
+            tokens = _split(line)
+            if not tokens:
+                continue
+            keyword, args = tokens[0], tokens[1:]
+            if keyword == 'SURF':
+                surf = int(args[0])
+            elif not indented:
+                surf = None
+            yield surf, keyword, args
+
+#%% Lens model
+class LensModel(object):
+    """In-memory, array-backed model of a sequential lens
+
+    All per-surface quantities are NumPy arrays of length `numSurf` (including
+    the object and image surfaces) so that they can be consumed by vectorized
+    (batched) computations directly. Fields and wavelengths use the 1-based
+    numbering convention of OpticStudio where numbers are exposed (such as
+    `primary_wave`).
+    """
+    def __init__(self):
+        self.filename = None
+        self.name = ''
+        self.mode = 'SEQ'
+        self.units = 'MM'
+        self.stop = 1
+        # aperture
+        self.aperture_type = 'ENPD'
+        self.aperture_value = 0.0
+        # per-surface data (arrays)
+        self.surf_type = []
+        self.curvature = None
+        self.thickness = None
+        self.semidia = None
+        self.semidia_fixed = None    # bool array, True for fixed (user defined) semi-diameters
+        self.conic = None
+        self.material = []
+        self.nd = None
+        self.vd = None
+        self.parm = None
+        self.comment = []
+        # fields
+        self.field_type = 0
+        self.fields = _np.zeros((0, 2))
+        self.field_weights = _np.zeros(0)
+        # wavelengths
+        self.wavelengths = _np.zeros(0)
+        self.wave_weights = _np.zeros(0)
+        self.primary_wave = 1
+        # multi-configuration data
+        self.num_configs = 1
+        self.mce_operands = []       # list of (type, param1, param2) tuples
+        self.mce_values = _np.zeros((1, 0))  # configs x operands (NaN if not numeric)
+        self.mce_strings = [[]]              # configs x operands, as in the file
+
+    def __repr__(self):
+        return ("{.__name__}(name='{}', numSurf={}, numField={}, numWave={}, "
+                "numConfig={})".format(type(self), self.name, self.numSurf,
+                                       len(self.fields), len(self.wavelengths),
+                                       self.num_configs))
+
+    @property
+    def numSurf(self):
+        """number of surfaces, including the object and image surfaces"""
+        return len(self.surf_type)
+
+    @property
+    def radius(self):
+        """radii of curvature (inf for plano surfaces)"""
+        with _np.errstate(divide='ignore'):
+            return _np.where(self.curvature == 0, _np.inf, 1.0/self.curvature)
+
+    @property
+    def glasses(self):
+        """sorted list of unique glasses (excluding mirrors) used in the lens"""
+        return sorted(set(m for m in self.material if m and m != 'MIRROR'))
+
+    @property
+    def num_elements(self):
+        """number of singlet elements (a cemented doublet counts as two)"""
+        return sum(1 for m in self.material[:-1] if m and m != 'MIRROR')
+
+    def lde_arrays(self, all_semidia=False):
+        """Return the LDE data of the model as a dictionary of arrays suitable
+        for bulk writing using `OpticalSystem.zSetLDEArray()`
+
+        @param all_semidia: if False (default), only the fixed semi-diameters are
+                            included (the others are NaN, i.e. not written, so
+                            that automatic semi-diameters stay automatic); if
+                            True, the semi-diameters of all surfaces are included
+
+        The dictionary includes the stop surface, the surface types (ZOS-API
+        SurfaceType names) and the parameters of the non-standard surfaces. The
+        round-trip is lossy for the surface types not in `SURFACE_TYPES`: their
+        type and parameters are `None` and NaN (not written), and the data
+        beyond the 12 parameter columns (extra data) is not retained.
+        """
+        semidia = self.semidia.copy()
+        if not all_semidia:
+            semidia[~self.semidia_fixed] = _np.nan
+        surftype = [SURFACE_TYPES.get(t) for t in self.surf_type]
+        parm = self.parm.copy()
+        parm[[t in (None, 'Standard') for t in surftype]] = _np.nan
+        return dict(radius=self.radius, thick=self.thickness,
+                    material=list(self.material), semidia=semidia,
+                    conic=self.conic, comment=list(self.comment), stop=self.stop,
+                    surftype=surftype, parm=parm)
+
+    def config(self, num):
+        """Return a copy of the model with the multi-configuration operands of
+        configuration `num` (1-based) applied. Only the surface operands
+        'CRVT', 'THIC', 'GLSS', 'CONI', 'SDIA', 'APER' and 'PRAM' are applied;
+        the catalog index data (`nd`, `vd`) is not updated for 'GLSS'.
+        """
+        if not 1 <= num <= self.num_configs:
+            raise ValueError('Invalid configuration number {}'.format(num))
+        lens = _copy_model(self)
+        for k, (optype, param, param2) in enumerate(lens.mce_operands):
+            value = lens.mce_values[num - 1, k]
+            if optype == 'GLSS':
+                lens.material[param] = lens.mce_strings[num - 1][k]
+                continue
+            if _np.isnan(value):
+                continue
+            if optype == 'CRVT':
+                lens.curvature[param] = value
+            elif optype == 'THIC':
+                lens.thickness[param] = value
+            elif optype == 'CONI':
+                lens.conic[param] = value
+            elif optype == 'SDIA':
+                lens.semidia[param] = value
+                lens.semidia_fixed[param] = True
+            elif optype == 'PRAM' and 1 <= param2 <= NUM_PARAMS:
+                lens.parm[param, param2 - 1] = value
+            elif optype == 'APER':
+                lens.aperture_value = value
+        return lens
+
+def _copy_model(lens):
+    new = LensModel()
+    for key, value in vars(lens).items():
+        if isinstance(value, _np.ndarray):
+            value = value.copy()
+        elif isinstance(value, list):
+            value = [list(v) if isinstance(v, list) else v for v in value]
+        setattr(new, key, value)
+    return new
+
+#%% Reader
+def read_zmx(filename):
+    """Read a sequential lens file into an in-memory `LensModel`
+
+    @param filename: name of the lens file (.zmx)
+    @return: instance of `LensModel`
+    @raise: ZMXFileError if the file is not a sequential lens file, or doesn't
+            contain any surface data.
+    """
+    lens = LensModel()
+    lens.filename = filename
+    surfs = _co.OrderedDict()
+    numField, numWave = None, None
+    xfln, yfln, fwgn = [], [], []
+    waves = {}
+    wavl, wwgt = [], []
+    mce_cells = []          # (type, param1, config, value-token)
+    in_mce = False
+
+    for surf, kw, args in iter_records(filename):
+        if surf is not None:
+            s = surfs.get(surf)
+            if s is None:
+                s = surfs[surf] = {'TYPE' : 'STANDARD', 'CURV' : 0.0, 'DISZ' : 0.0,
+                                   'DIAM' : 0.0, 'FIXD' : False, 'CONI' : 0.0, 'GLAS' : '',
+                                   'ND' : 1.0, 'VD' : 0.0, 'COMM' : '',
+                                   'PARM' : _np.zeros(NUM_PARAMS)}
+            if kw == 'TYPE' and args:
+                s['TYPE'] = args[0]
+            elif kw == 'STOP':
+                lens.stop = surf
+            elif kw in ('CURV', 'DISZ', 'DIAM', 'CONI') and args:
+                s[kw] = _float(args[0])
+                if kw == 'DIAM':   # DIAM value solve ...; solve 1 is a fixed semi-diameter
+                    s['FIXD'] = len(args) > 1 and args[1] == '1'
+            elif kw == 'GLAS' and args:
+                s['GLAS'] = args[0]
+                if len(args) > 4:
+                    s['ND'], s['VD'] = _float(args[3], 1.0), _float(args[4])
+            elif kw == 'COMM':
+                s['COMM'] = ' '.join(args)
+            elif kw == 'PARM' and len(args) > 1:
+                n = int(args[0])
+                if 1 <= n <= NUM_PARAMS:
+                    s['PARM'][n - 1] = _float(args[1])
+            continue
+        # system records
+        if kw == 'NAME':
+            lens.name = ' '.join(args)
+        elif kw == 'MODE' and args:
+            lens.mode = args[0]
+            if lens.mode != 'SEQ':
+                raise ZMXFileError('{} is not a sequential lens file'.format(filename))
+        elif kw == 'UNIT' and args:
+            lens.units = args[0]
+        elif kw in APERTURE_TYPES:
+            lens.aperture_type = kw
+            lens.aperture_value = _float(args[0]) if args else 0.0
+        elif kw == 'FTYP' and args:
+            lens.field_type = int(args[0])
+            if len(args) > 3:
+                numField, numWave = int(args[2]), int(args[3])
+        elif kw == 'XFLN':
+            xfln = [_float(a) for a in args]
+        elif kw == 'YFLN':
+            yfln = [_float(a) for a in args]
+        elif kw == 'FWGN':
+            fwgn = [_float(a) for a in args]
+        elif kw == 'WAVM' and len(args) > 1:
+            waves[int(args[0])] = (_float(args[1]), _float(args[2], 1.0) if len(args) > 2 else 1.0)
+        elif kw == 'WAVL':
+            wavl = [_float(a) for a in args]
+        elif kw == 'WWGT':
+            wwgt = [_float(a) for a in args]
+        elif kw == 'PWAV' and args:
+            lens.primary_wave = int(args[0])
+        elif kw == 'MNUM' and args:
+            lens.num_configs = max(1, int(args[0]))
+            in_mce = True
+        elif in_mce and len(args) > 2 and len(kw) == 4 and kw not in _NON_MCE_KEYWORDS:
+            # multi-configuration cell record (see _MCE_INT2_INDEX)
+            try:
+                mce_cells.append(('OFF' if kw == 'MOFF' else kw, int(args[0]),
+                                  int(args[1]), args[2],
+                                  int(args[_MCE_INT2_INDEX])
+                                  if len(args) > _MCE_INT2_INDEX and kw == 'PRAM' else 0))
+            except ValueError:
+                in_mce = False
+
+    if not surfs:
+        raise ZMXFileError('No surface data found in {}'.format(filename))
+
+    # surface data arrays
+    rows = list(surfs.values())
+    lens.surf_type = [r['TYPE'] for r in rows]
+    lens.curvature = _np.array([r['CURV'] for r in rows], dtype=_np.float64)
+    lens.thickness = _np.array([r['DISZ'] for r in rows], dtype=_np.float64)
+    lens.semidia = _np.array([r['DIAM'] for r in rows], dtype=_np.float64)
+    lens.semidia_fixed = _np.array([r['FIXD'] for r in rows], dtype=bool)
+    lens.conic = _np.array([r['CONI'] for r in rows], dtype=_np.float64)
+    lens.material = [r['GLAS'] for r in rows]
+    lens.nd = _np.array([r['ND'] if r['GLAS'] and r['GLAS'] != 'MIRROR' else 1.0
+                         for r in rows], dtype=_np.float64)
+    lens.vd = _np.array([r['VD'] for r in rows], dtype=_np.float64)
+    lens.parm = _np.array([r['PARM'] for r in rows], dtype=_np.float64)
+    lens.comment = [r['COMM'] for r in rows]
+
+    # field data
+    maxField = min(len(xfln), len(yfln))
+    if maxField:
+        fields = _np.array([xfln[:maxField], yfln[:maxField]], dtype=_np.float64).T
+        weights = _np.array((fwgn + [1.0]*maxField)[:maxField], dtype=_np.float64)
+        if numField is None:  # unused field slots are stored as zeros with zero weight
+            used = [i for i in range(maxField) if i == 0 or fields[i].any() or weights[i]]
+        else:
+            used = list(range(min(max(numField, 1), maxField)))
+        lens.fields, lens.field_weights = fields[used], weights[used]
+    else:
+        lens.fields, lens.field_weights = _np.zeros((1, 2)), _np.ones(1)
+
+    # wavelength data
+    if waves:
+        nums = sorted(waves)[:numWave] if numWave else sorted(waves)
+        lens.wavelengths = _np.array([waves[n][0] for n in nums], dtype=_np.float64)
+        lens.wave_weights = _np.array([waves[n][1] for n in nums], dtype=_np.float64)
+    elif wavl:
+        wavl = wavl[:numWave] if numWave else [w for w in wavl if w]
+        lens.wavelengths = _np.array(wavl, dtype=_np.float64)
+        lens.wave_weights = _np.array((wwgt + [1.0]*len(wavl))[:len(wavl)],
+                                      dtype=_np.float64)
+    else:
+        lens.wavelengths, lens.wave_weights = _np.array([0.55]), _np.ones(1)
+
+    # multi-configuration data
+    _build_mce(lens, mce_cells)
+    return lens
+
+def _build_mce(lens, mce_cells):
+    """Arrange the multi-configuration cell records into a configs x operands
+    value matrix. A new operand starts when the configuration number of
+    consecutive cell records doesn't increase.
+    """
+    operands, columns = [], []
+    last_config = None
+    for optype, param, config, value, param2 in mce_cells:
+        if last_config is None or config <= last_config:
+            operands.append((optype, param, param2))
+            columns.append({})
+        columns[-1][config] = value
+        last_config = config
+    numConfig = max([lens.num_configs] + [max(c) for c in columns if c])
+    lens.num_configs = numConfig
+    lens.mce_operands = operands
+    values = _np.full((numConfig, len(operands)), _np.nan)
+    strings = [[''] * len(operands) for _ in range(numConfig)]
+    for k, col in enumerate(columns):
+        for config, token in col.items():
+            values[config - 1, k] = _float(token, _np.nan)
+            strings[config - 1][k] = token
+    lens.mce_values = values
+    lens.mce_strings = strings
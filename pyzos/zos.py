@@ -16,11 +16,23 @@ import win32com.client as _comclient
 import pythoncom as _pythoncom
 import tempfile as _tempfile
 import time as _time
+import hashlib as _hashlib
+import weakref as _weakref
+import numpy as _np
 from pyzos.zosutils import (ZOSPropMapper as _ZOSPropMapper, 
                             replicate_methods as _replicate_methods,
                             inheritance_dict as _inheritance_dict,
-                            wrapped_zos_object as wrapped_zos_object)
+                            wrapped_zos_object as wrapped_zos_object,
+                            snapshot as _snapshot,
+                            invalidate_snapshot as _invalidate_snapshot,
+                            PropertyBatch as _PropertyBatch,
+                            get_property_mappers as _get_property_mappers,
+                            get_owner as _get_owner,
+                            add_edit_hook as _add_edit_hook)
 import pyzos.ddeclient as _dde
+import pyzos.resultcache as _rcache
+import pyzos.workers as _workers
+import pyzos.zosarrays as _zarr
 
 
 #%% Custom Exceptions and Exception handling
@@ -40,6 +52,22 @@ def _get_constants_dict():
     else:
         return dict(const_dict)
     
+def _constant_names(prefix):
+    """Returns dictionary of the value : name (without `prefix`) of the ZOS API 
+    constants whose names start with `prefix`, such as 'MultiConfigOperandType_'"""
+    return dict((value, name[len(prefix):]) for name, value in vars(Const).items()
+                if name.startswith(prefix))
+
+def _read_cell(cell):
+    """Returns the value of the editor cell `cell` as float, integer, or string"""
+    data_type = cell.DataType
+    if data_type == Const.CellDataType_Double:
+        return cell.DoubleValue
+    elif data_type == Const.CellDataType_Integer:
+        return cell.IntegerValue
+    else:
+        return cell.Value
+
 def _get_sync_ui_filename():
     temp_dir = _tempfile.gettempdir()
     temp_file = 'pyzos_ui_sync_file_{}.zmx'.format(_os.getpid())
@@ -207,21 +235,183 @@ class _PyZOSApp(object):
     connect = None
     
     def __new__(cls):
-        global Const
         if not cls.app:
-            # ensure win32com support files for ZOSAPI_Interfaces are available,
-            # generate if necessary.
-            _comclient.gencache.EnsureModule('ZOSAPI_Interfaces', 0, 1, 0)
-            edispatch = _comclient.gencache.EnsureDispatch
-            cls.connect = edispatch('ZOSAPI.ZOSAPI_Connection')
-            cls.app = cls.connect.CreateNewApplication()
-            if cls.connect.IsAlive:
-                Const = type('Const', (), _get_constants_dict()) # Constants class
-            else:
-                raise InitializationError("Couldn't connect to OpticStudio; "
-                    "Ensure hw/sw/net license key is properly installed." )
+            cls.connect, cls.app = new_connection()
         return cls.app
 
+def new_connection():
+    """Returns (connection, application) of a new ZOS-API standalone application.
+    See `OpticalSystem.zReconnect()`."""
+    global Const
+    # ensure win32com support files for ZOSAPI_Interfaces are available,
+    # generate if necessary.
+    _comclient.gencache.EnsureModule('ZOSAPI_Interfaces', 0, 1, 0)
+    edispatch = _comclient.gencache.EnsureDispatch
+    connect = edispatch('ZOSAPI.ZOSAPI_Connection')
+    app = connect.CreateNewApplication()
+    if connect.IsAlive:
+        Const = type('Const', (), _get_constants_dict()) # Constants class
+    else:
+        raise InitializationError("Couldn't connect to OpticStudio; "
+            "Ensure hw/sw/net license key is properly installed." )
+    return connect, app
+
+#%% Content fingerprint machinery
+# sections of the optical system state, in the order they are hashed
+FINGERPRINT_SECTIONS = ('SystemData', 'Fields', 'Wavelengths', 'LDE', 'MCE', 'NCE')
+
+# (prefix of ZOS interface name, sections that edits of the objects may change). 
+# The multi-configuration editor shows (and modifies) the values of the current 
+# configuration, therefore, edits of the other sections may change the MCE too.
+_EDIT_SECTIONS = [
+    ('IField', ('Fields', 'MCE')),
+    ('IWavelength', ('Wavelengths', 'MCE')),
+    ('ISystemData', ('SystemData', 'MCE')),
+    ('ISD', ('SystemData', 'MCE')),
+    ('ILensDataEditor', ('LDE', 'MCE')),
+    ('ILDE', ('LDE', 'MCE')),
+    ('ISurface', ('LDE', 'MCE')),
+    ('IMultiConfigEditor', FINGERPRINT_SECTIONS),
+    ('IMCE', FINGERPRINT_SECTIONS),
+    ('INonSeqEditor', ('NCE', 'MCE')),
+    ('INCE', ('NCE', 'MCE')),
+    ('IObject', ('NCE', 'MCE')),
+    ('IEditor', FINGERPRINT_SECTIONS),        # editor cells, rows, etc.
+    ('ISolve', FINGERPRINT_SECTIONS),
+    ('IOpticalSystem', FINGERPRINT_SECTIONS),
+    ('OpticalSystem', FINGERPRINT_SECTIONS),
+    ('ILocalOptimization', FINGERPRINT_SECTIONS),
+    ('IGlobalOptimization', FINGERPRINT_SECTIONS),
+    ('IHammerOptimization', FINGERPRINT_SECTIONS),
+    ('IQuick', FINGERPRINT_SECTIONS),         # quick focus & quick adjust tools
+]
+_edit_sections_cache = {}
+
+def _edited_sections(cls_name):
+    """Returns the fingerprint sections that may change by edits of objects of
+    the ZOS interface `cls_name`"""
+    sections = _edit_sections_cache.get(cls_name)
+    if sections is None:
+        sections = next((secs for prefix, secs in _EDIT_SECTIONS 
+                         if cls_name.startswith(prefix)), ())
+        _edit_sections_cache[cls_name] = sections
+    return sections
+
+def _fingerprint_edit_hook(obj, name):
+    """Edit hook (see `pyzos.zosutils.add_edit_hook()`) that marks the affected 
+    fingerprint sections of the optical system of `obj` as modified, counts 
+    the edits of the design (`OpticalSystem._edit_generation`), and discards the 
+    property snapshot of the system (see `OpticalSystem.zSnapshot()`)"""
+    sections = _edited_sections(type(obj).__name__)
+    if sections:
+        owner = _get_owner(obj)
+        # the optical system of objects not obtained through an optical system 
+        # (such as objects wrapped with wrapped_zos_object()) isn't known
+        systems = [owner] if owner is not None else list(OpticalSystem._systems)
+        if any(osys._zos_group is not None for osys in systems):
+            systems = set(peer for osys in systems for peer in (osys._zos_group or (osys,)))
+        for osys in systems:
+            osys._zos_snapshot = None
+            if name != 'SetCurrentConfiguration':
+                osys._edit_generation += 1
+            if osys in OpticalSystem._fingerprinted:
+                osys._fingerprint_dirty.update(sections)
+
+def _property_values(obj, exclude=()):
+    """Returns list of (name, value) of the properties of the wrapper object `obj`, 
+    sorted by name. Properties that can't be read have value `None`."""
+    mappers = _get_property_mappers(obj)
+    values = []
+    for name in sorted(mappers):
+        if name in exclude:
+            continue
+        try:
+            value = mappers[name].read(obj)
+        except _pythoncom.com_error:
+            value = None
+        values.append((name, value))
+    return values
+
+def _hash_properties(hasher, obj, depth=0, exclude=()):
+    """Update `hasher` with the values of the properties of the wrapper object 
+    `obj`, and, up to `depth` levels, of its sub-objects"""
+    for name, value in _property_values(obj, exclude):
+        if hasattr(value, '_wrapped'):
+            if depth > 0:
+                _hash_properties(hasher, value, depth - 1)
+        else:
+            hasher.update(repr((name, value)).encode('utf-8'))
+
+_SETTINGS_NUMBER_GETTERS = ('GetFieldNumber', 'GetWavelengthNumber', 'GetSurfaceNumber')
+
+def _settings_values(settings, depth=1):
+    """Returns list of (name, value) of the analysis settings object `settings`.
+    The sub-objects (`IAS_Field`, `IAS_Wavelength`, `IAS_Surface`, ...) are
+    represented by their selected field/wavelength/surface number and, up to
+    `depth` levels, by the values of their properties."""
+    values = []
+    for name, value in _property_values(settings):
+        if hasattr(value, '_wrapped'):
+            numbers = []
+            for getter in _SETTINGS_NUMBER_GETTERS:
+                if hasattr(value, getter):
+                    try:
+                        numbers.append((getter, getattr(value, getter)()))
+                    except _pythoncom.com_error:
+                        numbers.append((getter, None))
+            sub_values = _settings_values(value, depth - 1) if depth > 0 else []
+            values.append((name, (numbers, sub_values)))
+        else:
+            values.append((name, value))
+    return values
+
+_NCE_MAX_PARAMS = 250   # upper bound of the number of parameter columns of an object
+_JACOBIAN_CACHE_SIZE = 8   # number of Jacobians cached per system (see zJacobian())
+
+def _variable_cell(osys, variable):
+    """Returns the editor cell of the variable ('LDE'|'MCE'|'NCE', row, column)"""
+    editor, row, column = variable
+    if editor == 'LDE':
+        return osys.LDE.GetSurfaceAt(row).GetSurfaceCell(column)
+    elif editor == 'MCE':
+        return osys.MCE.GetOperandAt(row).GetOperandCell(column)
+    elif editor == 'NCE':
+        return osys.NCE.GetObjectAt(row).GetObjectCell(column)
+    else:
+        raise ValueError('Unknown editor {}'.format(editor))
+
+def _operand_values(osys):
+    """Returns the values of the merit function operands (after updating them)"""
+    mfe = osys.MFE
+    mfe.CalculateMeritFunction()
+    return [mfe.GetOperandAt(i).Value for i in range(1, mfe.NumberOfOperands + 1)]
+
+def _perturbed_operand_values(osys, variables, step, central=False):
+    """Returns the operand values for each variable perturbed by +`step` 
+    (and by -`step` if `central`), one at a time. The variables are restored."""
+    plus, minus = [], []
+    for variable in variables:
+        cell = _variable_cell(osys, variable)
+        value = cell.DoubleValue
+        cell.DoubleValue = value + step
+        plus.append(_operand_values(osys))
+        if central:
+            cell.DoubleValue = value - step
+            minus.append(_operand_values(osys))
+        cell.DoubleValue = value
+    return plus, minus
+
+def _jacobian_task(osys, filename, variables, step, central):
+    """Worker task of `OpticalSystem.zJacobian()`; returns the operand values 
+    at the base point (of the copy loaded by the worker), and the perturbed values"""
+    system = osys._iopticalsystem
+    system.LoadFile(filename, False)
+    base = _operand_values(system)
+    plus, minus = _perturbed_operand_values(system, variables, step, central)
+    return base, plus, minus
+
+_add_edit_hook(_fingerprint_edit_hook)
+
 #%% Optical System Class
 class OpticalSystem(object):
     """Wrapper class for for IOpticalSystem interface.
@@ -229,6 +419,19 @@ class OpticalSystem(object):
     _instantiated = False
     _pyzosapp = None
     _dde_link = None
+    _zos_snapshot = None   # property snapshot (see zSnapshot())
+    _zos_batch = None      # pending property sets (see zBatch())
+    _systems = _weakref.WeakSet()         # all the optical systems
+    _fingerprinted = _weakref.WeakSet()   # systems with fingerprints (see zFingerprint())
+    _edit_generation = 0                  # number of edits of the design (i.e. excluding 
+                                          # configuration switches) made through pyzos
+    _config_lde = None                    # per-configuration LDE data (see zIterConfigs())
+    _config_lde_generation = None
+    _nce_array = None                     # last known NCE data (see zSetNCEArray())
+    _nce_generation = None
+    _jacobian_cache = None                # recent Jacobians (see zJacobian())
+    _owner = True                         # False for wrappers from _from_zos_system()
+    _zos_group = None                     # wrappers of the same system (see _from_zos_system())
 
     # Patch managed properties of IOpticalSystem's base classes
     # Not required for now ... IOpticalSystem doesn't have any base class (currently)
@@ -266,6 +469,7 @@ class OpticalSystem(object):
             instance of wrapped IOpticalSystem ZOS object
         """
         self._iopticalsystem = None
+        OpticalSystem._systems.add(self)
         if OpticalSystem._instantiated:
             self._iopticalsystem = OpticalSystem._pyzosapp.CreateNewSystem(mode) # wrapped object
         else:
@@ -308,8 +512,16 @@ class OpticalSystem(object):
 
     def __repr__(self):
         return "{.__name__}(sync_ui={}, mode={})".format(type(self), self._sync_ui, self.pMode)
+
+    @property
+    def _zos_owner(self):
+        # owner of the wrapper objects obtained through the system (see 
+        # pyzos.zosutils.get_owner())
+        return _weakref.ref(self)
     
     def __del__(self):
+        if not self._owner:
+            return   # the wrapper of a system owned by another wrapper
         if self._sync_ui_file:
             ext_dict = ['.zmx', '.ZMX', '.CFG', '.SES', '.ZDA']
             filename_bar_ext = self._sync_ui_file.rsplit('.')[0]
@@ -338,7 +550,7 @@ class OpticalSystem(object):
         """Copy lens in UI to headless ZOS COM server"""
         OpticalSystem._dde_link.zGetRefresh()
         OpticalSystem._dde_link.zSaveFile(self._sync_ui_file)
-        self._iopticalsystem.LoadFile (self._sync_ui_file, False)
+        self.LoadFile(self._sync_ui_file, False)
     
     #%% Overridden Methods
     def SaveAs(self, filename):
@@ -375,6 +587,651 @@ class OpticalSystem(object):
         return _PyZOSApp.connect.IsAlive
     
     #%% Extra / Custom methods 
+    def zReconnect(self, mode=0, connection=None):
+        """Bind the optical system to the primary system of a new ZOS-API 
+        application, for example after OpticStudio crashed. The new system is 
+        empty (load the lens file to restore the state); the cached state of 
+        the optical system (snapshot, fingerprint, editor caches) is reset.
+
+        Parameters
+        ----------
+        mode : integer (0 or 1)
+            Sequential (0) or Non-sequential (1) mode 
+        connection : tuple, optional
+            (connection, application) returned by `new_connection()`, such as a 
+            connection created in advance; a new one is created if `None`
+
+        Notes
+        -----
+        The other systems of the previous application (`CreateNewSystem()`, 
+        `CopySystem()`) aren't restored.
+        """
+        _PyZOSApp.connect, _PyZOSApp.app = connection or new_connection()
+        OpticalSystem._pyzosapp = _PyZOSApp.app
+        OpticalSystem._instantiated = True
+        iopticalsystem = OpticalSystem._pyzosapp.GetSystemAt(0)
+        if mode == 1:
+            iopticalsystem.MakeNonSequential()
+        self._attach(iopticalsystem)
+
+    def _attach(self, iopticalsystem):
+        """Bind the wrapper to the ZOS IOpticalSystem object `iopticalsystem`, and 
+        reset the cached state"""
+        self._iopticalsystem = iopticalsystem
+        for attr in ('_zos_snapshot', '_zos_batch', '_config_lde', '_config_lde_generation', 
+                     '_nce_array', '_nce_generation', '_jacobian_cache'):
+            self.__dict__.pop(attr, None)
+        OpticalSystem._fingerprinted.discard(self)
+        OpticalSystem._systems.add(self)
+        if self._base_cls_list:
+            for base_cls_name in self._base_cls_list:
+                _replicate_methods(_comclient.CastTo(iopticalsystem, base_cls_name), self)
+        _replicate_methods(iopticalsystem, self)
+
+    @classmethod
+    def _from_zos_system(cls, iopticalsystem, peer=None):
+        """Returns an OpticalSystem wrapping the existing ZOS IOpticalSystem object
+        `iopticalsystem`, such as a system unmarshalled in another thread (see 
+        `pyzos.comthread`). If `peer` is the OpticalSystem of the same system, 
+        the edits made through either wrapper are tracked by both."""
+        osys = cls.__new__(cls)
+        osys._base_cls_list = _inheritance_dict.get('IOpticalSystem', None)
+        osys._wrapped = True
+        osys._sync_ui = False
+        osys._sync_ui_file = None
+        osys._file_to_save_on_Save = None
+        osys._owner = False
+        osys._attach(iopticalsystem)
+        if peer is not None:
+            if peer._zos_group is None:
+                peer._zos_group = _weakref.WeakSet([peer])
+            osys._zos_group = peer._zos_group
+            osys._zos_group.add(osys)
+        return osys
+
+    def zSnapshot(self, props=None):
+        """Read the properties of the optical system in one pass and return them 
+        as an immutable record (namedtuple). Until the snapshot is invalidated, 
+        the p* properties are served from the snapshot. The snapshot is 
+        invalidated by `zInvalidateSnapshot()`, and by the edits of the system 
+        made through pyzos (such as `LoadFile()`, `MakeNonSequential()` or 
+        editor edits).
+
+        @param props: sequence of property names, such as ['Mode', 'SystemName']; 
+                      all properties are read if `None`
+        
+        See `pyzos.zosutils.snapshot()`
+        """
+        return _snapshot(self, props)
+
+    def zInvalidateSnapshot(self):
+        """Discard the property snapshot"""
+        _invalidate_snapshot(self)
+
+    def zBatch(self):
+        """Return a context manager that buffers the property sets of the optical 
+        system, and writes them on exit. See `pyzos.zosutils.PropertyBatch`
+        """
+        return _PropertyBatch(self)
+
+    def zFingerprint(self, full=False):
+        """Return the content fingerprint of the optical system
+
+        The fingerprint is a hash (hex string) of the system data, fields, 
+        wavelengths, LDE, MCE and NCE. It can be used as a key to cache results 
+        derived from the system, or to find duplicate states of the system. 
+
+        Parameters
+        ----------
+        full : boolean
+            if `True`, all sections are re-read from OpticStudio. By default, 
+            only the sections modified (through pyzos) since the previous call 
+            are re-read.
+
+        Notes
+        -----
+        The hashes of the sections are updated incrementally: the property 
+        sets and modifying method calls made through the wrapper objects of 
+        the system (obtained through `osys`, such as `osys.pLDE.GetSurfaceAt(1)`)
+        mark the affected sections of the system. Edits of objects wrapped 
+        otherwise (`wrapped_zos_object()`) mark the sections of all systems. 
+        Use `full=True` if the system may have been modified by other means, 
+        for example in the UI, or through unwrapped ZOS-API COM objects 
+        (including `osys._iopticalsystem`).
+        """
+        if self not in OpticalSystem._fingerprinted:
+            self._fingerprint_sections = {}
+            self._fingerprint_dirty = set(FINGERPRINT_SECTIONS)
+            OpticalSystem._fingerprinted.add(self)
+        if full:
+            self._fingerprint_dirty.update(FINGERPRINT_SECTIONS)
+        for section in FINGERPRINT_SECTIONS:
+            if section in self._fingerprint_dirty:
+                self._fingerprint_dirty.discard(section)
+                self._fingerprint_sections[section] = self._fingerprint_section(section)
+        hasher = _hashlib.sha1()
+        for section in FINGERPRINT_SECTIONS:
+            hasher.update(self._fingerprint_sections[section])
+        return hasher.hexdigest()
+
+    def _fingerprint_section(self, section):
+        """Return the hash (digest) of the section `section` of the system"""
+        hasher = _hashlib.sha1(section.encode('utf-8'))
+        def update(*values):
+            hasher.update(repr(values).encode('utf-8'))
+        # the properties are read through the (wrapped) property mappers
+        sdata = self.pSystemData
+        update(self.pMode)
+        if section == 'SystemData':
+            _hash_properties(hasher, sdata, depth=1, exclude=('Fields', 'Wavelengths'))
+        elif section == 'Fields':
+            fields = sdata.pFields
+            _hash_properties(hasher, fields)
+            update(fields.GetFieldType())
+            for i in range(1, fields.NumberOfFields + 1):
+                _hash_properties(hasher, fields.GetField(i))
+        elif section == 'Wavelengths':
+            waves = sdata.pWavelengths
+            _hash_properties(hasher, waves)
+            for i in range(1, waves.NumberOfWavelengths + 1):
+                _hash_properties(hasher, waves.GetWavelength(i))
+        elif section == 'LDE':
+            if self.pMode == 0:
+                for value in self.zGetLDEArray():
+                    if isinstance(value, _np.ndarray):
+                        hasher.update(value.tobytes())
+                    else:
+                        update(value)
+        elif section == 'MCE':
+            mce = self.pMCE
+            numConfig, numOper = mce.NumberOfConfigurations, mce.NumberOfOperands
+            update(numConfig, numOper)
+            for i in range(1, numOper + 1):
+                row = mce.GetOperandAt(i)
+                _hash_properties(hasher, row)
+                update([row.GetOperandCell(c).Value for c in range(1, numConfig + 1)])
+        elif section == 'NCE':
+            nce = self.pNCE
+            numObj = nce.NumberOfObjects
+            update(numObj)
+            for i in range(1, numObj + 1):
+                row = nce.GetObjectAt(i)
+                _hash_properties(hasher, row)
+                values = []
+                for k in range(_NCE_MAX_PARAMS):
+                    cell = row.GetObjectCell(Const.ObjectColumn_Par1 + k)
+                    if cell is None:
+                        break
+                    values.append(cell.Value)
+                update(values)
+        return hasher.digest()
+
+    def zApplyAnalysis(self, analysis, cache=None):
+        """Run the analysis and return its results as NumPy arrays, using the 
+        result cache `cache` to skip the analysis if it was run before on the 
+        same system state with the same settings
+
+        Parameters
+        ----------
+        analysis : IA_ object
+            analysis (of this system), such as returned by `osys.pAnalyses.New_FftMtf()`
+        cache : `pyzos.resultcache.ResultCache`, optional
+            result cache; the analysis is always run if `None`
+
+        Returns
+        -------
+        data : `pyzos.resultcache.analysis_data` namedtuple
+            data grids and data series, see `IAR_.zGetDataArrays()`. The arrays 
+            served from the cache are read-only memory-mapped arrays.
+
+        Notes
+        -----
+        The cache key is made of the system fingerprint (`zFingerprint()`), the 
+        analysis type, and the values of the analysis settings properties,
+        including the field, wavelength and surface numbers of the settings.
+        """
+        if cache is None:
+            analysis.ApplyAndWaitForCompletion()
+            return analysis.GetResults().zGetDataArrays()
+        settings = _settings_values(analysis.GetSettings())
+        key = cache.make_key(self.zFingerprint(), analysis.pAnalysisType, settings)
+        entry = cache.get(key)
+        if entry is not None:
+            return _rcache.unpack_analysis_data(*entry)
+        analysis.ApplyAndWaitForCompletion()
+        data = analysis.GetResults().zGetDataArrays()
+        cache.put(key, *_rcache.pack_analysis_data(data))
+        return data
+
+    def zRunAnalysisMatrix(self, analysis_type, fields=None, waves=None, configs=None, 
+                           settings=None, workers=1, extract=None):
+        """Run an analysis for every combination of fields, wavelengths and 
+        configurations, and return the results as one labelled array
+
+        Parameters
+        ----------
+        analysis_type : integer or string
+            AnalysisIDM constant or its name, such as 'FftMtf'
+        fields, waves, configs : sequence of integers, optional
+            field, wavelength and configuration numbers. All fields, wavelengths
+            and configurations are used (one by one) if `None`. Use [0] to
+            use all fields (or all wavelengths) in one analysis, and [None] to
+            leave the field (or wavelength) of the analysis settings unchanged.
+        settings : dictionary, optional
+            other analysis settings (property name : value)
+        workers : integer
+            number of systems that run the analyses in parallel. The workers 
+            other than this system are copies (`CopySystem()`) of the system, 
+            which are closed on return.
+        extract : callable, optional
+            function that returns the array of results from the `analysis_data` 
+            returned by `IAR_.zGetDataArrays()`. The default returns the values
+            of the first data grid, or else, the y-values of the first data series.
+
+        Returns
+        -------
+        analysis_matrix : namedtuple
+            `data` -- array of shape (numFields, numWaves, numConfigs) + shape of 
+            the extracted results; `fields`, `waves`, `configs` -- the labels of 
+            the first three axes; `x` -- x-values of the first data series 
+            (if any) and `labels` -- series labels or grid description, of the 
+            first result.
+
+        Notes
+        -----
+        The analysis windows are taken from (and returned to) the analysis 
+        window pool (see `I_Analyses.zAcquireAnalysis()`).
+        """
+        osys = self._iopticalsystem
+        sdata = osys.SystemData
+        if fields is None:
+            fields = list(range(1, sdata.Fields.NumberOfFields + 1))
+        if waves is None:
+            waves = list(range(1, sdata.Wavelengths.NumberOfWavelengths + 1))
+        if configs is None:
+            configs = list(range(1, osys.MCE.NumberOfConfigurations + 1))
+        if extract is None:
+            extract = _zarr.default_extract
+        numCombos = len(fields)*len(waves)*len(configs)
+        curConfig = osys.MCE.CurrentConfiguration
+        systems = [osys] + [osys.CopySystem() for _ in range(min(workers, numCombos) - 1)]
+        analyses = [wrapped_zos_object(system.Analyses) for system in systems]
+        windows = []
+        results, first = [], None
+        try:
+            for system_analyses in analyses:
+                windows.append(system_analyses.zAcquireAnalysis(analysis_type, settings))
+            for chunk in _zarr.analysis_chunks(fields, waves, configs, len(systems)):
+                for (iF, iW, iC), system, window in zip(chunk, systems, windows):
+                    system.MCE.SetCurrentConfiguration(configs[iC])
+                    analysis_settings = window.GetSettings()
+                    if fields[iF] is not None:
+                        if fields[iF] == 0:
+                            analysis_settings.pField.UseAllFields()
+                        else:
+                            analysis_settings.pField.SetFieldNumber(fields[iF])
+                    if waves[iW] is not None:
+                        if waves[iW] == 0:
+                            analysis_settings.pWavelength.UseAllWavelengths()
+                        else:
+                            analysis_settings.pWavelength.SetWavelengthNumber(waves[iW])
+                    window.Apply()   # runs asynchronously
+                for window in windows[:len(chunk)]:
+                    window.WaitForCompletion()
+                    data = window.GetResults().zGetDataArrays()
+                    first = data if first is None else first
+                    results.append(_np.asarray(extract(data)))
+        finally:
+            for system_analyses, window in zip(analyses, windows):
+                system_analyses.zReleaseAnalysis(window)
+            for system, system_analyses in zip(systems[1:], analyses[1:]):
+                system_analyses.zCloseAnalysisPool()
+                system.Close(False)
+            osys.MCE.SetCurrentConfiguration(curConfig)
+        return _zarr.assemble_analysis_matrix(results, fields, waves, configs, first)
+
+    def zGetMCEArray(self):
+        """Return the operands and the values of all cells of the Multi-Configuration 
+        Editor (in one pass)
+
+        Returns
+        -------
+        mce_array : namedtuple
+            `type` -- list of operand type names, such as 'THIC'; `param1`, 
+            `param2`, `param3` -- integer arrays of operand parameters; 
+            `values` -- array (numConfig x numOperand) of numeric cell values 
+            (NaN for non-numeric cells); `strings` -- list (numConfig) of lists 
+            (numOperand) of the cell values as strings, and `current` -- the
+            current configuration number.
+        """
+        mce = self._iopticalsystem.MCE
+        numConfig, numOper = mce.NumberOfConfigurations, mce.NumberOfOperands
+        type_names = _constant_names('MultiConfigOperandType_')
+        optype, params = [], []
+        cells = [[None] * numOper for _ in range(numConfig)]
+        for k in range(numOper):
+            row = mce.GetOperandAt(k + 1)
+            optype.append(type_names.get(row.Type, str(row.Type)))
+            params.append((row.Param1, row.Param2, row.Param3))
+            for c in range(numConfig):
+                cells[c][k] = _read_cell(row.GetOperandCell(c + 1))
+        return _zarr.assemble_mce_array(optype, params, cells, mce.CurrentConfiguration)
+
+    def zSetMCEArray(self, optype=None, param1=None, param2=None, param3=None, 
+                     values=None, strings=None):
+        """Set the operands and the cell values of the Multi-Configuration Editor 
+        from arrays (in one pass)
+
+        Parameters
+        ----------
+        optype : sequence of strings, optional
+            operand type names, such as 'THIC'. If given, the number of operands
+            of the MCE is adjusted to the length of `optype`. 
+        param1, param2, param3 : sequence of integers, optional
+            operand parameters
+        values : array-like (numConfig x numOperand), optional
+            numeric cell values. The number of configurations of the MCE is 
+            adjusted to the number of rows. NaN values are not written.
+        strings : list (numConfig) of lists (numOperand) of strings, optional
+            cell values of non-numeric (e.g. 'GLSS') cells; `None` and empty 
+            strings are not written. 
+
+        Notes
+        -----
+        `zGetMCEArray()` output (except `current`) can be passed back, such as
+        `osys.zSetMCEArray(*mce[:6])`
+        """
+        mce = self.pMCE   # wrapped, so that the edits are tracked
+        if optype is not None:
+            numOper = len(optype)
+            while mce.NumberOfOperands < numOper:
+                mce.AddOperand()
+            while mce.NumberOfOperands > max(numOper, 1):
+                mce.RemoveOperandAt(mce.NumberOfOperands)
+        if values is not None:
+            values = _np.atleast_2d(_np.asarray(values, dtype=_np.float64))
+        numConfig = len(values) if values is not None else (len(strings) if strings else None)
+        if numConfig:
+            while mce.NumberOfConfigurations < numConfig:
+                mce.AddConfiguration(False)
+            while mce.NumberOfConfigurations > numConfig:
+                mce.DeleteConfiguration(mce.NumberOfConfigurations)
+        columns = [('pParam1', param1), ('pParam2', param2), ('pParam3', param3)]
+        numOper = mce.NumberOfOperands
+        for k in range(numOper):
+            row = mce.GetOperandAt(k + 1)
+            if optype is not None and k < len(optype):
+                row.ChangeType(getattr(Const, 'MultiConfigOperandType_' + optype[k]))
+            for prop, col in columns:
+                if col is not None and k < len(col):
+                    setattr(row, prop, int(col[k]))
+            for c, prop, value in _zarr.mce_cell_writes(values, strings, numConfig or 0, k):
+                setattr(row.GetOperandCell(c + 1), prop, value)
+
+    def zIterConfigs(self, configs=None):
+        """Returns a generator that makes each configuration current, and yields the 
+        configuration number and the LDE data (`zGetLDEArray()`) of the 
+        configuration
+
+        The LDE data of each configuration is cached; it is re-read only if the
+        design was edited (through pyzos) after it was read. The current 
+        configuration is restored at the end of the iteration. 
+
+        @param configs: sequence of configuration numbers (all if `None`)
+
+        Usage:
+        >>> for config, lde in osys.zIterConfigs():
+        ...     print(config, lde.thick)
+        """
+        return _zarr.iter_configs(self._iopticalsystem.MCE, self.zGetLDEArray, 
+                                  self._config_lde_cache, configs)
+
+    def _config_lde_cache(self):
+        """Returns the cache of per-configuration LDE data (see zIterConfigs()), 
+        emptied if the design was edited since it was filled"""
+        if self._config_lde is None or self._config_lde_generation != self._edit_generation:
+            self._config_lde = {}
+            self._config_lde_generation = self._edit_generation
+        return self._config_lde
+
+    def zGetNCEArray(self):
+        """Return the data of all objects in the Non-Sequential Component Editor 
+        as arrays (in one pass)
+
+        Returns
+        -------
+        nce_array : namedtuple
+            `type` -- list of object type names (ObjectType constant names, such
+            as 'StandardLens'); `comment`, `material` -- lists of strings; 
+            `ref_object`, `inside_of` -- integer arrays; `position` (x, y, z) 
+            and `tilt` (about x, y, z) -- arrays of shape (numObj, 3); `params` -- 
+            array (numObj x maxParams) of the parameter columns (Par1, Par2, ...), 
+            NaN for absent or non-numeric parameters. 
+        """
+        nce = self._iopticalsystem.NCE
+        numObj = nce.NumberOfObjects
+        type_names = _constant_names('ObjectType_')
+        optype, comment, material, ref_object, inside_of = [], [], [], [], []
+        position, tilt, params = [], [], []
+        for i in range(numObj):
+            row = nce.GetObjectAt(i + 1)
+            optype.append(type_names.get(row.Type, str(row.Type)))
+            comment.append(row.Comment)
+            material.append(row.Material)
+            ref_object.append(row.RefObject)
+            inside_of.append(row.InsideOf)
+            position.append((row.XPosition, row.YPosition, row.ZPosition))
+            tilt.append((row.TiltAboutX, row.TiltAboutY, row.TiltAboutZ))
+            values = []
+            for k in range(_NCE_MAX_PARAMS):
+                try:
+                    cell = row.GetObjectCell(Const.ObjectColumn_Par1 + k)
+                except _pythoncom.com_error:
+                    cell = None
+                if cell is None:
+                    break
+                values.append(_read_cell(cell))
+            params.append(values)
+        nce_data = _zarr.assemble_nce_array(optype, comment, material, ref_object, inside_of, 
+                                            position, tilt, params)
+        self._nce_array, self._nce_generation = nce_data, self._edit_generation
+        return nce_data
+
+    def zSetNCEArray(self, type=None, comment=None, material=None, ref_object=None, 
+                     inside_of=None, position=None, tilt=None, params=None):
+        """Set the data of the objects in the Non-Sequential Component Editor from
+        arrays (in one pass), writing only the cells whose values changed
+
+        Parameters
+        ----------
+        type : sequence of strings, optional
+            object type names (ObjectType constant names, such as 'StandardLens')
+        comment, material : sequence of strings, optional 
+            `None` elements are not written
+        ref_object, inside_of : sequence of integers, optional
+        position, tilt : array-like of shape (numObj, 3), optional
+            NaN values are not written
+        params : array-like of shape (numObj, numParams), optional
+            values of the parameter columns (Par1, Par2, ...); NaN values are 
+            not written
+
+        Returns
+        -------
+        num_writes : integer
+            number of cells written
+
+        Notes
+        -----
+        1. The number of objects in the NCE is adjusted to the length of the 
+           given columns.
+        2. The values are compared with the NCE data read by the last call to
+           `zGetNCEArray()` (or written by `zSetNCEArray()`), if the system was 
+           not edited through pyzos since; otherwise the NCE is read first.
+        3. `zGetNCEArray()` output can be passed back after modification, such as
+           `osys.zSetNCEArray(**nce._asdict())`
+        """
+        if self._nce_array is None or self._nce_generation != self._edit_generation:
+            self.zGetNCEArray()
+        nce = self.pNCE   # wrapped, so that the edits are tracked
+        curNumObj = nce.NumberOfObjects
+        numObj, writes, new = _zarr.plan_nce_writes(self._nce_array, curNumObj, type, comment, 
+                                                    material, ref_object, inside_of, position, 
+                                                    tilt, params)
+        if numObj > curNumObj:
+            for _ in range(numObj - curNumObj):
+                nce.AddObject()
+        elif 0 < numObj < curNumObj:
+            nce.RemoveObjectsAt(numObj + 1, curNumObj - numObj)
+        num_writes = 0
+        for obj, obj_type, props, param_values in writes:
+            row = nce.GetObjectAt(obj)
+            if obj_type is not None:
+                # the type settings are passed to ChangeType() as the COM object
+                settings = self._iopticalsystem.NCE.GetObjectAt(obj).GetObjectTypeSettings(
+                    getattr(Const, 'ObjectType_' + obj_type))
+                row.ChangeType(settings)
+                num_writes += 1
+            with row.zBatch() as batch:
+                for prop, value in props:
+                    setattr(row, 'p' + prop, value)
+            num_writes += batch.writes
+            for k, value in param_values:
+                cell = row.GetObjectCell(Const.ObjectColumn_Par1 + k)
+                if cell is not None:
+                    cell.pDoubleValue = value
+                    num_writes += 1
+        # the NCE is re-read by the next call if objects were added or changed type
+        self._nce_array = new
+        self._nce_generation = self._edit_generation
+        return num_writes
+
+    def zGetVariables(self):
+        """Return the variable cells of the LDE, MCE and NCE
+
+        Returns
+        -------
+        variables : list of tuples
+            (editor, row, column) of the variables, where `editor` is 'LDE', 
+            'MCE' or 'NCE', `row` is the surface, operand or object number, and 
+            `column` is the SurfaceColumn constant, configuration number or 
+            ObjectColumn constant of the cell. See `zJacobian()`.
+        """
+        osys = self._iopticalsystem
+        variables = []
+        lde_columns = sorted(_constant_names('SurfaceColumn_'))
+        nce_columns = sorted(_constant_names('ObjectColumn_'))
+        editors = [('LDE', osys.LDE.NumberOfSurfaces, lde_columns),
+                   ('MCE', osys.MCE.NumberOfOperands, 
+                    range(1, osys.MCE.NumberOfConfigurations + 1))]
+        if self.pMode == 1:
+            editors.append(('NCE', osys.NCE.NumberOfObjects, nce_columns))
+        for editor, numRows, columns in editors:
+            first = 0 if editor == 'LDE' else 1
+            for row in range(first, numRows if editor == 'LDE' else numRows + 1):
+                for column in columns:
+                    try:
+                        cell = _variable_cell(osys, (editor, row, column))
+                    except _pythoncom.com_error:
+                        continue
+                    if cell is None or cell.DataType != Const.CellDataType_Double:
+                        continue
+                    if cell.GetSolveData().Type == Const.SolveType_Variable:
+                        variables.append((editor, row, column))
+        return variables
+
+    def zJacobian(self, variables=None, step=1e-6, processes=None, pool=None, 
+                  central=False):
+        """Return the finite-difference Jacobian of the merit function operands 
+        with respect to the variables
+
+        The perturbations are distributed over worker processes, each with 
+        its own ZOS-API connection and a copy of this system.
+
+        Parameters
+        ----------
+        variables : list of tuples, optional
+            (editor, row, column) of the variable cells (see `zGetVariables()`). 
+            All variables of the system are used if `None`.
+        step : float
+            perturbation of the variables
+        processes : integer, optional
+            number of worker processes of the pool created (and stopped) for 
+            the call; the default is the number of CPUs. Use 1 to perturb this 
+            system (serially) instead.
+        pool : `pyzos.workers.SystemPool`, optional
+            pool of workers to use (starting a pool is slow; reuse one for 
+            repeated calls)
+        central : boolean
+            central (instead of forward) differences; twice as many evaluations
+
+        Returns
+        -------
+        jacobian : namedtuple
+            `matrix` -- array of shape (numOperands, numVariables) of the 
+            derivatives; `values` -- array of the operand values at the base 
+            point; `variables` -- list of the variables; `step` -- the step.
+
+        Notes
+        -----
+        The Jacobians of the last few calls are cached, keyed on the system 
+        fingerprint (`zFingerprint()`), the operand types and values at the base 
+        point, the variables, the step and the difference scheme.
+        With worker processes, the forward differences are taken against the
+        operand values of the copy of the system in each worker, so that the
+        (small) differences between the saved copy and this system cancel out.
+        """
+        jacobian =_co.namedtuple('jacobian', ['matrix', 'values', 'variables', 'step'])
+        osys = self._iopticalsystem
+        if variables is None:
+            variables = self.zGetVariables()
+        variables = [tuple(v) for v in variables]
+        mfe = osys.MFE
+        mfe.CalculateMeritFunction()
+        operands = [mfe.GetOperandAt(i) for i in range(1, mfe.NumberOfOperands + 1)]
+        types = [op.Type for op in operands]
+        values = _np.array([op.Value for op in operands], dtype=_np.float64)
+        key = (self.zFingerprint(), tuple(types), values.tobytes(), tuple(variables), 
+               step, central)
+        if self._jacobian_cache is None:
+            self._jacobian_cache = _co.OrderedDict()
+        if key in self._jacobian_cache:
+            return self._jacobian_cache[key]
+        if (processes == 1 and pool is None) or not variables:
+            plus, minus = _perturbed_operand_values(osys, variables, step, central)
+            base = [values]*len(plus)
+        else:
+            filename = _os.path.join(_tempfile.gettempdir(), 
+                                     'pyzos_jacobian_{}_{}.zmx'.format(_os.getpid(), id(self)))
+            copy = osys.CopySystem()
+            copy.SaveAs(filename)
+            copy.Close(False)
+            own_pool = pool is None
+            if own_pool:
+                pool = _workers.SystemPool(None, processes, self.pMode)
+            try:
+                chunks = [c.tolist() for c in _np.array_split(_np.arange(len(variables)), 
+                                                              min(pool.processes, len(variables)))]
+                results = pool.map(_jacobian_task, [(filename, [variables[k] for k in chunk], 
+                                                     step, central) for chunk in chunks])
+            finally:
+                if own_pool:
+                    pool.terminate()
+                _delete_file(filename)
+            base = [b for b, p, _ in results for _ in p]
+            plus = [v for _, p, _ in results for v in p]
+            minus = [v for _, _, m in results for v in m]
+        if not variables:
+            matrix = _np.zeros((len(values), 0), dtype=_np.float64)
+        elif central:
+            matrix = (_np.array(plus).T - _np.array(minus).T)/(2.0*step)
+        else:
+            matrix = (_np.array(plus).T - _np.array(base).T)/step
+        result = jacobian(matrix, values, variables, step)
+        self._jacobian_cache[key] = result
+        while len(self._jacobian_cache) > _JACOBIAN_CACHE_SIZE:
+            self._jacobian_cache.popitem(last=False)
+        return result
+
     def zGetSurfaceData(self, surfNum):
         """Return surface data"""
         if self.pMode == 0: # Sequential mode
@@ -386,6 +1243,236 @@ class OpticalSystem(object):
         else:
             raise NotImplementedError('Function not implemented for non-sequential mode')
 
+    def zGetLDEArray(self):
+        """Return the data of all surfaces in the LDE as arrays (in one pass)
+
+        Returns
+        -------
+        lde_array : namedtuple
+            fields `radius`, `thick`, `semidia`, `conic` are float arrays and 
+            `material` and `comment` are lists of strings, each of length equal
+            to the number of surfaces (including object and image surfaces).
+            `stop` is the stop surface number, `surftype` is the list of surface
+            type names, and `parm` is an array (numSurf x 12) of the parameter 
+            columns (Par1 ... Par12), which are only read for non-standard surfaces. 
+        """
+        if self.pMode == 0: # Sequential mode
+            lde_array = _co.namedtuple('lde_array', ['radius', 'thick', 'material', 'semidia', 
+                                                     'conic', 'comment', 'stop', 'surftype', 
+                                                     'parm'])
+            lde = self._iopticalsystem.LDE   # unwrapped for speed
+            numSurf = lde.NumberOfSurfaces
+            radius, thick, semidia, conic = (_np.empty(numSurf) for _ in range(4))
+            parm = _np.zeros((numSurf, 12))
+            material, comment, surftype = [], [], []
+            for i in range(numSurf):
+                surf = lde.GetSurfaceAt(i)
+                radius[i], thick[i] = surf.Radius, surf.Thickness
+                semidia[i], conic[i] = surf.SemiDiameter, surf.Conic
+                material.append(surf.Material)
+                comment.append(surf.Comment)
+                surftype.append(surf.TypeName)
+                if surftype[-1] != 'Standard':
+                    for k in range(12):
+                        cell = surf.GetSurfaceCell(Const.SurfaceColumn_Par1 + k)
+                        try:
+                            parm[i, k] = cell.DoubleValue
+                        except _pythoncom.com_error:
+                            pass  # not a numeric parameter
+            return lde_array(radius, thick, material, semidia, conic, comment, lde.StopSurface,
+                             surftype, parm)
+        else:
+            raise NotImplementedError('Function not implemented for non-sequential mode')
+
+    def zSetLDEArray(self, radius=None, thick=None, material=None, semidia=None, 
+                     conic=None, comment=None, stop=None, surftype=None, parm=None):
+        """Set the data of all surfaces in the LDE from arrays (in one pass)
+
+        Parameters
+        ----------
+        radius, thick, semidia, conic : array-like of real, optional
+            column data for each surface (including object and image surfaces). 
+            `None` or `NaN` elements are not written. 
+        material, comment : sequence of strings, optional
+            column data for each surface. `None` elements are not written. 
+        stop : integer, optional 
+            stop surface number
+        surftype : sequence of strings, optional
+            surface type names (SurfaceType constant names, such as 'EvenAspheric');
+            the type of a surface is only changed if it differs. `None` elements
+            are not written.
+        parm : array-like of shape (numSurf, numParams), optional
+            values of the parameter columns (Par1, Par2, ...); NaN values and 
+            non-numeric parameters are not written
+
+        Notes
+        -----
+        1. The number of surfaces in the LDE is adjusted to the length of the 
+           given columns, by inserting or removing surfaces before the image.
+        2. The surface types are set before the other columns.
+        3. `pyzos.zmxfile.LensModel.lde_arrays()` returns a dictionary that can 
+           be passed directly, i.e. `osys.zSetLDEArray(**lens.lde_arrays())`
+        """
+        if self.pMode == 0: # Sequential mode
+            columns = [('Radius', radius), ('Thickness', thick), ('Material', material),
+                       ('SemiDiameter', semidia), ('Conic', conic), ('Comment', comment)]
+            columns = [(prop, list(col)) for prop, col in columns if col is not None]
+            if parm is not None:
+                parm = _np.atleast_2d(_np.asarray(parm, dtype=_np.float64))
+            lengths = [len(col) for _, col in columns]
+            lengths += [len(col) for col in (surftype, parm) if col is not None]
+            lde = self.pLDE   # wrapped, so that the edits are tracked
+            if lengths:
+                numSurf = max(lengths)
+                curNumSurf = lde.NumberOfSurfaces
+                if numSurf > curNumSurf:
+                    for _ in range(numSurf - curNumSurf):
+                        lde.InsertNewSurfaceAt(curNumSurf - 1)
+                elif 2 < numSurf < curNumSurf:
+                    lde.RemoveSurfacesAt(numSurf - 1, curNumSurf - numSurf)
+                for i in range(numSurf):
+                    surf = lde.GetSurfaceAt(i)
+                    if surftype is not None and i < len(surftype) and surftype[i] is not None:
+                        type_value = getattr(Const, 'SurfaceType_' + surftype[i])
+                        if surf.pType != type_value:
+                            # the type settings are passed to ChangeType() as the COM object
+                            lde_row = self._iopticalsystem.LDE.GetSurfaceAt(i)
+                            surf.ChangeType(lde_row.GetSurfaceTypeSettings(type_value))
+                    for prop, col in columns:
+                        value = col[i] if i < len(col) else None
+                        if value is None or (isinstance(value, float) and value != value):
+                            continue
+                        setattr(surf, 'p' + prop, value)
+                    if parm is not None and i < len(parm):
+                        for k, value in enumerate(parm[i]):
+                            if value != value:
+                                continue
+                            cell = surf.GetSurfaceCell(Const.SurfaceColumn_Par1 + k)
+                            if cell is None:
+                                continue
+                            try:
+                                cell.pDoubleValue = float(value)
+                            except _pythoncom.com_error:
+                                pass  # not a numeric parameter
+            if stop is not None:
+                lde.pStopSurface = stop
+        else:
+            raise NotImplementedError('Function not implemented for non-sequential mode')
+
+    def zGetIndexArray(self, waveNum=None):
+        """Return the refractive index of the media following each surface 
+        in the LDE, as required by the paraxial engine `pyzos.paraxial`
+
+        Parameters
+        ----------
+        waveNum : integer, optional
+            wavelength number; the primary wavelength is used if `None`
+
+        Returns
+        -------
+        index : ndarray
+            index of the medium following each surface. The indices of the 
+            media following a mirror are negative.
+        """
+        if self.pMode == 0: # Sequential mode
+            if waveNum is None:
+                waves = self._iopticalsystem.SystemData.Wavelengths
+                waveNum = next((i for i in range(1, waves.NumberOfWavelengths + 1)
+                                if waves.GetWavelength(i).IsPrimary), 1)
+            lde = self._iopticalsystem.LDE
+            mfe = self._iopticalsystem.MFE
+            numSurf = lde.NumberOfSurfaces
+            index = _np.empty(numSurf)
+            sign = 1.0
+            for i in range(numSurf):
+                if lde.GetSurfaceAt(i).Material.upper() == 'MIRROR':
+                    sign = -sign
+                index[i] = sign*mfe.GetOperandValue(Const.MeritOperandType_INDX, i, waveNum, 
+                                                    0, 0, 0, 0, 0, 0)
+            return index
+        else:
+            raise NotImplementedError('Function not implemented for non-sequential mode')
+
+    def zBatchRayTrace(self, hx, hy, px, py, waveNum=1, toSurf=-1):
+        """Trace normalized unpolarized real rays using the batch ray trace tool
+
+        Parameters
+        ----------
+        hx, hy, px, py : array-like of real
+            normalized field and pupil coordinates of the rays (broadcast 
+            against each other)
+        waveNum : integer or array-like of integers
+            wavelength number(s)
+        toSurf : integer
+            surface to trace to (-1 for image surface)
+
+        Returns
+        -------
+        ray_data : dict of ndarrays
+            'x', 'y', 'z', 'l', 'm', 'n' (in the coordinates of `toSurf`), 
+            'error' and 'vignette' codes
+        """
+        hx, hy, px, py, waveNum = (a.ravel() for a in _np.broadcast_arrays(hx, hy, px, py, waveNum))
+        numRays = len(hx)
+        if toSurf < 0:
+            toSurf = self._iopticalsystem.LDE.NumberOfSurfaces - 1
+        tool = self._iopticalsystem.Tools.OpenBatchRayTrace()
+        try:
+            norm = tool.CreateNormUnpol(numRays, Const.RaysType_Real, toSurf)
+            for i in range(numRays):
+                norm.AddRay(int(waveNum[i]), float(hx[i]), float(hy[i]), float(px[i]), 
+                            float(py[i]), Const.OPDMode_None)
+            tool.RunAndWaitForCompletion()
+            norm.StartReadingResults()
+            keys = ('x', 'y', 'z', 'l', 'm', 'n')
+            ray_data = dict((k, _np.full(numRays, _np.nan)) for k in keys)
+            ray_data['error'] = _np.zeros(numRays, dtype=int)
+            ray_data['vignette'] = _np.zeros(numRays, dtype=int)
+            for _ in range(numRays):
+                out = norm.ReadNextResult()
+                if not out[0]:
+                    break
+                i = out[1] - 1   # ray numbers are 1-based
+                ray_data['error'][i], ray_data['vignette'][i] = out[2], out[3]
+                for k, value in zip(keys, out[4:10]):
+                    ray_data[k][i] = value
+        finally:
+            tool.Close()
+        return ray_data
+
+    def zRecordRayTraceFixture(self, filename, hx, hy, px, py, waveNum=1):
+        """Record the LDE data and the batch ray trace output of the given rays 
+        into a fixture file (.npz) for validating the local real-ray tracer 
+        using `pyzos.raytrace.compare_with_fixture()`
+
+        Parameters are as in `zBatchRayTrace()`. The fields must be angles (for
+        objects at infinity) or object heights (for finite objects).
+        """
+        hx, hy, px, py, waveNum = (a.ravel() for a in _np.broadcast_arrays(hx, hy, px, py, waveNum))
+        lde = self.zGetLDEArray()
+        sdata = self._iopticalsystem.SystemData
+        waves, fields = sdata.Wavelengths, sdata.Fields
+        wavelengths = [waves.GetWavelength(i).Wavelength 
+                       for i in range(1, waves.NumberOfWavelengths + 1)]
+        index = _np.array([self.zGetIndexArray(i) for i in range(1, len(wavelengths) + 1)])
+        field_xy = [(fields.GetField(i).X, fields.GetField(i).Y) 
+                    for i in range(1, fields.NumberOfFields + 1)]
+        field_type = 0 if fields.GetFieldType() == Const.FieldType_Angle else 1
+        radius = _np.asarray(lde.radius)
+        with _np.errstate(divide='ignore'):
+            curvature = _np.where((radius == 0) | _np.isinf(radius), 0.0, 1.0/radius)
+        asphere = _np.where(_np.array([t == 'Even Asphere' for t in lde.surftype])[:, None],
+                            lde.parm[:, :8], 0.0)
+        rays = self.zBatchRayTrace(hx, hy, px, py, waveNum)
+        _np.savez(filename, curvature=curvature, conic=lde.conic, asphere=asphere, 
+                  thickness=lde.thick, index=index, semidia=lde.semidia, stop=lde.stop, 
+                  wavelengths=wavelengths, aperture=self.pLDE.GetPupil().entrancePupilDiameter,
+                  field_type=field_type, fields=_np.array(field_xy), 
+                  surftype=_np.array(lde.surftype), hx=hx, hy=hy, px=px, py=py, 
+                  wave=waveNum - 1, x=rays['x'], y=rays['y'], z=rays['z'], l=rays['l'], 
+                  m=rays['m'], n=rays['n'], 
+                  vignetted=(rays['error'] != 0) | (rays['vignette'] != 0))
+
     def zInsertNewSurfaceAt(self, surfNum):
         if self.pMode == 0:
             lde = self.pLDE
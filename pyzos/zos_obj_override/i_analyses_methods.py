@@ -9,12 +9,166 @@
 """
 from __future__ import print_function
 from __future__ import division
+import time as _time
+import weakref as _weakref
+import contextlib as _contextlib
 from win32com.client import CastTo as _CastTo, constants as _constants
-from pyzos.zosutils import wrapped_zos_object as _wrapped_zos_object
+from pyzos.zosutils import wrapped_zos_object as _wrapped_zos_object, get_owner as _get_owner
+
+try:
+    _string_types = (basestring,)
+except NameError:
+    _string_types = (str,)
+
+# analysis window pools, keyed on the optical system owning the I_Analyses wrapper
+# (or on the wrapper itself if its system is unknown); the pools don't hold the keys
+_pools = _weakref.WeakKeyDictionary()
+
+class _AnalysisPool(object):
+    """Pool of open analysis windows of an optical system"""
+    def __init__(self, max_open=8, max_idle=300.0):
+        self.max_open = max_open
+        self.max_idle = max_idle
+        self.idle = {}             # analysis type : list of (IA_, release time)
+        self.busy = {}             # id(IA_) : IA_
+        self.opened = 0            # number of windows opened
+        self.reused = 0            # number of windows reused
+
+    def __repr__(self):
+        return ('{.__name__}(max_open={}, max_idle={}, numOpen={}, numBusy={}, opened={}, '
+                'reused={})'.format(type(self), self.max_open, self.max_idle, self.num_open, 
+                                    len(self.busy), self.opened, self.reused))
+
+    @property
+    def num_open(self):
+        return len(self.busy) + sum(len(windows) for windows in self.idle.values())
+
+    def acquire(self, analyses, analysis_type):
+        self.evict()
+        windows = self.idle.get(analysis_type)
+        if windows:
+            analysis, _ = windows.pop()
+            self.reused += 1
+        else:
+            if self.num_open >= self.max_open:
+                self.evict(max_idle=0, keep=self.max_open - 1)
+            if self.num_open >= self.max_open:
+                raise RuntimeError('All {} pooled analysis windows are in use'.format(self.max_open))
+            analysis = analyses.New_Analysis(analysis_type)
+            self.opened += 1
+        self.busy[id(analysis)] = analysis
+        return analysis
+
+    def release(self, analysis, analysis_type):
+        if self.busy.pop(id(analysis), None) is None:
+            raise ValueError('{!r} was not acquired from the pool'.format(analysis))
+        self.idle.setdefault(analysis_type, []).append((analysis, _time.time()))
+        self.evict()
+
+    def evict(self, max_idle=None, keep=None):
+        """Close idle windows released more than `max_idle` seconds ago (oldest 
+        first), keeping at most `keep` open windows, if given"""
+        max_idle = self.max_idle if max_idle is None else max_idle
+        now = _time.time()
+        candidates = sorted(((t, analysis_type, analysis) 
+                             for analysis_type, windows in self.idle.items()
+                             for analysis, t in windows if now - t >= max_idle),
+                            key=lambda item: item[0])
+        num_open = self.num_open
+        for t, analysis_type, analysis in candidates:
+            if keep is not None and num_open <= keep:
+                break
+            self.idle[analysis_type] = [(a, u) for a, u in self.idle[analysis_type] 
+                                        if a is not analysis]
+            analysis.Close()
+            num_open -= 1
 
 # overridden methods
 # ------------------
 
 
 # Custom methods
-# --------------
\ No newline at end of file
+# --------------
+def _pool_key(self):
+    owner = _get_owner(self)
+    return self if owner is None else owner
+
+def _analysis_pool(self):
+    key = _pool_key(self)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = _AnalysisPool()
+    return pool
+
+def _analysis_type_id(analysis_type):
+    """Returns the AnalysisIDM constant of `analysis_type`, which may be the 
+    constant itself or its name, such as 'FftMtf'"""
+    if isinstance(analysis_type, _string_types):
+        return getattr(_constants, 'AnalysisIDM_' + analysis_type)
+    return analysis_type
+
+def zConfigureAnalysisPool(self, max_open=None, max_idle=None):
+    """Configure the pool of analysis windows of the optical system
+
+    @param max_open: maximum number of windows opened by the pool (default 8)
+    @param max_idle: idle windows are closed after `max_idle` seconds (default 300)
+    @return: the pool object (its repr shows the pool statistics)
+    """
+    pool = _analysis_pool(self)
+    if max_open is not None:
+        pool.max_open = max_open
+    if max_idle is not None:
+        pool.max_idle = max_idle
+    pool.evict(keep=pool.max_open)
+    return pool
+
+def zAcquireAnalysis(self, analysis_type, settings=None):
+    """Returns an analysis window of type `analysis_type` from the pool of 
+    analysis windows, opening a new one only if no window of the type is idle
+
+    @param analysis_type: AnalysisIDM constant or its name, such as 'FftMtf'
+    @param settings: dictionary of settings (property name : value), such as
+                     {'pMaximumFrequency': 160}, set (in one batch) before 
+                     returning the window
+    @return: IA_ analysis object; release it using `zReleaseAnalysis()`
+
+    Notes:
+    1. A reused window keeps the settings of its previous use, except those 
+       given in `settings`.
+    2. If the maximum number of windows are open, idle windows of other types 
+       are closed (least recently used first). RuntimeError is raised if all 
+       windows are in use.
+    """
+    analysis = _analysis_pool(self).acquire(self, _analysis_type_id(analysis_type))
+    if settings:
+        analysis_settings = analysis.GetSettings()
+        with analysis_settings.zBatch():
+            for name, value in settings.items():
+                setattr(analysis_settings, name if name.startswith('p') else 'p' + name, value)
+    return analysis
+
+def zReleaseAnalysis(self, analysis):
+    """Returns the analysis window `analysis` (acquired using `zAcquireAnalysis()`) 
+    to the pool; idle windows are closed after the idle time of the pool"""
+    _analysis_pool(self).release(analysis, analysis.pAnalysisType)
+
+@_contextlib.contextmanager
+def zPooledAnalysis(self, analysis_type, settings=None):
+    """Context manager version of `zAcquireAnalysis()`/`zReleaseAnalysis()`
+
+    Usage:
+    >>> with osys.pAnalyses.zPooledAnalysis('FftMtf', {'MaximumFrequency': 160}) as mtf:
+    ...     data = osys.zApplyAnalysis(mtf)
+    """
+    analysis = zAcquireAnalysis(self, analysis_type, settings)
+    try:
+        yield analysis
+    finally:
+        zReleaseAnalysis(self, analysis)
+
+def zCloseAnalysisPool(self):
+    """Close all idle windows of the pool of analysis windows"""
+    pool = _analysis_pool(self)
+    pool.evict(max_idle=0)
+    if not pool.busy:
+        _pools.pop(_pool_key(self), None)
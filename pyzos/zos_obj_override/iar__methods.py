@@ -11,10 +11,40 @@ from __future__ import print_function
 from __future__ import division
 from win32com.client import CastTo as _CastTo, constants as _constants
 from pyzos.zosutils import wrapped_zos_object as _wrapped_zos_object
+import numpy as _np
+from pyzos.resultcache import (analysis_data as _analysis_data, data_grid as _data_grid,
+                               data_series as _data_series)
 
 # Overridden methods
 # ------------------
 
 
 # Extra methods
-# -------------
\ No newline at end of file
+# -------------
+
+def zGetDataArrays(self):
+    """Returns the data grids, data series and header of the analysis results 
+    as NumPy arrays (read in one pass)
+
+    @return: `analysis_data` namedtuple (see `pyzos.resultcache`) with lists of 
+             `data_grid` (values of shape (Ny, Nx)) and `data_series` (x of 
+             shape (N,) and y of shape (N, NumSeries)) namedtuples, and the 
+             list of header lines.
+    """
+    iar = self._iar_  # unwrapped for speed
+    grids, series = [], []
+    for i in range(iar.NumberOfDataGrids):
+        grid = iar.GetDataGrid(i)
+        grids.append(_data_grid(grid.Description, _np.array(grid.Values, dtype=_np.float64), 
+                                grid.MinX, grid.MinY, grid.Dx, grid.Dy, grid.XLabel, 
+                                grid.YLabel, grid.ValueLabel))
+    for i in range(iar.NumberOfDataSeries):
+        ds = iar.GetDataSeries(i)
+        y = _np.array(ds.YData.Data, dtype=_np.float64)
+        series.append(_data_series(ds.Description, _np.array(ds.XData.Data, dtype=_np.float64), 
+                                   y.reshape(len(y), -1), ds.XLabel, list(ds.SeriesLabels)))
+    try:
+        header = list(iar.HeaderData.Lines)
+    except (AttributeError, TypeError):
+        header = []
+    return _analysis_data(grids, series, header)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        inonseqeditor_methods.py
+# Purpose:     store custom methods for wrapper class of INonSeqEditor
+# Licence:     MIT License
+#-------------------------------------------------------------------------------
+"""Store custom methods for wrapper class of INonSeqEditor, which defines 
+   all properties and methods needed to interact with the Non-Sequential 
+   Component Editor. 
+   name := repr(zos_obj).split()[0].split('.')[-1].lower() + '_methods.py' 
+"""
+from __future__ import print_function
+from __future__ import division
+from win32com.client import CastTo as _CastTo, constants as _constants
+from pyzos.zosutils import wrapped_zos_object as _wrapped_zos_object
+import pyzos.detector as _det
+
+# Overridden methods
+# ------------------
+
+
+# Extra methods
+# -------------
+
+def zGetDetectorArray(self, objNum, data=0, filename=None, tile_rows=256, accumulator=None,
+                      per_pixel=False):
+    """Returns the data of all pixels of a detector object (rectangle, color, 
+    polar, ...) as a NumPy array
+
+    @param objNum: object number of the detector
+    @param data: data type code (the `Data` argument of `GetDetectorData()`, 
+                 which depends on the detector type), or a sequence of codes, 
+                 such as the data codes of the channels of a color detector
+    @param filename: if given, the data is written to (and returned as) a 
+                     memory-mapped .npy file; use for very large detectors
+    @param tile_rows: number of detector rows converted to NumPy and written 
+                      (to the output and the accumulator) at a time
+    @param accumulator: `pyzos.detector.DetectorAccumulator` to which the data
+                        is added
+    @param per_pixel: if `True`, the data is read with one `GetDetectorData()` 
+                      call per pixel instead of one `GetAllDetectorDataSafe()` 
+                      call per data code (much slower; fallback for very large 
+                      detectors)
+    @return: array of shape (numRows, numCols), or (len(data), numRows, numCols)
+             if `data` is a sequence
+    """
+    nce = self._inonseqeditor  # unwrapped for speed
+    out = _det.read_detector(nce, objNum, data, filename, tile_rows, per_pixel)
+    if accumulator is not None:
+        accumulator.add(out)
+    return out
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        zosarrays.py
+# Purpose:     Assembly of the array results of the bulk methods of OpticalSystem
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Assembly of the arrays read and written by the bulk methods of
+`pyzos.zos.OpticalSystem` (`zRunAnalysisMatrix()`, ...), from and to the
+plain values of the ZOS-API objects. The functions don't depend on COM.
+"""
+from __future__ import division, print_function
+import collections as _co
+import numpy as _np
+
+#%% Analysis matrix (zRunAnalysisMatrix)
+analysis_matrix = _co.namedtuple('analysis_matrix', ['data', 'fields', 'waves', 'configs',
+                                                     'x', 'labels'])
+
+def default_extract(data):
+    """Returns the values of the first data grid or the y-values of the first
+    data series of analysis data (`analysis_data` of `IAR_.zGetDataArrays()`)"""
+    if data.grids:
+        return data.grids[0].values
+    elif data.series:
+        return data.series[0].y
+    else:
+        raise ValueError('The analysis has no data grids or data series')
+
+def analysis_chunks(fields, waves, configs, num_systems):
+    """Returns list of the chunks of (field index, wavelength index, configuration
+    index) combinations run at a time by `num_systems` systems; the combinations
+    are in the order of the flattened analysis matrix"""
+    combos = [(iF, iW, iC) for iF in range(len(fields)) for iW in range(len(waves))
+              for iC in range(len(configs))]
+    return [combos[start:start + num_systems] for start in range(0, len(combos), num_systems)]
+
+def assemble_analysis_matrix(results, fields, waves, configs, first=None):
+    """Returns `analysis_matrix` namedtuple of the extracted results
+
+    @param results: list of the extracted results (array-likes of the same
+                    shape), in the order of `analysis_chunks()`
+    @param fields, waves, configs: field, wavelength and configuration numbers
+    @param first: `analysis_data` of the first result (for the labels), or `None`
+    """
+    data = _np.array(results, dtype=_np.float64)
+    data = data.reshape((len(fields), len(waves), len(configs)) + data.shape[1:])
+    if first is not None and first.grids:
+        x, labels = None, first.grids[0].description
+    elif first is not None and first.series:
+        x, labels = first.series[0].x, first.series[0].series_labels
+    else:
+        x, labels = None, None
+    return analysis_matrix(data, list(fields), list(waves), list(configs), x, labels)
+
+#%% Multi-Configuration Editor (zGetMCEArray, zSetMCEArray, zIterConfigs)
+mce_array = _co.namedtuple('mce_array', ['type', 'param1', 'param2', 'param3', 'values',
+                                         'strings', 'current'])
+
+def assemble_mce_array(optype, params, cells, current):
+    """Returns `mce_array` namedtuple of the MCE data
+
+    @param optype: list of the operand type names
+    @param params: list (numOperand) of (Param1, Param2, Param3)
+    @param cells: list (numConfig) of lists (numOperand) of the cell values
+                  (float, integer or string)
+    @param current: current configuration number
+    """
+    numOper = len(optype)
+    param_array = _np.zeros((3, numOper), dtype=int)
+    if numOper:
+        param_array[:] = _np.transpose(params)
+    values = _np.full((len(cells), numOper), _np.nan)
+    strings = [[str(value) for value in config_cells] for config_cells in cells]
+    for c, config_cells in enumerate(cells):
+        for k, value in enumerate(config_cells):
+            if isinstance(value, (int, float)):
+                values[c, k] = value
+    return mce_array(list(optype), param_array[0], param_array[1], param_array[2], values,
+                     strings, current)
+
+def mce_cell_writes(values, strings, numConfig, k):
+    """Generator that yields (configuration index, property name, value) of the
+    cells of the operand (index) `k` to write (see `OpticalSystem.zSetMCEArray()`)
+
+    @param values: 2D array (numConfig x numOperand) of numeric values (NaN values
+                   are not written), or `None`
+    @param strings: list (numConfig) of lists (numOperand) of strings (`None` and
+                    empty strings are not written), or `None`
+    @param numConfig: number of configurations
+    """
+    for c in range(numConfig):
+        if values is not None and k < values.shape[1] and values[c, k] == values[c, k]:
+            yield c, 'pDoubleValue', float(values[c, k])
+        elif strings is not None and k < len(strings[c]) and strings[c][k]:
+            yield c, 'pValue', strings[c][k]
+
+def iter_configs(mce, read, get_cache, configs=None):
+    """Generator that makes each configuration current, and yields the
+    configuration number and the (cached) data read by `read()`
+
+    @param mce: the Multi-Configuration Editor (ZOS-API object)
+    @param read: function that reads the data of the current configuration
+    @param get_cache: function that returns the (valid) cache, a dictionary of
+                      configuration number : data; it is called for each
+                      configuration, so that edits made during the iteration
+                      are taken into account.
+    @param configs: sequence of configuration numbers (all if `None`)
+
+    The current configuration is restored at the end of the iteration.
+    """
+    if configs is None:
+        configs = range(1, mce.NumberOfConfigurations + 1)
+    curConfig = mce.CurrentConfiguration
+    try:
+        for config in configs:
+            mce.SetCurrentConfiguration(config)
+            cache = get_cache()
+            data = cache.get(config)
+            if data is None:
+                data = cache[config] = read()
+            yield config, data
+    finally:
+        mce.SetCurrentConfiguration(curConfig)
+
+#%% Non-Sequential Component Editor (zGetNCEArray, zSetNCEArray)
+nce_array = _co.namedtuple('nce_array', ['type', 'comment', 'material', 'ref_object',
+                                         'inside_of', 'position', 'tilt', 'params'])
+nce_row_writes = _co.namedtuple('nce_row_writes', ['obj', 'type', 'props', 'params'])
+
+def assemble_nce_array(optype, comment, material, ref_object, inside_of, position, tilt,
+                       params):
+    """Returns `nce_array` namedtuple of the NCE data
+
+    @param optype, comment, material: lists (numObj) of strings
+    @param ref_object, inside_of: lists (numObj) of integers
+    @param position, tilt: lists (numObj) of (x, y, z)
+    @param params: list (numObj) of lists of the parameter values (float,
+                   integer or string); the rows are padded with NaN, and the
+                   non-numeric values are NaN.
+    """
+    numObj = len(optype)
+    maxParams = max([len(values) for values in params] + [0])
+    param_array = _np.full((numObj, maxParams), _np.nan)
+    for i, values in enumerate(params):
+        for k, value in enumerate(values):
+            if isinstance(value, (int, float)):
+                param_array[i, k] = value
+    return nce_array(list(optype), list(comment), list(material),
+                     _np.array(ref_object, dtype=int).reshape(numObj),
+                     _np.array(inside_of, dtype=int).reshape(numObj),
+                     _np.array(position, dtype=_np.float64).reshape((numObj, 3)),
+                     _np.array(tilt, dtype=_np.float64).reshape((numObj, 3)), param_array)
+
+def plan_nce_writes(old, curNumObj, type=None, comment=None, material=None, ref_object=None,
+                    inside_of=None, position=None, tilt=None, params=None):
+    """Returns the writes of `OpticalSystem.zSetNCEArray()`: the cells whose
+    values differ from the known NCE data
+
+    @param old: `nce_array` of the known NCE data (of the `curNumObj` objects)
+    @param curNumObj: current number of objects in the NCE
+    @param type, comment, ..., params: see `OpticalSystem.zSetNCEArray()`
+    @return: (numObj, writes, new) -- the number of objects to set in the NCE;
+             list of `nce_row_writes` namedtuples (`obj` -- object number;
+             `type` -- type name to change to, or `None`; `props` -- list of
+             (property name, value); `params` -- list of (parameter index, value),
+             the index 0 being Par1) of the objects to write, in order; and the
+             `nce_array` of the NCE data after the writes, `None` if it is
+             unknown (objects were added or removed, or changed type).
+    """
+    columns = [type, comment, material, ref_object, inside_of, position, tilt, params]
+    lengths = [len(col) for col in columns if col is not None]
+    numObj = max(lengths) if lengths else len(old.type)
+    oldNumObj = min(curNumObj, numObj)
+    structure_changed = numObj != curNumObj
+    position = None if position is None else _np.asarray(position, dtype=_np.float64)
+    tilt = None if tilt is None else _np.asarray(tilt, dtype=_np.float64)
+    params = None if params is None else _np.atleast_2d(_np.asarray(params, dtype=_np.float64))
+    # copy of the known NCE data, updated with the written values
+    new = old._replace(comment=list(old.comment), material=list(old.material),
+                       ref_object=old.ref_object.copy(), inside_of=old.inside_of.copy(),
+                       position=old.position.copy(), tilt=old.tilt.copy(),
+                       params=old.params.copy())
+    scalar_columns = [('Comment', comment, new.comment), ('Material', material, new.material),
+                      ('RefObject', ref_object, new.ref_object),
+                      ('InsideOf', inside_of, new.inside_of)]
+    vector_columns = [(('XPosition', 'YPosition', 'ZPosition'), position, new.position),
+                      (('TiltAboutX', 'TiltAboutY', 'TiltAboutZ'), tilt, new.tilt)]
+    writes = []
+    for i in range(numObj):
+        known = i < oldNumObj   # else, new object (unknown values)
+        new_type = None
+        if type is not None and i < len(type) and type[i] is not None:
+            if not known or type[i] != old.type[i]:
+                new_type = type[i]
+                known = False   # all columns may be changed by the type change
+                structure_changed = True
+        props = []
+        for prop, col, new_col in scalar_columns:
+            if col is not None and i < len(col) and col[i] is not None:
+                if not known or col[i] != new_col[i]:
+                    props.append((prop, col[i]))
+                    if known:
+                        new_col[i] = col[i]
+        for names, col, new_col in vector_columns:
+            if col is not None and i < len(col):
+                for k, prop in enumerate(names):
+                    value = col[i, k]
+                    if value == value and (not known or value != new_col[i, k]):
+                        props.append((prop, float(value)))
+                        if known:
+                            new_col[i, k] = value
+        param_values = []
+        if params is not None and i < len(params):
+            for k, value in enumerate(params[i]):
+                if value != value:
+                    continue
+                if known and k < new.params.shape[1]:
+                    if value == new.params[i, k]:
+                        continue
+                    new.params[i, k] = value
+                param_values.append((k, float(value)))
+        if new_type is not None or props or param_values:
+            writes.append(nce_row_writes(i + 1, new_type, props, param_values))
+    return numObj, writes, None if structure_changed else new
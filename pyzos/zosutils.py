@@ -7,8 +7,30 @@
 #              For further details, please refer to LICENSE.txt
 #-------------------------------------------------------------------------------
 from __future__ import division, print_function
-import sys as _sys
-from win32com.client import CastTo as _CastTo
+import threading as _threading
+import collections as _co
+import time as _time
+import weakref as _weakref
+try:
+    import pythoncom as _pythoncom
+    from win32com.client import CastTo as _CastTo
+except ImportError:   # pywin32 is only needed to wrap COM objects
+    _pythoncom = _CastTo = None
+
+#%% Module level caches
+# wrapper classes, keyed on the ZOS interface (class) name
+_wrapper_classes = {}
+# live wrapper objects, keyed on (IUnknown, ZOS interface name). The weak 
+# references ensure that a wrapper (and the COM object it holds) is collected 
+# when the user doesn't hold a reference to it any more. The lock serializes 
+# the lookups of threads using marshalled objects (see pyzos.comthread).
+_wrapper_cache = _weakref.WeakValueDictionary()
+_wrapper_cache_lock = _threading.RLock()
+# functions called after (potentially) modifying property sets and method calls 
+_edit_hooks = []
+
+# methods with these prefixes are assumed not to modify the state of ZOS objects
+_READ_METHOD_PREFIXES = ('Get', 'Find', 'Is', 'Has', 'Can', 'Check', 'Read', 'Open', 'Close')
 
 
 def get_callable_method_dict(obj):
@@ -53,16 +75,139 @@ def replicate_methods(srcObj, dstObj):
 
     def zos_wrapper_deco(func):
         def wrapper(*args, **kwargs):
-            return wrapped_zos_object(func(*args, **kwargs))
-        varnames = func.im_func.func_code.co_varnames # alternative is to use inspect.getargspec
-        params = [par for par in varnames if par not in ('self', 'ret')] # removes 'self' and 'ret'
-        wrapper.__doc__ = func.im_func.func_name + '(' + ', '.join(params) + ')' 
+            return _adopt(dstObj, wrapped_zos_object(func(*args, **kwargs)))
+        wrapper.__doc__ = _method_signature(func)
+        return wrapper 
+
+    def zos_edit_wrapper_deco(func, name):
+        def wrapper(*args, **kwargs):
+            ret = _adopt(dstObj, wrapped_zos_object(func(*args, **kwargs)))
+            if _edit_hooks:
+                notify_edit(dstObj, name)
+            return ret
+        wrapper.__doc__ = _method_signature(func)
         return wrapper 
     #
     for key, value in get_callable_method_dict(srcObj).items():
         if key not in overridden_methods:
-            setattr(dstObj, key, zos_wrapper_deco(value))
-        
+            if key.startswith(_READ_METHOD_PREFIXES):
+                setattr(dstObj, key, zos_wrapper_deco(value))
+            else:
+                setattr(dstObj, key, zos_edit_wrapper_deco(value, key))
+
+def add_edit_hook(func):
+    """Register the function `func(obj, name)` to be called after a property of a 
+    wrapper object `obj` is set, or after a method of `obj` that may modify 
+    the state of the ZOS object is called, through pyzos. `name` is the name of 
+    the ZOS property or method.
+    """
+    if func not in _edit_hooks:
+        _edit_hooks.append(func)
+
+def remove_edit_hook(func):
+    """Unregister the edit hook function `func`"""
+    if func in _edit_hooks:
+        _edit_hooks.remove(func)
+
+def notify_edit(obj, name):
+    """Call the registered edit hooks for the edit `name` of the wrapper `obj`"""
+    for hook in _edit_hooks:
+        hook(obj, name)
+
+def get_owner(obj):
+    """Returns the object (such as the `OpticalSystem`) through which the wrapper 
+    object `obj` was obtained, or None if it is not known (for example, for 
+    objects wrapped with `wrapped_zos_object()`)
+
+    Notes: the objects returned by the methods and properties of a wrapper with
+    an owner get the same owner. An owner has a `_zos_owner` attribute holding a
+    weak reference to itself.
+    """
+    ref = getattr(obj, '_zos_owner', None)
+    return ref() if ref is not None else None
+
+def _adopt(parent, child):
+    """Sets the owner of the wrapper `child`, returned by `parent`, to the owner 
+    of `parent` (unless it has one already), and returns `child`"""
+    if getattr(child, '_zos_owner', False) is None and type(child).__name__ != 'IOpticalSystem':
+        owner = getattr(parent, '_zos_owner', None)
+        if owner is not None:
+            child._zos_owner = owner
+    return child
+
+def _method_signature(func):
+    """Returns signature string, such as 'GetSurfaceAt(SurfaceNumber)', of the 
+    (bound) method `func` of a ZOS API Python COM object"""
+    func = getattr(func, '__func__', getattr(func, 'im_func', func))
+    code = getattr(func, '__code__', getattr(func, 'func_code', None))
+    varnames = code.co_varnames[:code.co_argcount] if code else ()
+    params = [par for par in varnames if par not in ('self', 'ret')] # removes 'self' and 'ret'
+    return func.__name__ + '(' + ', '.join(params) + ')'
+
+def _class_method_factory(method_name, dispatch_attr, cast_to=None, doc=None):
+    """Returns a function (to be used as a method of a wrapper class) that calls 
+    the method `method_name` of the ZOS object held by the wrapper object in 
+    the attribute `dispatch_attr`, and wraps the returned value.
+
+    Unlike `replicate_methods()`, which binds a closure per method to every 
+    wrapper instance, the methods created by this factory are shared by all 
+    instances of a wrapper class.
+    """
+    if cast_to:
+        def method(self, *args, **kwargs):
+            if self._zos_batch is not None:
+                self._zos_batch.commit()
+            zos_obj = _cast_zos_object(self, dispatch_attr, cast_to)
+            return _adopt(self, wrapped_zos_object(getattr(zos_obj, method_name)(*args, **kwargs)))
+    else:
+        def method(self, *args, **kwargs):
+            if self._zos_batch is not None:
+                self._zos_batch.commit()
+            return _adopt(self, wrapped_zos_object(getattr(getattr(self, dispatch_attr), 
+                                                           method_name)(*args, **kwargs)))
+    if not method_name.startswith(_READ_METHOD_PREFIXES):
+        read_method = method
+        def method(self, *args, **kwargs):
+            ret = read_method(self, *args, **kwargs)
+            if _edit_hooks:
+                notify_edit(self, method_name)
+            return ret
+    method.__name__ = str(method_name)
+    method.__doc__ = doc
+    return method
+
+def _cast_zos_object(obj, dispatch_attr, cast_to):
+    """Returns the ZOS object held by the wrapper object `obj` cast to the 
+    (base) interface `cast_to`. The casts are cached in the wrapper object"""
+    casts = getattr(obj, '_zos_casts', None)
+    if casts is None:
+        casts = {}
+        try:
+            obj._zos_casts = casts
+        except AttributeError:
+            pass
+    zos_obj = casts.get(cast_to)
+    if zos_obj is None:
+        zos_obj = casts[cast_to] = _CastTo(getattr(obj, dispatch_attr), cast_to)
+    return zos_obj
+
+def _com_identity(zos_obj):
+    """Returns the identity (IUnknown interface, `PyIUnknown`) of the COM object
+    `zos_obj`, or None if it cannot be determined. 
+
+    Per the COM identity rule, querying any interface of an object for IUnknown 
+    always returns the same pointer; `PyIUnknown` objects compare (and hash) on 
+    that pointer. 
+    """
+    if _pythoncom is None:
+        return None
+    try:
+        unknown = zos_obj._oleobj_.QueryInterface(_pythoncom.IID_IUnknown)
+        hash(unknown)
+    except (AttributeError, TypeError, _pythoncom.com_error):
+        return None
+    return unknown
+
 def get_properties(zos_obj):
     """Returns a lists of properties bound to the object `zos_obj`
 
@@ -96,29 +241,196 @@ class ZOSPropMapper(object):
         self.setter = setter
         self.cast_to = cast_to
 
-    def __get__(self, obj, objtype):
-        if self.cast_to:   
-            return wrapped_zos_object(getattr(_CastTo(obj.__dict__[self.zos_interface_attr], self.cast_to), self.property_name))
+    def _zos_object(self, obj):
+        if self.cast_to:
+            return _cast_zos_object(obj, self.zos_interface_attr, self.cast_to)
         else:
-            return wrapped_zos_object(getattr(obj.__dict__[self.zos_interface_attr], self.property_name))
+            return getattr(obj, self.zos_interface_attr)
+
+    def read(self, obj):
+        """Read the property from the ZOS object (bypassing any snapshot)"""
+        return _adopt(obj, wrapped_zos_object(getattr(self._zos_object(obj), self.property_name)))
+
+    def write(self, obj, value):
+        """Write the property to the ZOS object (bypassing any batch)"""
+        obj._zos_snapshot = None   # invalidate snapshot
+        setattr(self._zos_object(obj), self.property_name, value)
+        if _edit_hooks:
+            notify_edit(obj, self.property_name)
+
+    def __get__(self, obj, objtype):
+        if obj is None:
+            return self
+        batch = obj._zos_batch
+        if batch is not None:
+            if self.property_name in batch.pending:
+                return batch.pending[self.property_name][1]
+            batch.commit()
+        snap = obj._zos_snapshot
+        if snap is not None and self.property_name in snap:
+            return snap[self.property_name]
+        return self.read(obj)
     
     def __set__(self, obj, value):
         if self.setter:
-            if self.cast_to:
-                setattr(_CastTo(obj.__dict__[self.zos_interface_attr], self.cast_to), self.property_name, value)
+            batch = obj._zos_batch
+            if batch is not None:
+                batch.set(self, value)
             else:
-                setattr(obj.__dict__[self.zos_interface_attr], self.property_name, value)
+                self.write(obj, value)
         else:
             raise AttributeError("Can't set {}".format(self.property_name))
-            
+
+#%% Batched (write-behind) property setters
+class PropertyBatch(object):
+    """Context manager that buffers the property sets of a wrapper object and 
+    writes them to the ZOS object in one ordered pass on exit (or `commit()`)
+
+    Usage:
+    >>> with wizard.zBatch() as batch:
+    ...     wizard.pType = 0
+    ...     wizard.pData = 1
+    >>> batch.writes, batch.elapsed
+
+    Notes:
+    1. Repeated sets of the same property are coalesced into one write (of the 
+       last value), placed in the order of the last set.
+    2. Reads of a pending property return the pending value. Any other access 
+       to the ZOS object through the wrapper (reading another property or 
+       calling a method) commits the pending writes first.
+    3. If an exception is raised within the `with` block, the pending writes 
+       are discarded.
+
+    Attributes:
+    `sets` -- number of property sets requested 
+    `writes` -- number of property writes made to the ZOS object
+    `elapsed` -- time (seconds) spent writing the properties to the ZOS object
+    """
+    def __init__(self, obj):
+        self.obj = obj
+        self.pending = _co.OrderedDict()  # property name : (mapper, value)
+        self.sets = 0
+        self.writes = 0
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return ('{.__name__}(sets={}, writes={}, pending={}, elapsed={:.6f})'
+                .format(type(self), self.sets, self.writes, len(self.pending), self.elapsed))
+
+    def __enter__(self):
+        if self.obj._zos_batch is not None:
+            raise RuntimeError('{!r} is already batched'.format(self.obj))
+        self.obj._zos_batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.discard()
+        finally:
+            self.obj._zos_batch = None
+        return False
+
+    def set(self, mapper, value):
+        """Buffer the set of the property of `mapper` (`ZOSPropMapper`)"""
+        self.sets += 1
+        self.pending.pop(mapper.property_name, None)
+        self.pending[mapper.property_name] = (mapper, value)
+
+    def commit(self):
+        """Write the pending property sets to the ZOS object"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, _co.OrderedDict()
+        start = _time.time()
+        for mapper, value in pending.values():
+            mapper.write(self.obj, value)
+            self.writes += 1
+        self.elapsed += _time.time() - start
+
+    def discard(self):
+        """Discard the pending property sets"""
+        self.pending.clear()
+
+def batch(obj):
+    """Returns a `PropertyBatch` context manager for batching the property sets 
+    of the wrapper object `obj`"""
+    return PropertyBatch(obj)
+
+#%% Property snapshots
+_snapshot_classes = {}
+
+def get_property_mappers(obj):
+    """Returns a dictionary of the `ZOSPropMapper` descriptors (keyed on the ZOS 
+    property names) of the wrapper object `obj`"""
+    mappers = {}
+    for klass in reversed(type(obj).__mro__):
+        for value in vars(klass).values():
+            if isinstance(value, ZOSPropMapper):
+                mappers[value.property_name] = value
+    return mappers
+
+def snapshot(obj, props=None):
+    """Reads the (getter) properties of the wrapper object `obj` in one pass and 
+    returns them as an immutable record. 
+
+    @param obj: wrapped ZOS object (or `OpticalSystem`)
+    @param props: sequence of property names, with or without the prefix 'p', 
+                  such as ['Type', 'pData']. All properties are read if `None`.
+    @return: namedtuple with fields named after the ZOS properties (without the 
+             prefix 'p')
+
+    Notes:
+    1. Until the snapshot is invalidated, using `invalidate_snapshot()` or by setting 
+       any property of `obj` through pyzos, the values of the snapshot properties 
+       are returned by the property mappers (p*) of `obj` without COM calls.
+    2. The values of properties that are ZOS objects are the wrapped objects.
+    """
+    mappers = get_property_mappers(obj)
+    if props is None:
+        names = sorted(mappers)
+    else:
+        names = [name[1:] if name not in mappers and name.startswith('p') else name 
+                 for name in props]
+        unknown = [name for name in names if name not in mappers]
+        if unknown:
+            raise AttributeError('{.__name__} has no properties {}'.format(type(obj), unknown))
+    values = [mappers[name].read(obj) for name in names]
+    key = (type(obj).__name__, tuple(names))
+    Record = _snapshot_classes.get(key)
+    if Record is None:
+        Record = _snapshot_classes[key] = _co.namedtuple(type(obj).__name__ + '_snapshot', 
+                                                         names, rename=True)
+    snap = dict(obj._zos_snapshot or {})
+    snap.update(zip(names, values))
+    obj._zos_snapshot = snap
+    return Record(*values)
+
+def invalidate_snapshot(obj):
+    """Discards the property snapshot of the wrapper object `obj`; the following 
+    property reads are made from the ZOS object"""
+    obj._zos_snapshot = None
+
 
 def managed_wrapper_class_factory(zos_obj):
     """Creates and returns a wrapper class of a ZOS object, exposing the ZOS objects 
     methods and propertis, and patching custom specialized attributes
 
     @param zos_obj: ZOS API Python COM object
+
+    Notes:
+    1. The wrapper classes are created once per ZOS interface and cached. 
+    2. The instances of the wrapper classes use `__slots__`, i.e. they only store 
+       the ZOS object, its owner (see `get_owner()`) and lazily, its casts to the 
+       base interfaces; the methods of the ZOS object are mapped once, at class 
+       level.
     """
     cls_name = repr(zos_obj).split()[0].split('.')[-1]  
+    Class = _wrapper_classes.get(cls_name)
+    if Class is not None:
+        return Class
     dispatch_attr = '_' + cls_name.lower()  # protocol to be followed to store the ZOS COM object
     
     cdict = {}  # class dictionary
@@ -141,30 +453,20 @@ def managed_wrapper_class_factory(zos_obj):
         exec("p{} = ZOSPropMapper('{}', '{}', setter=True)".format(each, dispatch_attr, each), globals(), cdict)
     
     def __init__(self, zos_obj):
-        
         # dispatcher attribute
-        cls_name = repr(zos_obj).split()[0].split('.')[-1] 
-        dispatch_attr = '_' + cls_name.lower()    # protocol to be followed to store the ZOS COM object
-        self.__dict__[dispatch_attr] = zos_obj
-        self._dispatch_attr_value = dispatch_attr # used in __getattr__
-        
-        # Store base class object 
-        self._base_cls_list = inheritance_dict.get(cls_name, None)
-
-        # patch the methods of the base class(s) of the given ZOS object
-        if self._base_cls_list:
-            for base_cls_name in self._base_cls_list:
-                replicate_methods(_CastTo(zos_obj, base_cls_name), self)
-
-        # patch the methods of given ZOS object 
-        replicate_methods(zos_obj, self)
-
-        # mark object as wrapped to prevent it from being wrapped subsequently
-        self._wrapped = True
+        setattr(self, dispatch_attr, zos_obj)
+        self._zos_casts = None
+        self._zos_snapshot = None
+        self._zos_batch = None
+        self._zos_owner = None
     
     # Provide a way to make property calls without the prefix p
     def __getattr__(self, attrname):
-        return wrapped_zos_object(getattr(self.__dict__[self._dispatch_attr_value], attrname))
+        if attrname.startswith('__') or attrname in type(self).__slots__:
+            raise AttributeError(attrname)  # slot not (yet) set
+        if self._zos_batch is not None:
+            self._zos_batch.commit()
+        return _adopt(self, wrapped_zos_object(getattr(getattr(self, dispatch_attr), attrname)))
 
     def __repr__(self):
         if type(self).__name__ == 'IZOSAPI_Application':
@@ -176,6 +478,14 @@ def managed_wrapper_class_factory(zos_obj):
     cdict['__init__'] = __init__
     cdict['__getattr__'] = __getattr__
     cdict['__repr__'] = __repr__
+    cdict['zSnapshot'] = snapshot
+    cdict['zInvalidateSnapshot'] = invalidate_snapshot
+    cdict['zBatch'] = batch
+    cdict['__slots__'] = (dispatch_attr, '_zos_casts', '_zos_snapshot', '_zos_batch', 
+                          '_zos_owner', '__weakref__')
+    cdict['_dispatch_attr_value'] = dispatch_attr  
+    cdict['_base_cls_list'] = base_cls_list  # Store base class names
+    cdict['_wrapped'] = True  # mark objects as wrapped to prevent them from being wrapped subsequently
     
     # patch custom methods from python files imported as modules
     module_import_str = """
@@ -188,8 +498,23 @@ except ImportError:
 
     _ = cdict.pop('print_function', None)
     _ = cdict.pop('division', None)
+
+    # map the methods of the given ZOS object, and its base class(s), unless 
+    # they are overridden by the custom methods 
+    for key, value in get_callable_method_dict(zos_obj).items():
+        if key not in cdict:
+            cdict[key] = _class_method_factory(key, dispatch_attr, doc=_method_signature(value))
+    if base_cls_list:
+        for base_cls_name in base_cls_list:
+            base_obj = _CastTo(zos_obj, base_cls_name)
+            for key, value in get_callable_method_dict(base_obj).items():
+                if key not in cdict:
+                    cdict[key] = _class_method_factory(key, dispatch_attr, base_cls_name, 
+                                                       _method_signature(value))
     
-    return type(cls_name, (), cdict) 
+    Class = type(cls_name, (), cdict) 
+    _wrapper_classes[cls_name] = Class
+    return Class
 
 def wrapped_zos_object(zos_obj):
     """Helper function to wrap ZOS API COM objects. 
@@ -200,14 +525,25 @@ def wrapped_zos_object(zos_obj):
              wrapping.
 
     Notes:
-    The function dynamically creates a wrapped class with all the provided methods, 
-    properties, and custom methods monkey patched; and returns an instance of it.
+    1. The function dynamically creates a wrapped class with all the provided methods, 
+       properties, and custom methods monkey patched; and returns an instance of it.
+    2. If a live wrapper of the same COM object (identified by its IUnknown pointer)
+       and interface already exists, that wrapper is returned. 
     """
     if hasattr(zos_obj, '_wrapped') or ('CLSID' not in dir(zos_obj)):
         return zos_obj
     else:
         Class = managed_wrapper_class_factory(zos_obj)   
-        return Class(zos_obj)
+        identity = _com_identity(zos_obj)
+        if identity is None:
+            return Class(zos_obj)
+        key = (identity, Class.__name__)
+        with _wrapper_cache_lock:
+            wrapper = _wrapper_cache.get(key)
+            if wrapper is None:
+                wrapper = Class(zos_obj)
+                _wrapper_cache[key] = wrapper
+        return wrapper
 
 #%% ZOS object inheritance relationships dictionary
 # Unfortunately this dict is created manually following the ZOS-API documentation. There
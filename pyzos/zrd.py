@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        zrd.py
+# Purpose:     Streaming, memory-mapped reader of NSC ray database (.ZRD) files
+# Licence:     MIT License
+#              This file is subject to the terms and conditions of the MIT License.
+#              For further details, please refer to LICENSE.txt
+#-------------------------------------------------------------------------------
+"""Offline, memory-mapped reader of the (uncompressed, full data) ray database
+files (.ZRD) written by the non-sequential ray trace (`INSCRayTrace`).
+
+The file is never loaded as a whole. An index of the ray offsets is built in
+one pass (and cached next to the file, or in a given directory), and the ray
+segments are decoded in chunks of rays, as NumPy structured arrays
+(`SEGMENT_DTYPE`), optionally filtered and in parallel worker processes. Only
+NumPy is required, so ray databases can be post-processed on any platform.
+
+File layout
+-----------
+int32 version, int32 maximum number of segments per ray, followed by the
+rays, each an int32 number of segments followed by the segments (10 int32 and
+21 float64 fields, 208 bytes each, see `SEGMENT_DTYPE`). Compressed ray
+databases are not supported.
+
+Example
+-------
+>>> from pyzos.zrd import ZRDFile
+>>> zrd = ZRDFile('stray.ZRD')
+>>> for chunk in zrd.iter_chunks(ray_hits_object=12, processes=4):
+...     seg = chunk.segments[chunk.segments['hit_object'] == 12]
+...     total += seg['intensity'].sum()
+"""
+from __future__ import division, print_function
+import os as _os
+import mmap as _mmap
+import struct as _struct
+import array as _array
+import collections as _co
+import multiprocessing as _mp
+import numpy as _np
+
+#%% Module constants
+SEGMENT_DTYPE = _np.dtype([('status', '<u4'), ('level', '<i4'), ('hit_object', '<i4'),
+                           ('hit_face', '<i4'), ('unused', '<i4'), ('in_object', '<i4'),
+                           ('parent', '<i4'), ('storage', '<i4'), ('xybin', '<i4'),
+                           ('lmbin', '<i4'), ('index', '<f8'), ('starting_phase', '<f8'),
+                           ('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+                           ('l', '<f8'), ('m', '<f8'), ('n', '<f8'),
+                           ('nx', '<f8'), ('ny', '<f8'), ('nz', '<f8'),
+                           ('path_to', '<f8'), ('intensity', '<f8'),
+                           ('phase_of', '<f8'), ('phase_at', '<f8'),
+                           ('exr', '<f8'), ('exi', '<f8'), ('eyr', '<f8'), ('eyi', '<f8'),
+                           ('ezr', '<f8'), ('ezi', '<f8')])
+SEGMENT_SIZE = SEGMENT_DTYPE.itemsize   # 208 bytes
+HEADER_SIZE = 8
+_CACHE_VERSION = 1
+
+segment_chunk = _co.namedtuple('segment_chunk', ['ray', 'segments'])
+
+class ZRDError(Exception): pass
+
+#%% Index
+def build_index(filename):
+    """Walk the ray database `filename` and return (version, max_segments, offsets),
+    where `offsets` (int64 array of length numRays + 1) are the byte offsets of
+    the rays; the last element is the file size.
+    """
+    size = _os.path.getsize(filename)
+    if size < HEADER_SIZE:
+        raise ZRDError('{} is not a ray database file'.format(filename))
+    offsets = _array.array('d')   # exact up to 2**53 bytes; 'q' is not available in Python 2
+    with open(filename, 'rb') as f:
+        mm = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        try:
+            version, max_segments = _struct.unpack_from('<ii', mm, 0)
+            unpack_from = _struct.Struct('<i').unpack_from
+            offset = HEADER_SIZE
+            append = offsets.append
+            while offset + 4 <= size:
+                numSeg = unpack_from(mm, offset)[0]
+                if not 0 <= numSeg <= max(max_segments, 0):
+                    raise ZRDError('Invalid number of segments ({}) at byte {} of {}; '
+                                   'compressed ray databases are not supported'
+                                   .format(numSeg, offset, filename))
+                append(offset)
+                offset += 4 + numSeg*SEGMENT_SIZE
+        finally:
+            mm.close()
+    if offset != size:
+        raise ZRDError('{} is truncated'.format(filename))
+    offsets.append(size)
+    return version, max_segments, _np.array(offsets, dtype=_np.int64)
+
+def _cache_filename(filename, cache_dir):
+    if cache_dir is None:
+        return filename + '.idx.npz'
+    return _os.path.join(cache_dir, _os.path.basename(filename) + '.idx.npz')
+
+def load_index(filename, cache=True, cache_dir=None):
+    """Return (version, max_segments, offsets) of the ray database `filename`
+    (see `build_index()`) using the index cache file if it is up to date
+
+    @param cache: if `True` (default) the index is loaded from (and if required
+                  stored into) the index cache file
+    @param cache_dir: directory of the index cache files. The default is the
+                      directory of the ray database.
+    """
+    stat = _os.stat(filename)
+    stamp = _np.array([_CACHE_VERSION, stat.st_mtime, stat.st_size])
+    cache_file = _cache_filename(filename, cache_dir)
+    if cache and _os.path.exists(cache_file):
+        try:
+            with _np.load(cache_file) as npz:
+                if _np.array_equal(npz['stamp'], stamp):
+                    return int(npz['version']), int(npz['max_segments']), npz['offsets']
+        except (IOError, OSError, KeyError, ValueError):
+            pass  # rebuild the index
+    version, max_segments, offsets = build_index(filename)
+    if cache:
+        try:
+            with open(cache_file, 'wb') as f:
+                _np.savez(f, stamp=stamp, version=version, max_segments=max_segments,
+                          offsets=offsets)
+        except (IOError, OSError):
+            pass  # read-only location; the index is usable without cache
+    return version, max_segments, offsets
+
+#%% Chunk decoding and filtering
+def _as_set(values):
+    return _np.atleast_1d(_np.asarray(values, dtype=_np.int64))
+
+def _decode(words, offsets, first_ray):
+    """Decode the rays with byte offsets `offsets` (including the end offset of the
+    last ray) from the int32 memory map `words` of the file"""
+    start, end = offsets[0] // 4, offsets[-1] // 4
+    data = _np.array(words[start:end])
+    keep = _np.ones(len(data), dtype=bool)
+    keep[(offsets[:-1] - offsets[0]) // 4] = False     # the ray headers
+    segments = data[keep].view(SEGMENT_DTYPE)
+    counts = (_np.diff(offsets) - 4) // SEGMENT_SIZE
+    ray = _np.repeat(_np.arange(first_ray, first_ray + len(counts)), counts)
+    return segment_chunk(ray, segments)
+
+def _filter(chunk, hit_object=None, level=None, status=None, ray_hits_object=None):
+    """Return the segments of the chunk that pass the filters (see `ZRDFile.iter_chunks()`)"""
+    seg = chunk.segments
+    keep = None
+    def combine(mask):
+        return mask if keep is None else keep & mask
+    if ray_hits_object is not None:
+        hit = _np.isin(seg['hit_object'], _as_set(ray_hits_object))
+        keep = combine(_np.isin(chunk.ray, _np.unique(chunk.ray[hit])))
+    if hit_object is not None:
+        keep = combine(_np.isin(seg['hit_object'], _as_set(hit_object)))
+    if level is not None:
+        lo, hi = level if isinstance(level, (tuple, list)) else (level, level)
+        mask = _np.ones(len(seg), dtype=bool)
+        if lo is not None:
+            mask &= seg['level'] >= lo
+        if hi is not None:
+            mask &= seg['level'] <= hi
+        keep = combine(mask)
+    if status is not None:
+        keep = combine((seg['status'] & status) != 0)
+    if keep is None:
+        return chunk
+    return segment_chunk(chunk.ray[keep], seg[keep])
+
+_worker_words = {}   # file name : memory map, in worker processes
+
+def _process_chunk(args):
+    """Decode, filter and (optionally) reduce a chunk in a worker process"""
+    filename, offsets, first_ray, filters, func = args
+    words = _worker_words.get(filename)
+    if words is None:
+        words = _worker_words[filename] = _np.memmap(filename, dtype='<i4', mode='r')
+    chunk = _filter(_decode(words, offsets, first_ray), **filters)
+    return chunk if func is None else func(chunk)
+
+#%% Reader
+class ZRDFile(object):
+    """Memory-mapped ray database (.ZRD) file"""
+    def __init__(self, filename, cache=True, cache_dir=None):
+        """
+        @param filename: name of the ray database file (uncompressed, full data)
+        @param cache, cache_dir: see `load_index()`
+        """
+        self.filename = _os.path.abspath(filename)
+        self.version, self.max_segments, self.offsets = load_index(self.filename, cache,
+                                                                   cache_dir)
+        self._words = _np.memmap(self.filename, dtype='<i4', mode='r')
+
+    def __repr__(self):
+        return ("{.__name__}('{}', version={}, numRays={}, numSegments={})"
+                .format(type(self), self.filename, self.version, self.num_rays,
+                        self.num_segments))
+
+    def __len__(self):
+        return self.num_rays
+
+    @property
+    def num_rays(self):
+        """number of rays"""
+        return len(self.offsets) - 1
+
+    @property
+    def counts(self):
+        """number of segments of each ray"""
+        return (_np.diff(self.offsets) - 4) // SEGMENT_SIZE
+
+    @property
+    def num_segments(self):
+        """total number of segments"""
+        return int((self.offsets[-1] - HEADER_SIZE - 4*self.num_rays) // SEGMENT_SIZE)
+
+    def read_rays(self, start, stop=None):
+        """Return the segments of rays `start` to `stop` (exclusive, 0-based) as
+        `segment_chunk` namedtuple (`ray` -- ray number of each segment, and
+        `segments` -- structured array of `SEGMENT_DTYPE`)
+        """
+        stop = min(start + 1 if stop is None else stop, self.num_rays)
+        if not 0 <= start < stop:
+            raise IndexError('Invalid ray range ({}, {})'.format(start, stop))
+        return _decode(self._words, self.offsets[start:stop + 1], start)
+
+    def chunk_ranges(self, chunk_segments=1 << 18, rays=None):
+        """Return list of (start, stop) ray ranges of about `chunk_segments`
+        segments each (at least one ray), within the ray range `rays`"""
+        start, stop = (0, self.num_rays) if rays is None else rays
+        stop = min(stop, self.num_rays)
+        # cumulative number of segments before each ray (and after the last ray)
+        numRays = stop - start
+        cum = ((self.offsets[start:stop + 1] - self.offsets[start] - 4*_np.arange(numRays + 1))
+               // SEGMENT_SIZE)
+        ranges = []
+        i = 0
+        while i < numRays:
+            j = int(_np.searchsorted(cum, cum[i] + chunk_segments, side='right')) - 1
+            j = min(max(j, i + 1), numRays)
+            ranges.append((start + i, start + j))
+            i = j
+        return ranges
+
+    def iter_chunks(self, chunk_segments=1 << 18, rays=None, hit_object=None, level=None,
+                    status=None, ray_hits_object=None, processes=1, func=None):
+        """Generator of the (filtered) segments of the rays in chunks
+
+        Parameters
+        ----------
+        chunk_segments : integer
+            approximate number of segments per chunk (chunks contain whole rays)
+        rays : 2-tuple of integers, optional
+            (start, stop) range of ray numbers (0-based, stop exclusive)
+        hit_object : integer or sequence of integers, optional
+            only segments that hit the object(s)
+        level : integer or 2-tuple, optional
+            only segments of the level (ray generation; 0 for the segments
+            leaving the source), or (min, max) range of levels
+        status : integer, optional
+            only segments with any of the status bits of `status` set
+        ray_hits_object : integer or sequence of integers, optional
+            only (all the segments of) rays that hit the object(s)
+        processes : integer
+            number of worker processes decoding the chunks; chunks are still
+            yielded in order. Use None for the number of CPUs.
+        func : callable, optional
+            function applied to each chunk (in the worker processes); the
+            results of `func` are yielded instead of the chunks. `func` must
+            be picklable (i.e. a module level function) if `processes` != 1.
+
+        Yields
+        ------
+        `segment_chunk` namedtuples (or the results of `func`)
+        """
+        filters = dict(hit_object=hit_object, level=level, status=status,
+                       ray_hits_object=ray_hits_object)
+        tasks = ((self.filename, self.offsets[start:stop + 1], start, filters, func)
+                 for start, stop in self.chunk_ranges(chunk_segments, rays))
+        if processes == 1:
+            for _, offsets, first_ray, _, _ in tasks:
+                chunk = _filter(_decode(self._words, offsets, first_ray), **filters)
+                yield chunk if func is None else func(chunk)
+        else:
+            pool = _mp.Pool(processes)
+            try:
+                for result in pool.imap(_process_chunk, tasks):
+                    yield result
+            finally:
+                pool.terminate()
+                pool.join()
+
+    def map_chunks(self, func, **kwargs):
+        """Return list of the results of `func(chunk)` of all chunks; the keyword
+        arguments are those of `iter_chunks()`"""
+        return list(self.iter_chunks(func=func, **kwargs))
+
+    def read(self, **kwargs):
+        """Return all (filtered) segments as one `segment_chunk`; the keyword
+        arguments are those of `iter_chunks()`"""
+        chunks = list(self.iter_chunks(**kwargs))
+        if not chunks:
+            return segment_chunk(_np.zeros(0, dtype=_np.int64), _np.zeros(0, SEGMENT_DTYPE))
+        return segment_chunk(_np.concatenate([c.ray for c in chunks]),
+                             _np.concatenate([c.segments for c in chunks]))
+
+    def close(self):
+        """Release the memory map"""
+        self._words = None
@@ -27,6 +27,7 @@ setup(
     url='https://github.com/pyzos/pyzos',
     packages=find_packages(),
     include_package_data=True,
+    install_requires=['numpy'],
     classifiers=[
         'Intended Audience :: Science/Research',
         'Topic :: Scientific/Engineering',
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Writes the reference ray trace fixture `raytrace_asphere.npz` used by
+`tests/test_raytrace.py`.
+
+The fixture has the format of `OpticalSystem.zRecordRayTraceFixture()`. Its
+ray data is computed here with an independent scalar tracer (bisection on the
+exact sag, one ray at a time) instead of `IBatchRayTrace`, so that the
+fixture can be regenerated without OpticStudio. Fixtures recorded in
+OpticStudio (`raytrace_*.npz`) are picked up by the test as well.
+
+Lens: singlet with the stop on the spherical front surface and an even
+asphere back surface, object at infinity, two wavelengths, fields 0 and 7 deg.
+
+Usage: python make_raytrace_fixture.py
+"""
+from __future__ import division, print_function
+import os
+import math
+import numpy as np
+
+CURVATURE = [0.0, 1/40.0, -1/120.0, 0.0]
+CONIC = [0.0, 0.0, -2.5, 0.0]
+ASPHERE = [[0.0]*8, [0.0]*8, [0.0, 2e-6, -1.5e-9, 0, 0, 0, 0, 0], [0.0]*8]
+THICKNESS = [np.inf, 6.0, 62.0, 0.0]
+INDEX = [[1.0, 1.5168, 1.0, 1.0],      # 0.5876 um
+         [1.0, 1.5224, 1.0, 1.0]]      # 0.4861 um
+SEMIDIA = [0.0, 12.0, 12.0, 20.0]
+SURFTYPE = ['Standard', 'Standard', 'Even Asphere', 'Standard']
+WAVELENGTHS = [0.5875618, 0.4861327]
+EPD = 16.0
+FIELDS = [[0.0, 0.0], [0.0, 7.0]]
+
+def sag(i, r2):
+    c, k, a = CURVATURE[i], CONIC[i], ASPHERE[i]
+    z = c*r2/(1 + math.sqrt(1 - (1 + k)*c*c*r2))
+    return z + sum(a[j]*r2**(j + 1) for j in range(8))
+
+def dsag_dr(i, r):
+    c, k, a = CURVATURE[i], CONIC[i], ASPHERE[i]
+    d = c*r/math.sqrt(1 - (1 + k)*c*c*r*r)
+    return d + sum(2*(j + 1)*a[j]*r**(2*j + 1) for j in range(8))
+
+def intersect(i, p, d):
+    """Bisection on f(s) = z(s) - sag(x(s), y(s)) around the vertex plane"""
+    def f(s):
+        x, y, z = p[0] + s*d[0], p[1] + s*d[1], p[2] + s*d[2]
+        return z - sag(i, x*x + y*y)
+    s0 = -p[2]/d[2]
+    lo, hi = s0 - 10.0, s0 + 10.0
+    flo = f(lo)
+    for _ in range(200):
+        mid = 0.5*(lo + hi)
+        fm = f(mid)
+        if (fm < 0) == (flo < 0):
+            lo, flo = mid, fm
+        else:
+            hi = mid
+    s = 0.5*(lo + hi)
+    return [p[0] + s*d[0], p[1] + s*d[1], p[2] + s*d[2]]
+
+def normal(i, q):
+    r = math.hypot(q[0], q[1])
+    g = dsag_dr(i, r)/r if r > 0 else 0.0
+    nx, ny, nz = -q[0]*g, -q[1]*g, 1.0
+    norm = math.sqrt(nx*nx + ny*ny + nz*nz)
+    return [nx/norm, ny/norm, nz/norm]
+
+def refract(d, nrm, n1, n2):
+    cos_i = sum(a*b for a, b in zip(d, nrm))
+    mu = n1/n2
+    cos_t = math.sqrt(1 - mu*mu*(1 - cos_i*cos_i))
+    return [mu*a + (cos_t - mu*cos_i)*b for a, b in zip(d, nrm)]
+
+def trace_ray(hy, px, py, wave):
+    # the stop is surface 1, so the entrance pupil is at its vertex plane
+    theta = math.radians(hy*FIELDS[-1][1])
+    d = [0.0, math.tan(theta), 1.0]
+    norm = math.sqrt(sum(a*a for a in d))
+    d = [a/norm for a in d]
+    p = [px*EPD/2 - 20*d[0], py*EPD/2 - 20*d[1], -20*d[2]]
+    for i in range(1, len(CURVATURE)):
+        if i > 1:
+            p[2] -= THICKNESS[i - 1]
+        p = intersect(i, p, d)
+        d = refract(d, normal(i, p), INDEX[wave][i - 1], INDEX[wave][i])
+    return p + d
+
+def main():
+    rings = 3
+    pupil = [(0.0, 0.0)]
+    for r in range(1, rings + 1):
+        for j in range(6*r):
+            t = 2*math.pi*j/(6*r)
+            pupil.append((r/rings*math.sin(t), r/rings*math.cos(t)))
+    rays = [(hy, px, py, wave) for wave in (0, 1) for hy in (0.0, 0.5, 1.0) for px, py in pupil]
+    hy, px, py, wave = (np.array(a) for a in zip(*rays))
+    data = np.array([trace_ray(*ray) for ray in rays]).T
+    asphere = np.array(ASPHERE)
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'raytrace_asphere.npz')
+    np.savez(filename, curvature=CURVATURE, conic=CONIC, asphere=asphere, thickness=THICKNESS,
+             index=INDEX, semidia=SEMIDIA, stop=1, wavelengths=WAVELENGTHS, aperture=EPD,
+             field_type=0, fields=np.array(FIELDS), surftype=np.array(SURFTYPE),
+             hx=np.zeros(len(rays)), hy=hy, px=px, py=py, wave=wave, x=data[0], y=data[1],
+             z=data[2], l=data[3], m=data[4], n=data[5], vignetted=np.zeros(len(rays), bool))
+    print('Wrote {} rays to {}'.format(len(rays), filename))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests of the glass catalog loader `pyzos.agf`"""
+from __future__ import division, print_function
+import io
+import os
+import numpy as np
+import pytest
+import pyzos.agf as agf
+
+# Schott data of N-BK7 and F2 (Sellmeier 1 formula)
+CATALOG = u"""CC Test catalog
+NM N-BK7 2 517642.251 1.5168 64.17 0 0
+ED 7.1 -30 70 2.51 0
+CD 1.03961212 0.00600069867 0.231792344 0.0200179144 1.01046945 103.560653 0 0 0 0
+TD 1.86E-06 1.31E-08 -1.37E-11 4.34E-07 6.27E-10 0.17 20
+LD 0.3 2.5
+NM F2 2 620364.360 1.62004 36.37 0 0
+CD 1.34533359 0.00997743871 0.209073176 0.0470450767 0.937357162 111.886764 0 0 0 0
+TD 1.51E-06 1.56E-08 -2.78E-11 9.34E-07 1.04E-09 0.25 20
+LD 0.32 2.5
+"""
+
+@pytest.fixture
+def catalog_file(tmp_path):
+    filename = str(tmp_path / 'TEST.AGF')
+    with io.open(filename, 'w', encoding='utf-16') as f:
+        f.write(CATALOG)
+    return filename
+
+def test_index_and_abbe(catalog_file):
+    cat = agf.load_agf(catalog_file)
+    assert len(cat) == 2 and 'n-bk7' in cat
+    n = cat.index(['N-BK7', 'F2'], [agf.WAVE_d, agf.WAVE_F])
+    assert n.shape == (2, 2)
+    np.testing.assert_allclose(n[:, 0], [1.5168, 1.62004], atol=2e-5)
+    np.testing.assert_allclose(cat.abbe(['N-BK7', 'F2']), [64.17, 36.37], rtol=1e-3)
+    assert cat.index('F2', 0.5875618).shape == (1, 1)
+    with pytest.raises(KeyError):
+        cat.find('NOTAGLASS')
+
+def test_thermal_coefficients(catalog_file):
+    cat = agf.load_agf(catalog_file)
+    n20 = cat.index('N-BK7', agf.WAVE_d)
+    np.testing.assert_allclose(cat.index('N-BK7', agf.WAVE_d, temperature=20), n20)
+    dndt = cat.dndt('N-BK7', agf.WAVE_d)
+    assert 1e-6 < dndt[0, 0] < 4e-6   # Schott: 2.4e-6/K (absolute, d-line)
+    n21 = cat.index('N-BK7', agf.WAVE_d, temperature=21)
+    assert n21 - n20 == pytest.approx(dndt, rel=0.05)
+
+def test_range(catalog_file):
+    cat = agf.load_agf(catalog_file)
+    assert cat.in_range(['N-BK7', 'F2'], [0.31, 0.5]).tolist() == [[True, True], [False, True]]
+
+def test_cache(catalog_file, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    os.makedirs(cache_dir)
+    cat = agf.load_agf(catalog_file, cache_dir=cache_dir)
+    cache_file = os.path.join(cache_dir, 'TEST.AGF.npz')
+    assert os.path.exists(cache_file)
+    cached = agf.load_agf(catalog_file, cache_dir=cache_dir)
+    np.testing.assert_array_equal(cached.coeffs, cat.coeffs)
+    assert list(cached.names) == ['N-BK7', 'F2']
+
+def test_load_catalogs_precedence(catalog_file, tmp_path):
+    other = str(tmp_path / 'OTHER.AGF')
+    with io.open(other, 'w', encoding='latin-1') as f:
+        f.write(u'NM F2 2 0 1.7 30 0 0\nCD 1.5 0.01 0 1 0 1 0 0 0 0\n')
+    cat = agf.load_catalogs([catalog_file, other], cache=False)
+    assert len(cat) == 3
+    assert cat.index('F2', agf.WAVE_d)[0, 0] == pytest.approx(1.62004, abs=2e-5)
+
+def test_model_index():
+    n = agf.model_index([1.5168, 1.62], [64.17, 36.37],
+                        [agf.WAVE_d, agf.WAVE_F, agf.WAVE_C])
+    np.testing.assert_allclose(n[:, 0], [1.5168, 1.62])
+    np.testing.assert_allclose((n[:, 0] - 1)/(n[:, 1] - n[:, 2]), [64.17, 36.37])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Tests of the columnar store `pyzos.colstore` and of the perturbation
+sampling of `pyzos.tolerance`"""
+from __future__ import division, print_function
+import os
+import numpy as np
+import pytest
+from pyzos.colstore import ColumnStore
+import pyzos.tolerance as tol
+
+COLUMNS = [('trial', 'i8'), ('merit', 'f8')]
+
+def test_append_forms_and_read(tmp_path):
+    store = ColumnStore(str(tmp_path / 'store'), COLUMNS, meta={'seed': 1})
+    assert len(store) == 0 and store['merit'].shape == (0,)
+    store.append({'trial': 0, 'merit': 1.5})
+    store.append([{'trial': 1, 'merit': 2.5}, {'trial': 2, 'merit': 3.5}])
+    store.append({'trial': [3, 4], 'merit': np.array([4.5, 5.5])})
+    assert len(store) == 5 and store.names == ['trial', 'merit']
+    np.testing.assert_array_equal(store['trial'], np.arange(5))
+    assert store['trial'].dtype == np.int64
+    np.testing.assert_array_equal(store.read_all()['merit'], np.arange(5) + 1.5)
+    with pytest.raises(ValueError):
+        store.append({'trial': [5, 6], 'merit': [1.0]})
+
+def test_reopen(tmp_path):
+    directory = str(tmp_path / 'store')
+    ColumnStore(directory, COLUMNS, meta={'seed': 1}).append({'trial': 7, 'merit': 0.25})
+    store = ColumnStore(directory)
+    assert len(store) == 1 and store.meta == {'seed': 1} and store['trial'][0] == 7
+    ColumnStore(directory, COLUMNS)                     # same columns
+    with pytest.raises(ValueError):
+        ColumnStore(directory, [('trial', 'i4'), ('merit', 'f8')])
+    with pytest.raises(ValueError):
+        ColumnStore(str(tmp_path / 'new'))              # no columns
+
+def test_uncommitted_rows_are_discarded(tmp_path):
+    directory = str(tmp_path / 'store')
+    store = ColumnStore(directory, COLUMNS)
+    store.append({'trial': [0, 1], 'merit': [1.0, 2.0]})
+    # crash after writing a partial row to one column file
+    with open(os.path.join(directory, 'merit.bin'), 'ab') as f:
+        f.write(np.array([9.0, 9.0]).tobytes()[:11])
+    store = ColumnStore(directory)
+    assert len(store) == 2
+    assert os.path.getsize(os.path.join(directory, 'merit.bin')) == 16
+    store.append({'trial': 2, 'merit': 3.0})
+    np.testing.assert_array_equal(ColumnStore(directory)['merit'], [1.0, 2.0, 3.0])
+
+TOLERANCES = [tol.tolerance('TRAD', 2, 0, 0, -0.1, 0.1),
+              tol.tolerance('TTHI', 1, 3, 0, -0.02, 0.06)]
+
+@pytest.mark.parametrize('distribution', tol.DISTRIBUTIONS)
+def test_sample_reproducible_and_bounded(distribution):
+    assert not tol.sample(TOLERANCES, 0, 5, distribution).any()     # nominal trial
+    values = np.array([tol.sample(TOLERANCES, trial, 5, distribution)
+                       for trial in range(1, 2001)])
+    np.testing.assert_array_equal(values[9], tol.sample(TOLERANCES, 10, 5, distribution))
+    assert not np.array_equal(values[9], tol.sample(TOLERANCES, 10, 6, distribution))
+    lo, hi = [t.min for t in TOLERANCES], [t.max for t in TOLERANCES]
+    assert (values >= lo).all() and (values <= hi).all()
+    assert values.mean(axis=0) == pytest.approx([0.0, 0.02], abs=0.01)
+
+def test_sample_unknown_distribution():
+    with pytest.raises(ValueError):
+        tol.sample(TOLERANCES, 1, distribution='triangular')
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Tests of the COM thread pool executor `pyzos.comthread` with the `FakeCOM` layer"""
+from __future__ import division, print_function
+import threading
+import time
+import pytest
+import pyzos.comthread as ct
+
+TIMEOUT = 10
+
+class Target(object):
+    """Stand-in of a ZOS-API object"""
+    def __init__(self):
+        self.value = 0
+        self.threads = set()
+
+    def touch(self):
+        self.threads.add(threading.current_thread().ident)
+        return self.value
+
+@pytest.fixture
+def com():
+    return ct.FakeCOM()
+
+def test_apartment_rules(com):
+    obj = com.bind(Target())
+    assert obj.touch() == 0
+    errors = []
+    def use():
+        try:
+            obj.touch()
+        except ct.FakeCOMError as e:
+            errors.append(e)
+    thread = threading.Thread(target=use)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+
+def test_tasks_use_marshalled_interfaces(com):
+    target = Target()
+    obj = com.bind(target)
+    with ct.COMThreadPoolExecutor(obj, max_workers=3, com=com, wrap=None) as executor:
+        assert com.marshalled == com.unmarshalled == 3
+        assert len(com.initialized) == 3
+        def task(osys, k):
+            assert osys is ct.current_system()
+            osys.value = osys.value + 0     # attribute set in the worker's apartment
+            return osys.touch() + k
+        assert list(executor.map(task, range(20))) == list(range(20))
+        assert ct.current_system() is None
+    assert com.initialized == set()                   # uninitialized on shutdown
+    assert threading.current_thread().ident not in target.threads
+    assert 1 <= len(target.threads) <= 3
+
+def test_wrap(com):
+    obj = com.bind(Target())
+    wrapped = []
+    def wrap(system):
+        wrapped.append(system)
+        return ('wrapped', system)
+    with ct.COMThreadPoolExecutor(obj, max_workers=2, com=com, wrap=wrap) as executor:
+        result = executor.submit(lambda osys: osys[0]).result(TIMEOUT)
+    assert result == 'wrapped' and len(wrapped) == 2
+
+def test_error_propagation(com):
+    obj = com.bind(Target())
+    with ct.COMThreadPoolExecutor(obj, max_workers=2, com=com, wrap=None) as executor:
+        def fail(osys):
+            raise KeyError('missing')
+        future = executor.submit(fail)
+        with pytest.raises(KeyError):
+            future.result(TIMEOUT)
+        assert isinstance(future.exception(), KeyError) and future.done()
+        # the workers keep serving after a failed task
+        assert executor.submit(lambda osys: osys.touch()).result(TIMEOUT) == 0
+
+class UninitializedCOM(ct.FakeCOM):
+    """COM layer whose workers don't initialize COM (their unmarshalling fails,
+    after a delay)"""
+    def initialize(self):
+        pass
+
+    def unmarshal(self, stream, like):
+        time.sleep(0.05)
+        return ct.FakeCOM.unmarshal(self, stream, like)
+
+@pytest.mark.parametrize('barrier', [True, False])
+def test_init_errors_raised_in_caller(monkeypatch, barrier):
+    if not barrier:   # as in Python 2
+        monkeypatch.delattr(threading, 'Barrier', raising=False)
+    com = UninitializedCOM()
+    with pytest.raises(ct.FakeCOMError):
+        ct.COMThreadPoolExecutor(com.bind(Target()), max_workers=2, com=com, wrap=None)
+
+def test_shutdown_and_cancel(com):
+    obj = com.bind(Target())
+    executor = ct.COMThreadPoolExecutor(obj, max_workers=1, com=com, wrap=None)
+    gate, started = threading.Event(), threading.Event()
+    def wait(osys):
+        started.set()
+        return gate.wait(TIMEOUT)
+    running = executor.submit(wait)
+    started.wait(TIMEOUT)
+    pending = executor.submit(lambda osys: 'pending')
+    cancelled = executor.submit(lambda osys: 'cancelled')
+    assert not running.cancel() and cancelled.cancel() and cancelled.cancelled()
+    executor.shutdown(wait=False)
+    with pytest.raises(RuntimeError):
+        executor.submit(lambda osys: None)
+    gate.set()
+    executor.shutdown()
+    assert running.result() is True and pending.result() == 'pending'
+    with pytest.raises(RuntimeError):
+        cancelled.result()
+    assert not any(thread.is_alive() for thread in executor._threads)
+    assert com.initialized == set()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Tests of the NSC detector data helpers `pyzos.detector`"""
+from __future__ import division, print_function
+import numpy as np
+import pytest
+import pyzos.detector as det
+
+DATA = np.arange(35.0).reshape(7, 5)
+
+def test_to_array_tiles_and_memmap(tmp_path):
+    rows = [tuple(r) for r in DATA]
+    np.testing.assert_array_equal(det.to_array(rows, tile_rows=3), DATA)
+    filename = str(tmp_path / 'det.npy')
+    out = det.to_array(rows, filename, tile_rows=2)
+    assert isinstance(out, np.memmap)
+    np.testing.assert_array_equal(np.load(filename), DATA)
+    assert det.to_array(rows, shape=(35,)).shape == (35,)
+
+def test_to_array_empty():
+    assert det.to_array([]).shape == (0, 0)
+    assert det.to_array((), shape=(0, 4)).shape == (0, 4)
+
+@pytest.mark.parametrize('tile_rows', [1, 3, 7, 100])
+def test_from_pixels(tile_rows):
+    read = []
+    def get_pixel(pix):
+        read.append(pix)
+        return DATA.flat[pix - 1]
+    out = det.from_pixels(get_pixel, DATA.shape, tile_rows=tile_rows)
+    np.testing.assert_array_equal(out, DATA)
+    assert read == list(range(1, DATA.size + 1))
+
+def test_from_pixels_into_output(tmp_path):
+    out = np.zeros((2,) + DATA.shape)
+    det.from_pixels(lambda pix: DATA.flat[pix - 1], DATA.shape, tile_rows=2, out=out[1])
+    np.testing.assert_array_equal(out[1], DATA)
+    assert not out[0].any()
+    filename = str(tmp_path / 'det.npy')
+    det.from_pixels(lambda pix: -pix, (3, 2), filename, tile_rows=2)
+    np.testing.assert_array_equal(np.load(filename), -np.arange(1, 7).reshape(3, 2))
+
+def test_from_pixels_empty():
+    assert det.from_pixels(lambda pix: 0.0, (0, 5)).shape == (0, 5)
+
+def test_accumulator(tmp_path):
+    acc = det.DetectorAccumulator(str(tmp_path / 'sum.npy'), tile_rows=2)
+    assert acc.mean is None
+    acc.add(DATA)
+    acc.add(3*DATA)
+    assert acc.count == 2
+    np.testing.assert_array_equal(acc.mean, 2*DATA)
+    with pytest.raises(ValueError):
+        acc.add(DATA[:3])
+    acc.reset()
+    assert acc.count == 0 and not acc.sum.any()
+
+class FakeNCE(object):
+    """Duck-typed INonSeqEditor with one detector (object 3), counting the calls"""
+    def __init__(self, data):
+        self.data = {0: data, 1: -data}
+        self.bulk = self.pixels = 0
+
+    def GetDetectorDimensions(self, objNum):
+        numRows, numCols = self.data[0].shape
+        return objNum == 3, numCols, numRows
+
+    def GetAllDetectorDataSafe(self, objNum, code):
+        self.bulk += 1
+        return tuple(tuple(row) for row in self.data[code]) if code in self.data else None
+
+    def GetDetectorData(self, objNum, pix, code):
+        self.pixels += 1
+        return code in self.data, self.data.get(code, DATA).flat[pix - 1]
+
+def test_read_detector_in_one_call(tmp_path):
+    nce = FakeNCE(DATA)
+    np.testing.assert_array_equal(det.read_detector(nce, 3, tile_rows=2), DATA)
+    assert nce.bulk == 1 and nce.pixels == 0
+    filename = str(tmp_path / 'det.npy')
+    out = det.read_detector(nce, 3, [0, 1], filename, tile_rows=3)
+    assert isinstance(out, np.memmap) and nce.bulk == 3
+    np.testing.assert_array_equal(np.load(filename), [DATA, -DATA])
+    with pytest.raises(ValueError):
+        det.read_detector(nce, 3, 2)
+    with pytest.raises(ValueError):
+        det.read_detector(nce, 1)
+
+def test_read_detector_per_pixel():
+    nce = FakeNCE(DATA)
+    out = det.read_detector(nce, 3, [1], tile_rows=2, per_pixel=True)
+    np.testing.assert_array_equal(out, [-DATA])
+    assert nce.bulk == 0 and nce.pixels == DATA.size
+    with pytest.raises(ValueError):
+        det.read_detector(nce, 3, 2, per_pixel=True)
+
+def test_read_detector_empty():
+    nce = FakeNCE(np.zeros((0, 4)))
+    assert det.read_detector(nce, 3).shape == (0, 4)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Tests of the time-budgeted Global/Hammer optimization runner `pyzos.globalopt`
+with a stand-in system and tools"""
+from __future__ import division, print_function
+import os
+import pytest
+import pyzos.globalopt as gopt
+
+class Clock(object):
+    """Stand-in of the `time` module, advanced by the tools"""
+    def __init__(self):
+        self.now = 1.0e9
+
+    def time(self):
+        return self.now
+
+class FakeTool(object):
+    def __init__(self, osys, kind):
+        self.osys = osys
+        self.kind = kind
+        self.pIsRunning = False
+        self.found = {}
+
+    def RunAndWaitWithTimeout(self, seconds):
+        osys = self.osys
+        osys.runs.append(seconds)
+        if osys.interrupt_at == len(osys.runs):
+            raise KeyboardInterrupt
+        osys.clock.now += seconds
+        merits = osys.merits.pop(0)
+        if self.kind == 'hammer':
+            osys.merit = merits        # the Hammer leaves its design in the system
+            return
+        lens_dir = os.path.dirname(osys.pSystemFile)
+        for num, merit in enumerate(merits, 1):
+            path = os.path.join(lens_dir, 'GLOPT_{:04d}.ZMX'.format(num))
+            with open(path, 'w') as f:
+                f.write(repr(merit))
+            os.utime(path, (osys.clock.now,)*2)
+            self.found[num] = merit
+
+    def CurrentMeritFunction(self, num):
+        return self.found.get(num, 0.0)
+
+    def Close(self):
+        self.osys.open_tool = None
+
+class FakeTools(object):
+    def __init__(self, osys):
+        self.osys = osys
+
+    def _open(self, kind):
+        if self.osys.open_tool is not None:
+            return None
+        self.osys.open_tool = FakeTool(self.osys, kind)
+        return self.osys.open_tool
+
+    def OpenHammerOptimization(self):
+        return self._open('hammer')
+
+    def OpenGlobalOptimization(self):
+        return self._open('global')
+
+class FakeMFE(object):
+    def __init__(self, osys):
+        self.osys = osys
+
+    def CalculateMeritFunction(self):
+        return self.osys.merit
+
+class FakeCopy(object):
+    def __init__(self, merit):
+        self.merit = merit
+
+    def SaveAs(self, filename):
+        with open(filename, 'w') as f:
+            f.write(repr(self.merit))
+
+    def Close(self, saveIfNeeded):
+        pass
+
+class FakeSystem(object):
+    """Stand-in of an `OpticalSystem` whose design is its merit function value"""
+    def __init__(self, clock, merits, system_file=''):
+        self.clock = clock
+        self.merits = list(merits)   # results of the successive tool runs
+        self.merit = 10.0
+        self.pSystemFile = system_file
+        self.pTools = FakeTools(self)
+        self.pMFE = FakeMFE(self)
+        self.open_tool = None
+        self.runs = []
+        self.loaded = []
+        self.interrupt_at = None
+
+    def CopySystem(self):
+        return FakeCopy(self.merit)
+
+    def LoadFile(self, filename, saveIfNeeded):
+        with open(filename) as f:
+            self.merit = float(f.read())
+        self.pSystemFile = filename
+        self.loaded.append(os.path.basename(filename))
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gopt, '_time', clock)
+    return clock
+
+def design_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith('design_'))
+
+def test_hammer_budget_and_keep(clock, tmp_path):
+    osys = FakeSystem(clock, [8.0, 9.0, 4.0, 2.0, 1.0])
+    directory = str(tmp_path / 'run')
+    result = gopt.run(osys, directory, budget=1000, interval=300, keep=2)
+    assert osys.runs == [300, 300, 300, 100] and result.stopped == 'budget'
+    assert result.slices == 4 and result.elapsed == pytest.approx(1000)
+    assert result.merit == 2.0 and result.filename == os.path.join(directory, 'design_0004.zmx')
+    assert [m for _, m in result.history] == [10.0, 8.0, 8.0, 4.0, 2.0]
+    assert result.best == [[2.0, 'design_0004.zmx'], [4.0, 'design_0003.zmx']]
+    assert design_files(directory) == ['design_0003.zmx', 'design_0004.zmx']
+    assert osys.loaded == ['design_0001.zmx']     # after the worse design of slice 2
+    assert gopt.load_checkpoint(directory)['best'] == result.best
+    assert osys.open_tool is None
+
+def test_resume_after_interruption(clock, tmp_path):
+    osys = FakeSystem(clock, [8.0, 6.0, 4.0, 3.0])
+    osys.interrupt_at = 3
+    directory = str(tmp_path / 'run')
+    with pytest.raises(KeyboardInterrupt):
+        gopt.run(osys, directory, budget=1000, interval=250)
+    checkpoint = gopt.load_checkpoint(directory)
+    assert checkpoint['slices'] == 2 and checkpoint['best'][0] == [6.0, 'design_0002.zmx']
+    assert osys.open_tool is None                 # closed despite the interruption
+    resumed = FakeSystem(clock, [4.0, 3.0])
+    result = gopt.run(resumed, directory, budget=1000, interval=250)
+    assert resumed.loaded[0] == 'design_0002.zmx'  # resumed from the best design
+    assert resumed.runs == [250, 250] and result.slices == 4 and result.merit == 3.0
+    assert result.elapsed == pytest.approx(1000)
+    with pytest.raises(ValueError):
+        gopt.run(resumed, directory, budget=2000, tool='global')
+
+def test_stall(clock, tmp_path):
+    osys = FakeSystem(clock, [5.0, 5.0, 5.0, 5.0, 5.0])
+    result = gopt.run(osys, str(tmp_path), budget=10000, interval=100, stall_slices=3)
+    assert result.stopped == 'stalled' and result.slices == 4 and result.merit == 5.0
+
+def test_global_designs(clock, tmp_path):
+    lens_dir = tmp_path / 'lens'
+    lens_dir.mkdir()
+    osys = FakeSystem(clock, [[7.0, 9.0, 0.0], [6.0, 8.0]], str(lens_dir / 'lens.zmx'))
+    directory = str(tmp_path / 'run')
+    result = gopt.run(osys, directory, budget=200, tool='global', interval=100, keep=3)
+    assert result.best == [[6.0, 'design_0002_01.zmx'], [7.0, 'design_0001_01.zmx'],
+                           [8.0, 'design_0002_02.zmx']]
+    assert design_files(directory) == ['design_0001_01.zmx', 'design_0002_01.zmx',
+                                       'design_0002_02.zmx']
+    assert osys.merit == 6.0 and osys.loaded == ['design_0001_01.zmx', 'design_0002_01.zmx']
+
+def test_global_requires_saved_system(clock, tmp_path):
+    osys = FakeSystem(clock, [[1.0]])
+    with pytest.raises(ValueError):
+        gopt.run(osys, str(tmp_path / 'run'), budget=100, tool='global')
+    assert osys.runs == [] and not (tmp_path / 'run').exists()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Tests of the batched optimizers of `pyzos.optimize`"""
+from __future__ import division, print_function
+import numpy as np
+import pytest
+import pyzos.optimize as opt
+
+class Batched(object):
+    """Counts the batches and points of a batched function"""
+    def __init__(self, func):
+        self.func = func
+        self.batches = self.points = 0
+    def __call__(self, X):
+        X = np.asarray(X)
+        assert X.ndim == 2
+        self.batches += 1
+        self.points += len(X)
+        return self.func(X)
+
+def rosenbrock_residuals(X):
+    return np.column_stack([10*(X[:, 1] - X[:, 0]**2), 1 - X[:, 0]])
+
+def rosenbrock(X):
+    return (rosenbrock_residuals(X)**2).sum(axis=1)
+
+BOUNDS = ([-2.0, -2.0], [2.0, 2.0])
+
+def test_dls_rosenbrock():
+    residuals = Batched(rosenbrock_residuals)
+    res = opt.dls(residuals, [-1.2, 1.0], max_iter=200)
+    np.testing.assert_allclose(res.x, [1.0, 1.0], atol=1e-5)
+    assert res.fun < 1e-5 and res.nfev == residuals.points
+    assert all(a >= b for a, b in zip(res.history, res.history[1:]))
+    assert residuals.batches <= 2*res.nit + 1
+
+def test_dls_bounds():
+    res = opt.dls(rosenbrock_residuals, [-1.2, 1.0], max_iter=200,
+                  bounds=([-2.0, -2.0], [0.5, 2.0]))
+    assert res.x[0] <= 0.5
+    assert res.x[0] == pytest.approx(0.5, abs=1e-3)
+
+def test_dls_linear_least_squares():
+    A = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 7.0]])
+    b = np.array([1.0, 0.0, 2.0])
+    res = opt.dls(lambda X: X.dot(A.T) - b, [0.0, 0.0])
+    np.testing.assert_allclose(res.x, np.linalg.lstsq(A, b, rcond=None)[0], atol=1e-6)
+
+def test_differential_evolution():
+    func = Batched(rosenbrock)
+    res = opt.differential_evolution(func, BOUNDS, max_iter=300, seed=1)
+    np.testing.assert_allclose(res.x, [1.0, 1.0], atol=1e-2)
+    assert res.nfev == func.points and func.batches == res.nit + 1
+    assert all(a >= b for a, b in zip(res.history, res.history[1:]))
+    again = opt.differential_evolution(rosenbrock, BOUNDS, max_iter=300, seed=1)
+    np.testing.assert_array_equal(again.x, res.x)
+
+def test_particle_swarm():
+    func = Batched(rosenbrock)
+    res = opt.particle_swarm(func, BOUNDS, max_iter=500, seed=2)
+    np.testing.assert_allclose(res.x, [1.0, 1.0], atol=1e-2)
+    assert res.nfev == func.points == 30*func.batches
+    assert all(a >= b for a, b in zip(res.history, res.history[1:]))
+
+@pytest.mark.parametrize('optimizer', [opt.differential_evolution, opt.particle_swarm])
+def test_global_optimizers_respect_bounds_and_x0(optimizer):
+    seen = []
+    def func(X):
+        seen.append(X.copy())
+        return ((X - 3.0)**2).sum(axis=1)     # minimum outside the bounds
+    res = optimizer(func, ([-1.0, -1.0], [1.0, 1.0]), max_iter=50, seed=0, x0=[0.9, -0.9])
+    np.testing.assert_array_equal(seen[0][0], [0.9, -0.9])
+    allX = np.vstack(seen)
+    assert (allX >= -1.0).all() and (allX <= 1.0).all()
+    np.testing.assert_allclose(res.x, [1.0, 1.0], atol=1e-3)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests of the paraxial trace engine `pyzos.paraxial`"""
+from __future__ import division, print_function
+import numpy as np
+import pytest
+import pyzos.paraxial as par
+
+INF = np.inf
+
+def thick_lens(c1, c2, t, n):
+    """Returns (efl, bfl) of a thick lens in air"""
+    power = (n - 1)*(c1 - c2) + (n - 1)**2*t*c1*c2/n
+    efl = 1/power
+    return efl, efl*(1 - (n - 1)*t*c1/n)
+
+def singlet(c1=0.02, c2=-0.01, t=5.0, n=1.5, image=None):
+    efl, bfl = thick_lens(c1, c2, t, n)
+    return dict(curvature=[0, c1, c2, 0], thickness=[INF, t, bfl if image is None else image, 0],
+                index=[1, n, 1, 1], stop=1)
+
+def test_thick_lens_first_order():
+    efl, bfl = thick_lens(0.02, -0.01, 5.0, 1.5)
+    fo = par.trace(aperture=10, field=5, **singlet())
+    assert fo.efl == pytest.approx(efl) and fo.bfl == pytest.approx(bfl)
+    assert fo.enpp == pytest.approx(0) and fo.epd == 10
+    assert fo.fno == pytest.approx(efl/10)
+    # positive field angles are positive slopes in object space (OpticStudio)
+    assert fo.image_height == pytest.approx(efl*np.tan(np.radians(5)))    # in focus
+    assert fo.mag == 0
+    assert fo.marginal.y[-1] == pytest.approx(0, abs=1e-12)
+    assert fo.chief.y[1] == pytest.approx(0)                               # stop
+    assert fo.lagrange == pytest.approx(5*np.tan(np.radians(5)))
+
+def test_fnum_aperture():
+    efl, _ = thick_lens(0.02, -0.01, 5.0, 1.5)
+    fo = par.trace(aperture=4, aperture_type='FNUM', **singlet())
+    assert fo.epd == pytest.approx(efl/4) and fo.wfno == pytest.approx(4, rel=1e-3)
+
+def test_finite_conjugate_magnification():
+    # thin lens (f = 100) imaging at 2f - 2f
+    fo = par.trace(curvature=[0, 0.01, -0.01, 0], thickness=[200, 0, 200, 0],
+                   index=[1, 1.5, 1, 1], stop=1, aperture=10, field=1, field_type=1)
+    assert fo.efl == pytest.approx(100)
+    assert fo.mag == pytest.approx(-1)
+    assert fo.image_height == pytest.approx(-1)
+
+def test_mirror():
+    fo = par.trace(curvature=[0, -0.005, 0], thickness=[INF, -100, 0], index=[1, -1, -1],
+                   stop=1, aperture=20)
+    assert abs(fo.efl) == pytest.approx(100)
+    assert fo.marginal.y[-1] == pytest.approx(0, abs=1e-12)
+
+def test_batch_matches_single():
+    thick = np.linspace(2, 8, 7)
+    lens = singlet()
+    fo = par.trace(curvature=lens['curvature'],
+                   thickness=np.column_stack([np.full(7, INF), thick, np.full(7, 90), np.zeros(7)]),
+                   index=lens['index'], stop=1, aperture=10, field=5)
+    assert fo.efl.shape == (7,) and fo.marginal.y.shape == (7, 4)
+    for k, t in enumerate(thick):
+        one = par.trace(aperture=10, field=5, **singlet(t=t, image=90))
+        assert fo.efl[k] == pytest.approx(one.efl)
+        assert fo.image_height[k] == pytest.approx(one.image_height)
+        np.testing.assert_allclose(fo.chief.y[k], one.chief.y)
+
+def test_surface_indices():
+    material = ['', 'N-BK7', '', 'MIRROR', 'F2', '']
+    n = par.surface_indices(material, nd=[1, 1.5168, 1, 1, 1.62, 1])
+    np.testing.assert_allclose(n, [1, 1.5168, 1, -1, -1.62, -1])
+    n = par.surface_indices(material, nd=[1, 1.5168, 1, 1, 1.62, 1], vd=[0, 64.17, 0, 0, 36.4, 0],
+                            wavelength=[0.5875618, 0.4861327])
+    assert n.shape == (2, 6) and n[1, 1] > n[0, 1]
+
+def test_invalid_stop():
+    with pytest.raises(ValueError):
+        par.trace(aperture=10, **dict(singlet(), stop=3))
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Tests of the local real-ray tracer `pyzos.raytrace` against ray trace
+fixtures (see `fixtures/make_raytrace_fixture.py`)"""
+from __future__ import division, print_function
+import glob
+import os
+import numpy as np
+import pytest
+import pyzos.raytrace as rt
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURES = sorted(glob.glob(os.path.join(FIXTURE_DIR, 'raytrace_*.npz')))
+
+POSITION_TOLERANCE = 1e-8    # lens units
+DIRECTION_TOLERANCE = 1e-10
+
+@pytest.mark.parametrize('filename', FIXTURES, ids=os.path.basename)
+def test_compare_with_fixture(filename):
+    dpos, ddir, count = rt.compare_with_fixture(filename)
+    assert count > 0
+    assert dpos < POSITION_TOLERANCE and ddir < DIRECTION_TOLERANCE
+
+def test_fixture_covers_even_asphere():
+    lens, inputs, expected = rt.load_fixture(os.path.join(FIXTURE_DIR, 'raytrace_asphere.npz'))
+    assert lens.surf_type == ['STANDARD', 'STANDARD', 'EVENASPH', 'STANDARD']
+    assert lens.asphere[2].any() and lens.conic[2] != 0
+    assert len(np.unique(inputs['wave'])) == 2 and inputs['hy'].max() == 1
+
+def test_compare_detects_deviations(tmp_path):
+    with np.load(os.path.join(FIXTURE_DIR, 'raytrace_asphere.npz')) as f:
+        data = dict((k, f[k]) for k in f.files)
+    data['asphere'] = data['asphere'].copy()
+    data['asphere'][2, 1] *= 1.01
+    filename = str(tmp_path / 'perturbed.npz')
+    np.savez(filename, **data)
+    dpos, ddir, _ = rt.compare_with_fixture(filename)
+    assert dpos > 100*POSITION_TOLERANCE and ddir > 100*DIRECTION_TOLERANCE
+
+def test_spot_and_chunked_trace():
+    lens, _, _ = rt.load_fixture(os.path.join(FIXTURE_DIR, 'raytrace_asphere.npz'))
+    px, py = rt.hexapolar_pupil(6)
+    on_axis = rt.trace_normalized(lens, 0, 0, px, py)
+    assert on_axis.x[0] == 0 and on_axis.y[0] == 0           # chief ray
+    assert rt.spot_rms(on_axis) == pytest.approx(rt.spot_rms(on_axis, 'chief'), abs=1e-12)
+    r = np.hypot(on_axis.x, on_axis.y)
+    np.testing.assert_allclose(r[1:7], r[1])                 # rotational symmetry
+    chunked = rt.trace_normalized(lens, 0, 1, px, py, processes=2, chunksize=50)
+    single = rt.trace_normalized(lens, 0, 1, px, py)
+    np.testing.assert_allclose(chunked.y, single.y)
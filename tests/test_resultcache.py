@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Tests of the on-disk analysis result cache `pyzos.resultcache`"""
+from __future__ import division, print_function
+import numpy as np
+import pytest
+import pyzos.resultcache as rc
+
+def arrays(n, value=0.0):
+    return {'a': np.full(n, value)}
+
+def test_put_get_roundtrip(tmp_path):
+    cache = rc.ResultCache(str(tmp_path / 'cache'))
+    key = cache.make_key('fingerprint', 'FftMtf', [('SampleSize', 3)])
+    assert cache.get(key) is None and cache.misses == 1
+    cache.put(key, {'a': np.arange(6.0).reshape(2, 3), 'b': np.array([1, 2])}, {'x': 'y'})
+    assert key in cache and len(cache) == 1
+    got, meta = cache.get(key)
+    assert isinstance(got['a'], np.memmap) and not got['a'].flags.writeable
+    np.testing.assert_array_equal(got['a'], np.arange(6.0).reshape(2, 3))
+    assert meta == {'x': 'y'} and cache.hits == 1
+    got, _ = cache.get(key, mmap=False)
+    assert not isinstance(got['b'], np.memmap)
+    cache.close()
+
+def test_entries_persist_across_instances(tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = rc.ResultCache(directory)
+    cache.put('k', arrays(4, 2.0))
+    cache.close()
+    cache = rc.ResultCache(directory)
+    np.testing.assert_array_equal(cache.get('k')[0]['a'], 2.0)
+    cache.close()
+
+def test_lru_eviction(tmp_path):
+    cache = rc.ResultCache(str(tmp_path / 'cache'))
+    for key in ('k1', 'k2', 'k3'):
+        cache.put(key, arrays(1000))
+    size = cache.nbytes//3
+    cache.max_bytes = 3*size
+    cache.get('k1')                       # k2 is now the least recently used
+    cache.put('k4', arrays(1000))
+    assert 'k2' not in cache and all(k in cache for k in ('k1', 'k3', 'k4'))
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.clear() == 3 and len(cache) == 0 and cache.nbytes == 0
+    cache.close()
+
+def test_removed_files_are_a_miss(tmp_path):
+    import shutil
+    cache = rc.ResultCache(str(tmp_path / 'cache'))
+    cache.put('k', arrays(3))
+    shutil.rmtree(cache._entry_dir('k'))
+    assert cache.get('k') is None and 'k' not in cache
+    cache.close()
+
+def test_make_key():
+    key = rc.make_key('fp', 5, [('Field', ([('GetFieldNumber', 1)], []))])
+    assert key == rc.make_key('fp', 5, [('Field', ([('GetFieldNumber', 1)], []))])
+    assert key != rc.make_key('fp', 5, [('Field', ([('GetFieldNumber', 2)], []))])
+    assert len(key) == 40
+
+def test_pack_unpack_analysis_data():
+    grid = rc.data_grid('psf', np.ones((2, 2)), -1.0, -1.0, 1.0, 1.0, 'x', 'y', 'I')
+    series = rc.data_series('mtf', np.linspace(0, 1, 5), np.ones((5, 2)), 'f', ['T', 'S'])
+    data = rc.analysis_data([grid], [series], ['header line'])
+    unpacked = rc.unpack_analysis_data(*rc.pack_analysis_data(data))
+    assert unpacked.header == ['header line']
+    assert unpacked.grids[0].description == 'psf' and unpacked.grids[0].dx == 1.0
+    np.testing.assert_array_equal(unpacked.series[0].y, series.y)
+    assert unpacked.series[0].series_labels == ['T', 'S']
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Tests of the priority job scheduler `pyzos.scheduler`"""
+from __future__ import division, print_function
+import contextlib
+import threading
+import pytest
+from pyzos.comthread import FakeCOM
+from pyzos.scheduler import Scheduler, CancelledError, INTERACTIVE, NORMAL, BULK
+
+TIMEOUT = 10
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler()
+    yield scheduler
+    scheduler.shutdown()
+
+def block(scheduler):
+    """Submit a job occupying the worker until the returned event is set"""
+    gate, started = threading.Event(), threading.Event()
+    def wait():
+        started.set()
+        gate.wait(TIMEOUT)
+    job = scheduler.submit(wait)
+    started.wait(TIMEOUT)
+    return gate, job
+
+def test_priorities_and_fairness(scheduler):
+    order = []
+    gate, _ = block(scheduler)
+    jobs = [scheduler.submit(order.append, ('bulk',), priority=BULK),
+            scheduler.submit(order.append, ('a1',), caller='a'),
+            scheduler.submit(order.append, ('a2',), caller='a'),
+            scheduler.submit(order.append, ('a3',), caller='a'),
+            scheduler.submit(order.append, ('b1',), caller='b'),
+            scheduler.submit(order.append, ('now',), priority=INTERACTIVE)]
+    assert scheduler.queue_depth() == 6 and scheduler.queue_depth(NORMAL) == 4
+    gate.set()
+    for job in jobs:
+        job.result(TIMEOUT)
+    assert order == ['now', 'a1', 'b1', 'a2', 'a3', 'bulk']
+
+def test_coalescing(scheduler):
+    calls = []
+    def compute(x):
+        calls.append(x)
+        return x*x
+    gate, _ = block(scheduler)
+    first = scheduler.submit(compute, (3,), key='k', priority=BULK)
+    other = scheduler.submit(compute, (4,), priority=NORMAL)
+    second = scheduler.submit(compute, (3,), key='k', priority=INTERACTIVE)   # moves 'k' up
+    gate.set()
+    assert first.result(TIMEOUT) == second.result(TIMEOUT) == 9
+    other.result(TIMEOUT)
+    assert calls == [3, 4]
+    metrics = scheduler.metrics()
+    assert metrics.submitted == 4 and metrics.coalesced == 1 and metrics.completed == 3
+    # a finished task is not reused
+    assert scheduler.submit(compute, (3,), key='k').result(TIMEOUT) == 9 and calls == [3, 4, 3]
+
+def test_cancel_pending(scheduler):
+    calls = []
+    gate, _ = block(scheduler)
+    job = scheduler.submit(calls.append, (1,))
+    first = scheduler.submit(calls.append, (2,), key='k')
+    second = scheduler.submit(calls.append, (2,), key='k')
+    assert job.cancel() and job.state == 'cancelled' and job.done()
+    assert first.cancel() and second.state == 'pending'    # the task is still needed
+    gate.set()
+    with pytest.raises(CancelledError):
+        job.result()
+    with pytest.raises(CancelledError):
+        first.result()
+    second.result(TIMEOUT)
+    assert calls == [2] and not second.cancel()
+    assert scheduler.metrics().cancelled == 2
+
+def test_cancel_running_interrupts(scheduler):
+    stop, started = threading.Event(), threading.Event()
+    def run():
+        started.set()
+        stop.wait(TIMEOUT)
+        return 'interrupted' if stop.is_set() else 'timeout'
+    job = scheduler.submit(run, interrupt=stop.set)
+    started.wait(TIMEOUT)
+    assert job.state == 'running' and scheduler.metrics().running == 1
+    assert job.cancel()
+    with pytest.raises(CancelledError):
+        job.result(TIMEOUT)
+    assert stop.is_set()
+
+def test_errors(scheduler):
+    def fail():
+        raise KeyError('missing')
+    with pytest.raises(KeyError):
+        scheduler.submit(fail).result(TIMEOUT)
+    with pytest.raises(ValueError):
+        scheduler.submit(fail, priority=7)
+    metrics = scheduler.metrics()
+    assert metrics.failed == 1 and metrics.wait_mean >= 0 and metrics.run_p95 >= 0
+
+def test_shutdown():
+    scheduler = Scheduler()
+    gate, running = block(scheduler)
+    pending = scheduler.submit(lambda: 1)
+    threading.Timer(0.05, gate.set).start()
+    scheduler.shutdown()
+    assert running.state == 'done'
+    with pytest.raises(CancelledError):
+        pending.result(TIMEOUT)
+    with pytest.raises(RuntimeError):
+        scheduler.submit(lambda: 1)
+    scheduler = Scheduler(workers=2)
+    jobs = [scheduler.submit(lambda k=k: k) for k in range(10)]
+    scheduler.shutdown(cancel_pending=False)
+    assert [job.result() for job in jobs] == list(range(10))
+
+class FakeAnalyses(object):
+    @contextlib.contextmanager
+    def zPooledAnalysis(self, analysis_type, settings=None):
+        yield (analysis_type, settings)
+
+class FakeSystem(object):
+    """Duck-typed optical system with the members used by `submit_analysis()`"""
+    def __init__(self):
+        self.applied = []
+        self.fingerprint = 'a'
+        self.pAnalyses = FakeAnalyses()
+
+    def zFingerprint(self):
+        return self.fingerprint
+
+    def zApplyAnalysis(self, analysis, cache=None):
+        self.applied.append(analysis)
+        return analysis
+
+def test_submit_analysis_coalesces_on_fingerprint():
+    com = FakeCOM()
+    scheduler = Scheduler(com=com)
+    osys = com.bind(FakeSystem())     # usable in other threads only once marshalled
+    try:
+        gate, _ = block(scheduler)
+        jobs = [scheduler.submit_analysis(osys, 'FftMtf', {'MaximumFrequency': 100}),
+                scheduler.submit_analysis(osys, 'FftMtf', {'MaximumFrequency': 100}),
+                scheduler.submit_analysis(osys, 'FftMtf', {'MaximumFrequency': 200})]
+        osys.fingerprint = 'b'          # edited system
+        jobs.append(scheduler.submit_analysis(osys, 'FftMtf', {'MaximumFrequency': 100}))
+        gate.set()
+        results = [job.result(TIMEOUT) for job in jobs]
+        assert results[0] == results[1] == ('FftMtf', {'MaximumFrequency': 100})
+        assert len(osys.applied) == 3
+        assert com.marshalled == com.unmarshalled == 1     # one executor of the system
+    finally:
+        scheduler.shutdown()
+    assert com.initialized == set()
+
+class FakeTool(object):
+    def __init__(self):
+        self.pIsRunning = False
+        self.calls = []
+        self.started = threading.Event()
+
+    def zBatch(self):
+        return contextlib.contextmanager(lambda: (yield self))()
+
+    def Run(self):
+        self.calls.append('Run')
+        self.pIsRunning = True
+        self.started.set()
+
+    def Cancel(self):
+        self.calls.append('Cancel')
+        self.pIsRunning = False
+
+    def WaitForCompletion(self):
+        self.calls.append('Wait')
+
+    def Close(self):
+        self.calls.append('Close')
+
+class FakeTools(object):
+    def __init__(self, tool):
+        self.tool = tool
+
+    def OpenLocalOptimization(self):
+        return self.tool
+
+def test_submit_tool_cancelled_in_worker():
+    com = FakeCOM()
+    tool = FakeTool()
+    system = FakeSystem()
+    system.pTools = FakeTools(tool)
+    with Scheduler(com=com) as scheduler:
+        job = scheduler.submit_tool(com.bind(system), 'LocalOptimization', {'Cycles': 3})
+        tool.started.wait(TIMEOUT)
+        assert job.cancel()
+        with pytest.raises(CancelledError):
+            job.result(TIMEOUT)
+    assert tool.calls == ['Run', 'Cancel', 'Wait', 'Close'] and tool.pCycles == 3
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Tests of the Seidel aberration calculator `pyzos.seidel`"""
+from __future__ import division, print_function
+import numpy as np
+import pytest
+import pyzos.seidel as sei
+
+INF = np.inf
+
+def mirror(conic=0.0, a4=0.0, field=1.0):
+    """Spherical/conic mirror (R = -200, f = 100), stop at the mirror, EPD 20"""
+    return sei.seidel(curvature=[0, -0.005, 0], thickness=[INF, -100, 0], index=[1, -1, -1],
+                      stop=1, aperture=20, field=field, conic=[0, conic, 0], a4=[0, a4, 0])
+
+def test_thin_lens_petzval_and_axial_color():
+    n, c1, c2, dn = 1.5, 0.01, -0.01, 0.008
+    res = sei.seidel(curvature=[0, c1, c2, 0], thickness=[INF, 0, 100, 0], index=[1, n, 1, 1],
+                     stop=1, aperture=20, field=5, dispersion=[0, dn, 0, 0])
+    power = (n - 1)*(c1 - c2)
+    H = res.first_order.lagrange
+    assert res.total.SIV == pytest.approx(H*H*power/n)           # Petzval sum
+    assert res.total.CL == pytest.approx(10**2*power*dn/(n - 1))  # y^2 phi / V
+    assert res.total.CT == pytest.approx(0, abs=1e-15)            # stop at the thin lens
+    assert res.surface.SI.shape == (4,) and res.surface.SI[0] == res.surface.SI[-1] == 0
+
+def test_mirror_spherical_aberration_and_conic():
+    y, c = 10.0, -0.005
+    assert abs(mirror().total.SI) == pytest.approx(2*y**4*abs(c)**3)
+    assert mirror(conic=-1).total.SI == pytest.approx(0, abs=1e-15)   # paraboloid
+    # a conic is equivalent to a 4th order asphere term a4 = k c^3 / 8 (third order)
+    for a, b in zip(mirror(conic=-1).total, mirror(a4=-c**3/8).total):
+        assert a == pytest.approx(b, abs=1e-15)
+
+def test_stop_at_center_of_curvature():
+    # a spherical mirror with the stop at its center of curvature has no coma,
+    # astigmatism and distortion
+    res = sei.seidel(curvature=[0, 0, -0.005, 0], thickness=[INF, 200, -100, 0],
+                     index=[1, 1, -1, -1], stop=1, aperture=20, field=2)
+    assert abs(res.total.SI) > 0
+    for name in ('SII', 'SIII', 'SV'):
+        assert getattr(res.total, name) == pytest.approx(0, abs=1e-12)
+
+def test_batch_matches_single():
+    conics = np.linspace(-2, 1, 5)
+    batch = sei.seidel(curvature=[0, -0.005, 0], thickness=[INF, -100, 0], index=[1, -1, -1],
+                       stop=1, aperture=20, field=1,
+                       conic=np.column_stack([np.zeros(5), conics, np.zeros(5)]))
+    assert batch.total.SI.shape == (5,) and batch.surface.SII.shape == (5, 3)
+    for k, conic in enumerate(conics):
+        single = mirror(conic=conic)
+        for a, b in zip(batch.total, single.total):
+            assert a[k] == pytest.approx(b, abs=1e-15)
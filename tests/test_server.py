@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Tests of the RPC server `pyzos.server` with the `StubBackend`"""
+from __future__ import division, print_function
+import gc
+import socket
+import threading
+import time
+import numpy as np
+import pytest
+import pyzos.server as srv
+
+@pytest.fixture
+def server():
+    server = srv.Server(('127.0.0.1', 0), srv.StubBackend()).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def client(server):
+    with srv.Client(server.address, timeout=10) as client:
+        yield client
+
+def num_objects(server, client):
+    client._request({'op': 'release', 'refs': []})   # round trip: pending releases applied
+    return len(server._objects)
+
+def test_attributes_methods_and_arrays(client):
+    osys = client.new_system()
+    assert isinstance(osys, srv.RemoteObject) and osys.pMode == 0
+    osys.pSystemName = 'test'
+    assert osys.pSystemName == 'test'
+    lde = osys.pLDE
+    assert lde.pNumberOfSurfaces == 3
+    lde.InsertNewSurfaceAt(1).pThickness = 2.0
+    osys.zSetLDEArray(thick=np.arange(4.0))
+    lde_array = osys.zGetLDEArray()
+    assert type(lde_array).__name__ == 'lde_array'
+    np.testing.assert_array_equal(lde_array.thick, np.arange(4.0))
+    assert lde_array.material == [''] * 4
+    assert osys.pMFE.CalculateMeritFunction() == pytest.approx(14.0)
+
+def test_batch(client):
+    osys = client.new_system()
+    lde = osys.pLDE
+    surfs = [lde.GetSurfaceAt(k) for k in range(3)]
+    with client.batch(osys) as batch:
+        for k, surf in enumerate(surfs):
+            batch.set(surf, 'pThickness', float(k + 1))
+        index = batch.call(osys.pMFE, 'CalculateMeritFunction')
+        batch.get(surfs[2], 'pThickness')
+    assert batch.results[index] == pytest.approx(14.0) and batch.results[-1] == 3.0
+
+def test_errors_and_private_names(client):
+    osys = client.new_system()
+    with pytest.raises(srv.RemoteError) as err:
+        osys.pLDE.GetSurfaceAt(10)
+    assert err.value.type_name == 'IndexError'
+    for request in ({'op': 'getattr', 'name': '__class__'},
+                    {'op': 'getattr', 'name': '_surfaces'},
+                    {'op': 'setattr', 'name': '_surfaces', 'value': None},
+                    {'op': 'call', 'name': '__init__', 'args': []}):
+        request.update(system=osys._system, ref=osys.pLDE._ref)
+        with pytest.raises(srv.RemoteError) as err:
+            client._request(request)
+        assert err.value.type_name == 'AttributeError'
+    assert osys.pLDE.pNumberOfSurfaces == 3    # the connection is still usable
+
+def test_one_reference_per_object(server, client):
+    osys = client.new_system()
+    lde1, lde2 = osys.pLDE, osys.pLDE
+    assert lde1._ref == lde2._ref
+    assert lde1.GetSurfaceAt(1)._ref == lde2.GetSurfaceAt(1)._ref
+    assert lde1.GetSurfaceAt(1)._ref != lde1.GetSurfaceAt(2)._ref
+
+def test_references_released_with_proxies(server, client):
+    osys = client.new_system()
+    base = num_objects(server, client)
+    lde = osys.pLDE
+    surfs = [lde.GetSurfaceAt(k) for k in range(3)]
+    again = lde.GetSurfaceAt(1)
+    assert num_objects(server, client) == base + 4
+    del surfs
+    gc.collect()
+    assert num_objects(server, client) == base + 2       # lde, surface 1 (again)
+    assert again.pThickness == 0.0
+    client.release(again)
+    assert num_objects(server, client) == base + 1
+    with pytest.raises(srv.RemoteError):                # its object is released
+        again.pThickness
+    del lde
+    gc.collect()
+    assert num_objects(server, client) == base
+    assert osys.pMode == 0                              # systems are kept
+
+def test_close_system_and_connection(server):
+    client = srv.Client(server.address, timeout=10)
+    other = srv.Client(server.address, timeout=10)
+    osys = client.new_system()
+    lde = osys.pLDE
+    kept = other.new_system().pLDE
+    client.close_system(osys)
+    assert all(system != osys._system for system, _, _ in server._objects.values())
+    surf = other.new_system().pLDE.GetSurfaceAt(0)
+    count = num_objects(server, other)
+    other.close()
+    deadline = time.time() + 5
+    while len(server._objects) > count - 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(server._objects) == count - 2     # kept and surf; the systems are kept
+    client.close()
+    del lde, kept, surf
+
+def test_close_system_fails_queued_requests(server, client):
+    osys = client.new_system()
+    system, ref = osys._system, osys._ref
+    closing = server.backend.close_system
+    def close_system(obj):      # waits for the request of the other client to be queued
+        deadline = time.time() + 5
+        while not server._queues.get(system) and time.time() < deadline:
+            time.sleep(0.01)
+        closing(obj)
+    server.backend.close_system = close_system
+    results = []
+    def request(connection, message):
+        try:
+            results.append(connection._request(message))
+        except srv.RemoteError as e:
+            results.append(e.type_name)
+    with srv.Client(server.address, timeout=10) as other:
+        closer = threading.Thread(target=client.close_system, args=(osys,))
+        closer.start()
+        time.sleep(0.05)
+        getter = threading.Thread(target=request, args=(other, {'op': 'getattr', 'name': 'pMode',
+                                                                'system': system, 'ref': ref}))
+        getter.start()
+        getter.join(10)
+        closer.join(10)
+        assert results == ['LookupError']
+        assert other.new_system().pMode == 0      # the connection is still usable
+
+def test_message_roundtrip():
+    a, b = socket.socketpair()
+    try:
+        message = {'array': np.arange(6, dtype='<i2').reshape(2, 3), 'bytes': b'\x00\x01',
+                   'tuple': (1, 2.5, None), 'list': ['x', True], 'empty': np.zeros(0)}
+        srv.send_message(a, message)
+        got = srv.recv_message(b, lambda marker: marker)
+        np.testing.assert_array_equal(got['array'], message['array'])
+        assert got['array'].dtype == np.dtype('<i2')
+        assert got['bytes'] == b'\x00\x01' and got['tuple'] == (1, 2.5, None)
+        assert got['list'] == ['x', True] and got['empty'].shape == (0,)
+        a.sendall(b'XXXX' + b'\x00' * 8)
+        with pytest.raises(srv.ProtocolError):
+            srv.recv_message(b, lambda marker: marker)
+    finally:
+        a.close()
+        b.close()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Tests of the connection supervisor `pyzos.supervisor` with a stand-in system
+and the `FakeCOM` layer"""
+from __future__ import division, print_function
+import os
+import threading
+import time
+import pytest
+import pyzos.comthread as ct
+import pyzos.supervisor as sv
+
+TIMEOUT = 10
+
+class FakeCopy(object):
+    def __init__(self, owner):
+        self.owner = owner
+
+    def SaveAs(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.owner.state)
+
+    def Close(self, saveIfNeeded):
+        pass
+
+class FakeSystem(object):
+    """Stand-in of an `OpticalSystem` whose connection can be lost"""
+    def __init__(self):
+        self.alive = True
+        self.fail_reconnects = 0     # number of failing zReconnect() calls
+        self.probes = 0
+        self.state = 'lens'
+        self.pSystemFile = ''
+        self.reconnected = []        # connections passed to zReconnect()
+        self.loaded = []
+        self.copy_threads = []
+
+    @property
+    def pConnectIsAlive(self):
+        return self.alive
+
+    @property
+    def pMode(self):
+        self.probes += 1
+        if not self.alive:
+            raise RuntimeError('RPC server unavailable')
+        return 0
+
+    def zReconnect(self, mode=0, connection=None):
+        if self.fail_reconnects:
+            self.fail_reconnects -= 1
+            raise RuntimeError('OpticStudio is not started')
+        self.reconnected.append(connection)
+        self.alive = True
+
+    def LoadFile(self, filename, saveIfNeeded):
+        self.loaded.append(filename)
+
+    def CopySystem(self):
+        if not self.alive:
+            raise RuntimeError('RPC server unavailable')
+        self.copy_threads.append(threading.current_thread().ident)
+        return FakeCopy(self)
+
+@pytest.fixture
+def osys():
+    return FakeSystem()
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(sv._time, 'sleep', delays.append)
+    monkeypatch.setattr(sv._random, 'uniform', lambda a, b: b)
+    return delays
+
+def wait_for(condition):
+    deadline = time.time() + TIMEOUT
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+def test_check_interval(osys, tmp_path):
+    sup = sv.Supervisor(osys, str(tmp_path), interval=1000)
+    probes = osys.probes
+    assert sup.check() and osys.probes == probes          # within the interval
+    assert sup.check(force=True) and osys.probes == probes + 1
+    osys.alive = False
+    assert sup.check()                                    # not checked yet
+    sup.interval = 0
+    assert not sup.check() and sup.reconnects == 1 and sup.downtime >= 0
+    assert osys.alive and osys.reconnected == [None]
+
+def test_checkpoints_and_restore_file(osys, tmp_path):
+    lens_file = str(tmp_path / 'lens.zmx')
+    with open(lens_file, 'w') as f:
+        f.write('saved')
+    osys.pSystemFile = lens_file
+    sup = sv.Supervisor(osys, str(tmp_path / 'state'), interval=0, checkpoint_interval=1000)
+    assert sup._restore_file() == lens_file                # no checkpoint yet
+    assert sup.check()                                    # first automatic checkpoint
+    with open(sup.state_file) as f:
+        assert f.read() == 'lens'
+    assert sup._restore_file() == sup.state_file
+    os.utime(sup.state_file, (time.time() - 100,)*2)     # lens file saved after it
+    assert sup._restore_file() == lens_file
+    osys.alive = False
+    assert sup.reconnect() == lens_file and osys.loaded == [lens_file]
+    os.remove(lens_file)
+    assert sup._restore_file() == sup.state_file
+
+def test_backoff_and_exhaustion(osys, tmp_path, no_sleep):
+    sup = sv.Supervisor(osys, str(tmp_path), max_attempts=6, backoff=1.0, max_backoff=4.0)
+    osys.alive = False
+    osys.fail_reconnects = 100
+    with pytest.raises(sv.ConnectionLostError):
+        sup.reconnect()
+    assert no_sleep == [1.0, 2.0, 4.0, 4.0, 4.0]           # no sleep after the last attempt
+    assert isinstance(sup.last_error, RuntimeError) and sup.reconnects == 0
+    osys.fail_reconnects = 2
+    del no_sleep[:]
+    sup.reconnect()
+    assert no_sleep == [1.0, 2.0] and sup.reconnects == 1
+
+def test_standby_handoff(osys, tmp_path, monkeypatch):
+    connections = iter(['standby1', 'standby2'])
+    monkeypatch.setattr(sv, '_new_connection', lambda: next(connections))
+    sup = sv.Supervisor(osys, str(tmp_path), standby=True)
+    assert sup._standby == 'standby1'
+    sup.reconnect()
+    assert osys.reconnected == ['standby1'] and sup._standby == 'standby2'
+    def fail():
+        raise RuntimeError('no license')
+    monkeypatch.setattr(sv, '_new_connection', fail)
+    with pytest.warns(UserWarning):
+        sup.reconnect()
+    assert osys.reconnected == ['standby1', 'standby2']
+    assert sup._standby is None and not sup.standby
+    sup.reconnect()                                       # without standby
+    assert osys.reconnected[-1] is None
+
+def test_call_retry(osys, tmp_path):
+    reconnected = []
+    sup = sv.Supervisor(osys, str(tmp_path), on_reconnect=reconnected.append)
+    calls = []
+    def evaluate(system, value):
+        calls.append(value)
+        if len(calls) == 1:
+            system.alive = False                          # crash during the call
+            raise RuntimeError('RPC server unavailable')
+        return 2*value
+    assert sup.call(evaluate, 21) == 42 and calls == [21, 21]
+    assert sup.reconnects == 1 and reconnected == [osys]
+    def fail(system):
+        raise ValueError('bad input')                     # the connection is healthy
+    with pytest.raises(ValueError):
+        sup.call(fail)
+    assert sup.reconnects == 1
+
+def test_monitor(tmp_path):
+    com = ct.FakeCOM()
+    system = FakeSystem()
+    osys = com.bind(system)       # usable in the monitor thread only once marshalled
+    sup = sv.Supervisor(osys, str(tmp_path), interval=0.01, checkpoint_interval=1000)
+    sup.start(com)
+    try:
+        assert wait_for(lambda: os.path.exists(sup.state_file))
+        assert threading.current_thread().ident not in system.copy_threads
+        assert not sup._lost.is_set()
+        system.alive = False
+        assert wait_for(sup._lost.is_set)
+        assert system.reconnected == []                   # reconnected by the owner thread
+        assert not sup.check() and sup.reconnects == 1 and system.reconnected == [None]
+        assert not sup._lost.is_set() and sup._monitor is not None
+        assert com.marshalled == 2                        # restarted on the new interfaces
+        system.alive = False
+        assert wait_for(sup._lost.is_set)                 # the new monitor probes too
+    finally:
+        sup.stop()
+    assert com.initialized == set()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Tests of the Monte Carlo tolerancing orchestration of `pyzos.tolerance` with
+a stand-in system and an in-process worker pool"""
+from __future__ import division, print_function
+import collections
+import numpy as np
+import pytest
+import pyzos.tolerance as tol
+
+# (radius, thickness) of the surfaces of the nominal system
+NOMINAL = [(np.inf, 0.0), (50.0, 5.0), (-50.0, 3.0), (np.inf, 40.0)]
+
+class TiltDecenter(object):
+    def __init__(self):
+        self.pBeforeSurfaceDecenterX = self.pBeforeSurfaceDecenterY = 0.0
+        self.pBeforeSurfaceTiltX = self.pBeforeSurfaceTiltY = 0.0
+
+class Cell(object):
+    def __init__(self, system, surf_num, name):
+        self.system, self.surf_num, self.name = system, surf_num, name
+
+    def MakeSolveVariable(self):
+        self.system.variables.append((self.surf_num, self.name))
+
+class Surface(object):
+    def __init__(self, system, surf_num, radius, thickness):
+        self.pRadius = radius
+        self.pThickness = thickness
+        self.pConic = 0.0
+        self.pTiltDecenterData = TiltDecenter()
+        self.pRadiusCell = Cell(system, surf_num, 'radius')
+        self.pThicknessCell = Cell(system, surf_num, 'thickness')
+
+class StubSystem(object):
+    """Stand-in of an `OpticalSystem`: the Lens Data Editor, the tools and the
+    merit function (focus error and surface errors) used by `run_trial()`"""
+    def __init__(self):
+        self.loads = 0
+        self.LoadFile('nominal.zmx', False)
+
+    def LoadFile(self, filename, saveIfNeeded):
+        self.loads += 1
+        self.surfaces = [Surface(self, k, r, t) for k, (r, t) in enumerate(NOMINAL)]
+        self.variables = []
+
+    @property
+    def pLDE(self):
+        return self
+
+    @property
+    def pTools(self):
+        return self
+
+    @property
+    def pMFE(self):
+        return self
+
+    def GetSurfaceAt(self, surf_num):
+        return self.surfaces[surf_num]
+
+    def RemoveAllVariables(self):
+        self.variables = []
+
+    def CalculateMeritFunction(self):
+        focus = sum(s.pThickness for s in self.surfaces) - sum(t for _, t in NOMINAL)
+        curvatures = [1/s.pRadius - 1/r for s, (r, _) in zip(self.surfaces, NOMINAL)]
+        decenters = [s.pTiltDecenterData.pBeforeSurfaceDecenterX for s in self.surfaces]
+        return focus**2 + sum(c**2 for c in curvatures) + sum(d**2 for d in decenters)
+
+def refocus(osys):
+    """Stand-in of the local optimization: the thickness variables correct the focus"""
+    focus = sum(s.pThickness for s in osys.surfaces) - sum(t for _, t in NOMINAL)
+    for surf_num, name in osys.variables:
+        if name == 'thickness':
+            osys.surfaces[surf_num].pThickness -= focus
+            focus = 0.0
+
+@pytest.fixture(autouse=True)
+def stub_optimizer(monkeypatch):
+    monkeypatch.setattr(tol, '_optimize_compensators', refocus)
+
+TOLERANCES = [tol.tolerance('TRAD', 1, 0, 0, -1.0, 1.0),
+              tol.tolerance('TCUR', 2, 0, 0, -1e-3, 1e-3),
+              tol.tolerance('TTHI', 1, 2, 0, -0.2, 0.2),
+              tol.tolerance('TTHI', 2, 0, 0, -0.1, 0.1),
+              tol.tolerance('TCON', 1, 0, 0, -0.01, 0.01),
+              tol.tolerance('TSDX', 2, 0, 0, -0.05, 0.05),
+              tol.tolerance('TSTY', 1, 0, 0, -0.1, 0.1)]
+COMPENSATORS = [tol.tolerance('COMP', 3, 0, 0, -1.0, 1.0)]
+
+def test_run_trial_applies_perturbations():
+    osys = StubSystem()
+    values = [0.5, 1e-3, 0.2, -0.1, 0.01, 0.05, -0.1]
+    state = {}
+    def criterion(system):
+        surfs = system.surfaces
+        state.update(radius=(surfs[1].pRadius, surfs[2].pRadius), conic=surfs[1].pConic,
+                     thickness=[s.pThickness for s in surfs],
+                     decenter=surfs[2].pTiltDecenterData.pBeforeSurfaceDecenterX,
+                     tilt=surfs[1].pTiltDecenterData.pBeforeSurfaceTiltY)
+        return 7.0
+    trial, value, comps, elapsed = tol.run_trial(osys, 'nominal.zmx', 3, TOLERANCES, values,
+                                                 [], criterion)
+    assert (trial, value, comps) == (3, 7.0, []) and elapsed >= 0 and osys.loads == 2
+    assert state['radius'] == pytest.approx((50.5, 1/(-1/50.0 + 1e-3)))
+    assert state['thickness'] == pytest.approx([0.0, 5.2, 2.7, 40.0])   # adjusted by surface 2
+    assert state['conic'] == 0.01 and state['decenter'] == 0.05 and state['tilt'] == -0.1
+
+def test_run_trial_compensators():
+    osys = StubSystem()
+    values = [0.0, 0.0, 0.0, 0.1, 0.0, 0.0, 0.0]           # focus error of 0.1
+    trial, merit, comps, _ = tol.run_trial(osys, 'nominal.zmx', 1, TOLERANCES, values,
+                                           COMPENSATORS)
+    assert osys.variables == [(3, 'thickness')]
+    assert comps == pytest.approx([39.9]) and merit == pytest.approx(0.0)
+    # the nominal trial is not optimized
+    _, merit, comps, _ = tol.run_trial(osys, 'nominal.zmx', 0, TOLERANCES, np.zeros(7),
+                                       COMPENSATORS)
+    assert comps == [40.0] and merit == 0.0
+
+class SerialPool(object):
+    """In-process stand-in of `pyzos.workers.SystemPool`, which can be interrupted
+    after a number of results"""
+    runs = collections.Counter()      # trial : number of evaluations
+
+    def __init__(self, filename, processes=None, stop_after=None):
+        self.osys = StubSystem()
+        self.stop_after = stop_after
+        self.terminated = self.closed = False
+
+    def apply(self, func, *args):
+        return func(self.osys, *args)
+
+    def imap_unordered(self, func, args_list):
+        for k, args in enumerate(args_list):
+            if k == self.stop_after:
+                raise KeyboardInterrupt
+            SerialPool.runs[args[1]] += 1
+            yield func(self.osys, *args)
+
+    def terminate(self):
+        self.terminated = True
+
+    def close(self):
+        self.closed = True
+
+def test_monte_carlo_resume(monkeypatch, tmp_path):
+    tolerances = TOLERANCES + [tol.tolerance('TIRR', 1, 0, 0, -1, 1)] + COMPENSATORS
+    monkeypatch.setattr(tol, 'read_tolerances', lambda osys: tolerances)
+    SerialPool.runs.clear()
+    pools = []
+    def pool(filename, processes=None, stop_after=None):
+        pools.append(SerialPool(filename, processes, stop_after))
+        return pools[-1]
+    directory = str(tmp_path / 'mc')
+    monkeypatch.setattr(tol, '_SystemPool', lambda f, p: pool(f, p, stop_after=12))
+    with pytest.raises(KeyboardInterrupt), pytest.warns(UserWarning):
+        tol.monte_carlo('lens.zmx', directory, 30, seed=3)
+    assert pools[-1].terminated and not pools[-1].closed
+    monkeypatch.setattr(tol, '_SystemPool', pool)
+    with pytest.warns(UserWarning):              # TIRR is not supported
+        store = tol.monte_carlo('lens.zmx', directory, 30, seed=3)
+    assert pools[-1].closed
+    assert sorted(store['trial']) == list(range(30)) and len(store) == 30
+    assert max(SerialPool.runs.values()) == 1     # no trial is run twice
+    assert store.meta['tolerances'] == [list(t) for t in TOLERANCES]
+    rows = dict((t, k) for k, t in enumerate(store['trial']))
+    for trial in (0, 5, 29):
+        values = [store['p{}'.format(i)][rows[trial]] for i in range(len(TOLERANCES))]
+        np.testing.assert_array_equal(values, tol.sample(TOLERANCES, trial, 3))
+    np.testing.assert_allclose(store['c0'] + store['p3'], 40.0)   # refocused
+    assert store['criterion'][rows[0]] == 0.0 and (store['criterion'] > 0).any()
+    with pytest.raises(ValueError), pytest.warns(UserWarning):
+        tol.monte_carlo('lens.zmx', directory, 30, seed=4)     # different run
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Tests of the lens file catalog `pyzos.zmxcatalog`"""
+from __future__ import division, print_function
+import io
+import os
+import pytest
+from pyzos.zmxcatalog import LensCatalog, lens_metadata
+
+LENS = u"""MODE SEQ
+NAME {name}
+UNIT MM X W X CM MR CPMM
+ENPD 10
+FTYP 0 0 1 1 0 0 0
+XFLN 0
+YFLN {field}
+WAVM 1 0.5876 1
+SURF 0
+  DISZ INFINITY
+SURF 1
+  STOP
+  CURV {curv}
+  DISZ 2
+  GLAS {glass} 0 0 1.5 60
+SURF 2
+  CURV {back}
+  DISZ 95
+SURF 3
+"""
+
+def write_lens(directory, filename, name, curv, glass='N-BK7', field=5):
+    """Writes a singlet (thin lens focal length ~ 1/(0.5*2*curv))"""
+    path = os.path.join(directory, filename)
+    with io.open(path, 'w', encoding='utf-16') as f:
+        f.write(LENS.format(name=name, curv=curv, back=-curv, glass=glass, field=field))
+    return path
+
+@pytest.fixture
+def tree(tmp_path):
+    root = str(tmp_path / 'lenses')
+    os.makedirs(os.path.join(root, 'sub'))
+    write_lens(root, 'f100.zmx', 'Singlet 100', 0.01)
+    write_lens(root, 'f50.zmx', 'Singlet 50', 0.02, glass='F2', field=10)
+    write_lens(os.path.join(root, 'sub'), 'f200.zmx', 'Singlet 200', 0.005)
+    with io.open(os.path.join(root, 'sub', 'bad.zmx'), 'w', encoding='latin-1') as f:
+        f.write(u'MODE NSC\n')
+    return root
+
+def test_lens_metadata(tree):
+    rec = lens_metadata(os.path.join(tree, 'f100.zmx'))
+    assert rec.error is None and rec.name == 'Singlet 100'
+    assert rec.efl == pytest.approx(100, rel=0.02)
+    assert rec.epd == 10 and rec.fno == pytest.approx(rec.efl/10)
+    assert rec.num_elements == 1 and rec.glasses == ['N-BK7'] and rec.max_field == 5
+
+def test_query(tree):
+    cat = LensCatalog(':memory:')
+    assert cat.update(tree, processes=1) == (4, 0)
+    assert len(cat) == 4
+    assert [r.name for r in cat.query(efl=(90, 110))] == ['Singlet 100']
+    assert [r.name for r in cat.query(efl=(None, 150))] == ['Singlet 100', 'Singlet 50']
+    assert [r.name for r in cat.query(glass='f2')] == ['Singlet 50']
+    assert [r.name for r in cat.query(max_field=(6, None))] == ['Singlet 50']
+    assert [r.name for r in cat.query(name='200')] == ['Singlet 200']
+    assert len(cat.query(elements=1)) == 3 and cat.query(elements=2) == []
+    assert [os.path.basename(p) for p, _ in cat.errors()] == ['bad.zmx']
+
+def test_incremental_update(tree, tmp_path):
+    index_file = str(tmp_path / 'lenses.idx')
+    cat = LensCatalog(index_file)
+    cat.update(tree, processes=1)
+    assert cat.update(tree, processes=1) == (0, 0)
+    os.remove(os.path.join(tree, 'f50.zmx'))
+    path = write_lens(tree, 'f100.zmx', 'Singlet 100 v2', 0.01)
+    os.utime(path, (0, 1e9))   # modified
+    assert cat.update(tree, processes=1) == (1, 1)
+    cat.close()
+    cat = LensCatalog(index_file)   # persistent
+    assert sorted(r.name for r in cat.query()) == ['Singlet 100 v2', 'Singlet 200']
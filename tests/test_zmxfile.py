@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Tests of the offline lens file reader `pyzos.zmxfile`"""
+from __future__ import division, print_function
+import io
+import numpy as np
+import pytest
+import pyzos.zmxfile as zmx
+
+SINGLET = u"""VERS 150101 0 0
+MODE SEQ
+NAME Test singlet
+UNIT MM X W X CM MR CPMM
+ENPD 10
+FTYP 0 0 2 2 0 0 0
+XFLN 0 0 0 0 0 0 0 0 0 0 0 0
+YFLN 0 5 0 0 0 0 0 0 0 0 0 0
+FWGN 1 1 1 1 1 1 1 1 1 1 1 1
+WAVM 1 0.5876 1
+WAVM 2 0.4861 1
+PWAV 1
+SURF 0
+  TYPE STANDARD
+  CURV 0.0 0 0 0 0 ""
+  DISZ INFINITY
+SURF 1
+  STOP
+  TYPE STANDARD
+  CURV 0.02 0 0 0 0 ""
+  DISZ 4
+  GLAS N-BK7 0 0 1.5168 64.17
+  DIAM 6 1 0 0 1 ""
+SURF 2
+  TYPE EVENASPH
+  CURV -0.01 0 0 0 0 ""
+  CONI -1.5
+  PARM 1 0
+  PARM 2 1e-5
+  DISZ 45
+  DIAM 5.5 0 0 0 1 ""
+SURF 3
+  TYPE STANDARD
+  CURV 0.0 0 0 0 0 ""
+  DISZ 0
+  DIAM 1.2 0 0 0 1 ""
+MNUM 2 1
+MOFF 0 1 "" 0 0 0 1 1 0 0.0 ""
+MOFF 0 2 "" 0 0 0 1 1 0 0.0 ""
+THIC 2 1 45 0 0 0 1 1 0 0.0 ""
+THIC 2 2 50 0 0 0 1 1 0 0.0 ""
+PRAM 2 1 1e-5 0 0 0 1 1 0 0.0 "" 2
+PRAM 2 2 2e-5 0 0 0 1 1 0 0.0 "" 2
+GLSS 1 1 N-BK7 0 0 0 1 1 0 0.0 ""
+GLSS 1 2 F2 0 0 0 1 1 0 0.0 ""
+"""
+
+@pytest.fixture(params=['utf-16', 'latin-1'])
+def singlet(request, tmp_path):
+    filename = str(tmp_path / 'singlet.zmx')
+    with io.open(filename, 'w', encoding=request.param) as f:
+        f.write(SINGLET)
+    return filename
+
+def test_surface_data(singlet):
+    lens = zmx.read_zmx(singlet)
+    assert lens.name == 'Test singlet'
+    assert lens.numSurf == 4 and lens.stop == 1
+    assert lens.surf_type == ['STANDARD', 'STANDARD', 'EVENASPH', 'STANDARD']
+    np.testing.assert_allclose(lens.curvature, [0, 0.02, -0.01, 0])
+    assert np.isinf(lens.thickness[0]) and lens.thickness[2] == 45
+    np.testing.assert_allclose(lens.radius[1:3], [50, -100])
+    assert lens.material == ['', 'N-BK7', '', '']
+    assert lens.nd[1] == pytest.approx(1.5168) and lens.vd[1] == pytest.approx(64.17)
+    assert lens.conic[2] == -1.5 and lens.parm[2, 1] == 1e-5
+    assert lens.glasses == ['N-BK7'] and lens.num_elements == 1
+
+def test_system_data(singlet):
+    lens = zmx.read_zmx(singlet)
+    assert (lens.aperture_type, lens.aperture_value) == ('ENPD', 10)
+    np.testing.assert_allclose(lens.fields, [[0, 0], [0, 5]])
+    np.testing.assert_allclose(lens.wavelengths, [0.5876, 0.4861])
+    assert lens.primary_wave == 1
+
+def test_lde_arrays_keeps_automatic_semidiameters(singlet):
+    lens = zmx.read_zmx(singlet)
+    assert list(lens.semidia_fixed) == [False, True, False, False]
+    arrays = lens.lde_arrays()
+    assert arrays['semidia'][1] == 6
+    assert np.isnan(arrays['semidia'][[0, 2, 3]]).all()
+    np.testing.assert_allclose(lens.lde_arrays(all_semidia=True)['semidia'], [0, 6, 5.5, 1.2])
+    assert not np.isnan(lens.semidia).any()   # the model itself is unchanged
+
+def test_lde_arrays_keeps_stop_and_aspheres(singlet):
+    lens = zmx.read_zmx(singlet)
+    arrays = lens.lde_arrays()
+    assert arrays['stop'] == 1
+    assert arrays['surftype'] == ['Standard', 'Standard', 'EvenAspheric', 'Standard']
+    assert arrays['parm'].shape == (4, zmx.NUM_PARAMS)
+    np.testing.assert_array_equal(arrays['parm'][2, :3], [0, 1e-5, 0])
+    assert np.isnan(arrays['parm'][[0, 1, 3]]).all()   # standard surfaces
+    lens.surf_type[2] = 'GRID_SAG'                      # not in SURFACE_TYPES
+    arrays = lens.lde_arrays()
+    assert arrays['surftype'][2] is None and np.isnan(arrays['parm'][2]).all()
+    assert lens.parm[2, 1] == 1e-5
+
+def test_multi_configuration(singlet):
+    lens = zmx.read_zmx(singlet)
+    assert lens.num_configs == 2
+    assert lens.mce_operands == [('OFF', 0, 0), ('THIC', 2, 0), ('PRAM', 2, 2), ('GLSS', 1, 0)]
+    np.testing.assert_allclose(lens.mce_values[:, 1:3], [[45, 1e-5], [50, 2e-5]])
+    assert lens.mce_strings[1][3] == 'F2'
+    config2 = lens.config(2)
+    assert config2.thickness[2] == 50
+    assert config2.parm[2, 1] == 2e-5 and config2.parm[2, 0] == 0
+    assert config2.material[1] == 'F2'
+    assert lens.thickness[2] == 45 and lens.material[1] == 'N-BK7'   # unchanged
+    with pytest.raises(ValueError):
+        lens.config(3)
+
+def test_non_sequential_file_raises(tmp_path):
+    filename = str(tmp_path / 'nsc.zmx')
+    with io.open(filename, 'w', encoding='latin-1') as f:
+        f.write(u'MODE NSC\n')
+    with pytest.raises(zmx.ZMXFileError):
+        zmx.read_zmx(filename)
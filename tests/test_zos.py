@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests of `pyzos.zos.OpticalSystem` that need a running OpticStudio (ZOS-API);
+they are skipped otherwise"""
+from __future__ import division, print_function
+import pytest
+
+pytest.importorskip('win32com')
+
+@pytest.fixture(scope='module')
+def osys():
+    import pyzos.zos as zos
+    try:
+        osys = zos.OpticalSystem()
+    except Exception as err:
+        pytest.skip('OpticStudio is not available: {}'.format(err))
+    osys.New(False)
+    sdata = osys.pSystemData
+    sdata.pWavelengths.AddWavelength(0.486, 1.0)
+    sdata.pFields.AddField(0, 5.0, 1.0)
+    osys.pLDE.InsertNewSurfaceAt(1)
+    return osys
+
+def test_fingerprint_tracks_field_edits(osys):
+    before = osys.zFingerprint()
+    assert osys.zFingerprint() == before
+    field = osys.pSystemData.pFields.GetField(2)
+    field.pY = field.pY + 1.0
+    assert osys.zFingerprint() != before
+    assert osys.zFingerprint(full=True) == osys.zFingerprint()
+
+def test_fingerprint_tracks_wavelength_edits(osys):
+    before = osys.zFingerprint()
+    wave = osys.pSystemData.pWavelengths.GetWavelength(2)
+    wave.pWavelength = wave.pWavelength + 0.01
+    assert osys.zFingerprint() != before
+
+def test_fingerprint_tracks_lde_array_edits(osys):
+    before = osys.zFingerprint()
+    osys.zSetLDEArray(thick=osys.zGetLDEArray().thick + 1.0)
+    assert osys.zFingerprint() != before
+
+def test_analysis_cache_key_includes_field_number(osys, tmp_path):
+    from pyzos.resultcache import ResultCache
+    cache = ResultCache(str(tmp_path / 'cache'))
+    analysis = osys.pAnalyses.New_FftPsf()
+    settings = analysis.GetSettings()
+    settings.pField.SetFieldNumber(1)
+    osys.zApplyAnalysis(analysis, cache)
+    settings.pField.SetFieldNumber(2)
+    osys.zApplyAnalysis(analysis, cache)
+    assert cache.misses == 2 and len(cache) == 2
+    osys.zApplyAnalysis(analysis, cache)
+    assert cache.hits == 1
+    analysis.Close()
+    cache.close()
+
+def test_analysis_pool_reuses_windows(osys):
+    pool = osys.pAnalyses.zConfigureAnalysisPool()
+    opened = pool.opened
+    with osys.pAnalyses.zPooledAnalysis('FftMtf') as mtf:
+        pass
+    with osys.pAnalyses.zPooledAnalysis(u'FftMtf') as mtf2:   # through a new I_Analyses wrapper
+        assert mtf2 is mtf
+    assert pool.opened == opened + 1 and pool.reused >= 1
+    osys.pAnalyses.zCloseAnalysisPool()
+
+def test_snapshot_invalidated_by_system_edits(osys, tmp_path):
+    filename = str(tmp_path / 'snapshot.zmx')
+    osys.SaveAs(filename)
+    osys.zSnapshot(['SystemFile', 'Mode'])
+    osys.New(False)
+    assert osys.pSystemFile != filename
+    osys.LoadFile(filename, False)
+    osys.zSnapshot(['Mode'])
+    osys.pLDE.GetSurfaceAt(1).pThickness = 3.0
+    assert osys._zos_snapshot is None
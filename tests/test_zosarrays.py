@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Tests of the array assembly of the bulk methods of `OpticalSystem`,
+`pyzos.zosarrays`, with plain Python stand-ins of the ZOS-API data"""
+from __future__ import division, print_function
+import collections
+import numpy as np
+import pytest
+import pyzos.zosarrays as za
+
+grid = collections.namedtuple('grid', ['values', 'description'])
+series = collections.namedtuple('series', ['x', 'y', 'series_labels'])
+analysis_data = collections.namedtuple('analysis_data', ['grids', 'series'])
+
+def test_default_extract():
+    values = np.ones((2, 3))
+    assert za.default_extract(analysis_data([grid(values, 'MTF')], [])) is values
+    y = np.arange(4.0)
+    assert za.default_extract(analysis_data([], [series(None, y, ['T'])])) is y
+    with pytest.raises(ValueError):
+        za.default_extract(analysis_data([], []))
+
+def test_analysis_chunks():
+    chunks = za.analysis_chunks([1, 2], [1, 2, 3], [1], 4)
+    assert [len(c) for c in chunks] == [4, 2]
+    combos = [combo for chunk in chunks for combo in chunk]
+    assert combos == [(iF, iW, 0) for iF in range(2) for iW in range(3)]
+    assert za.analysis_chunks([1], [1], [1, 2], 1) == [[(0, 0, 0)], [(0, 0, 1)]]
+
+def test_assemble_analysis_matrix():
+    fields, waves, configs = [1, 2], [1, 2, 3], [1, 4]
+    combos = [c for chunk in za.analysis_chunks(fields, waves, configs, 3) for c in chunk]
+    results = [np.array([iF, iW, iC], dtype=float) for iF, iW, iC in combos]
+    x = np.linspace(0, 1, 3)
+    first = analysis_data([], [series(x, results[0], ['a', 'b'])])
+    matrix = za.assemble_analysis_matrix(results, fields, waves, configs, first)
+    assert matrix.data.shape == (2, 3, 2, 3)
+    np.testing.assert_array_equal(matrix.data[1, 2, 0], [1, 2, 0])
+    np.testing.assert_array_equal(matrix.data[0, 1, 1], [0, 1, 1])
+    assert matrix.x is x and matrix.labels == ['a', 'b']
+    assert (matrix.fields, matrix.waves, matrix.configs) == (fields, waves, configs)
+    first = analysis_data([grid(None, 'Footprint')], [])
+    matrix = za.assemble_analysis_matrix([np.eye(2)]*2, [1], [1], (1, 2), first)
+    assert matrix.data.shape == (1, 1, 2, 2, 2) and matrix.configs == [1, 2]
+    assert matrix.x is None and matrix.labels == 'Footprint'
+
+def test_assemble_mce_array():
+    cells = [[1.5, 'N-BK7', 2], [2.5, '', 3]]
+    mce = za.assemble_mce_array(['THIC', 'GLSS', 'PRAM'], [(1, 0, 0), (2, 0, 0), (3, 1, 0)],
+                                cells, 2)
+    assert mce.type == ['THIC', 'GLSS', 'PRAM'] and mce.current == 2
+    np.testing.assert_array_equal(mce.param1, [1, 2, 3])
+    np.testing.assert_array_equal(mce.param2, [0, 0, 1])
+    np.testing.assert_array_equal(mce.values, [[1.5, np.nan, 2], [2.5, np.nan, 3]])
+    assert mce.strings == [['1.5', 'N-BK7', '2'], ['2.5', '', '3']]
+    empty = za.assemble_mce_array([], [], [[], []], 1)
+    assert empty.values.shape == (2, 0) and empty.param3.shape == (0,)
+
+def test_mce_cell_writes():
+    mce = za.assemble_mce_array(['THIC', 'GLSS'], [(1, 0, 0), (2, 0, 0)],
+                                [[1.5, 'N-BK7'], [2.5, 'F2']], 1)
+    assert list(za.mce_cell_writes(mce.values, mce.strings, 2, 0)) == [
+        (0, 'pDoubleValue', 1.5), (1, 'pDoubleValue', 2.5)]
+    assert list(za.mce_cell_writes(mce.values, mce.strings, 2, 1)) == [
+        (0, 'pValue', 'N-BK7'), (1, 'pValue', 'F2')]
+    strings = [['', None], ['x', '']]
+    assert list(za.mce_cell_writes(None, strings, 2, 0)) == [(1, 'pValue', 'x')]
+    assert list(za.mce_cell_writes(None, strings, 2, 1)) == []
+    assert list(za.mce_cell_writes(mce.values, None, 2, 5)) == []
+
+class StubMCE(object):
+    def __init__(self, numConfig):
+        self.NumberOfConfigurations = numConfig
+        self.CurrentConfiguration = 1
+        self.history = []
+
+    def SetCurrentConfiguration(self, config):
+        self.CurrentConfiguration = config
+        self.history.append(config)
+
+def test_iter_configs_cache_and_restore():
+    mce = StubMCE(3)
+    mce.SetCurrentConfiguration(2)
+    reads = []
+    def read():
+        reads.append(mce.CurrentConfiguration)
+        return 'lde{}'.format(mce.CurrentConfiguration)
+    cache = {}
+    assert list(za.iter_configs(mce, read, lambda: cache)) == [(1, 'lde1'), (2, 'lde2'),
+                                                                (3, 'lde3')]
+    assert mce.CurrentConfiguration == 2 and reads == [1, 2, 3]
+    assert list(za.iter_configs(mce, read, lambda: cache, [3, 1])) == [(3, 'lde3'),
+                                                                        (1, 'lde1')]
+    assert reads == [1, 2, 3]                    # served from the cache
+    # an edit during the iteration (a new cache) is taken into account
+    caches = [cache, {}]
+    for config, lde in za.iter_configs(mce, read, lambda: caches[0], [1, 2]):
+        caches.pop(0)
+    assert reads == [1, 2, 3, 2]
+    # the configuration is restored if the iteration is stopped
+    for config, lde in za.iter_configs(mce, read, lambda: cache):
+        break
+    assert mce.CurrentConfiguration == 2
+
+def nce_data():
+    return za.assemble_nce_array(['StandardLens', 'Rectangle'], ['lens', ''], ['N-BK7', ''],
+                                 [0, 1], [0, 0], [(0, 0, 10), (0, 0, 20)], [(0, 0, 0)]*2,
+                                 [[1, 25.0, 'x'], [2.5]])
+
+def test_assemble_nce_array():
+    nce = nce_data()
+    assert nce.type == ['StandardLens', 'Rectangle'] and nce.material == ['N-BK7', '']
+    assert nce.ref_object.dtype == int and list(nce.ref_object) == [0, 1]
+    assert nce.position.shape == nce.tilt.shape == (2, 3)
+    np.testing.assert_array_equal(nce.params, [[1, 25, np.nan], [2.5, np.nan, np.nan]])
+    empty = za.assemble_nce_array([], [], [], [], [], [], [], [])
+    assert empty.position.shape == (0, 3) and empty.params.shape == (0, 0)
+
+def test_plan_nce_writes_changed_cells():
+    old = nce_data()
+    position = old.position.copy()
+    position[1, 2] = 25.0
+    params = old.params.copy()
+    params[0, 1] = 30.0
+    numObj, writes, new = za.plan_nce_writes(old, 2, type=old.type, comment=['lens', None],
+                                             material=['N-SF5', ''], position=position,
+                                             params=params)
+    assert numObj == 2
+    assert writes == [(1, None, [('Material', 'N-SF5')], [(1, 30.0)]),
+                      (2, None, [('ZPosition', 25.0)], [])]
+    assert new.material == ['N-SF5', ''] and new.position[1, 2] == 25.0
+    assert new.params[0, 1] == 30.0
+    assert old.material == ['N-BK7', ''] and old.params[0, 1] == 25.0   # unchanged
+    # writing the same data again writes nothing
+    numObj, writes, newer = za.plan_nce_writes(new, 2, **new._asdict())
+    assert writes == [] and newer.material == new.material
+    np.testing.assert_array_equal(newer.params, new.params)
+    assert za.plan_nce_writes(new, 2)[:2] == (2, [])
+
+def test_plan_nce_writes_structure_changes():
+    old = nce_data()
+    # a type change writes all the given columns of the object
+    numObj, writes, new = za.plan_nce_writes(old, 2, type=['StandardLens', 'Ellipse'],
+                                             material=old.material, params=old.params)
+    assert writes == [(2, 'Ellipse', [('Material', '')], [(0, 2.5)])] and new is None
+    # new objects
+    numObj, writes, new = za.plan_nce_writes(old, 2, comment=['lens', '', 'new'],
+                                             ref_object=[0, 1, 2])
+    assert numObj == 3 and new is None
+    assert writes == [(3, None, [('Comment', 'new'), ('RefObject', 2)], [])]
+    # removed objects
+    numObj, writes, new = za.plan_nce_writes(old, 2, comment=['lens'])
+    assert (numObj, writes, new) == (1, [], None)
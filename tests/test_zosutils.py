@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Tests of the property snapshots and batches of `pyzos.zosutils`, on a wrapper
+class of a plain Python stand-in of a ZOS object"""
+from __future__ import division, print_function
+import pytest
+import pyzos.zosutils as zu
+
+class FakeZOSObject(object):
+    """Stand-in of a ZOS-API COM object, logging the property gets and sets and
+    the method calls"""
+    def __init__(self):
+        object.__setattr__(self, 'log', [])
+        object.__setattr__(self, 'values', {'Type': 0, 'Data': 1.0, 'Name': 'wizard'})
+
+    def __getattr__(self, name):
+        if name not in self.values:
+            raise AttributeError(name)
+        self.log.append(('get', name))
+        return self.values[name]
+
+    def __setattr__(self, name, value):
+        self.log.append(('set', name, value))
+        self.values[name] = value
+
+    def Apply(self):
+        self.log.append(('call', 'Apply'))
+
+class IWizard(object):
+    """Wrapper class as made by `managed_wrapper_class_factory()`"""
+    __slots__ = ('_iwizard', '_zos_casts', '_zos_snapshot', '_zos_batch', '_zos_owner',
+                 '__weakref__')
+    pType = zu.ZOSPropMapper('_iwizard', 'Type', setter=True)
+    pData = zu.ZOSPropMapper('_iwizard', 'Data', setter=True)
+    pName = zu.ZOSPropMapper('_iwizard', 'Name')
+    Apply = zu._class_method_factory('Apply', '_iwizard')
+    zSnapshot = zu.snapshot
+    zInvalidateSnapshot = zu.invalidate_snapshot
+    zBatch = zu.batch
+
+    def __init__(self, zos_obj):
+        self._iwizard = zos_obj
+        self._zos_casts = self._zos_snapshot = self._zos_batch = self._zos_owner = None
+
+@pytest.fixture
+def wizard():
+    return IWizard(FakeZOSObject())
+
+def test_snapshot_serves_reads(wizard):
+    log = wizard._iwizard.log
+    snap = wizard.zSnapshot()
+    assert type(snap).__name__ == 'IWizard_snapshot' and snap._fields == ('Data', 'Name', 'Type')
+    assert snap == (1.0, 'wizard', 0)
+    assert log == [('get', 'Data'), ('get', 'Name'), ('get', 'Type')]
+    del log[:]
+    assert (wizard.pType, wizard.pData, wizard.pName) == (0, 1.0, 'wizard') and log == []
+    with pytest.raises(AttributeError):
+        wizard.pName = 'other'                   # read-only
+
+def test_snapshot_props_and_invalidation(wizard):
+    log = wizard._iwizard.log
+    assert tuple(wizard.zSnapshot(['pType', 'Name'])) == (0, 'wizard')
+    with pytest.raises(AttributeError):
+        wizard.zSnapshot(['Unknown'])
+    wizard._iwizard.values['Type'] = 4           # changed outside pyzos
+    assert wizard.pType == 0                     # served from the snapshot
+    wizard.zInvalidateSnapshot()
+    assert wizard.pType == 4
+    wizard.zSnapshot(['Type'])
+    del log[:]
+    wizard.pData = 2.0                           # a set through pyzos invalidates it
+    assert wizard._zos_snapshot is None
+    assert wizard.pType == 4 and log == [('set', 'Data', 2.0), ('get', 'Type')]
+
+def test_edit_hooks(wizard):
+    edits = []
+    def hook(obj, name):
+        edits.append((obj, name))
+    zu.add_edit_hook(hook)
+    try:
+        wizard.pType = 1
+        wizard.Apply()
+        assert edits == [(wizard, 'Type'), (wizard, 'Apply')]
+    finally:
+        zu.remove_edit_hook(hook)
+    wizard.pType = 2
+    assert len(edits) == 2
+
+def test_batch_coalesces_writes(wizard):
+    log = wizard._iwizard.log
+    with wizard.zBatch() as batch:
+        wizard.pType = 1
+        wizard.pData = 3.0
+        wizard.pType = 2
+        assert wizard.pType == 2                 # pending value, no read
+        assert log == []
+    assert log == [('set', 'Data', 3.0), ('set', 'Type', 2)]   # in the order of the last sets
+    assert batch.sets == 3 and batch.writes == 2 and batch.elapsed >= 0
+    assert wizard._zos_batch is None and not batch.pending
+
+def test_batch_commits_before_other_access(wizard):
+    log = wizard._iwizard.log
+    with wizard.zBatch() as batch:
+        wizard.pType = 1
+        assert wizard.pName == 'wizard'          # another property: commits first
+        wizard.pData = 2.0
+        wizard.Apply()                           # method call: commits first
+        wizard.pType = 3
+    assert log == [('set', 'Type', 1), ('get', 'Name'), ('set', 'Data', 2.0),
+                   ('call', 'Apply'), ('set', 'Type', 3)]
+    assert batch.writes == 3
+
+def test_batch_discarded_on_error(wizard):
+    log = wizard._iwizard.log
+    with pytest.raises(KeyError):
+        with wizard.zBatch():
+            wizard.pType = 1
+            raise KeyError('failed')
+    assert log == [] and wizard._zos_batch is None
+    assert wizard.pType == 0
+    with wizard.zBatch():
+        with pytest.raises(RuntimeError):
+            with wizard.zBatch():                # already batched
+                pass
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Tests of the ray database reader `pyzos.zrd` on synthetic .ZRD files"""
+from __future__ import division, print_function
+import os
+import numpy as np
+import pytest
+import pyzos.zrd as zrd
+
+def make_rays(counts, seed=0):
+    """Return list of segment arrays; the segment k of ray i hits object k + 1,
+    has level k and intensity i + k/10"""
+    rng = np.random.RandomState(seed)
+    rays = []
+    for i, numSeg in enumerate(counts):
+        seg = np.zeros(numSeg, zrd.SEGMENT_DTYPE)
+        seg['hit_object'] = np.arange(1, numSeg + 1)
+        seg['level'] = np.arange(numSeg)
+        seg['status'] = np.where(np.arange(numSeg) % 2, 4, 1)
+        seg['intensity'] = i + np.arange(numSeg)/10
+        seg['x'] = rng.randn(numSeg)
+        rays.append(seg)
+    return rays
+
+def write_zrd(filename, rays, version=2002):
+    with open(filename, 'wb') as f:
+        np.array([version, max(len(r) for r in rays)], '<i4').tofile(f)
+        for seg in rays:
+            np.array([len(seg)], '<i4').tofile(f)
+            seg.tofile(f)
+    return filename
+
+@pytest.fixture
+def zrd_file(tmp_path):
+    counts = [3, 1, 0, 4, 2, 5, 1]
+    rays = make_rays(counts)
+    return write_zrd(str(tmp_path / 'test.ZRD'), rays), counts, rays
+
+def test_segment_size():
+    assert zrd.SEGMENT_SIZE == 208
+
+def test_index_and_read_rays(zrd_file):
+    filename, counts, rays = zrd_file
+    f = zrd.ZRDFile(filename)
+    assert f.version == 2002 and f.max_segments == 5
+    assert len(f) == len(counts) and f.num_segments == sum(counts)
+    np.testing.assert_array_equal(f.counts, counts)
+    chunk = f.read_rays(3)
+    assert chunk.segments.tobytes() == rays[3].tobytes()
+    np.testing.assert_array_equal(chunk.ray, 3)
+    chunk = f.read_rays(1, 4)
+    assert chunk.segments.tobytes() == b''.join(r.tobytes() for r in rays[1:4])
+    np.testing.assert_array_equal(chunk.ray, [1, 3, 3, 3, 3])
+    with pytest.raises(IndexError):
+        f.read_rays(len(counts))
+    f.close()
+
+def test_index_cache(zrd_file, tmp_path):
+    filename, counts, _ = zrd_file
+    cache_dir = str(tmp_path / 'idx')
+    os.makedirs(cache_dir)
+    zrd.ZRDFile(filename, cache_dir=cache_dir)
+    cache_file = os.path.join(cache_dir, 'test.ZRD.idx.npz')
+    assert os.path.exists(cache_file)
+    version, max_segments, offsets = zrd.load_index(filename, cache_dir=cache_dir)
+    assert offsets[-1] == os.path.getsize(filename) and len(offsets) == len(counts) + 1
+    # a rewritten file invalidates the index
+    write_zrd(filename, make_rays([2, 2]))
+    os.utime(filename, (0, 0))
+    assert len(zrd.ZRDFile(filename, cache_dir=cache_dir)) == 2
+
+@pytest.mark.parametrize('chunk_segments', [1, 4, 100])
+def test_chunks_cover_all_rays(zrd_file, chunk_segments):
+    filename, counts, rays = zrd_file
+    f = zrd.ZRDFile(filename, cache=False)
+    ranges = f.chunk_ranges(chunk_segments)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(counts)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    data = f.read(chunk_segments=chunk_segments)
+    assert data.segments.tobytes() == b''.join(r.tobytes() for r in rays)
+    np.testing.assert_array_equal(data.ray, np.repeat(np.arange(len(counts)), counts))
+
+def test_filters(zrd_file):
+    filename, counts, rays = zrd_file
+    f = zrd.ZRDFile(filename, cache=False)
+    data = f.read(hit_object=2)
+    np.testing.assert_array_equal(data.ray, [i for i, n in enumerate(counts) if n >= 2])
+    data = f.read(level=(1, None), status=4)
+    assert (data.segments['level'] >= 1).all() and (data.segments['status'] & 4).all()
+    data = f.read(ray_hits_object=5)      # all the segments of ray 5 only
+    np.testing.assert_array_equal(data.ray, [5]*5)
+    assert f.read(hit_object=99).segments.size == 0
+    assert f.read(rays=(2, 3)).segments.size == 0
+
+def total_intensity(chunk):
+    return chunk.segments['intensity'].sum()
+
+def test_parallel_map_chunks(zrd_file):
+    filename, _, rays = zrd_file
+    f = zrd.ZRDFile(filename, cache=False)
+    expected = sum(r['intensity'].sum() for r in rays)
+    serial = f.map_chunks(total_intensity, chunk_segments=4)
+    parallel = f.map_chunks(total_intensity, chunk_segments=4, processes=2)
+    assert serial == pytest.approx(parallel) and sum(parallel) == pytest.approx(expected)
+
+def test_invalid_files(tmp_path):
+    filename = str(tmp_path / 'bad.ZRD')
+    with open(filename, 'wb') as f:
+        f.write(b'\x00' * 4)
+    with pytest.raises(zrd.ZRDError):
+        zrd.build_index(filename)
+    rays = make_rays([2, 2])
+    write_zrd(filename, rays)
+    with open(filename, 'ab') as f:
+        f.write(b'\x01\x00\x00\x00' + b'\x00' * 10)    # truncated ray
+    with pytest.raises(zrd.ZRDError):
+        zrd.build_index(filename)
+    # compressed (or foreign) data: invalid number of segments
+    with open(filename, 'wb') as f:
+        np.array([2002, 3, 1000], '<i4').tofile(f)
+    with pytest.raises(zrd.ZRDError):
+        zrd.build_index(filename)